@@ -25,7 +25,9 @@ import cv2
 import numpy as np
 import math
 import time
+import threading
 import traceback
+from concurrent.futures import Future
 import paddle
 
 import tools.infer.utility as utility
@@ -577,7 +579,7 @@ class TextRecognizer(object):
         img = img.astype("float32")
         return img
 
-    def __call__(self, img_list):
+    def __call__(self, img_list, batch_num=None):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
@@ -586,7 +588,7 @@ class TextRecognizer(object):
         # Sorting can speed up the recognition process
         indices = np.argsort(np.array(width_list))
         rec_res = [["", 0.0]] * img_num
-        batch_num = self.rec_batch_num
+        batch_num = batch_num or self.rec_batch_num
         st = time.time()
         if self.benchmark:
             self.autolog.times.start()
@@ -858,6 +860,169 @@ class TextRecognizer(object):
         return rec_res, time.time() - st
 
 
+class RecognitionScheduler(object):
+    """
+    Cross-image recognition batching for a TextRecognizer.
+
+    TextRecognizer.__call__ sorts and batches the crops of one call only, so a
+    receipt with a handful of lines runs a handful of under-filled batches.
+    The scheduler pools crops from many images (recognize_many) or from many
+    concurrent callers (submit), sorts them by aspect ratio and cuts batches
+    of at most max_batch crops whose padded size, crops * imgH * widest
+    width, stays within max_pixels. Every batch runs as one inference and
+    the results are scattered back to the crop lists they came from.
+    submit() holds crops for at most max_wait_ms (the added latency) while
+    waiting for enough crops to fill a batch.
+    """
+
+    def __init__(self, text_recognizer, max_batch=32, max_pixels=0, max_wait_ms=10):
+        self.text_recognizer = text_recognizer
+        self.max_batch = max(1, int(max_batch))
+        self.max_pixels = max_pixels
+        self.max_wait = max_wait_ms / 1000.0
+        imgC, imgH, imgW = text_recognizer.rec_image_shape[:3]
+        self.imgH = imgH
+        self.min_wh_ratio = imgW / imgH
+        self.stats = {"batches": 0, "crops": 0, "pixels": 0, "padded_pixels": 0}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = []  # (enqueue time, future, crops)
+        self._thread = None
+        self._closed = False
+
+    def plan(self, ratios):
+        """
+        Split crop indices into width-bucketed batches.
+        args:
+            ratios(list): w / h of every crop
+        return:
+            list of index lists; neighbouring ratios share a batch so padding
+            to the widest crop of the batch wastes little
+        """
+        batches, batch, widest = [], [], self.min_wh_ratio
+        for index in np.argsort(np.array(ratios), kind="stable"):
+            ratio = max(widest, ratios[index])
+            padded = (len(batch) + 1) * self.imgH * self.imgH * ratio
+            if batch and (
+                len(batch) >= self.max_batch
+                or (self.max_pixels and padded > self.max_pixels)
+            ):
+                batches.append(batch)
+                batch, ratio = [], max(self.min_wh_ratio, ratios[index])
+            batch.append(int(index))
+            widest = ratio
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _run(self, crops):
+        """Recognize crops in planned batches, returns results in crop order"""
+        ratios = [crop.shape[1] / float(crop.shape[0]) for crop in crops]
+        results = [["", 0.0]] * len(crops)
+        for batch in self.plan(ratios):
+            batch_res, _ = self.text_recognizer(
+                [crops[i] for i in batch], batch_num=len(batch)
+            )
+            widest = max([self.min_wh_ratio] + [ratios[i] for i in batch])
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["crops"] += len(batch)
+                self.stats["pixels"] += sum(
+                    self.imgH * self.imgH * min(ratios[i], widest) for i in batch
+                )
+                self.stats["padded_pixels"] += len(batch) * self.imgH * self.imgH * widest
+            for i, res in zip(batch, batch_res):
+                results[i] = res
+        return results
+
+    def recognize_many(self, crop_lists):
+        """
+        Recognize the crops of many images together.
+        args:
+            crop_lists(list): one list of crops per image
+        return:
+            one rec_res list per image, and the elapsed time
+        """
+        st = time.time()
+        flat = [crop for crops in crop_lists for crop in crops]
+        results = self._run(flat) if flat else []
+        rec_res_list, offset = [], 0
+        for crops in crop_lists:
+            rec_res_list.append(results[offset : offset + len(crops)])
+            offset += len(crops)
+        return rec_res_list, time.time() - st
+
+    def submit(self, crops):
+        """
+        Queue the crops of one image for pooled recognition (thread-safe).
+        return:
+            concurrent.futures.Future resolving to the rec_res list
+        """
+        future = Future()
+        if not crops:
+            future.set_result([])
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("RecognitionScheduler is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="rec-scheduler", daemon=True
+                )
+                self._thread.start()
+            self._pending.append((time.time(), future, crops))
+            self._cond.notify()
+        return future
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    pooled = sum(len(crops) for _, _, crops in self._pending)
+                    waited = (
+                        time.time() - self._pending[0][0] if self._pending else 0.0
+                    )
+                    # run once a batch can be filled, or the oldest request hit the latency budget
+                    if self._pending and (
+                        pooled >= self.max_batch or waited >= self.max_wait or self._closed
+                    ):
+                        requests, self._pending = self._pending, []
+                        break
+                    self._cond.wait(
+                        self.max_wait - waited if self._pending else None
+                    )
+            try:
+                rec_res_list, _ = self.recognize_many(
+                    [crops for _, _, crops in requests]
+                )
+                for (_, future, _), rec_res in zip(requests, rec_res_list):
+                    future.set_result(rec_res)
+            except Exception as e:
+                for _, future, _ in requests:
+                    future.set_exception(e)
+
+    def close(self):
+        """Run what is still pending and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self):
+        """Batch fill (crops per batch / max_batch) and pixel efficiency (unpadded / padded pixels)"""
+        stats = self.stats
+        batches = max(stats["batches"], 1)
+        return {
+            "batches": stats["batches"],
+            "crops": stats["crops"],
+            "batch_fill": stats["crops"] / float(batches * self.max_batch),
+            "pixel_efficiency": stats["pixels"] / float(stats["padded_pixels"] or 1),
+        }
+
+
 def main(args):
     image_file_list = get_image_file_list(args.image_dir)
     valid_image_file_list = []
@@ -23,10 +23,13 @@ os.environ["FLAGS_allocator_strategy"] = "auto_growth"
 
 import cv2
 import copy
+import collections
 import numpy as np
 import json
 import time
 import logging
+import queue
+import threading
 from PIL import Image
 import tools.infer.utility as utility
 import tools.infer.predict_rec as predict_rec
@@ -57,8 +60,18 @@ class TextSystem(object):
         if self.use_angle_cls:
             self.text_classifier = predict_cls.TextClassifier(args)
 
+        self.rec_scheduler = None
+        if getattr(args, "use_rec_pool", False):
+            self.rec_scheduler = predict_rec.RecognitionScheduler(
+                self.text_recognizer,
+                max_batch=args.rec_pool_batch_num,
+                max_pixels=args.rec_pool_max_pixels,
+                max_wait_ms=args.rec_pool_max_wait_ms,
+            )
+
         self.args = args
         self.crop_image_res_index = 0
+        self.stream_stats = None
 
     def draw_crop_rec_res(self, output_dir, img_crop_list, rec_res):
         os.makedirs(output_dir, exist_ok=True)
@@ -73,15 +86,7 @@ class TextSystem(object):
             logger.debug(f"{bno}, {rec_res[bno]}")
         self.crop_image_res_index += bbox_num
 
-    def __call__(self, img, cls=True, slice={}):
-        time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
-
-        if img is None:
-            logger.debug("no valid image provided")
-            return None, None, time_dict
-
-        start = time.time()
-        ori_im = img.copy()
+    def _detect(self, img, slice={}):
         if slice:
             slice_gen = slice_generator(
                 img,
@@ -107,7 +112,39 @@ class TextSystem(object):
             elapse = sum(elapsed)
         else:
             dt_boxes, elapse = self.text_detector(img)
+        return dt_boxes, elapse
 
+    def _crop(self, ori_im, dt_boxes):
+        dt_boxes = sorted_boxes(dt_boxes)
+        img_crop_list = []
+        for bno in range(len(dt_boxes)):
+            tmp_box = copy.deepcopy(dt_boxes[bno])
+            if self.args.det_box_type == "quad":
+                img_crop = get_rotate_crop_image(ori_im, tmp_box)
+            else:
+                img_crop = get_minarea_rect_crop(ori_im, tmp_box)
+            img_crop_list.append(img_crop)
+        return dt_boxes, img_crop_list
+
+    def _filter(self, dt_boxes, rec_res):
+        filter_boxes, filter_rec_res = [], []
+        for box, rec_result in zip(dt_boxes, rec_res):
+            text, score = rec_result[0], rec_result[1]
+            if score >= self.drop_score:
+                filter_boxes.append(box)
+                filter_rec_res.append(rec_result)
+        return filter_boxes, filter_rec_res
+
+    def __call__(self, img, cls=True, slice={}):
+        time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+
+        if img is None:
+            logger.debug("no valid image provided")
+            return None, None, time_dict
+
+        start = time.time()
+        ori_im = img.copy()
+        dt_boxes, elapse = self._detect(img, slice)
         time_dict["det"] = elapse
 
         if dt_boxes is None:
@@ -119,17 +156,8 @@ class TextSystem(object):
             logger.debug(
                 "dt_boxes num : {}, elapsed : {}".format(len(dt_boxes), elapse)
             )
-        img_crop_list = []
 
-        dt_boxes = sorted_boxes(dt_boxes)
-
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            if self.args.det_box_type == "quad":
-                img_crop = get_rotate_crop_image(ori_im, tmp_box)
-            else:
-                img_crop = get_minarea_rect_crop(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        dt_boxes, img_crop_list = self._crop(ori_im, dt_boxes)
         if self.use_angle_cls and cls:
             img_crop_list, angle_list, elapse = self.text_classifier(img_crop_list)
             time_dict["cls"] = elapse
@@ -141,21 +169,226 @@ class TextSystem(object):
                 f"rec crops num: {len(img_crop_list)}, time and memory cost may be large."
             )
 
-        rec_res, elapse = self.text_recognizer(img_crop_list)
+        if self.rec_scheduler is not None:
+            # pooled with the crops of concurrent callers, waits at most rec_pool_max_wait_ms
+            st = time.time()
+            rec_res = self.rec_scheduler.submit(img_crop_list).result()
+            elapse = time.time() - st
+        else:
+            rec_res, elapse = self.text_recognizer(img_crop_list)
         time_dict["rec"] = elapse
         logger.debug("rec_res num  : {}, elapsed : {}".format(len(rec_res), elapse))
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
-        filter_boxes, filter_rec_res = [], []
-        for box, rec_result in zip(dt_boxes, rec_res):
-            text, score = rec_result[0], rec_result[1]
-            if score >= self.drop_score:
-                filter_boxes.append(box)
-                filter_rec_res.append(rec_result)
+        filter_boxes, filter_rec_res = self._filter(dt_boxes, rec_res)
         end = time.time()
         time_dict["all"] = end - start
         return filter_boxes, filter_rec_res, time_dict
 
+    def predict_stream(self, images, cls=True, slice={}, queue_size=None):
+        """
+        Pipelined OCR over an iterable of images.
+        args:
+            images(iterable): BGR images (np.ndarray) or image paths; pulling the
+                next item (and reading a path) is the decode stage
+            queue_size(int): capacity of the queue between two stages,
+                defaults to args.pipeline_queue_size
+        return:
+            generator of (dt_boxes, rec_res, time_dict) in input order, the same
+            triple __call__ returns; time_dict["all"] is the latency from decode
+            to recognition including queueing. Per-stage busy time and
+            utilization are in self.stream_stats once the generator finishes.
+
+        decode, det, crop, cls and rec each run in their own thread, connected
+        by bounded queues, so the predictors overlap across consecutive images
+        (inference releases the GIL). Every stage is a single FIFO worker, which
+        keeps the output in input order. With --use_rec_pool the rec stage takes
+        up to rec_pool_images queued images at once and recognizes their crops
+        in shared batches (predict_rec.RecognitionScheduler).
+        """
+        if queue_size is None:
+            queue_size = getattr(self.args, "pipeline_queue_size", 4)
+        use_cls = self.use_angle_cls and cls
+
+        def decode(image):
+            if isinstance(image, str):
+                image = cv2.imread(image)
+            return {
+                "img": image,
+                "start": time.time(),
+                "time_dict": {"det": 0, "rec": 0, "cls": 0, "all": 0},
+                "dt_boxes": None,
+                "rec_res": None,
+            }
+
+        def det(state):
+            if state["img"] is None:
+                logger.debug("no valid image provided")
+                return state
+            state["ori_im"] = state["img"].copy()
+            dt_boxes, elapse = self._detect(state["img"], slice)
+            state["time_dict"]["det"] = elapse
+            if dt_boxes is None:
+                logger.debug("no dt_boxes found, elapsed : {}".format(elapse))
+            state["boxes"] = dt_boxes
+            return state
+
+        def crop(state):
+            if state.get("boxes") is not None:
+                state["boxes"], state["crops"] = self._crop(
+                    state.pop("ori_im"), state["boxes"]
+                )
+            return state
+
+        def classify(state):
+            if state.get("crops") is not None:
+                state["crops"], _, elapse = self.text_classifier(state["crops"])
+                state["time_dict"]["cls"] = elapse
+            return state
+
+        def finish(state, rec_res, elapse):
+            state["time_dict"]["rec"] = elapse
+            if self.args.save_crop_res:
+                self.draw_crop_rec_res(
+                    self.args.crop_res_save_dir, state["crops"], rec_res
+                )
+            state["dt_boxes"], state["rec_res"] = self._filter(state["boxes"], rec_res)
+
+        def recognize(states):
+            # with the scheduler, the crops of all images taken together share batches
+            active = [state for state in states if state.get("crops") is not None]
+            if active and self.rec_scheduler is not None:
+                rec_res_list, elapse = self.rec_scheduler.recognize_many(
+                    [state["crops"] for state in active]
+                )
+                for state, rec_res in zip(active, rec_res_list):
+                    finish(state, rec_res, elapse)
+            else:
+                for state in active:
+                    rec_res, elapse = self.text_recognizer(state["crops"])
+                    finish(state, rec_res, elapse)
+            for state in states:
+                if state["img"] is not None:
+                    state["time_dict"]["all"] = time.time() - state["start"]
+            return states
+
+        def single(fn):
+            return lambda states: [fn(states[0])]
+
+        # (name, fn over a list of states, max states taken per call)
+        rec_pool = 1
+        if self.rec_scheduler is not None:
+            rec_pool = max(1, getattr(self.args, "rec_pool_images", 8))
+        stages = [("det", single(det), 1), ("crop", single(crop), 1)]
+        if use_cls:
+            stages.append(("cls", single(classify), 1))
+        stages.append(("rec", recognize, rec_pool))
+
+        stop = threading.Event()
+        busy = {name: 0.0 for name in ["decode"] + [name for name, _, _ in stages]}
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def source():
+            iterator = iter(images)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    state = decode(next(iterator))
+                except StopIteration:
+                    break
+                except Exception as e:
+                    put(queues[0], _StageFailure(e))
+                    return
+                busy["decode"] += time.perf_counter() - started
+                put(queues[0], state)
+            put(queues[0], _STREAM_END)
+
+        def is_last(state):
+            return state is _STREAM_END or isinstance(state, _StageFailure)
+
+        def worker(name, fn, pool, q_in, q_out):
+            while not stop.is_set():
+                try:
+                    states = [q_in.get(timeout=0.1)]
+                except queue.Empty:
+                    continue
+                # a pooled stage also takes whatever is already queued behind
+                while len(states) < pool and not is_last(states[-1]):
+                    try:
+                        states.append(q_in.get_nowait())
+                    except queue.Empty:
+                        break
+                last = states.pop() if is_last(states[-1]) else None
+                if states:
+                    started = time.perf_counter()
+                    try:
+                        states = fn(states)
+                    except Exception as e:
+                        states = [_StageFailure(e)]
+                    busy[name] += time.perf_counter() - started
+                    for state in states:
+                        put(q_out, state)
+                if last is not None:
+                    put(q_out, last)
+                    return
+
+        threads = [threading.Thread(target=source, name="ocr-decode", daemon=True)]
+        for i, (name, fn, pool) in enumerate(stages):
+            threads.append(
+                threading.Thread(
+                    target=worker,
+                    args=(name, fn, pool, queues[i], queues[i + 1]),
+                    name="ocr-" + name,
+                    daemon=True,
+                )
+            )
+
+        start = time.time()
+        count = 0
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                state = queues[-1].get()
+                if state is _STREAM_END:
+                    break
+                if isinstance(state, _StageFailure):
+                    raise state.error
+                count += 1
+                yield state["dt_boxes"], state["rec_res"], state["time_dict"]
+        finally:
+            stop.set()
+            for thread in threads[1:]:
+                thread.join()
+            elapse = time.time() - start
+            self.stream_stats = {
+                "images": count,
+                "elapse": elapse,
+                "images_per_sec": count / elapse if elapse > 0 else 0.0,
+                "utilization": {
+                    name: value / elapse if elapse > 0 else 0.0
+                    for name, value in busy.items()
+                },
+            }
+
+
+class _StageFailure(object):
+    """Exception raised inside a pipeline stage, forwarded to the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+_STREAM_END = object()
+
 
 def sorted_boxes(dt_boxes):
     """
@@ -204,99 +437,130 @@ def main(args):
         for i in range(10):
             res = text_sys(img)
 
+    def load_pages():
+        for idx, image_file in enumerate(image_file_list):
+            img, flag_gif, flag_pdf = check_and_read(image_file)
+            if not flag_gif and not flag_pdf:
+                img = cv2.imread(image_file)
+            if not flag_pdf:
+                if img is None:
+                    logger.debug("error in loading image:{}".format(image_file))
+                    continue
+                imgs = [img]
+            else:
+                page_num = args.page_num
+                if page_num > len(img) or page_num == 0:
+                    page_num = len(img)
+                imgs = img[:page_num]
+            for index, img in enumerate(imgs):
+                yield (idx, image_file, index, len(imgs), flag_gif, flag_pdf, img)
+
+    def predict_pages():
+        if not args.use_pipeline:
+            for page in load_pages():
+                yield page, text_sys(page[-1])
+            return
+        # decode/det/cls/rec overlap across pages; predict_stream keeps input order
+        pages = collections.deque()
+
+        def images():
+            for page in load_pages():
+                pages.append(page)
+                yield page[-1]
+
+        for result in text_sys.predict_stream(images()):
+            yield pages.popleft(), result
+
     total_time = 0
     cpu_mem, gpu_mem, gpu_util = 0, 0, 0
     _st = time.time()
     count = 0
-    for idx, image_file in enumerate(image_file_list):
-        img, flag_gif, flag_pdf = check_and_read(image_file)
-        if not flag_gif and not flag_pdf:
-            img = cv2.imread(image_file)
-        if not flag_pdf:
-            if img is None:
-                logger.debug("error in loading image:{}".format(image_file))
-                continue
-            imgs = [img]
+    for page, (dt_boxes, rec_res, time_dict) in predict_pages():
+        idx, image_file, index, page_count, flag_gif, flag_pdf, img = page
+        elapse = time_dict["all"]
+        total_time += elapse
+        if page_count > 1:
+            logger.debug(
+                str(idx)
+                + "_"
+                + str(index)
+                + "  Predict time of %s: %.3fs" % (image_file, elapse)
+            )
         else:
-            page_num = args.page_num
-            if page_num > len(img) or page_num == 0:
-                page_num = len(img)
-            imgs = img[:page_num]
-        for index, img in enumerate(imgs):
-            starttime = time.time()
-            dt_boxes, rec_res, time_dict = text_sys(img)
-            elapse = time.time() - starttime
-            total_time += elapse
-            if len(imgs) > 1:
-                logger.debug(
-                    str(idx)
-                    + "_"
-                    + str(index)
-                    + "  Predict time of %s: %.3fs" % (image_file, elapse)
-                )
-            else:
-                logger.debug(
-                    str(idx) + "  Predict time of %s: %.3fs" % (image_file, elapse)
-                )
-            for text, score in rec_res:
-                logger.debug("{}, {:.3f}".format(text, score))
-
-            res = [
-                {
-                    "transcription": rec_res[i][0],
-                    "points": np.array(dt_boxes[i]).astype(np.int32).tolist(),
-                }
-                for i in range(len(dt_boxes))
-            ]
-            if len(imgs) > 1:
-                save_pred = (
-                    os.path.basename(image_file)
-                    + "_"
-                    + str(index)
-                    + "\t"
-                    + json.dumps(res, ensure_ascii=False)
-                    + "\n"
-                )
+            logger.debug(
+                str(idx) + "  Predict time of %s: %.3fs" % (image_file, elapse)
+            )
+        for text, score in rec_res:
+            logger.debug("{}, {:.3f}".format(text, score))
+
+        res = [
+            {
+                "transcription": rec_res[i][0],
+                "points": np.array(dt_boxes[i]).astype(np.int32).tolist(),
+            }
+            for i in range(len(dt_boxes))
+        ]
+        if page_count > 1:
+            save_pred = (
+                os.path.basename(image_file)
+                + "_"
+                + str(index)
+                + "\t"
+                + json.dumps(res, ensure_ascii=False)
+                + "\n"
+            )
+        else:
+            save_pred = (
+                os.path.basename(image_file)
+                + "\t"
+                + json.dumps(res, ensure_ascii=False)
+                + "\n"
+            )
+        save_results.append(save_pred)
+
+        if is_visualize:
+            image = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+            boxes = dt_boxes
+            txts = [rec_res[i][0] for i in range(len(rec_res))]
+            scores = [rec_res[i][1] for i in range(len(rec_res))]
+
+            draw_img = draw_ocr_box_txt(
+                image,
+                boxes,
+                txts,
+                scores,
+                drop_score=drop_score,
+                font_path=font_path,
+            )
+            if flag_gif:
+                save_file = image_file[:-3] + "png"
+            elif flag_pdf:
+                save_file = image_file.replace(".pdf", "_" + str(index) + ".png")
             else:
-                save_pred = (
-                    os.path.basename(image_file)
-                    + "\t"
-                    + json.dumps(res, ensure_ascii=False)
-                    + "\n"
-                )
-            save_results.append(save_pred)
-
-            if is_visualize:
-                image = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-                boxes = dt_boxes
-                txts = [rec_res[i][0] for i in range(len(rec_res))]
-                scores = [rec_res[i][1] for i in range(len(rec_res))]
-
-                draw_img = draw_ocr_box_txt(
-                    image,
-                    boxes,
-                    txts,
-                    scores,
-                    drop_score=drop_score,
-                    font_path=font_path,
-                )
-                if flag_gif:
-                    save_file = image_file[:-3] + "png"
-                elif flag_pdf:
-                    save_file = image_file.replace(".pdf", "_" + str(index) + ".png")
-                else:
-                    save_file = image_file
-                cv2.imwrite(
-                    os.path.join(draw_img_save_dir, os.path.basename(save_file)),
-                    draw_img[:, :, ::-1],
-                )
-                logger.debug(
-                    "The visualized image saved in {}".format(
-                        os.path.join(draw_img_save_dir, os.path.basename(save_file))
-                    )
+                save_file = image_file
+            cv2.imwrite(
+                os.path.join(draw_img_save_dir, os.path.basename(save_file)),
+                draw_img[:, :, ::-1],
+            )
+            logger.debug(
+                "The visualized image saved in {}".format(
+                    os.path.join(draw_img_save_dir, os.path.basename(save_file))
                 )
+            )
 
     logger.info("The predict total time is {}".format(time.time() - _st))
+    if args.use_pipeline and text_sys.stream_stats:
+        stats = text_sys.stream_stats
+        logger.info(
+            "pipeline: {} images, {:.2f} images/s, stage utilization: {}".format(
+                stats["images"],
+                stats["images_per_sec"],
+                ", ".join(
+                    "{} {:.0%}".format(name, value)
+                    for name, value in stats["utilization"].items()
+                ),
+            )
+        )
     if args.benchmark:
         text_sys.text_detector.autolog.report()
         text_sys.text_recognizer.autolog.report()
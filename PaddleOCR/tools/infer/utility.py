@@ -149,6 +149,17 @@ def init_args():
     parser.add_argument("--total_process_num", type=int, default=1)
     parser.add_argument("--process_id", type=int, default=0)
 
+    # pipelined system inference (TextSystem.predict_stream)
+    parser.add_argument("--use_pipeline", type=str2bool, default=False)
+    parser.add_argument("--pipeline_queue_size", type=int, default=4)
+
+    # cross-image recognition batching (predict_rec.RecognitionScheduler)
+    parser.add_argument("--use_rec_pool", type=str2bool, default=False)
+    parser.add_argument("--rec_pool_batch_num", type=int, default=32)
+    parser.add_argument("--rec_pool_max_pixels", type=int, default=0)
+    parser.add_argument("--rec_pool_max_wait_ms", type=float, default=10)
+    parser.add_argument("--rec_pool_images", type=int, default=8)
+
     parser.add_argument("--benchmark", type=str2bool, default=False)
     parser.add_argument("--save_log_path", type=str, default="./log_output/")
 
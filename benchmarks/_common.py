@@ -0,0 +1,119 @@
+"""
+基准测试公共部分 - 项目路径、命令行参数、临时工作目录、计时，以及建库与随机账单数据
+
+脚本以 python benchmarks/bench_xxx.py 运行时本目录在sys.path上：先 `from _common import ...`（把项目根目录
+加入sys.path），再导入 src 下的模块。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+MERCHANTS = ["星巴克", "麦当劳", "肯德基", "滴滴出行", "淘宝", "京东", "美团外卖", "沃尔玛"]
+CATEGORIES = ["餐饮", "购物", "交通", "娱乐", "教育", "生活"]
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BILL_INSERT_COLUMNS = ('user_id', 'consume_time', 'amount', 'merchant', 'category', 'payment_method')
+
+
+def arg_parser(description: str, **defaults) -> argparse.ArgumentParser:
+    """按默认值生成 --参数（类型取默认值的类型，下划线写作连字符）；值为 (默认值, 说明) 时附带帮助文本"""
+    parser = argparse.ArgumentParser(description=description)
+    for name, default in defaults.items():
+        default, help_text = default if isinstance(default, tuple) else (default, None)
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default,
+                            help=f"{help_text}（默认 %(default)s）" if help_text else "默认 %(default)s")
+    return parser
+
+
+@contextmanager
+def workspace(**env) -> Iterator[Path]:
+    """临时目录；env中的环境变量（值为相对该目录的路径）在块内生效，退出时恢复
+
+    src.config 在首次导入时读取环境变量，依赖这些变量的模块要在块内导入。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update({key: str(tmp / value) for key, value in env.items()})
+        try:
+            yield tmp
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def measure(fn, repeat: int) -> float:
+    """返回中位耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def create_schema(path: Path, time_columns: bool = True):
+    """按当前模型建表；time_columns 为 False 时不建时间戳生成列与索引（模拟迁移前的旧库）"""
+    from sqlalchemy import create_engine
+
+    from src.models import Base
+    from src.database import ensure_model_columns, ensure_time_columns
+
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    if time_columns:
+        ensure_model_columns(path)
+        ensure_time_columns(path)
+
+
+def random_bills(rng: random.Random, count: int, users: Sequence[int] = (1,), start: datetime = None,
+                 days: int = 365, amount: Tuple[float, float] = (5, 500), merchants: Sequence[str] = MERCHANTS,
+                 categories: Sequence[str] = CATEGORIES,
+                 payment_methods: Sequence[str] = ("微信",)) -> Iterator[tuple]:
+    """随机账单行，字段顺序同 BILL_INSERT_COLUMNS；消费时间落在 start 之后 days 天内（默认截至当前）"""
+    start = start or datetime.now() - timedelta(days=days)
+    minutes = days * 24 * 60
+    for _ in range(count):
+        yield (rng.choice(users), (start + timedelta(minutes=rng.randint(0, minutes))).strftime(TIME_FORMAT),
+               round(rng.uniform(*amount), 2), rng.choice(merchants), rng.choice(categories),
+               rng.choice(payment_methods))
+
+
+def insert_rows(path: Path, table: str, columns: Sequence[str], rows: Iterable[tuple], batch_size: int = 50000) -> int:
+    """分批写入，返回行数（生成器数据不会整体驻留内存）"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    conn = sqlite3.connect(str(path))
+    count = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+            count += len(batch)
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def insert_bills(path: Path, rows: Iterable[tuple], columns: Sequence[str] = BILL_INSERT_COLUMNS) -> int:
+    return insert_rows(path, 'bills', columns, rows)
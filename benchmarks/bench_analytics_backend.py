@@ -0,0 +1,150 @@
+"""
+分析后端基准测试 - SQLite+pandas 路径 vs DuckDB 列式副本
+
+用法：python benchmarks/bench_analytics_backend.py --rows 500000 --users 50
+"""
+import random
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from _common import arg_parser, workspace, measure, random_bills, insert_bills
+
+from src.analytics_engine import AnalyticsEngine, HAS_DUCKDB, normalize_time_series
+
+CATEGORIES = ["餐饮", "交通", "购物", "娱乐", "医疗", "教育", "其他"]
+PAYMENT_METHODS = ["微信", "支付宝", "银行卡", "现金"]
+MERCHANTS = ["星巴克", "麦当劳", "滴滴出行", "淘宝", "京东", "美团外卖", "沃尔玛", "电影院"]
+
+
+def build_database(path: Path, rows: int, users: int):
+    """生成测试库"""
+    conn = sqlite3.connect(str(path))
+    conn.execute("""
+        CREATE TABLE bills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            consume_time TEXT NOT NULL,
+            amount REAL NOT NULL,
+            merchant TEXT NOT NULL,
+            category TEXT DEFAULT '未知',
+            payment_method TEXT NOT NULL,
+            location TEXT,
+            description TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX idx_bills_user_id ON bills(user_id)")
+    conn.execute("CREATE INDEX idx_bills_time ON bills(consume_time)")
+    conn.close()
+    insert_bills(path, random_bills(random.Random(42), rows, range(1, users + 1), datetime(datetime.now().year, 1, 1),
+                                    days=300, amount=(1, 800), merchants=MERCHANTS, categories=CATEGORIES,
+                                    payment_methods=PAYMENT_METHODS))
+
+
+def sqlite_monthly(db_path: Path, user_id: int, year: int):
+    """OLTP路径：get_monthly_spending 的逐行strftime聚合"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return conn.execute("""
+            SELECT strftime('%m', consume_time) as month, SUM(amount), COUNT(*), AVG(amount)
+            FROM bills WHERE user_id = ? AND strftime('%Y', consume_time) = ?
+            GROUP BY strftime('%m', consume_time) ORDER BY month
+        """, (user_id, str(year))).fetchall()
+    finally:
+        conn.close()
+
+
+def _load_frame(db_path: Path, user_id: int, limit: int = None) -> pd.DataFrame:
+    """OLTP路径：行 -> dict -> DataFrame"""
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    try:
+        sql = "SELECT * FROM bills WHERE user_id = ? ORDER BY consume_time DESC"
+        params = [user_id]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows)
+    df['consume_time'] = normalize_time_series(df['consume_time'])
+    return df
+
+
+def pandas_category(db_path: Path, user_id: int, limit: int = None):
+    df = _load_frame(db_path, user_id, limit)
+    stats = df.groupby('category').agg({'amount': ['sum', 'count', 'mean', 'std']}).round(2)
+    stats.columns = ['total_amount', 'count', 'avg_amount', 'std_amount']
+    stats['percentage'] = (stats['total_amount'] / stats['total_amount'].sum() * 100).round(2)
+    return stats.to_dict('index')
+
+
+def pandas_habits(db_path: Path, user_id: int, limit: int = None):
+    df = _load_frame(db_path, user_id, limit)
+    peak_hour = df.groupby(df['consume_time'].dt.hour).size().idxmax()
+    weekly = df.groupby(df['consume_time'].dt.isocalendar().week)['amount'].sum()
+    return peak_hour, 1 - weekly.std() / weekly.mean()
+
+
+def main():
+    args = arg_parser("分析后端延迟对比", rows=200000, users=20, repeat=5).parse_args()
+
+    if not HAS_DUCKDB:
+        print("未安装duckdb，无法对比，请先 pip install duckdb")
+        return
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.rows} 行, {args.users} 个用户 ...")
+        build_database(db_path, args.rows, args.users)
+
+        engine = AnalyticsEngine(db_path, tmp / "bench.duckdb",
+                                 config={"backend": "duckdb", "sync_interval_seconds": 3600})
+        engine.ensure_schema()
+        sync_stats = engine.sync(full=True)
+        print(f"初次全量同步: {sync_stats['inserted']} 行, {sync_stats['elapsed_ms']} ms")
+
+        year = datetime.now().year
+        user_id = 1
+        cases = [
+            ("月度趋势(全年)", lambda: sqlite_monthly(db_path, user_id, year),
+             lambda: engine.monthly_trend(user_id, year)),
+            ("分类占比(最近1000笔)", lambda: pandas_category(db_path, user_id, 1000),
+             lambda: engine.category_shares(user_id, limit=1000)),
+            ("分类占比(全部历史)", lambda: pandas_category(db_path, user_id),
+             lambda: engine.category_shares(user_id)),
+            ("高峰时段+周一致性(全部历史)", lambda: pandas_habits(db_path, user_id),
+             lambda: (engine.hourly_peaks(user_id), engine.weekly_consistency(user_id))),
+        ]
+
+        print(f"\n{'场景':<28}{'SQLite/pandas(ms)':>20}{'DuckDB(ms)':>14}{'加速比':>10}")
+        for name, oltp_fn, olap_fn in cases:
+            oltp_ms = measure(oltp_fn, args.repeat)
+            olap_ms = measure(olap_fn, args.repeat)
+            print(f"{name:<28}{oltp_ms:>20.2f}{olap_ms:>14.2f}{oltp_ms / olap_ms:>9.1f}x")
+
+        # 增量同步开销
+        conn = sqlite3.connect(str(db_path))
+        conn.executemany("INSERT INTO bills (user_id, consume_time, amount, merchant, category, payment_method) "
+                         "VALUES (1, ?, 10.0, '星巴克', '餐饮', '微信')",
+                         [(f"{year}-06-01 12:00:00",)] * 1000)
+        conn.commit()
+        conn.close()
+        print(f"\n增量同步1000行: {engine.sync()['elapsed_ms']} ms")
+
+        # 删除按id同步（行数不变也能识别）
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("DELETE FROM bills WHERE id IN (SELECT id FROM bills ORDER BY id LIMIT 1000)")
+        conn.commit()
+        conn.close()
+        stats = engine.sync()
+        print(f"增量同步删除{stats['deleted']}行: {stats['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
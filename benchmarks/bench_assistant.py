@@ -0,0 +1,74 @@
+"""
+对话助手基准测试 - 每个意图各自查库 vs 共用一份列式账单快照
+
+用法：python benchmarks/bench_assistant.py --rows 20000 --repeat 20
+"""
+import random
+import sqlite3
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, create_schema, insert_bills, random_bills
+
+from src.assistant import AssistantContext, SnapshotStore, intents
+from src.merchant_index import merchant_index
+
+MERCHANTS = ["星巴克", "麦当劳", "肯德基", "滴滴出行", "淘宝", "京东", "美团外卖", "沃尔玛",
+             "万达影城", "海底捞", "中国石化加油站", "全家便利店", "盒马鲜生", "新东方", "顺丰速运"]
+QUERIES = ["今日消费分析", "消费趋势分析", "好商家推荐", "消费预警"]
+
+
+def build_database(path: Path, rows: int):
+    create_schema(path)
+    insert_bills(path, random_bills(random.Random(42), rows, days=400, amount=(5, 1500), merchants=MERCHANTS))
+
+
+def per_intent_queries(db_path: Path, today_ts: int):
+    """改造前的做法：今日/趋势/好商家/预警各自查一次，趋势再做一次汇总"""
+    conn = sqlite3.connect(str(db_path))
+    sql = ("SELECT id, consume_time, consume_ts, amount, merchant, merchant_id, category FROM bills "
+           "WHERE user_id = 1 AND consume_ts >= ? ORDER BY consume_ts DESC LIMIT ?")
+    conn.execute(sql, (today_ts, 1000)).fetchall()
+    conn.execute("SELECT COUNT(*), SUM(amount), AVG(amount) FROM bills WHERE user_id = 1").fetchone()
+    conn.execute("SELECT category, COUNT(*), SUM(amount) FROM bills WHERE user_id = 1 GROUP BY category").fetchall()
+    conn.execute(sql, (today_ts - 6 * 86400, 1000)).fetchall()
+    conn.execute(sql, (today_ts - 90 * 86400, 10000)).fetchall()
+    conn.execute(sql, (0, 1000)).fetchall()
+    conn.close()
+
+
+def main():
+    args = arg_parser("对话助手账单快照性能", rows=20000, repeat=20).parse_args()
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: 单用户 {args.rows} 笔账单（近400天） ...")
+        build_database(db_path, args.rows)
+        # 快照按规范商家id分组，全局商家字典指向测试库并回填
+        merchant_index.db_path = db_path
+        merchant_index.load()
+        merchant_index.backfill()
+        store = SnapshotStore(db_path)
+        today_ts = AssistantContext(1, '', store).today_ts
+
+        def snapshot_turns():
+            # 每轮都重新加载快照（TTL过期时的最坏情况）
+            store.invalidate()
+            for query in QUERIES:
+                intents.dispatch(AssistantContext(1, query, store))
+
+        def cached_turns():
+            for query in QUERIES:
+                intents.dispatch(AssistantContext(1, query, store))
+
+        old_ms = measure(lambda: per_intent_queries(db_path, today_ts), args.repeat)
+        load_ms = measure(lambda: store.load(1), args.repeat)
+        new_ms = measure(snapshot_turns, args.repeat)
+        cached_ms = measure(cached_turns, args.repeat)
+        print(f"四个意图各自查库（仅SQL，不含Python端聚合）: {old_ms:.2f} ms")
+        print(f"加载一次快照: {load_ms:.2f} ms（{len(store.load(1))} 行）")
+        print(f"四个意图共用新加载的快照: {new_ms:.2f} ms")
+        print(f"四个意图命中TTL内快照: {cached_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+冷数据分层基准测试 - 归档前后OLTP库大小、近期查询与全历史月度统计的耗时
+
+用法：python benchmarks/bench_cold_storage.py --users 200 --years 5 --per-day 2
+"""
+import itertools
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, create_schema, insert_bills, MERCHANTS, CATEGORIES
+
+from src.cold_storage import ColdStore, HAS_PYARROW
+
+
+def build_database(path: Path, users: int, years: int, per_day: int):
+    create_schema(path)
+    rng = random.Random(42)
+    now = datetime.now()
+    # 按时间顺序写入，与真实账单的id/时间相关性一致
+    insert_bills(path, (
+        (user_id, (now - timedelta(days=day, minutes=rng.randint(0, 1439))).strftime('%Y-%m-%d %H:%M:%S'),
+         round(rng.uniform(5, 500), 2), rng.choice(MERCHANTS), rng.choice(CATEGORIES), "微信")
+        for day in range(years * 365, -1, -1) for user_id in range(1, users + 1) for _ in range(per_day)
+    ))
+
+
+def recent_bills(db_path: Path, user_id: int, since_ts: int):
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("SELECT * FROM bills WHERE user_id = ? AND consume_ts >= ? ORDER BY consume_ts DESC LIMIT 100",
+                 (user_id, since_ts)).fetchall()
+    conn.close()
+
+
+def yearly_trend(db_path: Path, store: ColdStore, user_id: int, year: int):
+    conn = sqlite3.connect(str(db_path))
+    monthly = [{"month": f"{row[0] % 100:02d}", "total_amount": row[1], "count": row[2], "avg_amount": row[3]}
+               for row in conn.execute(
+                   "SELECT consume_month, SUM(amount), COUNT(*), AVG(amount) FROM bills "
+                   "WHERE user_id = ? AND consume_month BETWEEN ? AND ? GROUP BY consume_month",
+                   (user_id, year * 100 + 1, year * 100 + 12))]
+    conn.close()
+    return store.merge_monthly(user_id, year, monthly)
+
+
+def main():
+    args = arg_parser("冷数据归档对OLTP库的影响", users=200, years=5, per_day=(2, "每个用户每天的账单数"),
+                      horizon_days=365, repeat=30).parse_args()
+    if not HAS_PYARROW:
+        print("跳过：冷数据归档需要安装 pyarrow")
+        return
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.users} 个用户 × {args.years} 年 × 每天 {args.per_day} 笔 ...")
+        build_database(db_path, args.users, args.years, args.per_day)
+        store = ColdStore(db_path, {'archive_dir': tmp / "archive", 'horizon_days': args.horizon_days})
+        store.ensure_schema()
+        since_ts = int(time.time()) - 30 * 86400
+        old_year = datetime.now().year - args.years + 1
+        users = random.Random(7).sample(range(1, args.users + 1), min(args.repeat, args.users))
+        user_iter = itertools.cycle(users)
+
+        def report(label: str):
+            recent_ms = measure(lambda: recent_bills(db_path, next(user_iter), since_ts), args.repeat)
+            trend_ms = measure(lambda: yearly_trend(db_path, store, next(user_iter), old_year), args.repeat)
+            print(f"[{label}] 库文件 {db_path.stat().st_size / 1024 / 1024:.1f} MB，"
+                  f"近30天账单 {recent_ms:.2f} ms，{old_year} 年月度统计 {trend_ms:.2f} ms")
+
+        report("归档前")
+        expected = yearly_trend(db_path, store, 1, old_year)
+        stats = store.archive()
+        conn = sqlite3.connect(str(db_path), isolation_level=None)
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"归档 {stats['rows']} 笔到 {stats['files']} 个分区文件，耗时 {stats['seconds']}s，"
+              f"Parquet合计 {store.status()['bytes'] / 1024 / 1024:.1f} MB")
+        report("归档后")
+        actual = yearly_trend(db_path, store, 1, old_year)
+        assert [(r['month'], r['count']) for r in expected] == [(r['month'], r['count']) for r in actual]
+
+
+if __name__ == "__main__":
+    main()
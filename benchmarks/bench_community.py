@@ -0,0 +1,96 @@
+"""
+社区计数基准测试 - 多线程给同一热门帖子点赞：原事务内查重+插入+读改写计数 vs 唯一索引幂等插入+计数缓冲；
+以及热榜：每次请求SQL现算热度排序 vs 缓存的排序结果切片
+
+用法：python benchmarks/bench_community.py --posts 5000 --likes 2000 --threads 8
+"""
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, create_schema, insert_rows
+
+
+def build_database(path: Path, posts: int):
+    create_schema(path)
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    insert_rows(path, 'community_posts',
+                ('id', 'user_id', 'title', 'content', 'likes_count', 'comments_count', 'created_at'),
+                ((i, rng.randint(1, 1000), f"帖子{i}", "内容" * 20, rng.randint(0, 50), rng.randint(0, 10),
+                  (now - timedelta(minutes=rng.randint(0, 30 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S'))
+                 for i in range(1, posts + 1)))
+
+
+def legacy_like(post_id: int, user_id: int) -> bool:
+    """改动前的点赞：同一事务内查重、插入点赞、读改写帖子点赞数"""
+    from src.sharding import shard_router
+    from src.models import CommunityPost, PostLike
+
+    with shard_router.session() as session:
+        if session.query(PostLike).filter(PostLike.post_id == post_id, PostLike.user_id == user_id).first():
+            return False
+        session.add(PostLike(post_id=post_id, user_id=user_id))
+        post = session.query(CommunityPost).filter(CommunityPost.id == post_id).first()
+        if post:
+            post.likes_count = (post.likes_count or 0) + 1
+        session.commit()
+        return True
+
+
+def hot_by_sql(db_path: Path, limit: int):
+    """对照：每次请求在SQL里按相同公式算热度并排序"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return conn.execute("""
+            SELECT id, (COALESCE(likes_count, 0) + 2 * COALESCE(comments_count, 0) + 1) /
+                   pow((strftime('%s', 'now') - strftime('%s', created_at)) / 3600.0 + 2, 1.5) AS score
+            FROM community_posts ORDER BY score DESC LIMIT ?
+        """, (limit,)).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    args = arg_parser("社区计数：事务内读改写 vs 写缓冲", posts=5000,
+                      likes=(2000, "对同一帖子的点赞次数（每次不同用户）"), threads=8, repeat=50).parse_args()
+
+    # 全局单例按 BILL_DB_PATH 建立，业务模块在块内导入
+    with workspace(BILL_DB_PATH="bench.sqlite") as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.posts} 篇帖子 ...")
+        build_database(db_path, args.posts)
+
+        from src.community import community_feed
+        from src.database import db_manager
+
+        community_feed.config['hot_candidates'] = args.posts
+        community_feed.ensure_schema()
+        conn = sqlite3.connect(str(db_path))
+        likes_count = lambda: conn.execute("SELECT likes_count FROM community_posts WHERE id = 1").fetchone()[0]
+        for label, like, first_user in (("事务内读改写", legacy_like, 1),
+                                        ("唯一索引+计数缓冲", db_manager.like_post, args.likes + 1)):
+            before = likes_count()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                results = list(pool.map(lambda user_id: like(1, user_id), range(first_user, first_user + args.likes)))
+            community_feed.flush()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<14} {args.threads} 线程点赞 {sum(results)} 次：{elapsed * 1000:.0f} ms，"
+                  f"{args.likes / elapsed:.0f} 次/秒，计数增加 {likes_count() - before}")
+        conn.close()
+
+        community_feed.hot_posts(20)
+        sql_ms = measure(lambda: hot_by_sql(db_path, 20), args.repeat)
+        cached_ms = measure(lambda: community_feed.hot_posts(20, 20), args.repeat)
+        print(f"热榜第2页：SQL现算排序 {sql_ms:.2f} ms，缓存切片 {cached_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+列表接口序列化基准测试 - 整份列表 + jsonable_encoder + json.dumps vs 从游标分批orjson流式输出 的耗时与峰值内存
+
+用法：python benchmarks/bench_json_stream.py --rows 100000
+"""
+import gc
+import json
+import random
+import sqlite3
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+
+from _common import arg_parser, workspace, measure, create_schema, insert_bills, random_bills, BILL_INSERT_COLUMNS
+
+from src.records import BILL_COLUMNS, BILL_SELECT, bill_records
+from src.json_stream import HAS_ORJSON, iter_json_array, iter_ndjson
+
+QUERY = f"SELECT {BILL_SELECT} FROM bills WHERE user_id = 1 ORDER BY consume_ts DESC"
+
+
+def build_database(path: Path, rows: int):
+    create_schema(path)
+    created = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    insert_bills(path, (row + ("上海", "日常消费", created, created)
+                        for row in random_bills(random.Random(42), rows, start=datetime(2024, 1, 1), days=600)),
+                 BILL_INSERT_COLUMNS + ('location', 'description', 'created_at', 'updated_at'))
+
+
+def buffered(db_path: Path) -> int:
+    """改动前的路径：记录列表 -> to_dict -> jsonable_encoder -> 整体序列化"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        bills = bill_records(conn.execute(QUERY))
+        content = jsonable_encoder({"success": True, "data": [b.to_dict() for b in bills], "total": len(bills)})
+        return len(json.dumps(content, ensure_ascii=False).encode('utf-8'))
+    finally:
+        conn.close()
+
+
+def streamed(db_path: Path, ndjson: bool = False) -> int:
+    """游标分批序列化，逐块消费（模拟写出到socket）"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        cursor = conn.execute(QUERY)
+        chunks = iter_ndjson(cursor, BILL_COLUMNS) if ndjson else \
+            iter_json_array(cursor, BILL_COLUMNS, head={"success": True}, tail={"total": 0})
+        return sum(len(chunk) for chunk in chunks)
+    finally:
+        conn.close()
+
+
+def peak_bytes(fn) -> int:
+    """调用期间的峰值内存（tracemalloc）"""
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    args = arg_parser("列表接口：整体序列化 vs 流式序列化", rows=100000, repeat=5).parse_args()
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.rows} 笔账单（orjson {'可用' if HAS_ORJSON else '未安装，使用标准库json'}）...")
+        build_database(db_path, args.rows)
+        for label, fn in (("整体序列化", lambda: buffered(db_path)),
+                          ("流式JSON", lambda: streamed(db_path)),
+                          ("流式NDJSON", lambda: streamed(db_path, ndjson=True))):
+            elapsed = measure(fn, args.repeat)
+            peak = peak_bytes(fn)
+            print(f"{label:<10} {elapsed:8.1f} ms，峰值内存 {peak / 1024 / 1024:7.1f} MB，输出 {fn() / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+读模型基准测试 - 每10万行账单：ORM对象 vs sqlite3.Row拷贝成字典 vs slots记录 vs 按列数组 的耗时与内存
+
+用法：python benchmarks/bench_read_model.py --rows 100000
+"""
+import gc
+import random
+import sqlite3
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from _common import arg_parser, workspace, measure, create_schema, insert_bills, random_bills, BILL_INSERT_COLUMNS
+
+from src.models import Bill
+from src.records import BILL_COLUMNS, BILL_SELECT, bill_records, to_columns, select_columns
+
+ANALYTICS_COLUMNS = ['consume_time', 'amount', 'merchant', 'category', 'payment_method']
+
+
+def build_database(path: Path, rows: int):
+    create_schema(path)
+    created = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    insert_bills(path, (row + ("上海", None, created, created)
+                        for row in random_bills(random.Random(42), rows, start=datetime(2024, 1, 1), days=600)),
+                 BILL_INSERT_COLUMNS + ('location', 'description', 'created_at', 'updated_at'))
+
+
+def orm_objects(db_path: Path):
+    session = sessionmaker(bind=create_engine(f"sqlite:///{db_path}"), expire_on_commit=False)()
+    try:
+        return session.query(Bill).filter(Bill.user_id == 1).order_by(Bill.consume_ts.desc()).all()
+    finally:
+        session.close()
+
+
+def row_dicts(db_path: Path):
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"SELECT {BILL_SELECT} FROM bills WHERE user_id = 1 ORDER BY consume_ts DESC")
+        return [{name: row[name] for name in BILL_COLUMNS} for row in rows]
+    finally:
+        conn.close()
+
+
+def records(db_path: Path):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return bill_records(conn.execute(f"SELECT {BILL_SELECT} FROM bills WHERE user_id = 1 ORDER BY consume_ts DESC"))
+    finally:
+        conn.close()
+
+
+def columns(db_path: Path):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        rows = conn.execute(f"SELECT {select_columns(ANALYTICS_COLUMNS)} FROM bills WHERE user_id = 1 "
+                            f"ORDER BY consume_ts DESC").fetchall()
+        return to_columns(rows, ANALYTICS_COLUMNS)
+    finally:
+        conn.close()
+
+
+def retained_bytes(fn) -> int:
+    """结果对象常驻内存（tracemalloc，调用返回后仍被引用的部分）"""
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    args = arg_parser("账单读路径：ORM vs 轻量记录", rows=100000, repeat=5).parse_args()
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.rows} 笔账单 ...")
+        build_database(db_path, args.rows)
+        scale = 100000 / args.rows
+        for label, fn in (("ORM对象", orm_objects), ("Row转字典", row_dicts),
+                          ("slots记录", records), ("按列数组(5列)", columns)):
+            elapsed = measure(lambda: fn(db_path), args.repeat) * scale
+            memory = retained_bytes(lambda: fn(db_path)) * scale
+            print(f"{label:<12} 每10万行 {elapsed:8.1f} ms，常驻内存 {memory / 1024 / 1024:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+识别批处理基准测试 - 同一批图片的文字框逐张识别（每张图单独凑batch）与跨图片合并、按宽高比分桶识别的
+吞吐（框/秒）、batch填充率、有效像素占比，以及并发请求下合批带来的单张额外等待（CPU）
+
+用法：python benchmarks/bench_rec_batching.py --image_dir data/uploads \\
+        --det_model_dir models/det --rec_model_dir models/rec --use_gpu false \\
+        --rec_pool_batch_num 32 --rec_pool_max_wait_ms 10 --concurrency 8
+其余参数与 PaddleOCR/tools/infer/predict_system.py 相同
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import ROOT
+
+sys.path.insert(0, str(ROOT / "PaddleOCR"))
+
+import cv2
+
+import tools.infer.utility as utility
+from ppocr.utils.utility import get_image_file_list
+from tools.infer.predict_rec import RecognitionScheduler
+from tools.infer.predict_system import TextSystem
+
+
+def main():
+    parser = utility.init_args()
+    parser.add_argument("--repeat", type=int, default=2, help="图片列表重复次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="模拟并发请求的线程数")
+    args = parser.parse_args()
+    args.show_log = False
+    args.use_rec_pool = False
+
+    images = [cv2.imread(path) for path in get_image_file_list(args.image_dir)]
+    images = [image for image in images if image is not None] * args.repeat
+    text_sys = TextSystem(args)
+    crop_lists = []
+    for image in images:
+        dt_boxes, _ = text_sys._detect(image)
+        crop_lists.append(text_sys._crop(image, dt_boxes)[1])
+    crops = sum(len(item) for item in crop_lists)
+    recognizer = text_sys.text_recognizer
+    recognizer(crop_lists[0])  # 预热
+
+    started = time.perf_counter()
+    single = [recognizer(item)[0] if item else [] for item in crop_lists]
+    single_seconds = time.perf_counter() - started
+
+    scheduler = RecognitionScheduler(recognizer, max_batch=args.rec_pool_batch_num,
+                                     max_pixels=args.rec_pool_max_pixels, max_wait_ms=args.rec_pool_max_wait_ms)
+    started = time.perf_counter()
+    pooled = []
+    for i in range(0, len(crop_lists), args.rec_pool_images):
+        pooled.extend(scheduler.recognize_many(crop_lists[i:i + args.rec_pool_images])[0])
+    pooled_seconds = time.perf_counter() - started
+    report = scheduler.report()
+
+    print(f"{len(images)} 张图片，{crops} 个文字框，cpu_threads={args.cpu_threads}")
+    print(f"逐张识别 rec_batch_num={args.rec_batch_num:<3} {crops / single_seconds:7.1f} 框/秒（{single_seconds:.2f}s）")
+    print(f"跨图合批 每次{args.rec_pool_images}张 max_batch={args.rec_pool_batch_num:<3} "
+          f"{crops / pooled_seconds:7.1f} 框/秒（{pooled_seconds:.2f}s），"
+          f"batch填充率 {report['batch_fill']:.0%}，有效像素 {report['pixel_efficiency']:.0%}")
+    print(f"识别结果一致 {sum(a == b for a, b in zip(single, pooled))}/{len(images)}")
+
+    # 并发请求：每个请求各自提交，调度线程在 max_wait_ms 内合批
+    def timed(submit, item):
+        started = time.perf_counter()
+        submit(item)
+        return time.perf_counter() - started
+
+    for label, submit in (("逐张识别", lambda item: recognizer(item) if item else None),
+                          ("调度合批", lambda item: scheduler.submit(item).result())):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            latencies = sorted(pool.map(lambda item: timed(submit, item), crop_lists))
+        seconds = time.perf_counter() - started
+        print(f"{args.concurrency}并发 {label} {crops / seconds:7.1f} 框/秒，单张识别延迟 "
+              f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms / p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms")
+    scheduler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+报表流水线基准测试 - 分别调用消费/分类/趋势三个分析（各自扫描、各自分组） vs 一次扫描的完整报表
+
+用法：python benchmarks/bench_report_pipeline.py --users 50 --days 730 --per-day 3
+"""
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, create_schema, insert_bills, MERCHANTS, CATEGORIES
+
+PAYMENT_METHODS = ["微信", "支付宝", "银行卡", "现金"]
+
+
+def build_database(path: Path, users: int, days: int, per_day: int):
+    create_schema(path)
+    rng = random.Random(42)
+    now = datetime.now()
+    insert_bills(path, (
+        (user_id, (now - timedelta(days=day, minutes=rng.randint(0, 1439))).strftime('%Y-%m-%d %H:%M:%S'),
+         round(rng.uniform(5, 800), 2), rng.choice(MERCHANTS), rng.choice(CATEGORIES), rng.choice(PAYMENT_METHODS))
+        for day in range(days, -1, -1) for user_id in range(1, users + 1) for _ in range(per_day)
+    ))
+
+
+def main():
+    args = arg_parser("完整报表：三次扫描 vs 一次扫描", users=50, days=730,
+                      per_day=(3, "每个用户每天的账单数"), repeat=20).parse_args()
+
+    # 全局单例按 BILL_DB_PATH 建立，业务模块在块内导入
+    with workspace(BILL_DB_PATH="bench.sqlite", BILL_ARCHIVE_DIR="archive") as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.users} 个用户 × {args.days} 天 × 每天 {args.per_day} 笔 ...")
+        build_database(db_path, args.users, args.days, args.per_day)
+
+        from src.cost_analysis import cost_analyzer
+
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month_end = month_start - timedelta(seconds=1)
+        last_month_start = last_month_end.replace(day=1, hour=0, minute=0, second=0)
+        users = random.Random(7).sample(range(1, args.users + 1), min(args.repeat, args.users))
+
+        for label, window in (("最近1000笔", (None, None)), ("上月", (last_month_start, last_month_end))):
+            def separate():
+                user_id = random.choice(users)
+                cost_analyzer.get_spending_analysis(user_id, *window)
+                cost_analyzer.get_category_analysis(user_id, *window)
+                cost_analyzer.get_trend_analysis(user_id, 'monthly')
+
+            def pipeline():
+                cost_analyzer.generate_report(random.choice(users), *window)
+
+            separate_ms = measure(separate, args.repeat)
+            pipeline_ms = measure(pipeline, args.repeat)
+            print(f"[{label}] 分别调用三个分析 {separate_ms:.1f} ms，一次扫描完整报表 {pipeline_ms:.1f} ms"
+                  f"（{separate_ms / pipeline_ms:.2f}x）")
+
+
+if __name__ == "__main__":
+    main()
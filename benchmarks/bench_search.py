@@ -0,0 +1,133 @@
+"""
+全文检索基准测试 - FTS5(中文二字切分) vs LIKE '%x%' 全表扫描
+
+用法：python benchmarks/bench_search.py --rows 1000000 --users 100
+"""
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, insert_bills
+
+from src.search_index import SearchIndex
+
+MERCHANTS = ["星巴克", "麦当劳", "肯德基", "滴滴出行", "淘宝", "京东", "美团外卖", "沃尔玛",
+             "万达影城", "海底捞", "中国石化加油站", "全家便利店", "盒马鲜生", "新东方", "顺丰速运"]
+BRANCHES = ["国贸店", "中关村店", "西湖店", "陆家嘴店", "天河店", "南山店", "春熙路店", "解放碑店"]
+NOTES = ["工作日午餐", "周末聚餐", "打车回家", "网购日用品", "电影票两张", "给孩子买书",
+         "加油", "买咖啡", "生鲜采购", "寄快递", "年度会员续费", None]
+CATEGORIES = ["餐饮", "交通", "购物", "娱乐", "医疗", "教育", "其他"]
+
+QUERIES = ["星巴克", "海底捞 聚餐", "国贸", "咖啡", "会员续费"]
+
+
+def build_database(path: Path, rows: int, users: int):
+    """生成测试库（与线上bills/invoices结构一致）"""
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE bills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            consume_time TEXT NOT NULL,
+            amount REAL NOT NULL,
+            merchant TEXT NOT NULL,
+            category TEXT DEFAULT '未知',
+            payment_method TEXT NOT NULL,
+            location TEXT,
+            description TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_bills_user_id ON bills(user_id);
+        CREATE INDEX idx_bills_merchant ON bills(merchant);
+        CREATE TABLE invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            bill_id INTEGER,
+            invoice_time TEXT NOT NULL,
+            amount REAL NOT NULL,
+            merchant TEXT NOT NULL,
+            invoice_type TEXT DEFAULT '未知',
+            ocr_text TEXT
+        );
+    """)
+    conn.close()
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    insert_bills(path, ((rng.randint(1, users),
+                         (start + timedelta(minutes=rng.randint(0, 600 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S'),
+                         round(rng.uniform(1, 800), 2), f"{rng.choice(MERCHANTS)}({rng.choice(BRANCHES)})",
+                         rng.choice(CATEGORIES), "微信", rng.choice(NOTES)) for _ in range(rows)),
+                 ('user_id', 'consume_time', 'amount', 'merchant', 'category', 'payment_method', 'description'))
+    conn = sqlite3.connect(str(path))
+    conn.execute("""
+        INSERT INTO invoices (user_id, invoice_time, amount, merchant, ocr_text)
+        SELECT user_id, consume_time, amount, merchant,
+               '发票\n商户：' || merchant || '\n金额：' || amount || '元\n时间：' || consume_time
+        FROM bills WHERE id % 10 = 0
+    """)
+    conn.commit()
+    conn.close()
+
+
+def like_search(db_path: Path, query: str, user_id: int = None):
+    """现有做法：各词LIKE '%x%'，商家/备注/OCR文本逐行扫描（带总数与分页）"""
+    terms = query.split()
+    conn = sqlite3.connect(str(db_path))
+    try:
+        results = 0
+        for table, body_col, time_col in (("bills", "description", "consume_time"),
+                                          ("invoices", "ocr_text", "invoice_time")):
+            conditions = [f"(merchant LIKE ? OR {body_col} LIKE ?)" for _ in terms]
+            params = [p for t in terms for p in (f"%{t}%", f"%{t}%")]
+            if user_id is not None:
+                conditions.insert(0, "user_id = ?")
+                params.insert(0, user_id)
+            where_clause = " AND ".join(conditions)
+            conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where_clause}", params).fetchone()
+            results += len(conn.execute(f"SELECT id FROM {table} WHERE {where_clause} "
+                                        f"ORDER BY {time_col} DESC LIMIT 20", params).fetchall())
+        return results
+    finally:
+        conn.close()
+
+
+def main():
+    args = arg_parser("全文检索延迟对比", rows=1000000, users=100, repeat=5).parse_args()
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.rows} 行账单, {args.users} 个用户 ...")
+        build_database(db_path, args.rows, args.users)
+
+        index = SearchIndex(db_path)
+        started = time.perf_counter()
+        index.ensure_schema()
+        print(f"全量建索引: {time.perf_counter() - started:.1f} s")
+
+        # 单用户检索（LIKE可先走user_id索引）与全量检索（客服/运营后台）
+        for scope, user_id in (("单用户", 1), ("全部用户", None)):
+            print(f"\n[{scope}]")
+            print(f"{'查询':<16}{'LIKE(ms)':>12}{'FTS5(ms)':>12}{'加速比':>10}{'命中数':>10}")
+            for query in QUERIES:
+                like_ms = measure(lambda: like_search(db_path, query, user_id), args.repeat)
+                fts_ms = measure(lambda: index.search(query, user_id=user_id), args.repeat)
+                total = index.search(query, user_id=user_id)['total']
+                print(f"{query:<16}{like_ms:>12.2f}{fts_ms:>12.2f}{like_ms / fts_ms:>9.1f}x{total:>10}")
+
+        # 增量维护开销：触发器入队 + 检索前分词
+        conn = sqlite3.connect(str(db_path))
+        conn.executemany("INSERT INTO bills (user_id, consume_time, amount, merchant, payment_method, description) "
+                         "VALUES (1, '2025-06-01 12:00:00', 10.0, ?, '微信', '买咖啡')",
+                         [(f"星巴克(测试{i}店)",) for i in range(1000)])
+        conn.commit()
+        conn.close()
+        started = time.perf_counter()
+        processed = index.sync()
+        print(f"\n增量索引{processed}行: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+服务容量基准测试 - 不同worker数下的吞吐量与延迟
+
+依次以 1/2/4... 个worker启动 gunicorn（使用数据库副本，不改动 data/bill_db.sqlite），
+用多个压测进程持续发送请求，统计吞吐量、P50/P99延迟与相对单worker的扩展效率。
+
+用法：python benchmarks/bench_server_capacity.py --workers 1 2 4 --clients 16 --duration 20
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+from _common import ROOT, workspace
+
+from src.config import DATABASE_PATH
+
+# 混合负载：列表查询、全文检索、自然语言查询
+DEFAULT_PATHS = [
+    "/api/v1/bills?user_id=1&limit=50",
+    "/api/v1/search?user_id=1&q=" + quote("星巴克"),
+    "/api/v1/analysis/summary?user_id=1",
+]
+
+
+def wait_ready(port: int, timeout: float = 120) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/v1/bills?limit=1")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def client_loop(port: int, paths, duration: float, queue):
+    """单个压测进程：keep-alive连接循环请求"""
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    deadline = time.time() + duration
+    i = 0
+    while time.time() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    queue.put((latencies, errors))
+
+
+def run_load(port: int, paths, clients: int, duration: float):
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client_loop, args=(port, paths, duration, queue))
+             for _ in range(clients)]
+    for p in procs:
+        p.start()
+    latencies, errors = [], 0
+    for _ in procs:
+        lat, err = queue.get()
+        latencies.extend(lat)
+        errors += err
+    for p in procs:
+        p.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多worker吞吐量对比")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16, help="并发压测进程数")
+    parser.add_argument("--duration", type=float, default=20, help="每轮压测秒数")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--path", action="append", help="压测路径，可多次指定")
+    args = parser.parse_args()
+    paths = args.path or DEFAULT_PATHS
+
+    print(f"CPU核数: {os.cpu_count()}，压测进程: {args.clients}，每轮 {args.duration}s")
+    results = []
+    with workspace() as tmp:
+        for workers in args.workers:
+            # 每轮使用全新的数据库副本
+            db_copy = os.path.join(tmp, f"bench_{workers}.sqlite")
+            shutil.copy(DATABASE_PATH, db_copy)
+            env = dict(os.environ, BILL_DB_PATH=db_copy, WEB_CONCURRENCY=str(workers),
+                       BIND=f"127.0.0.1:{args.port}")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+                 "--access-logfile", "/dev/null", "src.main:app"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                if not wait_ready(args.port):
+                    print(f"{workers} worker 启动超时")
+                    continue
+                run_load(args.port, paths, args.clients, args.warmup)
+                latencies, errors = run_load(args.port, paths, args.clients, args.duration)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+            rps = len(latencies) / args.duration
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            results.append((workers, rps, p50, p99, errors))
+
+    if not results:
+        return
+    base_rps = results[0][1] / results[0][0]
+    print(f"\n{'workers':>8}{'req/s':>10}{'P50(ms)':>10}{'P99(ms)':>10}{'错误':>6}{'扩展效率':>10}")
+    for workers, rps, p50, p99, errors in results:
+        efficiency = rps / (base_rps * workers) * 100
+        print(f"{workers:>8}{rps:>10.1f}{p50:>10.1f}{p99:>10.1f}{errors:>6}{efficiency:>9.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+分片写入基准测试 - 多进程并发逐笔写入账单（每笔一个事务，与API写入方式一致），对比不同分片数的吞吐
+
+用法：python benchmarks/bench_sharding.py --shards 1,2,4,8 --workers 8 --writes 2000
+"""
+import multiprocessing
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+from _common import arg_parser, workspace, create_schema, MERCHANTS
+
+from src.sharding import ShardRouter
+
+def make_router(tmp: Path, shards: int) -> ShardRouter:
+    return ShardRouter({'shards': shards, 'shard_dir': tmp / "shards"}, home_path=tmp / "home.sqlite")
+
+
+def prepare(tmp: Path, shards: int):
+    create_schema(tmp / "home.sqlite")
+    make_router(tmp, shards).ensure_schema()
+
+
+def writer(tmp: Path, shards: int, writes: int, users: int, seed: int, start_event):
+    """单个写入进程：随机用户逐笔插入并提交"""
+    router = make_router(tmp, shards)
+    rng = random.Random(seed)
+    start_event.wait()
+    for _ in range(writes):
+        user_id = rng.randint(1, users)
+        conn = router.connect(user_id)
+        try:
+            conn.execute(
+                "INSERT INTO bills (id, user_id, consume_time, amount, merchant, payment_method) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (router.next_id('bills') if router.sharded else None, user_id, "2025-06-01 12:00:00",
+                 round(rng.uniform(5, 500), 2), rng.choice(MERCHANTS), "微信")
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def run(shards: int, workers: int, writes: int, users: int) -> float:
+    with workspace() as tmp:
+        prepare(tmp, shards)
+        start_event = multiprocessing.Event()
+        processes = [multiprocessing.Process(target=writer, args=(tmp, shards, writes, users, i, start_event))
+                     for i in range(workers)]
+        for p in processes:
+            p.start()
+        time.sleep(0.5)
+        started = time.perf_counter()
+        start_event.set()
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - started
+
+        total = 0
+        for path in make_router(tmp, shards).paths():
+            conn = sqlite3.connect(str(path))
+            total += conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+            conn.close()
+        assert total == workers * writes, f"写入行数不符: {total}"
+        return workers * writes / elapsed
+
+
+def main():
+    args = arg_parser("按用户分片的并发写入吞吐", shards="1,2,4,8", workers=8,
+                      writes=(2000, "每个进程写入的笔数"), users=10000).parse_args()
+
+    print(f"{args.workers} 个写入进程，每个 {args.writes} 笔（每笔单独提交），{args.users} 个用户")
+    baseline = None
+    for shards in [int(s) for s in args.shards.split(",")]:
+        throughput = run(shards, args.workers, args.writes, args.users)
+        baseline = baseline or throughput
+        print(f"{shards} 个分片: {throughput:.0f} 笔/s（{throughput / baseline:.2f}x）")
+
+
+if __name__ == "__main__":
+    main()
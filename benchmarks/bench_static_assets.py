@@ -0,0 +1,123 @@
+"""
+静态资源基准测试 - 页面加载的请求数与传输字节：StaticFiles直接挂载 vs 指纹+预压缩+immutable缓存
+
+首次访问：index.html 及其引用的本地资源全部下载；
+再次访问：按响应头模拟浏览器缓存，immutable资源直接命中缓存，其余带 If-None-Match 条件请求。
+
+用法：python benchmarks/bench_static_assets.py [--source web] [--encoding "gzip, deflate, br"]
+"""
+import argparse
+import asyncio
+import gzip
+import re
+import time
+
+from starlette.staticfiles import StaticFiles
+
+from _common import workspace
+
+from src.static_assets import StaticAssets, StaticAssetApp, HAS_BROTLI
+
+if HAS_BROTLI:
+    import brotli
+
+MOUNT = "/app"
+_LOCAL_REFERENCE = re.compile(r'''\b(?:src|href)\s*=\s*["']([^"'#?]+)''')
+
+
+async def fetch(app, path: str, headers: dict):
+    """直接调用ASGI应用，返回 (状态码, 响应头, 响应体字节数)"""
+    messages = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0', 'spec_version': '2.3'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+        'root_path': MOUNT, 'path': MOUNT + path, 'raw_path': (MOUNT + path).encode(), 'query_string': b'',
+        'headers': [(key.lower().encode(), value.encode()) for key, value in headers.items()]
+    }
+    await app(scope, receive, send)
+    disconnected.set()
+    start = next(m for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    response_headers = {key.decode().lower(): value.decode() for key, value in start['headers']}
+    return start['status'], response_headers, body
+
+
+def page_assets(html: str):
+    """index.html 中引用的本地资源路径"""
+    paths = []
+    for ref in _LOCAL_REFERENCE.findall(html):
+        if ref.startswith(('http:', 'https:', '//', 'data:')):
+            continue
+        paths.append('/' + (ref[len(MOUNT) + 1:] if ref.startswith(MOUNT + '/') else ref.lstrip('./')))
+    return paths
+
+
+async def page_load(app, accept_encoding: str, cache: dict):
+    """加载一次页面；cache为模拟的浏览器缓存（路径 -> 响应头），返回 (请求数, 传输字节数)"""
+    requests, transferred = 0, 0
+
+    async def get(path):
+        nonlocal requests, transferred
+        cached = cache.get(path)
+        if cached and 'immutable' in cached.get('cache-control', ''):
+            return cached['_body']
+        headers = {'accept-encoding': accept_encoding}
+        if cached and 'etag' in cached:
+            headers['if-none-match'] = cached['etag']
+        status, response_headers, body = await fetch(app, path, headers)
+        requests += 1
+        # 响应头按 "name: value\r\n" 计入传输量
+        transferred += len(body) + sum(len(k) + len(v) + 4 for k, v in response_headers.items())
+        if status == 304:
+            return cached['_body']
+        decoded = body
+        encoding = response_headers.get('content-encoding')
+        if encoding == 'gzip':
+            decoded = gzip.decompress(body)
+        elif encoding == 'br':
+            decoded = brotli.decompress(body)
+        cache[path] = dict(response_headers, _body=decoded)
+        return decoded
+
+    html = (await get('/')).decode('utf-8')
+    await asyncio.gather(*(get(path) for path in page_assets(html)))
+    return requests, transferred
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", help="资源目录（默认frontend/dist，不存在时为web）")
+    parser.add_argument("--encoding", default="gzip, deflate, br", help="浏览器的Accept-Encoding")
+    args = parser.parse_args()
+
+    with workspace() as tmp:
+        assets = StaticAssets({'out_dir': tmp / "static",
+                               **({'source_dir': args.source} if args.source else {})})
+        source = assets.source_dir()
+        started = time.perf_counter()
+        result = assets.build(source)
+        assets.load()
+        print(f"资源目录 {source}：{result['files']} 个文件，构建 {time.perf_counter() - started:.2f}s"
+              f"{'' if HAS_BROTLI else '（未安装brotli，只有gzip）'}")
+
+        apps = (("StaticFiles", StaticFiles(directory=str(source), html=True)),
+                ("指纹+预压缩", StaticAssetApp(assets)))
+        for label, app in apps:
+            cache = {}
+            first = asyncio.run(page_load(app, args.encoding, cache))
+            repeat = asyncio.run(page_load(app, args.encoding, cache))
+            print(f"{label:<12} 首次访问 {first[0]} 个请求 {first[1] / 1024:7.1f} KB；"
+                  f"再次访问 {repeat[0]} 个请求 {repeat[1] / 1024:7.2f} KB")
+
+
+if __name__ == "__main__":
+    main()
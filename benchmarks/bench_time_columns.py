@@ -0,0 +1,135 @@
+"""
+时间列基准测试 - 文本时间比较/strftime分组 vs consume_ts/consume_month整数生成列
+
+旧库的时间文本混有ISO带T、缺秒、斜杠等写法：按文本比较既慢又会漏数，迁移后全部走整数索引。
+
+用法：python benchmarks/bench_time_columns.py --rows 1000000 --users 100
+"""
+import calendar
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from _common import arg_parser, workspace, measure, insert_bills
+
+from src.database import ensure_model_columns, ensure_time_columns
+
+# 旧数据中出现过的时间写法及占比
+TIME_FORMATS = [('%Y-%m-%d %H:%M:%S', 0.85), ('%Y-%m-%dT%H:%M:%S', 0.08),
+                ('%Y-%m-%d %H:%M', 0.05), ('%Y/%m/%d %H:%M:%S', 0.02)]
+CATEGORIES = ["餐饮", "交通", "购物", "娱乐", "医疗", "教育", "其他"]
+
+RANGE_START, RANGE_END = '2024-03-01', '2024-05-31'
+YEAR = 2024
+
+
+def build_database(path: Path, rows: int, users: int):
+    """生成迁移前结构的测试库（最初版本的bills/invoices：时间为TEXT，没有merchant_id/bill_id列，只有user_id索引）"""
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE bills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            consume_time DATETIME NOT NULL,
+            amount REAL NOT NULL,
+            merchant TEXT NOT NULL,
+            category TEXT DEFAULT '未知',
+            payment_method TEXT NOT NULL,
+            location TEXT,
+            description TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_bills_user_id ON bills(user_id);
+        CREATE TABLE invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            invoice_time DATETIME NOT NULL,
+            amount REAL NOT NULL,
+            merchant TEXT NOT NULL,
+            invoice_type TEXT DEFAULT '未知',
+            ocr_text TEXT,
+            file_path TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.close()
+    rng = random.Random(42)
+    formats = [f for f, _ in TIME_FORMATS]
+    weights = [w for _, w in TIME_FORMATS]
+    start = datetime(2023, 1, 1)
+    insert_bills(path, ((rng.randint(1, users),
+                         (start + timedelta(minutes=rng.randint(0, 730 * 24 * 60))).strftime(
+                             rng.choices(formats, weights)[0]),
+                         round(rng.uniform(1, 800), 2), "商家", rng.choice(CATEGORIES), "微信")
+                        for _ in range(rows)))
+
+
+def old_queries(conn, user_id: int):
+    """迁移前的写法：文本比较日期范围 + strftime逐行分组"""
+    in_range = conn.execute(
+        "SELECT id, amount FROM bills WHERE user_id = ? AND consume_time >= ? AND consume_time <= ? "
+        "ORDER BY consume_time DESC", (user_id, RANGE_START, RANGE_END + " 23:59:59")
+    ).fetchall()
+    monthly = conn.execute(
+        "SELECT strftime('%m', consume_time) AS month, SUM(amount), COUNT(*) FROM bills "
+        "WHERE user_id = ? AND strftime('%Y', consume_time) = ? GROUP BY month ORDER BY month",
+        (user_id, str(YEAR))
+    ).fetchall()
+    return len(in_range), monthly
+
+
+def new_queries(conn, user_id: int):
+    """迁移后的写法：consume_ts范围 + consume_month分组，均走(user_id, 整数列)索引"""
+    start_ts = calendar.timegm(datetime.strptime(RANGE_START, '%Y-%m-%d').timetuple())
+    end_ts = calendar.timegm(datetime.strptime(RANGE_END, '%Y-%m-%d').timetuple()) + 86400
+    in_range = conn.execute(
+        "SELECT id, amount FROM bills WHERE user_id = ? AND consume_ts >= ? AND consume_ts < ? "
+        "ORDER BY consume_ts DESC", (user_id, start_ts, end_ts)
+    ).fetchall()
+    monthly = conn.execute(
+        "SELECT printf('%02d', consume_month % 100), SUM(amount), COUNT(*) FROM bills "
+        "WHERE user_id = ? AND consume_month BETWEEN ? AND ? GROUP BY consume_month ORDER BY consume_month",
+        (user_id, YEAR * 100 + 1, YEAR * 100 + 12)
+    ).fetchall()
+    return len(in_range), monthly
+
+
+def main():
+    args = arg_parser("时间列查询延迟对比", rows=1000000, users=100, repeat=5).parse_args()
+
+    with workspace() as tmp:
+        db_path = tmp / "bench.sqlite"
+        print(f"生成测试数据: {args.rows} 行账单, {args.users} 个用户 ...")
+        build_database(db_path, args.rows, args.users)
+
+        conn = sqlite3.connect(str(db_path))
+        old_ms = measure(lambda: old_queries(conn, 1), args.repeat)
+        old_count, old_monthly = old_queries(conn, 1)
+        conn.close()
+
+        # 与 init_database 相同的迁移顺序：先补普通列及其索引，再建时间生成列与索引
+        started = time.perf_counter()
+        added = ensure_model_columns(db_path)
+        rewritten = ensure_time_columns(db_path)
+        print(f"迁移（补 {len(added)} 个字段，改写 {rewritten['bills']} 行非规范时间、建生成列与索引）: "
+              f"{time.perf_counter() - started:.1f} s")
+
+        conn = sqlite3.connect(str(db_path))
+        new_ms = measure(lambda: new_queries(conn, 1), args.repeat)
+        new_count, new_monthly = new_queries(conn, 1)
+        conn.close()
+
+        print(f"\n{'写法':<12}{'耗时(ms)':>12}{'区间命中':>10}{'月份数':>8}{'全年笔数':>10}")
+        print(f"{'文本/strftime':<12}{old_ms:>12.2f}{old_count:>10}{len(old_monthly):>8}"
+              f"{sum(r[2] for r in old_monthly):>10}")
+        print(f"{'整数生成列':<12}{new_ms:>12.2f}{new_count:>10}{len(new_monthly):>8}"
+              f"{sum(r[2] for r in new_monthly):>10}")
+        print(f"加速比: {old_ms / new_ms:.1f}x（文本比较漏掉的行数: {new_count - old_count}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,92 +5,84 @@ import sqlite3
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
-def get_bills_simple(user_id: int = 1, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-    """使用直接SQL查询获取账单，避免SQLAlchemy会话问题"""
-    conn = sqlite3.connect("data/bill_db.sqlite")
-    conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
+from src.database import get_sqlite_connection
+from src.data_cleaning import data_cleaner
+from src.merchant_index import merchant_index
+from src.sharding import shard_router
+from src.records import BillRecord, BILL_SELECT, bill_records
+
+def get_bills_simple(user_id: int = 1, limit: int = 100, offset: int = 0,
+                     start_ts: int = None, end_ts: int = None) -> List[BillRecord]:
+    """使用直接SQL查询获取账单，避免SQLAlchemy会话问题
+
+    start_ts/end_ts 为秒级时间戳（DataCleaner.to_epoch），区间左闭右开，走 (user_id, consume_ts) 索引。
+    返回只读记录 BillRecord（按属性取值，如 bill.amount）；需要字典时调用 bill.to_dict()。
+    """
+    conn = shard_router.connect(user_id)
     cursor = conn.cursor()
     
+    conditions = ["user_id = ?"]
+    params = [user_id]
+    if start_ts is not None:
+        conditions.append("consume_ts >= ?")
+        params.append(start_ts)
+    if end_ts is not None:
+        conditions.append("consume_ts < ?")
+        params.append(end_ts)
+    
     try:
-        cursor.execute("""
-            SELECT id, user_id, consume_time, amount, merchant, category, 
-                   payment_method, location, description, created_at, updated_at
+        cursor.execute(f"""
+            SELECT {BILL_SELECT}
             FROM bills 
-            WHERE user_id = ? 
-            ORDER BY consume_time DESC 
+            WHERE {" AND ".join(conditions)}
+            ORDER BY consume_ts DESC 
             LIMIT ? OFFSET ?
-        """, (user_id, limit, offset))
+        """, params + [limit, offset])
         
-        bills = []
-        for row in cursor.fetchall():
-            bills.append({
-                'id': row['id'],
-                'user_id': row['user_id'],
-                'consume_time': row['consume_time'],
-                'amount': row['amount'],
-                'merchant': row['merchant'],
-                'category': row['category'],
-                'payment_method': row['payment_method'],
-                'location': row['location'],
-                'description': row['description'],
-                'created_at': row['created_at'],
-                'updated_at': row['updated_at']
-            })
-        
-        return bills
+        # 游标行直接构造只读记录，不再逐行拷贝成字典
+        return bill_records(cursor.fetchall())
         
     finally:
         conn.close()
 
-def get_bill_by_id(bill_id: int) -> Optional[Dict[str, Any]]:
-    """根据ID获取账单"""
-    conn = sqlite3.connect("data/bill_db.sqlite")
-    conn.row_factory = sqlite3.Row
+def get_bill_by_id(bill_id: int, user_id: int = None) -> Optional[BillRecord]:
+    """根据ID获取账单（user_id用于定位分片，不确定时各分片依次查找），返回 BillRecord 或 None"""
+    return shard_router.locate(lambda path: _get_bill_at(path, bill_id), user_id)
+
+def _get_bill_at(db_path, bill_id: int) -> Optional[BillRecord]:
+    conn = get_sqlite_connection(db_path)
     cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            SELECT id, user_id, consume_time, amount, merchant, category, 
-                   payment_method, location, description, created_at, updated_at
+        cursor.execute(f"""
+            SELECT {BILL_SELECT}
             FROM bills 
             WHERE id = ?
         """, (bill_id,))
         
         row = cursor.fetchone()
-        if row:
-            return {
-                'id': row['id'],
-                'user_id': row['user_id'],
-                'consume_time': row['consume_time'],
-                'amount': row['amount'],
-                'merchant': row['merchant'],
-                'category': row['category'],
-                'payment_method': row['payment_method'],
-                'location': row['location'],
-                'description': row['description'],
-                'created_at': row['created_at'],
-                'updated_at': row['updated_at']
-            }
-        return None
+        return BillRecord(*row) if row else None
         
     finally:
         conn.close()
 
 def create_bill_simple(bill_data: Dict[str, Any]) -> int:
-    """创建账单记录"""
-    conn = sqlite3.connect("data/bill_db.sqlite")
+    """创建账单记录（分片模式下使用全局id，否则id为NULL由SQLite自增）"""
+    conn = shard_router.connect(bill_data['user_id'])
     cursor = conn.cursor()
     
     try:
         cursor.execute("""
-            INSERT INTO bills (user_id, consume_time, amount, merchant, category, 
+            INSERT INTO bills (id, user_id, consume_time, amount, merchant, merchant_id, category, 
                              payment_method, location, description, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
+            shard_router.next_id('bills') if shard_router.sharded else None,
             bill_data['user_id'],
-            bill_data['consume_time'],
+            data_cleaner.normalize_time_text(bill_data['consume_time']),
             bill_data['amount'],
             bill_data['merchant'],
+            merchant_index.resolve(bill_data['merchant']),
             bill_data['category'],
             bill_data['payment_method'],
             bill_data.get('location'),
@@ -107,7 +99,7 @@ def create_bill_simple(bill_data: Dict[str, Any]) -> int:
 
 def get_spending_summary_simple(user_id: int = 1) -> Dict[str, Any]:
     """获取消费汇总"""
-    conn = sqlite3.connect("data/bill_db.sqlite")
+    conn = shard_router.connect(user_id)
     cursor = conn.cursor()
     
     try:
@@ -172,7 +164,7 @@ def test_fixed_functions():
     bills = get_bills_simple(user_id=1, limit=5)
     print(f"获取账单: {len(bills)} 条")
     for bill in bills[:3]:
-        print(f"  {bill['merchant']} - {bill['amount']}元 - {bill['category']}")
+        print(f"  {bill.merchant} - {bill.amount}元 - {bill.category}")
     
     # 测试消费汇总
     summary = get_spending_summary_simple(user_id=1)
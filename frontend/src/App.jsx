@@ -10,8 +10,9 @@ import Community from './pages/Community'
 import Health from './pages/Health'
 
 function App() {
+  // 构建产物由后端挂载在 /app 下（vite.config.js 的 base），开发服务器下为 /
   return (
-    <BrowserRouter>
+    <BrowserRouter basename={import.meta.env.BASE_URL}>
       <Routes>
         <Route path="/" element={<MainLayout />}>
           <Route index element={<Navigate to="/dashboard" replace />} />
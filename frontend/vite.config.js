@@ -1,7 +1,9 @@
 import { defineConfig } from 'vite'
 import react from '@vitejs/plugin-react'
 
-export default defineConfig({
+export default defineConfig(({ command }) => ({
+  // 构建产物由后端在 /app 下提供（带哈希的文件名 + 预压缩，见 src/static_assets.py）
+  base: command === 'build' ? '/app/' : '/',
   plugins: [react()],
   server: {
     port: 3000,
@@ -24,5 +26,4 @@ export default defineConfig({
       transformMixedEsModules: true
     }
   }
-})
-
+}))
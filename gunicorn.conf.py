@@ -0,0 +1,54 @@
+"""
+gunicorn 生产配置 - 预加载应用后fork多个uvicorn worker
+
+用法：gunicorn -c gunicorn.conf.py src.main:app
+     或 python run_server.py --prod --workers 4
+"""
+import gc
+import os
+
+from src.config import HOST, PORT, SERVER_CONFIG
+
+bind = os.getenv("BIND", f"{HOST}:{PORT}")
+workers = SERVER_CONFIG["workers"]
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# 主进程先导入应用（发票分类器、jieba词典等在import时加载），worker以写时复制共享这些内存页
+preload_app = True
+
+timeout = SERVER_CONFIG["timeout"]
+graceful_timeout = SERVER_CONFIG["graceful_timeout"]
+keepalive = SERVER_CONFIG["keepalive"]
+max_requests = SERVER_CONFIG["max_requests"]
+max_requests_jitter = SERVER_CONFIG["max_requests_jitter"]
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+
+def when_ready(server):
+    """应用已预加载、即将fork worker"""
+    from src.main import prepare_storage
+    from src.analytics_engine import analytics_engine
+
+    # 建表/建索引在主进程做一次，避免多个worker同时全量建索引
+    prepare_storage()
+    if analytics_engine.enabled and server.num_workers > 1:
+        server.log.warning("DuckDB分析库只允许单进程写入，多worker时请使用 ANALYTICS_BACKEND=sqlite")
+
+    # 把预加载的对象移出GC跟踪，避免worker中的垃圾回收触碰这些页面导致写时复制失效
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"应用已预加载，冻结对象数: {gc.get_freeze_count()}，启动 {server.num_workers} 个worker")
+
+
+def post_fork(server, worker):
+    """worker进程启动后丢弃继承的数据库连接"""
+    from src.database import dispose_engine_after_fork
+
+    dispose_engine_after_fork()
+
+
+def worker_exit(server, worker):
+    server.log.info(f"worker {worker.pid} 已退出")
@@ -4,131 +4,33 @@
 """
 import sqlite3
 import json
-import re
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 
-DB_PATH = Path(__file__).parent / 'data' / 'bill_db.sqlite'
+from load_financial_data import (
+    DB_PATH, FINANCIAL_COLUMNS, LOAN_COLUMNS, FINANCIAL_KEY, LOAN_KEY,
+    parse_financial_products_from_sql, parse_loan_products_from_sql, upsert_products
+)
 
-def parse_wealth_management_sql(sql_file: Path) -> List[Dict[str, Any]]:
-    """解析理财产品SQL文件（MySQL格式转SQLite）"""
-    products = []
-    
-    if not sql_file.exists():
-        print(f"文件不存在: {sql_file}")
-        return products
-    
-    with open(sql_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 提取INSERT语句中的数据
-    insert_pattern = r"INSERT INTO financial_products\s*\([^)]+\)\s*VALUES\s*(.+?);"
-    matches = re.findall(insert_pattern, content, re.DOTALL | re.IGNORECASE)
-    
-    for match in matches:
-        # 解析每一行数据
-        rows = re.findall(r"\(([^)]+)\)", match)
-        for row in rows:
-            try:
-                # 简单的字段解析（需要根据实际SQL调整）
-                fields = [f.strip().strip("'\"") for f in row.split(',')]
-                if len(fields) >= 10:
-                    products.append({
-                        'product_type': fields[2] if len(fields) > 2 else '理财',
-                        'product_name': fields[1] if len(fields) > 1 else fields[0],
-                        'interest_rate': float(fields[7]) if len(fields) > 7 and fields[7] else None,
-                        'min_amount': float(fields[9]) if len(fields) > 9 else 100.0,
-                        'max_amount': float(fields[10]) if len(fields) > 10 else 1000000.0,
-                        'term_months': int(fields[12]) // 30 if len(fields) > 12 else 12,
-                        'risk_level': fields[5].lower() if len(fields) > 5 else 'medium',
-                        'description': fields[0] if len(fields) > 0 else ''
-                    })
-            except Exception as e:
-                print(f"解析行失败: {row[:50]}... 错误: {e}")
-                continue
-    
-    return products
+def parse_wealth_management_sql(sql_file: Path) -> Iterator[Dict[str, Any]]:
+    """流式解析理财产品SQL文件（MySQL格式转SQLite）"""
+    return parse_financial_products_from_sql(sql_file)
 
-def parse_loan_sql(sql_file: Path) -> List[Dict[str, Any]]:
-    """解析贷款产品SQL文件（MySQL格式转SQLite）"""
-    products = []
-    
-    if not sql_file.exists():
-        print(f"文件不存在: {sql_file}")
-        return products
-    
-    with open(sql_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 提取INSERT语句中的数据
-    insert_pattern = r"INSERT INTO loan_products\s*\([^)]+\)\s*VALUES\s*(.+?);"
-    matches = re.findall(insert_pattern, content, re.DOTALL | re.IGNORECASE)
-    
-    for match in matches:
-        rows = re.findall(r"\(([^)]+)\)", match)
-        for row in rows:
-            try:
-                # 解析字段
-                fields = [f.strip().strip("'\"") for f in row.split(',')]
-                if len(fields) >= 7:
-                    # eligibility_criteria 可能是JSON字符串
-                    eligibility = fields[7] if len(fields) > 7 else '{}'
-                    try:
-                        json.loads(eligibility)
-                    except:
-                        eligibility = '{}'
-                    
-                    products.append({
-                        'name': fields[0],
-                        'description': fields[1] if len(fields) > 1 else '',
-                        'interest_rate': float(fields[2]) if len(fields) > 2 else 6.0,
-                        'term_min': int(fields[3]) if len(fields) > 3 else 12,
-                        'term_max': int(fields[4]) if len(fields) > 4 else 60,
-                        'amount_min': float(fields[5]) if len(fields) > 5 else 10000.0,
-                        'amount_max': float(fields[6]) if len(fields) > 6 else 500000.0,
-                        'eligibility_criteria': eligibility
-                    })
-            except Exception as e:
-                print(f"解析行失败: {row[:50]}... 错误: {e}")
-                continue
-    
-    return products
+def parse_loan_sql(sql_file: Path) -> Iterator[Dict[str, Any]]:
+    """流式解析贷款产品SQL文件（MySQL格式转SQLite）"""
+    return parse_loan_products_from_sql(sql_file)
+
+def find_sql_file(paths: List[Path]) -> Optional[Path]:
+    """候选路径中第一个存在的SQL文件"""
+    return next((path for path in paths if path.exists()), None)
 
-def load_from_sql_files() -> tuple[List[Dict], List[Dict]]:
-    """从SQL文件加载数据"""
+def sql_file_paths() -> Dict[str, List[Path]]:
+    """SQL文件的候选路径（尝试多个可能的位置）"""
     base_dir = Path(__file__).parent
-    
-    # 尝试多个可能的路径
-    wealth_sql_paths = [
-        base_dir / 'wealth_management_db.sql',
-        base_dir / 'data' / 'wealth_management_db.sql',
-    ]
-    
-    loan_sql_paths = [
-        base_dir / 'loan_db.sql',
-        base_dir / 'data' / 'loan_db.sql',
-    ]
-    
-    financial_products = []
-    loan_products = []
-    
-    # 加载理财产品
-    for path in wealth_sql_paths:
-        if path.exists():
-            print(f"从 {path} 加载理财产品...")
-            financial_products = parse_wealth_management_sql(path)
-            if financial_products:
-                break
-    
-    # 加载贷款产品
-    for path in loan_sql_paths:
-        if path.exists():
-            print(f"从 {path} 加载贷款产品...")
-            loan_products = parse_loan_sql(path)
-            if loan_products:
-                break
-    
-    return financial_products, loan_products
+    return {
+        'wealth': [base_dir / 'wealth_management_db.sql', base_dir / 'data' / 'wealth_management_db.sql'],
+        'loan': [base_dir / 'loan_db.sql', base_dir / 'data' / 'loan_db.sql'],
+    }
 
 def get_default_financial_products() -> List[Dict[str, Any]]:
     """生成默认理财产品数据（如果SQL文件解析失败）"""
@@ -260,75 +162,31 @@ def load_to_database():
     print(f"  贷款产品: {existing_loan} 条")
     print(f"  账单数据: {existing_bills} 条")
     
-    # 从SQL文件加载数据
-    financial_products, loan_products = load_from_sql_files()
-    
-    # 如果SQL文件解析失败或数据不够，使用默认数据
-    if not financial_products:
-        print("\n未找到或无法解析理财产品SQL文件，使用默认数据...")
-        financial_products = get_default_financial_products()
-    
-    if not loan_products:
-        print("\n未找到或无法解析贷款产品SQL文件，使用默认数据...")
-        loan_products = get_default_loan_products()
-    
-    print(f"\n准备导入:")
-    print(f"  理财产品: {len(financial_products)} 条")
-    print(f"  贷款产品: {len(loan_products)} 条")
-    
-    # 导入理财产品（如果现有数据少于10条，则导入）
-    if existing_financial < 10:
-        print(f"\n导入理财产品（现有 {existing_financial} 条，目标至少 10 条）...")
-        for product in financial_products:
-            try:
-                cur.execute("""
-                INSERT OR IGNORE INTO financial_products 
-                (product_type, product_name, interest_rate, min_amount, max_amount, term_months, risk_level, description)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    product['product_type'],
-                    product['product_name'],
-                    product['interest_rate'],
-                    product['min_amount'],
-                    product['max_amount'],
-                    product['term_months'],
-                    product['risk_level'],
-                    product['description']
-                ))
-            except Exception as e:
-                print(f"导入理财产品失败: {product.get('product_name', '未知')}, 错误: {e}")
-        
-        conn.commit()
-        print(f"理财产品导入完成")
-    else:
-        print(f"\n理财产品已有 {existing_financial} 条，跳过导入")
-    
-    # 导入贷款产品（如果现有数据少于10条，则导入）
-    if existing_loan < 10:
-        print(f"\n导入贷款产品（现有 {existing_loan} 条，目标至少 10 条）...")
-        for product in loan_products:
+    # 从SQL文件边解析边导入（现有数据少于10条时），解析不到数据时使用默认数据
+    paths = sql_file_paths()
+    sources = [
+        ('理财产品', 'financial_products', FINANCIAL_COLUMNS, FINANCIAL_KEY, find_sql_file(paths['wealth']),
+         parse_wealth_management_sql, get_default_financial_products, existing_financial),
+        ('贷款产品', 'loan_products', LOAN_COLUMNS, LOAN_KEY, find_sql_file(paths['loan']),
+         parse_loan_sql, get_default_loan_products, existing_loan),
+    ]
+    for label, table, columns, key, sql_file, parse, defaults, existing in sources:
+        if existing >= 10:
+            print(f"\n{label}已有 {existing} 条，跳过导入")
+            continue
+        print(f"\n导入{label}（现有 {existing} 条，目标至少 10 条）...")
+        counts = {'rows': 0, 'inserted': 0, 'updated': 0}
+        if sql_file is not None:
+            print(f"从 {sql_file} 加载{label}...")
             try:
-                cur.execute("""
-                INSERT OR IGNORE INTO loan_products
-                (name, description, interest_rate, term_min, term_max, amount_min, amount_max, eligibility_criteria)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    product['name'],
-                    product['description'],
-                    product['interest_rate'],
-                    product['term_min'],
-                    product['term_max'],
-                    product['amount_min'],
-                    product['amount_max'],
-                    product['eligibility_criteria']
-                ))
-            except Exception as e:
-                print(f"导入贷款产品失败: {product.get('name', '未知')}, 错误: {e}")
-        
-        conn.commit()
-        print(f"贷款产品导入完成")
-    else:
-        print(f"\n贷款产品已有 {existing_loan} 条，跳过导入")
+                counts = upsert_products(conn, table, columns, key, parse(sql_file))
+            except (ValueError, UnicodeDecodeError) as e:
+                print(f"解析 {sql_file.name} 失败: {e}")
+        if counts['rows'] == 0:
+            print(f"未找到或无法解析{label}SQL文件，使用默认数据...")
+            counts = upsert_products(conn, table, columns, key, defaults())
+        print(f"解析 {counts['rows']} 条，新增 {counts['inserted']} 条，更新 {counts['updated']} 条")
+        print(f"{label}导入完成")
     
     # 检查账单数据
     if existing_bills < 100:
@@ -1,183 +1,120 @@
 """
 从已有SQL文件加载金融产品和贷款产品数据
 优先使用SQL文件中的数据，如果不够则补充虚拟数据
+
+SQL文件按块流式解析（src/mysql_dump.py），内存占用与文件大小无关，按产品名批量upsert
 """
 import sqlite3
 import json
-import re
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 
-DB_PATH = Path(__file__).parent / 'data' / 'bill_db.sqlite'
+from src.config import DATABASE_PATH
+from src.mysql_dump import MySQLDumpReader, ProgressReporter, bulk_upsert
 
-def parse_financial_products_from_sql(sql_file: Path) -> List[Dict[str, Any]]:
-    """从SQL文件解析理财产品数据"""
-    products = []
-    
+DB_PATH = DATABASE_PATH
+
+# 目标表的写入列与业务键
+FINANCIAL_COLUMNS = ['product_type', 'product_name', 'interest_rate', 'min_amount', 'max_amount',
+                     'term_months', 'risk_level', 'description']
+LOAN_COLUMNS = ['name', 'description', 'interest_rate', 'term_min', 'term_max', 'amount_min',
+                'amount_max', 'eligibility_criteria']
+FINANCIAL_KEY = ['product_name']
+LOAN_KEY = ['name']
+
+# 风险等级转换 R1-R5 -> low/medium/high
+RISK_MAP = {'R1': 'low', 'R2': 'low', 'R3': 'medium', 'R4': 'high', 'R5': 'high'}
+
+
+def _number(value, default: float) -> float:
+    return float(value) if value not in (None, '') else default
+
+
+def map_financial_product(record: Dict[str, Any]) -> Dict[str, Any]:
+    """wealth_management_db.financial_products 一行 -> 本地理财产品"""
+    display_name = record.get('display_name') or record.get('product_name')
+    # 收益率取历史收益率，没有则取业绩基准中值
+    benchmark_min = _number(record.get('benchmark_min'), 0.0)
+    benchmark_max = _number(record.get('benchmark_max'), 0.0)
+    historical_return = _number(record.get('historical_return'), 0.0)
+    interest_rate = historical_return if historical_return > 0 else (benchmark_min + benchmark_max) / 2
+    # 转换为百分比（如果小于1则乘以100）
+    if interest_rate < 1:
+        interest_rate = interest_rate * 100
+
+    purchase_threshold = _number(record.get('purchase_threshold'), 100.0)
+    lock_period = int(_number(record.get('lock_period'), 0))
+    return {
+        'product_type': record.get('product_type') or '理财',
+        'product_name': display_name,
+        'interest_rate': round(interest_rate, 2),
+        'min_amount': purchase_threshold,
+        'max_amount': purchase_threshold * 10000,  # 估算最大金额
+        'term_months': max(lock_period // 30, 12) if lock_period > 0 else 12,
+        'risk_level': RISK_MAP.get(record.get('risk_level'), 'medium'),
+        'description': record.get('product_description') or display_name
+    }
+
+
+def map_loan_product(record: Dict[str, Any]) -> Dict[str, Any]:
+    """loan_db.loan_products 一行 -> 本地贷款产品"""
+    eligibility = record.get('eligibility_criteria') or '{}'
+    # 验证JSON格式
+    try:
+        json.loads(eligibility)
+    except (TypeError, ValueError):
+        eligibility = '{}'
+    return {
+        'name': record['name'],
+        'description': record.get('description') or '',
+        'interest_rate': _number(record.get('interest_rate'), 6.0),
+        'term_min': int(_number(record.get('term_min'), 12)),
+        'term_max': int(_number(record.get('term_max'), 60)),
+        'amount_min': _number(record.get('amount_min'), 10000.0),
+        'amount_max': _number(record.get('amount_max'), 500000.0),
+        'eligibility_criteria': eligibility
+    }
+
+
+def iter_products(reader: MySQLDumpReader, table: str, mapper) -> Iterator[Dict[str, Any]]:
+    """流式读取导出文件中某张表的行，按列名映射为本地产品"""
+    for _, columns, values in reader.iter_rows([table]):
+        record = dict(zip(columns, values))
+        try:
+            yield mapper(record)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"解析失败: {str(values[0])[:50] if values else '未知'}, 错误: {e}")
+
+
+def parse_financial_products_from_sql(sql_file: Path) -> Iterator[Dict[str, Any]]:
+    """从SQL文件流式解析理财产品数据（生成器，直接交给 upsert_products，不整体驻留内存）"""
     if not sql_file.exists():
         print(f"文件不存在: {sql_file}")
-        return products
-    
-    with open(sql_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 提取INSERT语句
-    insert_match = re.search(r"INSERT INTO financial_products[^;]+VALUES\s*(.+?);", content, re.DOTALL | re.IGNORECASE)
-    if not insert_match:
-        print("未找到INSERT语句")
-        return products
-    
-    # 解析每一行数据
-    rows_text = insert_match.group(1)
-    # 移除注释行
-    rows_text = re.sub(r'--[^\n]*\n', '\n', rows_text)
-    
-    # 解析每个括号内的数据
-    row_pattern = r"\(([^)]+)\)"
-    for row_match in re.finditer(row_pattern, rows_text):
-        row = row_match.group(1)
-        
-        # 处理字段值（考虑引号内的逗号）
-        fields = []
-        current_field = ""
-        in_quotes = False
-        quote_char = None
-        
-        for char in row:
-            if char in ["'", '"'] and not in_quotes:
-                in_quotes = True
-                quote_char = char
-                current_field += char
-            elif char == quote_char and in_quotes:
-                in_quotes = False
-                quote_char = None
-                current_field += char
-            elif char == ',' and not in_quotes:
-                fields.append(current_field.strip())
-                current_field = ""
-            else:
-                current_field += char
-        
-        if current_field:
-            fields.append(current_field.strip())
-        
-        # 解析字段
-        if len(fields) >= 10:
-            try:
-                # 字段顺序：product_name, display_name, product_type, issuer, product_code, 
-                # risk_level, benchmark_min, benchmark_max, historical_return, ...
-                display_name = fields[1].strip("'\"") if len(fields) > 1 else fields[0].strip("'\"")
-                product_type = fields[2].strip("'\"") if len(fields) > 2 else '理财'
-                
-                # 风险等级转换 R1-R5 -> low/medium/high
-                risk_level_str = fields[5].strip("'\"") if len(fields) > 5 else 'R2'
-                risk_map = {'R1': 'low', 'R2': 'low', 'R3': 'medium', 'R4': 'high', 'R5': 'high'}
-                risk_level = risk_map.get(risk_level_str, 'medium')
-                
-                # 解析收益率（取中间值或历史收益率）
-                benchmark_min = float(fields[6]) if len(fields) > 6 and fields[6] != 'NULL' else 0.0
-                benchmark_max = float(fields[7]) if len(fields) > 7 and fields[7] != 'NULL' else 0.0
-                historical_return = float(fields[8]) if len(fields) > 8 and fields[8] != 'NULL' else 0.0
-                interest_rate = historical_return if historical_return > 0 else (benchmark_min + benchmark_max) / 2
-                
-                # 转换为百分比（如果小于1则乘以100）
-                if interest_rate < 1:
-                    interest_rate = interest_rate * 100
-                
-                purchase_threshold = float(fields[9]) if len(fields) > 9 and fields[9] != 'NULL' else 100.0
-                lock_period = int(float(fields[11])) if len(fields) > 11 and fields[11] != 'NULL' else 0
-                term_months = max(lock_period // 30, 12) if lock_period > 0 else 12
-                
-                description = fields[18].strip("'\"") if len(fields) > 18 else display_name
-                
-                products.append({
-                    'product_type': product_type,
-                    'product_name': display_name,
-                    'interest_rate': round(interest_rate, 2),
-                    'min_amount': purchase_threshold,
-                    'max_amount': purchase_threshold * 10000,  # 估算最大金额
-                    'term_months': term_months,
-                    'risk_level': risk_level,
-                    'description': description
-                })
-            except Exception as e:
-                print(f"解析失败: {fields[0][:50] if fields else '未知'}, 错误: {e}")
-                continue
-    
-    return products
+        return
+    yield from iter_products(MySQLDumpReader(sql_file), 'financial_products', map_financial_product)
 
-def parse_loan_products_from_sql(sql_file: Path) -> List[Dict[str, Any]]:
-    """从SQL文件解析贷款产品数据"""
-    products = []
-    
+
+def parse_loan_products_from_sql(sql_file: Path) -> Iterator[Dict[str, Any]]:
+    """从SQL文件流式解析贷款产品数据（生成器，直接交给 upsert_products，不整体驻留内存）"""
     if not sql_file.exists():
         print(f"文件不存在: {sql_file}")
-        return products
-    
-    with open(sql_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 提取INSERT语句
-    insert_match = re.search(r"INSERT INTO loan_products[^;]+VALUES\s*(.+?);", content, re.DOTALL | re.IGNORECASE)
-    if not insert_match:
-        print("未找到INSERT语句")
-        return products
-    
-    # 解析每一行
-    rows_text = insert_match.group(1)
-    row_pattern = r"\(([^)]+)\)"
-    
-    for row_match in re.finditer(row_pattern, rows_text):
-        row = row_match.group(1)
-        
-        # 处理字段值
-        fields = []
-        current_field = ""
-        in_quotes = False
-        quote_char = None
-        
-        for char in row:
-            if char in ["'", '"'] and not in_quotes:
-                in_quotes = True
-                quote_char = char
-                current_field += char
-            elif char == quote_char and in_quotes:
-                in_quotes = False
-                quote_char = None
-                current_field += char
-            elif char == ',' and not in_quotes:
-                fields.append(current_field.strip())
-                current_field = ""
-            else:
-                current_field += char
-        
-        if current_field:
-            fields.append(current_field.strip())
-        
-        if len(fields) >= 7:
-            try:
-                eligibility = fields[7].strip("'\"") if len(fields) > 7 else '{}'
-                # 验证JSON格式
-                try:
-                    json.loads(eligibility)
-                except:
-                    eligibility = '{}'
-                
-                products.append({
-                    'name': fields[0].strip("'\""),
-                    'description': fields[1].strip("'\""),
-                    'interest_rate': float(fields[2]) if fields[2] != 'NULL' else 6.0,
-                    'term_min': int(float(fields[3])) if fields[3] != 'NULL' else 12,
-                    'term_max': int(float(fields[4])) if fields[4] != 'NULL' else 60,
-                    'amount_min': float(fields[5]) if fields[5] != 'NULL' else 10000.0,
-                    'amount_max': float(fields[6]) if fields[6] != 'NULL' else 500000.0,
-                    'eligibility_criteria': eligibility
-                })
-            except Exception as e:
-                print(f"解析失败: {fields[0][:50] if fields else '未知'}, 错误: {e}")
-                continue
-    
-    return products
+        return
+    yield from iter_products(MySQLDumpReader(sql_file), 'loan_products', map_loan_product)
+
+
+def upsert_products(conn, table: str, columns: List[str], key: List[str],
+                    products, progress=None) -> Dict[str, int]:
+    """按产品名批量upsert（每批一个事务）"""
+    rows = (tuple(product[c] for c in columns) for product in products)
+    return bulk_upsert(conn, table, columns, rows, key, progress=progress)
+
+
+def import_sql_file(conn, sql_file: Path, table: str, mapper, columns: List[str],
+                    key: List[str]) -> Dict[str, int]:
+    """边解析边导入，返回 {'rows', 'inserted', 'updated'}"""
+    reader = MySQLDumpReader(sql_file)
+    return upsert_products(conn, table, columns, key, iter_products(reader, table, mapper),
+                           ProgressReporter(reader, table))
 
 def get_default_financial_products() -> List[Dict[str, Any]]:
     """默认理财产品（当SQL解析失败时使用）"""
@@ -265,88 +202,28 @@ def load_financial_data():
     print(f"  贷款产品: {existing_loan} 条")
     print(f"  账单数据: {existing_bills} 条")
     
-    # 从SQL文件加载数据
-    financial_products = []
-    loan_products = []
-    
-    if wealth_sql.exists() and existing_financial < 20:
-        print(f"\n从 {wealth_sql.name} 加载理财产品...")
-        financial_products = parse_financial_products_from_sql(wealth_sql)
-        print(f"解析到 {len(financial_products)} 条理财产品")
-    
-    if loan_sql.exists() and existing_loan < 20:
-        print(f"\n从 {loan_sql.name} 加载贷款产品...")
-        loan_products = parse_loan_products_from_sql(loan_sql)
-        print(f"解析到 {len(loan_products)} 条贷款产品")
-    
-    # 如果解析失败或数据不够，使用默认数据
-    if not financial_products and existing_financial < 10:
-        print("\n使用默认理财产品数据...")
-        financial_products = get_default_financial_products()
-    
-    if not loan_products and existing_loan < 10:
-        print("\n使用默认贷款产品数据...")
-        loan_products = get_default_loan_products()
-    
-    # 导入理财产品
-    if financial_products and existing_financial < 20:
-        print(f"\n导入理财产品...")
-        imported = 0
-        for product in financial_products:
+    # 从SQL文件导入（按产品名upsert，重复运行不会产生重复数据）
+    sources = [
+        ('理财产品', wealth_sql, 'financial_products', map_financial_product, FINANCIAL_COLUMNS,
+         FINANCIAL_KEY, get_default_financial_products, existing_financial),
+        ('贷款产品', loan_sql, 'loan_products', map_loan_product, LOAN_COLUMNS,
+         LOAN_KEY, get_default_loan_products, existing_loan),
+    ]
+    for label, sql_file, table, mapper, columns, key, defaults, existing in sources:
+        counts = {'rows': 0, 'inserted': 0, 'updated': 0}
+        if sql_file.exists():
+            print(f"\n从 {sql_file.name} 导入{label}...")
             try:
-                cur.execute("""
-                INSERT OR IGNORE INTO financial_products 
-                (product_type, product_name, interest_rate, min_amount, max_amount, term_months, risk_level, description)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    product['product_type'],
-                    product['product_name'],
-                    product['interest_rate'],
-                    product['min_amount'],
-                    product['max_amount'],
-                    product['term_months'],
-                    product['risk_level'],
-                    product['description']
-                ))
-                if cur.rowcount > 0:
-                    imported += 1
-            except Exception as e:
-                print(f"导入失败: {product.get('product_name', '未知')}, 错误: {e}")
+                counts = import_sql_file(conn, sql_file, table, mapper, columns, key)
+            except (ValueError, UnicodeDecodeError) as e:
+                print(f"解析 {sql_file.name} 失败: {e}")
         
-        conn.commit()
-        print(f"成功导入 {imported} 条理财产品")
-    else:
-        print(f"\n理财产品已有 {existing_financial} 条，无需导入")
-    
-    # 导入贷款产品
-    if loan_products and existing_loan < 20:
-        print(f"\n导入贷款产品...")
-        imported = 0
-        for product in loan_products:
-            try:
-                cur.execute("""
-                INSERT OR IGNORE INTO loan_products
-                (name, description, interest_rate, term_min, term_max, amount_min, amount_max, eligibility_criteria)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    product['name'],
-                    product['description'],
-                    product['interest_rate'],
-                    product['term_min'],
-                    product['term_max'],
-                    product['amount_min'],
-                    product['amount_max'],
-                    product['eligibility_criteria']
-                ))
-                if cur.rowcount > 0:
-                    imported += 1
-            except Exception as e:
-                print(f"导入失败: {product.get('name', '未知')}, 错误: {e}")
+        # 如果解析失败或数据不够，使用默认数据
+        if counts['rows'] == 0 and existing < 10:
+            print(f"\n使用默认{label}数据...")
+            counts = upsert_products(conn, table, columns, key, defaults())
         
-        conn.commit()
-        print(f"成功导入 {imported} 条贷款产品")
-    else:
-        print(f"\n贷款产品已有 {existing_loan} 条，无需导入")
+        print(f"{label}: 解析 {counts['rows']} 条，新增 {counts['inserted']} 条，更新 {counts['updated']} 条")
     
     # 最终统计
     cur.execute("SELECT COUNT(*) FROM financial_products")
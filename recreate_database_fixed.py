@@ -3,15 +3,20 @@
 """
 import sqlite3
 import os
-import shutil
 from datetime import datetime
 
 def backup_existing_database():
-    """备份现有数据库"""
+    """备份现有数据库（SQLite在线备份，服务运行中也能得到一致副本；直接拷贝文件可能拷到写了一半的页）"""
     db_path = "data/bill_db.sqlite"
     if os.path.exists(db_path):
         backup_path = f"data/bill_db_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sqlite"
-        shutil.copy2(db_path, backup_path)
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(backup_path)
+        try:
+            src.backup(dst, pages=256, sleep=0.005)
+        finally:
+            dst.close()
+            src.close()
         print(f"数据库已备份到: {backup_path}")
         return backup_path
     return None
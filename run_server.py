@@ -1,6 +1,10 @@
 """
 启动服务器脚本
+
+开发模式（单进程、热重载）：python run_server.py
+生产模式（预fork多worker）：python run_server.py --prod --workers 4
 """
+import argparse
 import uvicorn
 import sys
 import os
@@ -8,18 +12,45 @@ import os
 # 添加src目录到Python路径
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.config import HOST, PORT
+from src.config import HOST, PORT, SERVER_CONFIG
+
+
+def run_production(workers: int):
+    """gunicorn + UvicornWorker；不支持gunicorn的平台（Windows）退回uvicorn多进程"""
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    try:
+        import gunicorn  # noqa: F401
+        has_gunicorn = os.name != "nt"
+    except ImportError:
+        has_gunicorn = False
+
+    if has_gunicorn:
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", config_path, "src.main:app"])
+
+    print("Warning: gunicorn不可用，使用uvicorn多进程模式（无预加载共享）")
+    uvicorn.run("src.main:app", host=HOST, port=PORT, workers=workers, log_level="info")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动账单查询与管理系统")
+    parser.add_argument("--prod", action="store_true", help="生产模式：多worker、无热重载")
+    parser.add_argument("--workers", type=int, default=SERVER_CONFIG["workers"])
+    args = parser.parse_args()
+
     print("启动账单查询与管理系统...")
     print(f"服务器地址: http://{HOST}:{PORT}")
     print(f"API文档: http://{HOST}:{PORT}/docs")
     print(f"ReDoc文档: http://{HOST}:{PORT}/redoc")
-    
-    uvicorn.run(
-        "src.main:app",
-        host=HOST,
-        port=PORT,
-        reload=True,
-        log_level="info"
-    )
+
+    if args.prod:
+        print(f"生产模式: {args.workers} 个worker")
+        run_production(args.workers)
+    else:
+        uvicorn.run(
+            "src.main:app",
+            host=HOST,
+            port=PORT,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,242 @@
+"""
+准入控制模块 - 按路由分级限并发、有界排队与超时拒绝，合并相同的在途重请求
+"""
+import asyncio
+import json
+import re
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import ADMISSION_CONFIG
+from .metrics import registry, timed_section
+
+ADMISSION_ACTIVE = registry.gauge(
+    "admission_active_requests", "已放行、正在处理的请求数", ("class",))
+ADMISSION_QUEUED = registry.gauge(
+    "admission_queued_requests", "排队等待放行的请求数", ("class",))
+ADMISSION_REJECTED = registry.counter(
+    "admission_rejected_total", "因排队已满或排队超时被拒绝的请求数", ("route", "reason"))
+ADMISSION_COALESCED = registry.counter(
+    "admission_coalesced_total", "与相同的在途请求共用结果的请求数", ("route",))
+
+_PATH_PARAM = re.compile(r'\\{[^/]+?\\}')
+
+
+class Overloaded(Exception):
+    """请求未被放行：排队已满（429）或排队超时（503）"""
+
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+
+class AdmissionController:
+    """请求准入：总槽位 + 每个优先级类别的并发上限 + 单路由并发上限；
+    有空位时按类别优先级、类别内先来先放行（单个事件循环内使用，不需要加锁）"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = dict(ADMISSION_CONFIG, **(config or {}))
+        self.classes = self.config['classes']
+        self._order = sorted(self.classes, key=lambda name: self.classes[name]['priority'])
+        self._routes = [
+            (re.compile('^' + _PATH_PARAM.sub('[^/]+', re.escape(template)) + '$'), template, settings)
+            for template, settings in self.config['routes'].items()
+        ]
+        self._total = 0
+        self._active: Dict[str, int] = defaultdict(int)
+        self._route_active: Dict[str, int] = defaultdict(int)
+        self._waiters: Dict[str, deque] = {name: deque() for name in self.classes}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config['enabled']
+
+    def classify(self, path: str) -> Tuple[Optional[str], str, Dict[str, Any]]:
+        """请求路径 -> (路由模板, 类别, 路由配置)；未配置的路由归入默认类别"""
+        for pattern, template, settings in self._routes:
+            if pattern.match(path):
+                return template, settings.get('class', self.config['default_class']), settings
+        return None, self.config['default_class'], {}
+
+    # 放行与释放
+    def _can_run(self, cls: str, route: Optional[str], settings: Dict[str, Any]) -> bool:
+        if self._total >= self.config['slots'] or self._active[cls] >= self.classes[cls]['max_active']:
+            return False
+        return 'max_active' not in settings or self._route_active[route] < settings['max_active']
+
+    def _grant(self, cls: str, route: Optional[str]):
+        self._total += 1
+        self._active[cls] += 1
+        self._route_active[route] += 1
+        ADMISSION_ACTIVE.inc(**{'class': cls})
+
+    def _dispatch(self):
+        """按类别优先级放行排队的请求；被单路由上限卡住的请求不挡住同类别的其他路由"""
+        for cls in self._order:
+            waiters = self._waiters[cls]
+            for waiter in list(waiters):
+                if self._total >= self.config['slots']:
+                    return
+                future, route, settings = waiter
+                if future.done():
+                    waiters.remove(waiter)
+                elif self._can_run(cls, route, settings):
+                    waiters.remove(waiter)
+                    self._grant(cls, route)
+                    future.set_result(None)
+
+    async def acquire(self, cls: str, route: Optional[str], settings: Dict[str, Any]):
+        """等待放行；排队已满或超时抛出Overloaded"""
+        limits = self.classes[cls]
+        # 有更高优先级或更早的排队请求时也要排队
+        if not any(self._waiters[name] for name in self._order[:self._order.index(cls) + 1]) \
+                and self._can_run(cls, route, settings):
+            self._grant(cls, route)
+            return
+        if len(self._waiters[cls]) >= limits['queue']:
+            raise Overloaded(429, 'queue_full', "服务繁忙，请稍后重试")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, route, settings)
+        self._waiters[cls].append(waiter)
+        self._dispatch()
+        ADMISSION_QUEUED.inc(**{'class': cls})
+        try:
+            with timed_section('queue'):
+                await asyncio.wait({future}, timeout=limits['timeout'])
+        except BaseException:
+            # 请求被取消：已放行则归还槽位
+            if future.done() and not future.cancelled():
+                self.release(cls, route)
+            raise
+        finally:
+            ADMISSION_QUEUED.dec(**{'class': cls})
+            if not future.done():
+                future.cancel()
+                if waiter in self._waiters[cls]:
+                    self._waiters[cls].remove(waiter)
+        if future.cancelled():
+            raise Overloaded(503, 'timeout', "服务繁忙，排队超时")
+
+    def release(self, cls: str, route: Optional[str]):
+        self._total -= 1
+        self._active[cls] -= 1
+        self._route_active[route] -= 1
+        ADMISSION_ACTIVE.dec(**{'class': cls})
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前放行/排队情况"""
+        return {
+            'active': self._total,
+            'classes': {cls: {'active': self._active[cls], 'queued': len(self._waiters[cls])}
+                        for cls in self._order},
+            'coalescing': len(self._inflight)
+        }
+
+
+async def _buffer_body(receive, max_bytes: int) -> Tuple[Optional[bytes], Any]:
+    """读出请求体用于计算合并键，返回 (请求体, 可重放的receive)；超过上限时请求体为None"""
+    messages: List[Dict[str, Any]] = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        size += len(message.get('body', b''))
+        if message['type'] != 'http.request' or not message.get('more_body') or size > max_bytes:
+            break
+    complete = size <= max_bytes and not messages[-1].get('more_body')
+    body = b''.join(m.get('body', b'') for m in messages) if complete else None
+    pending = deque(messages)
+
+    async def replay():
+        return pending.popleft() if pending else await receive()
+
+    return body, replay
+
+
+class AdmissionMiddleware:
+    """ASGI中间件：按路由放行/排队/拒绝；配置了coalesce的路由合并相同的在途请求"""
+
+    def __init__(self, app, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller or admission_controller
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        route, cls, settings = self.controller.classify(scope['path'])
+        if settings.get('coalesce'):
+            body, receive = await _buffer_body(receive, self.controller.config['coalesce_max_body'])
+            if body is not None:
+                headers = dict(scope['headers'])
+                key = (scope['method'], scope['path'], scope['query_string'],
+                       headers.get(b'authorization', b''), body)
+                await self._coalesce(key, route, cls, settings, scope, receive, send)
+                return
+        await self._admit(route, cls, settings, scope, receive, send)
+
+    async def _admit(self, route, cls, settings, scope, receive, send):
+        try:
+            await self.controller.acquire(cls, route, settings)
+        except Overloaded as e:
+            ADMISSION_REJECTED.inc(route=route or 'default', reason=e.reason)
+            await self._reject(e, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, route)
+
+    async def _coalesce(self, key, route, cls, settings, scope, receive, send):
+        """同一用户的相同请求在途时（含排队中）直接等它的响应，只计算一次"""
+        inflight = self.controller._inflight
+        leader = inflight.get(key)
+        if leader is not None:
+            ADMISSION_COALESCED.inc(route=route)
+            for message in await asyncio.shield(leader):
+                await send(message)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        inflight[key] = future
+        messages: List[Dict[str, Any]] = []
+
+        async def recording_send(message):
+            messages.append(message)
+            await send(message)
+
+        try:
+            await self._admit(route, cls, settings, scope, receive, recording_send)
+            future.set_result(messages)
+        except Exception as e:
+            future.set_exception(e)
+            # 没有跟随者时不留下"异常未被读取"的警告
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del inflight[key]
+
+    async def _reject(self, error: Overloaded, send):
+        body = json.dumps({"detail": error.detail}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': error.status_code,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(self.controller.config['retry_after']).encode())
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+# 创建全局准入控制实例
+admission_controller = AdmissionController()
@@ -14,7 +14,9 @@ from collections import Counter
 import json
 
 from .database import db_manager
-from .config import AI_CONFIG
+from .analytics_engine import analytics_engine
+from .metrics import timed_section
+from .config import AI_CONFIG, ANALYTICS_CONFIG
 
 class UserProfiler:
     """用户画像生成器"""
@@ -26,41 +28,34 @@ class UserProfiler:
     
     def generate_user_profile(self, user_id: int) -> Dict[str, Any]:
         """生成用户画像"""
-        # 获取用户消费数据（使用直接SQL查询避免会话问题）
+        # 获取用户消费数据（按列批量取数，consume_time为datetime64）
         try:
-            import sqlite3
-            from .config import DATABASE_PATH
-            from fix_sqlalchemy_session import get_bills_simple
-            
-            bills_data = get_bills_simple(user_id, limit=1000)
+            bills_data = db_manager.get_bill_columns(
+                user_id, ['consume_time', 'amount', 'merchant', 'category', 'payment_method'], limit=1000
+            )
             
-            if not bills_data:
+            if not len(bills_data['amount']):
                 return self._get_default_profile(user_id)
         except Exception as e:
             print(f"获取账单数据失败，使用默认画像: {e}")
             return self._get_default_profile(user_id)
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'consume_time': bill.get('consume_time', ''),
-            'amount': bill.get('amount', 0),
-            'merchant': bill.get('merchant', ''),
-            'category': bill.get('category', '未知'),
-            'payment_method': bill.get('payment_method', '')
-        } for bill in bills_data])
-        
-        # 生成各种画像特征
-        profile = {
-            'user_id': user_id,
-            'generated_at': datetime.now().isoformat(),
-            'spending_pattern': self._analyze_spending_pattern(df),
-            'category_preference': self._analyze_category_preference(df),
-            'payment_behavior': self._analyze_payment_behavior(df),
-            'consumption_habits': self._analyze_consumption_habits(df),
-            'risk_profile': self._analyze_risk_profile(df),
-            'financial_health': self._analyze_financial_health(df),
-            'recommendation_tags': self._generate_recommendation_tags(df)
-        }
+        with timed_section('pandas'):
+            # 转换为DataFrame
+            df = pd.DataFrame(bills_data)
+            
+            # 生成各种画像特征
+            profile = {
+                'user_id': user_id,
+                'generated_at': datetime.now().isoformat(),
+                'spending_pattern': self._analyze_spending_pattern(df),
+                'category_preference': self._analyze_category_preference(df),
+                'payment_behavior': self._analyze_payment_behavior(df),
+                'consumption_habits': self._analyze_consumption_habits(df, user_id),
+                'risk_profile': self._analyze_risk_profile(df),
+                'financial_health': self._analyze_financial_health(df),
+                'recommendation_tags': self._generate_recommendation_tags(df)
+            }
         
         # 保存用户画像到数据库
         self._save_user_profile(user_id, profile)
@@ -164,7 +159,7 @@ class UserProfiler:
             'diversity': len(payment_data)
         }
     
-    def _analyze_consumption_habits(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _analyze_consumption_habits(self, df: pd.DataFrame, user_id: int = None) -> Dict[str, Any]:
         """分析消费习惯"""
         # 消费频率
         df['date'] = df['consume_time'].dt.date
@@ -178,10 +173,19 @@ class UserProfiler:
         else:
             frequency = 'low'
         
-        # 消费时间偏好
-        df['hour'] = df['consume_time'].dt.hour
-        hourly_counts = df.groupby('hour').size()
-        peak_hour = hourly_counts.idxmax()
+        # 消费时间偏好与一致性（启用列式引擎时在DuckDB中聚合）
+        if analytics_engine.enabled and user_id is not None:
+            limit = ANALYTICS_CONFIG['recent_limit']
+            hourly_peaks = analytics_engine.hourly_peaks(user_id, limit=limit)
+            peak_hour = hourly_peaks[0]['hour'] if hourly_peaks else 0
+            consistency = analytics_engine.weekly_consistency(user_id, limit=limit)
+        else:
+            df['hour'] = df['consume_time'].dt.hour
+            hourly_counts = df.groupby('hour').size()
+            peak_hour = int(hourly_counts.idxmax())
+            
+            weekly_amounts = df.groupby(df['consume_time'].dt.isocalendar().week)['amount'].sum()
+            consistency = 1 - (weekly_amounts.std() / weekly_amounts.mean()) if weekly_amounts.mean() > 0 else 0
         
         if 6 <= peak_hour <= 11:
             time_preference = 'morning'
@@ -192,10 +196,6 @@ class UserProfiler:
         else:
             time_preference = 'night'
         
-        # 消费一致性
-        weekly_amounts = df.groupby(df['consume_time'].dt.isocalendar().week)['amount'].sum()
-        consistency = 1 - (weekly_amounts.std() / weekly_amounts.mean()) if weekly_amounts.mean() > 0 else 0
-        
         return {
             'frequency': frequency,
             'avg_daily_frequency': avg_daily_frequency,
@@ -348,9 +348,9 @@ class RecommendationEngine:
         # 获取金融产品（使用直接SQL查询避免会话问题）
         try:
             import sqlite3
-            from .config import DATABASE_PATH
+            from .database import get_sqlite_connection
             
-            conn = sqlite3.connect(str(DATABASE_PATH))
+            conn = get_sqlite_connection()
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM financial_products LIMIT 100")
@@ -476,22 +476,24 @@ class RecommendationEngine:
         
         return "；".join(reasons) if reasons else "基于您的消费习惯推荐"
     
+    def get_collaborative_recommendations(self, user_id: int, kind: str = 'merchant',
+                                          limit: int = None) -> List[Dict[str, Any]]:
+        """基于相似用户消费行为的商家/类别推荐（协同过滤）"""
+        from .recommender import collaborative_recommender
+        return collaborative_recommender.recommend(user_id, kind, limit)
+    
     def get_spending_recommendations(self, user_id: int) -> List[Dict[str, Any]]:
         """获取消费建议"""
-        # 获取用户消费数据（使用直接SQL查询避免会话问题）
+        # 获取用户消费数据（按列批量取数，consume_time为datetime64）
         try:
-            from fix_sqlalchemy_session import get_bills_simple
-            bills_data = get_bills_simple(user_id, limit=1000)
+            bills_data = db_manager.get_bill_columns(
+                user_id, ['consume_time', 'amount', 'category', 'merchant'], limit=1000
+            )
             
-            if not bills_data:
+            if not len(bills_data['amount']):
                 return []
             
-            df = pd.DataFrame([{
-                'consume_time': bill.get('consume_time', ''),
-                'amount': bill.get('amount', 0),
-                'category': bill.get('category', '未知'),
-                'merchant': bill.get('merchant', '')
-            } for bill in bills_data])
+            df = pd.DataFrame(bills_data)
         except Exception as e:
             print(f"获取消费建议失败: {e}")
             return []
@@ -499,8 +501,11 @@ class RecommendationEngine:
         recommendations = []
         
         # 基于消费类别的建议
-        category_data = df.groupby('category')['amount'].sum().sort_values(ascending=False)
-        total_amount = category_data.sum()
+        with timed_section('pandas'):
+            category_data = df.groupby('category')['amount'].sum().sort_values(ascending=False)
+            total_amount = category_data.sum()
+            avg_amount = df['amount'].mean()
+            daily_counts = df.groupby(df['consume_time'].dt.date).size()
         
         for category, amount in category_data.items():
             percentage = amount / total_amount * 100
@@ -514,7 +519,6 @@ class RecommendationEngine:
                 })
         
         # 基于消费金额的建议
-        avg_amount = df['amount'].mean()
         if avg_amount > 500:
             recommendations.append({
                 'type': 'amount_control',
@@ -525,7 +529,6 @@ class RecommendationEngine:
             })
         
         # 基于消费频率的建议
-        daily_counts = df.groupby(df['consume_time'].dt.date).size()
         if daily_counts.mean() > 3:
             recommendations.append({
                 'type': 'frequency_control',
@@ -0,0 +1,377 @@
+"""
+分析引擎模块 - 将bills表复制到本地DuckDB列式库，重聚合以向量化SQL执行
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import pandas as pd
+
+# 尝试导入duckdb，如果失败则回退到SQLite路径
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+    print("Warning: duckdb not available, analytics will fall back to SQLite")
+
+from .config import DATABASE_PATH, ANALYTICS_CONFIG, SHARD_CONFIG
+
+# 从OLTP库复制到分析库的列
+REPLICATED_COLUMNS = ['id', 'user_id', 'consume_time', 'amount', 'merchant',
+                      'category', 'payment_method', 'updated_at']
+
+# OLTP库中的删除日志：触发器记下被删账单的id，同步时按序号增量删除副本中的行
+DELETION_LOG_SQL = """
+    CREATE TABLE IF NOT EXISTS bill_deletions (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        bill_id INTEGER NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS bills_deletions_ad AFTER DELETE ON bills BEGIN
+        INSERT INTO bill_deletions (bill_id) VALUES (old.id);
+    END;
+"""
+
+
+def normalize_time_series(series: pd.Series) -> pd.Series:
+    """把多种格式的时间文本统一解析为datetime（ISO带T、缺秒、带微秒等）"""
+    s = series.astype(str).str.replace('T', ' ', regex=False).str.slice(0, 19)
+    s = s.where(s.str.len() != 16, s + ':00')
+    s = s.where(s.str.len() != 10, s + ' 00:00:00')
+    return pd.to_datetime(s, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+
+
+class AnalyticsEngine:
+    """列式分析引擎（DuckDB副本 + 增量同步）"""
+
+    def __init__(self, sqlite_path: Path = DATABASE_PATH, duckdb_path: Path = None,
+                 config: Dict[str, Any] = None):
+        self.config = dict(ANALYTICS_CONFIG, **(config or {}))
+        self.sqlite_path = Path(sqlite_path)
+        self.duckdb_path = Path(duckdb_path or self.config['duckdb_path'])
+        self._conn = None
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self._sync_thread = None
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用DuckDB后端（副本只从单个SQLite库同步，分片部署时回退到分片库直接查询）"""
+        return self.config['backend'] == 'duckdb' and HAS_DUCKDB and SHARD_CONFIG['shards'] <= 1
+
+    # 连接与同步
+    def _get_conn(self):
+        """获取DuckDB连接（懒加载并建表）"""
+        if self._conn is None:
+            self.duckdb_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = duckdb.connect(str(self.duckdb_path))
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS bills (
+                    id BIGINT PRIMARY KEY,
+                    user_id BIGINT,
+                    consume_time TIMESTAMP,
+                    amount DOUBLE,
+                    merchant VARCHAR,
+                    category VARCHAR,
+                    payment_method VARCHAR,
+                    updated_at VARCHAR
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key VARCHAR PRIMARY KEY,
+                    value VARCHAR
+                )
+            """)
+        return self._conn
+
+    def _get_state(self, key: str, default: str) -> str:
+        row = self._get_conn().execute("SELECT value FROM sync_state WHERE key = ?", [key]).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key: str, value: str):
+        self._get_conn().execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", [key, value])
+
+    def _apply_batch(self, rows: List[tuple]):
+        """把一批SQLite行写入DuckDB（按主键覆盖）"""
+        df = pd.DataFrame(rows, columns=REPLICATED_COLUMNS)
+        df['consume_time'] = normalize_time_series(df['consume_time'])
+        df['category'] = df['category'].fillna('未知')
+        df['updated_at'] = df['updated_at'].astype(str)
+        conn = self._get_conn()
+        conn.register('batch_df', df)
+        try:
+            conn.execute(f"INSERT OR REPLACE INTO bills SELECT {', '.join(REPLICATED_COLUMNS)} FROM batch_df")
+        finally:
+            conn.unregister('batch_df')
+
+    def ensure_schema(self):
+        """在OLTP库建删除日志表与触发器（启用DuckDB后端时由 prepare_storage 调用）"""
+        if not self.enabled:
+            return
+        src = sqlite3.connect(str(self.sqlite_path))
+        try:
+            src.executescript(DELETION_LOG_SQL)
+            src.commit()
+        finally:
+            src.close()
+
+    def _apply_deletions(self, src, last_seq: int, max_seq: int) -> int:
+        """把 (last_seq, max_seq] 之间删除日志中的id从副本删掉，返回日志条数"""
+        ids = [row[0] for row in src.execute(
+            "SELECT bill_id FROM bill_deletions WHERE seq > ? AND seq <= ?", (last_seq, max_seq))]
+        if ids:
+            conn = self._get_conn()
+            conn.register('deleted_df', pd.DataFrame({'id': ids}))
+            try:
+                conn.execute("DELETE FROM bills WHERE id IN (SELECT id FROM deleted_df)")
+            finally:
+                conn.unregister('deleted_df')
+        return len(ids)
+
+    def _prune_deletions(self, max_seq: int):
+        """已同步的删除日志从OLTP库清掉（同步来源可能是只读副本，日志序号不会超前于主库）"""
+        src = sqlite3.connect(str(self.sqlite_path))
+        try:
+            src.execute("DELETE FROM bill_deletions WHERE seq <= ?", (max_seq,))
+            src.commit()
+        finally:
+            src.close()
+
+    def _source_path(self) -> Path:
+        """同步来源：启用只读副本时读副本，不与OLTP写入争锁（延迟导入：snapshot 模块间接依赖本模块）"""
+        from .snapshot import snapshot_store
+        return snapshot_store.read_path(self.sqlite_path)
+
+    def sync(self, full: bool = False) -> Dict[str, Any]:
+        """增量同步：按删除日志删掉已删除的行，按自增id追加新行，按updated_at水位线覆盖修改行
+
+        删除按id识别（同步间隔内既有删除又有新增、行数不变时也能发现）；
+        来源库没有删除日志时退回旧办法：源表行数少于副本时全量重建。
+        """
+        started = time.perf_counter()
+        batch_size = self.config['sync_batch_size']
+        columns = ', '.join(REPLICATED_COLUMNS)
+
+        with self._lock:
+            conn = self._get_conn()
+            src = sqlite3.connect(str(self._source_path()))
+            try:
+                source_count = src.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+                has_log = src.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                                      "AND name = 'bill_deletions'").fetchone() is not None
+                # 先取日志水位再读账单：其间发生的删除留到下次同步，重复删除不存在的id无副作用
+                max_seq = src.execute("SELECT COALESCE(MAX(seq), 0) FROM bill_deletions").fetchone()[0] \
+                    if has_log else 0
+                last_seq = self._get_state('last_deletion_seq', '')
+                if has_log:
+                    # 副本还没有日志水位（首次同步或升级前建的副本）时全量重建一次
+                    rebuild = full or last_seq == ''
+                else:
+                    replica_count = conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+                    rebuild = full or source_count < replica_count
+                if rebuild:
+                    conn.execute("DELETE FROM bills")
+                    self._set_state('last_id', '0')
+                    self._set_state('last_updated_at', '')
+
+                # 删除须在追加新行之前处理：删掉最大id的行后该id可能被新行复用
+                deleted = self._apply_deletions(src, int(last_seq), max_seq) \
+                    if has_log and not rebuild else 0
+
+                last_id = int(self._get_state('last_id', '0'))
+                last_updated_at = self._get_state('last_updated_at', '')
+                inserted = 0
+                updated = 0
+
+                # 新增行
+                cursor = src.execute(f"SELECT {columns} FROM bills WHERE id > ? ORDER BY id", (last_id,))
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    self._apply_batch(rows)
+                    inserted += len(rows)
+                    last_id = rows[-1][0]
+
+                # 修改行
+                if last_updated_at:
+                    cursor = src.execute(
+                        f"SELECT {columns} FROM bills WHERE id <= ? AND updated_at > ?",
+                        (last_id, last_updated_at)
+                    )
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        self._apply_batch(rows)
+                        updated += len(rows)
+
+                max_updated = src.execute("SELECT MAX(updated_at) FROM bills").fetchone()[0]
+                self._set_state('last_id', str(last_id))
+                self._set_state('last_updated_at', str(max_updated or ''))
+                if has_log:
+                    self._set_state('last_deletion_seq', str(max_seq))
+                self._set_state('synced_at', datetime.now().isoformat())
+            finally:
+                src.close()
+            if deleted:
+                self._prune_deletions(max_seq)
+            self._last_sync = time.time()
+
+        return {
+            'inserted': inserted,
+            'updated': updated,
+            'deleted': deleted,
+            'source_count': source_count,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def maybe_sync(self):
+        """距离上次同步超过间隔时触发同步"""
+        if time.time() - self._last_sync >= self.config['sync_interval_seconds']:
+            self.sync()
+
+    def start_background_sync(self):
+        """启动后台周期同步线程"""
+        if not self.enabled or self._sync_thread is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"分析库同步失败: {e}")
+                time.sleep(self.config['sync_interval_seconds'])
+
+        self._sync_thread = threading.Thread(target=_loop, name="analytics-sync", daemon=True)
+        self._sync_thread.start()
+
+    def export_parquet(self) -> Path:
+        """将副本导出为Parquet快照"""
+        self.maybe_sync()
+        parquet_dir = Path(self.config['parquet_dir'])
+        parquet_dir.mkdir(parents=True, exist_ok=True)
+        target = parquet_dir / "bills.parquet"
+        with self._lock:
+            self._get_conn().execute(f"COPY bills TO '{target.as_posix()}' (FORMAT PARQUET)")
+        return target
+
+    # 聚合查询
+    def _query(self, sql: str, params: List[Any]) -> List[tuple]:
+        self.maybe_sync()
+        with self._lock:
+            return self._get_conn().execute(sql, params).fetchall()
+
+    def _window_sql(self, user_id: int, start_date: datetime = None, end_date: datetime = None,
+                    limit: int = None) -> Tuple[str, List[Any]]:
+        """构造用户账单窗口子查询：日期范围或最近limit笔"""
+        if start_date and end_date:
+            return ("SELECT * FROM bills WHERE user_id = ? AND consume_time BETWEEN ? AND ?",
+                    [user_id, start_date, end_date])
+        if limit:
+            return ("SELECT * FROM bills WHERE user_id = ? ORDER BY consume_time DESC LIMIT ?",
+                    [user_id, limit])
+        return "SELECT * FROM bills WHERE user_id = ?", [user_id]
+
+    def monthly_trend(self, user_id: int, year: int) -> List[Dict[str, Any]]:
+        """月度消费趋势（与DatabaseManager.get_monthly_spending格式一致）"""
+        rows = self._query("""
+            SELECT strftime(consume_time, '%m') AS month,
+                   SUM(amount), COUNT(*), AVG(amount)
+            FROM bills
+            WHERE user_id = ? AND year(consume_time) = ?
+            GROUP BY month
+            ORDER BY month
+        """, [user_id, year])
+        return [{"month": row[0], "total_amount": row[1], "count": row[2], "avg_amount": row[3]}
+                for row in rows]
+
+    def category_shares(self, user_id: int, start_date: datetime = None, end_date: datetime = None,
+                        limit: int = None) -> Dict[str, Any]:
+        """分类占比（与CostAnalyzer.get_category_analysis格式一致）"""
+        window, params = self._window_sql(user_id, start_date, end_date, limit)
+        rows = self._query(f"""
+            WITH w AS ({window}),
+            agg AS (
+                SELECT category,
+                       ROUND(SUM(amount), 2) AS total_amount,
+                       COUNT(*) AS count,
+                       ROUND(AVG(amount), 2) AS avg_amount,
+                       ROUND(STDDEV_SAMP(amount), 2) AS std_amount
+                FROM w
+                GROUP BY category
+            )
+            SELECT category, total_amount, count, avg_amount, std_amount,
+                   ROUND(total_amount / SUM(total_amount) OVER () * 100, 2) AS percentage
+            FROM agg
+            ORDER BY total_amount DESC
+        """, params)
+
+        if not rows:
+            return {'categories': [], 'total_amount': 0}
+
+        categories = {
+            row[0]: {
+                'total_amount': row[1],
+                'count': row[2],
+                'avg_amount': row[3],
+                'std_amount': row[4] if row[4] is not None else float('nan'),
+                'percentage': row[5]
+            }
+            for row in rows
+        }
+        return {
+            'categories': categories,
+            'total_amount': sum(row[1] for row in rows),
+            'category_count': len(rows)
+        }
+
+    def weekly_trend(self, user_id: int, limit: int = None) -> List[Dict[str, Any]]:
+        """周度消费趋势（周一开始）"""
+        window, params = self._window_sql(user_id, limit=limit)
+        rows = self._query(f"""
+            WITH w AS ({window})
+            SELECT date_trunc('week', consume_time) AS week_start, SUM(amount)
+            FROM w
+            GROUP BY week_start
+            ORDER BY week_start
+        """, params)
+        return [{
+            'week_str': f"{row[0]:%Y-%m-%d}/{(row[0] + pd.Timedelta(days=6)):%Y-%m-%d}",
+            'amount': row[1]
+        } for row in rows]
+
+    def weekly_consistency(self, user_id: int, limit: int = None) -> float:
+        """周消费一致性：1 - 周消费额变异系数（按ISO周序号分组，与画像路径一致）"""
+        window, params = self._window_sql(user_id, limit=limit)
+        row = self._query(f"""
+            WITH w AS ({window}),
+            weekly AS (SELECT weekofyear(consume_time) AS wk, SUM(amount) AS amount FROM w GROUP BY wk)
+            SELECT STDDEV_SAMP(amount), AVG(amount) FROM weekly
+        """, params)[0]
+        std, mean = row
+        if not mean or mean <= 0 or std is None:
+            return 0
+        return 1 - std / mean
+
+    def hourly_peaks(self, user_id: int, limit: int = None) -> List[Dict[str, Any]]:
+        """按小时统计消费笔数，按笔数降序（同笔数按小时升序）"""
+        window, params = self._window_sql(user_id, limit=limit)
+        rows = self._query(f"""
+            WITH w AS ({window})
+            SELECT hour(consume_time) AS hour, COUNT(*) AS count, SUM(amount) AS amount
+            FROM w
+            WHERE consume_time IS NOT NULL
+            GROUP BY hour
+            ORDER BY count DESC, hour
+        """, params)
+        return [{'hour': row[0], 'count': row[1], 'amount': row[2]} for row in rows]
+
+
+# 创建全局分析引擎实例
+analytics_engine = AnalyticsEngine()
@@ -0,0 +1,356 @@
+"""
+对话助手模块 - 每轮对话只加载一次用户近期账单的列式快照，各意图处理器都在快照上计算
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import numpy as np
+
+from .config import ASSISTANT_CONFIG
+from .data_cleaning import data_cleaner
+from .database import get_sqlite_connection
+from .merchant_index import merchant_index
+from .sharding import shard_router
+
+DAY_SECONDS = 86400
+
+
+class BillSnapshot:
+    """单个用户近期账单的列式快照：时间/金额为NumPy数组，商家与类别为分类编码"""
+
+    def __init__(self, user_id: int, since_ts: int, rows: List[Tuple], lifetime: Tuple):
+        self.user_id = user_id
+        self.since_ts = since_ts
+        self.loaded_at = time.time()
+        merchant_codes: Dict[Any, int] = {}
+        category_codes: Dict[str, int] = {}
+        self.merchant_labels: List[str] = []
+        self.category_labels: List[str] = []
+
+        unresolved: Dict[str, Any] = {}
+        ts, amounts, merchants, categories = [], [], [], []
+        for consume_ts, amount, merchant_id, merchant, category in rows:
+            key = merchant_id
+            if key is None:
+                # 未解析出商家id的账单只查字典不新建，仍查不到时按原始名称归组
+                if merchant not in unresolved:
+                    unresolved[merchant] = merchant_index.lookup(merchant) or (merchant or '未知')
+                key = unresolved[merchant]
+            code = merchant_codes.get(key)
+            if code is None:
+                code = merchant_codes[key] = len(self.merchant_labels)
+                self.merchant_labels.append(merchant_index.name(key) if isinstance(key, int) else key)
+            category = category or '未知'
+            category_code = category_codes.get(category)
+            if category_code is None:
+                category_code = category_codes[category] = len(self.category_labels)
+                self.category_labels.append(category)
+            ts.append(consume_ts)
+            amounts.append(amount or 0.0)
+            merchants.append(code)
+            categories.append(category_code)
+
+        self.ts = np.array(ts, dtype=np.int64)
+        self.amount = np.array(amounts, dtype=np.float64)
+        self.merchant = np.array(merchants, dtype=np.int32)
+        self.category = np.array(categories, dtype=np.int32)
+        # 全部历史账单的汇总（快照只覆盖近期，趋势对比需要累计值）
+        count, total, avg = lifetime
+        self.total_count = count or 0
+        self.total_amount = float(total or 0)
+        self.avg_amount = float(avg or 0)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def between(self, start_ts: int, end_ts: int = None) -> np.ndarray:
+        """[start_ts, end_ts) 区间的行掩码"""
+        mask = self.ts >= start_ts
+        if end_ts is not None:
+            mask &= self.ts < end_ts
+        return mask
+
+    @staticmethod
+    def _most_common(codes: np.ndarray, labels: List[str]) -> Tuple[Optional[str], int]:
+        if not len(codes):
+            return None, 0
+        counts = np.bincount(codes, minlength=len(labels))
+        best = int(counts.argmax())
+        return labels[best], int(counts[best])
+
+    def top_merchant(self, mask: np.ndarray) -> Tuple[Optional[str], int]:
+        return self._most_common(self.merchant[mask], self.merchant_labels)
+
+    def top_category(self, mask: np.ndarray) -> Tuple[Optional[str], int]:
+        return self._most_common(self.category[mask], self.category_labels)
+
+    def top_merchants(self, since_ts: int, top_k: int = 10) -> List[Dict[str, Any]]:
+        """since_ts 以来的商家评估榜：访问次数、金额、复购、平均间隔天数"""
+        mask = self.ts >= since_ts
+        codes, ts, amounts = self.merchant[mask], self.ts[mask], self.amount[mask]
+        size = len(self.merchant_labels)
+        visits = np.bincount(codes, minlength=size)
+        totals = np.bincount(codes, weights=amounts, minlength=size)
+        # 按 (商家, 时间) 排序后相邻两笔属于同一商家时的间隔天数
+        order = np.lexsort((ts, codes))
+        codes, ts = codes[order], ts[order]
+        same = codes[1:] == codes[:-1]
+        gap_codes = codes[1:][same]
+        gap_sum = np.bincount(gap_codes, weights=(np.diff(ts) // DAY_SECONDS)[same], minlength=size)
+        gap_count = np.bincount(gap_codes, minlength=size)
+
+        results = []
+        for code in np.flatnonzero(visits):
+            count, total = int(visits[code]), float(totals[code])
+            repurchase = 1.0 if count >= 2 else 0.0  # 单用户退化定义
+            # 简易评分：访问频次+复购+金额占比权重
+            score = count * 0.5 + repurchase * 1.5 + (total / (1 + total))
+            results.append({
+                'merchant': self.merchant_labels[code],
+                'visits': count,
+                'total_amount': round(total, 2),
+                'repurchase_rate': repurchase,
+                'avg_interval_days': float(gap_sum[code] / gap_count[code]) if gap_count[code] else None,
+                'score': round(score, 3)
+            })
+        return sorted(results, key=lambda x: x['score'], reverse=True)[:top_k]
+
+
+class SnapshotStore:
+    """按用户缓存账单快照，短TTL内的多轮对话复用同一份快照"""
+
+    def __init__(self, db_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(ASSISTANT_CONFIG, **(config or {}))
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[int, BillSnapshot]" = OrderedDict()
+
+    def _connect(self, user_id: int = None):
+        if self.db_path is not None:
+            return get_sqlite_connection(self.db_path)
+        return shard_router.connect(user_id)
+
+    def load(self, user_id: int, days: int = None) -> BillSnapshot:
+        """一次 (user_id, consume_ts) 索引范围扫描取近days天账单，外加一次全量汇总"""
+        days = days or self.config['snapshot_days']
+        today_ts = data_cleaner.to_epoch(datetime.now().replace(hour=0, minute=0, second=0))
+        since_ts = today_ts - days * DAY_SECONDS
+        conn = self._connect(user_id)
+        try:
+            rows = conn.execute(
+                # 已有商家id的行不取原始商家名
+                "SELECT consume_ts, amount, merchant_id, CASE WHEN merchant_id IS NULL THEN merchant END, category "
+                "FROM bills "
+                "WHERE user_id = ? AND consume_ts >= ?", (user_id, since_ts)
+            ).fetchall()
+            lifetime = conn.execute(
+                "SELECT COUNT(*), SUM(amount), AVG(amount) FROM bills WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return BillSnapshot(user_id, since_ts, rows, lifetime)
+
+    def get(self, user_id: int) -> BillSnapshot:
+        """取用户快照，超过TTL时重新加载"""
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is not None and time.time() - snapshot.loaded_at < self.config['snapshot_ttl']:
+                self._snapshots.move_to_end(user_id)
+                return snapshot
+        snapshot = self.load(user_id)
+        with self._lock:
+            self._snapshots[user_id] = snapshot
+            self._snapshots.move_to_end(user_id)
+            while len(self._snapshots) > self.config['max_snapshots']:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int = None):
+        """账单变更后丢弃快照；user_id为空时全部丢弃"""
+        with self._lock:
+            if user_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(user_id, None)
+
+
+class AssistantContext:
+    """一轮对话的上下文：用户、问题、当天0点时间戳，快照在首次访问时加载"""
+
+    def __init__(self, user_id: int, query: str, store: SnapshotStore = None):
+        self.user_id = user_id
+        self.query = (query or '').strip().lower()
+        self.today_ts = data_cleaner.to_epoch(datetime.now().replace(hour=0, minute=0, second=0))
+        self._store = store or snapshot_store
+        self._snapshot: Optional[BillSnapshot] = None
+
+    @property
+    def snapshot(self) -> BillSnapshot:
+        if self._snapshot is None:
+            self._snapshot = self._store.get(self.user_id)
+        return self._snapshot
+
+
+class IntentRegistry:
+    """意图注册表：按注册顺序匹配关键词，第一个命中的处理器生成回复，都不命中时走兜底处理器"""
+
+    def __init__(self):
+        self._intents: List[Tuple[str, Tuple[str, ...], Callable]] = []
+        self._fallback: Optional[Callable] = None
+
+    def register(self, name: str, keywords: List[str]):
+        """装饰器：注册意图处理器，同名意图重复注册时原位替换"""
+        def decorator(handler: Callable[[AssistantContext], Dict[str, Any]]):
+            entry = (name, tuple(k.lower() for k in keywords), handler)
+            for i, (existing, _, _) in enumerate(self._intents):
+                if existing == name:
+                    self._intents[i] = entry
+                    break
+            else:
+                self._intents.append(entry)
+            return handler
+        return decorator
+
+    def fallback(self, handler: Callable[[AssistantContext], Dict[str, Any]]):
+        """装饰器：注册兜底处理器"""
+        self._fallback = handler
+        return handler
+
+    def match(self, query: str) -> Optional[str]:
+        """问题 -> 命中的意图名，都不命中时为None"""
+        for name, keywords, _ in self._intents:
+            if any(k in query for k in keywords):
+                return name
+        return None
+
+    def dispatch(self, ctx: AssistantContext) -> Dict[str, Any]:
+        name = self.match(ctx.query)
+        for existing, _, handler in self._intents:
+            if existing == name:
+                return handler(ctx)
+        return self._fallback(ctx)
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _, _ in self._intents]
+
+
+# 创建全局实例
+snapshot_store = SnapshotStore()
+intents = IntentRegistry()
+
+
+# 内置意图
+@intents.register('today', ['今日', '今天', 'today', '今天花了', '今日消费'])
+def today_intent(ctx: AssistantContext) -> Dict[str, Any]:
+    """今日消费分析"""
+    snapshot = ctx.snapshot
+    mask = snapshot.between(ctx.today_ts, ctx.today_ts + DAY_SECONDS)
+    count = int(mask.sum())
+    if not count:
+        return {
+            'cards': [{'type': 'tip', 'title': '今日暂无消费记录', 'content': '今天还没有消费记录哦~继续保持理性消费的好习惯！💰'}],
+            'humanized': '今天过得真节俭呢！为您点赞👍 继续保持理性消费的好习惯。'
+        }
+
+    total = float(snapshot.amount[mask].sum())
+    avg_amount = total / count
+    topm, _ = snapshot.top_merchant(mask)
+    top_category, top_category_count = snapshot.top_category(mask)
+
+    mood = "今天消费控制得很好" if total < 200 else "今天的消费在合理范围内" if total < 500 else "看起来今天消费比较活跃呢"
+    advice = "继续保持理性消费！" if total < 200 else "继续保持良好的消费习惯！" if total < 500 else "建议关注一下各类别支出占比，合理控制消费节奏~"
+
+    return {
+        'cards': [
+            {'type': 'summary', 'title': '今日消费概览', 'content': f"共 {count} 笔交易，总计 ¥{total:.2f} 元，平均单笔 ¥{avg_amount:.2f} 元"},
+            {'type': 'tip', 'title': '消费亮点', 'content': f"今日最爱类别：{top_category or '—'}（{top_category_count}次）；最常光顾：{topm or '—'}"},
+            {'type': 'tip', 'title': '温馨提示', 'content': f"{mood}，{advice}"}
+        ],
+        'humanized': f"您好！根据今天的账单记录，您共消费了 {count} 笔，总计 ¥{total:.2f} 元。{mood}！{advice} ✨"
+    }
+
+
+@intents.register('trend', ['趋势', 'trend', '近7', '近30', '消费趋势', '趋势分析'])
+def trend_intent(ctx: AssistantContext) -> Dict[str, Any]:
+    """消费趋势分析：近7天消费与累计消费对比"""
+    snapshot = ctx.snapshot
+    total_amount, avg_amount, total_count = snapshot.total_amount, snapshot.avg_amount, snapshot.total_count
+
+    if total_count:
+        recent_total = float(snapshot.amount[snapshot.between(ctx.today_ts - 6 * DAY_SECONDS)].sum())
+        trend = "上升" if recent_total > total_amount / 4 else "下降" if recent_total < total_amount / 8 else "稳定"
+    else:
+        trend = "稳定"
+
+    return {
+        'cards': [
+            {'type': 'summary', 'title': '消费趋势分析', 'content': f"累计消费 ¥{total_amount:.2f} 元，共 {total_count} 笔，平均单笔 ¥{avg_amount:.2f} 元。近7天消费趋势：{trend}趋势"},
+            {'type': 'tip', 'title': '趋势建议', 'content': '建议关注月度预算，合理规划支出节奏，让每一分钱都花得有价值~'}
+        ],
+        'humanized': f"根据您的消费记录分析，总消费金额为 ¥{total_amount:.2f} 元，共 {total_count} 笔交易，平均单笔 ¥{avg_amount:.2f} 元。近期的消费呈现{trend}趋势。建议您关注月度预算，合理规划支出节奏，让每一分钱都花得有价值~ 📊"
+    }
+
+
+@intents.register('merchants', ['好商家', '推荐商家', '回购', '常去', '喜欢的商家'])
+def merchants_intent(ctx: AssistantContext) -> Dict[str, Any]:
+    """好商家推荐：近90天商家评估榜前5"""
+    merchants = ctx.snapshot.top_merchants(ctx.today_ts - 90 * DAY_SECONDS, top_k=5)
+    if not merchants:
+        return {
+            'cards': [{'type': 'tip', 'title': '暂无推荐', 'content': '消费记录较少，建议多使用系统记录消费，我们会为您推荐优质商家~'}],
+            'humanized': '您好！目前您的消费记录还不够丰富，建议多使用系统记录消费，积累数据后我会为您推荐优质商家哦~ 💡'
+        }
+
+    merchant_list = '、'.join([f"{m['merchant']}({m['visits']}次)" for m in merchants[:3]])
+    return {
+        'cards': [
+            {'type': 'recommendation', 'title': '好商家推荐', 'items': merchants, 'content': f"根据您的消费频率和复购率，为您推荐：{merchant_list}"},
+            {'type': 'tip', 'title': '推荐理由', 'content': '这些商家在您的消费记录中频率较高，复购率良好，说明您对他们的服务比较满意~'}
+        ],
+        'humanized': f"根据您近90天的消费记录，我为您推荐以下优质商家：{merchant_list}。这些商家在您的消费记录中频率较高，复购率良好，说明您对他们的服务比较满意呢~ 建议继续关注这些商家的优惠活动！⭐"
+    }
+
+
+@intents.register('warning', ['预警', '超额', '大额', '异常', '风险'])
+def warning_intent(ctx: AssistantContext) -> Dict[str, Any]:
+    """大额消费预警：快照窗口内的全部账单（不再只看最近1000笔）"""
+    snapshot = ctx.snapshot
+    threshold = ASSISTANT_CONFIG['large_amount']
+    large = snapshot.amount[snapshot.amount >= threshold]
+    if not len(large):
+        return {
+            'cards': [{'type': 'tip', 'title': '消费健康', 'content': '恭喜！您的消费记录中没有发现异常大额交易，消费习惯良好~'}],
+            'humanized': '恭喜您！我检查了您的消费记录，没有发现异常大额交易，您的消费习惯非常健康，继续保持！🎉'
+        }
+
+    large_total = float(large.sum())
+    avg_large = large_total / len(large)
+    return {
+        'cards': [
+            {'type': 'alert', 'title': '大额支出提示', 'content': f"发现 {len(large)} 笔大额交易（≥¥{threshold:g}），累计金额 ¥{large_total:.2f} 元，平均单笔 ¥{avg_large:.2f} 元。建议核对交易详情，确认商家信息正确。"},
+            {'type': 'tip', 'title': '安全建议', 'content': '大额交易已标记，建议您及时核对交易详情和商家信息，确保资金安全~'}
+        ],
+        'humanized': f"⚠️ 消费预警：我检查了您的账单，发现了 {len(large)} 笔大额交易（单笔≥¥{threshold:g}），累计金额 ¥{large_total:.2f} 元。为了您的资金安全，建议您及时核对这些交易的详情和商家信息。如果发现异常，请及时联系银行处理~"
+    }
+
+
+@intents.fallback
+def help_intent(ctx: AssistantContext) -> Dict[str, Any]:
+    """未命中任何意图：识别到关键词时给出提问示例，否则返回功能介绍（不需要快照）"""
+    keywords = ['消费', '账单', '分析', '推荐', '商家', '趋势', '金额', '类别', '餐饮', '购物', '交通', '娱乐']
+    matched = [k for k in keywords if k in ctx.query]
+    if matched:
+        return {
+            'cards': [{'type': 'tip', 'title': '关键词识别', 'content': f"我识别到您提到了：{', '.join(matched)}。试试问我：\"今日消费分析\"、\"消费趋势分析\"、\"好商家推荐\"等具体问题~"}],
+            'humanized': f"您好！我注意到您提到了：{', '.join(matched)}。我可以帮您分析消费、推荐商家、预测趋势、预警异常等。试试问我更具体的问题，比如：\"今日消费分析\"、\"消费趋势分析\"、\"好商家推荐\"、\"消费预警\"等~ 💡"
+        }
+
+    return {
+        'cards': [{'type': 'tip', 'title': '我可以帮您做什么？', 'content': '试试问我："今日消费分析"、"消费趋势分析"、"好商家推荐"、"消费预警"等，我会为您提供详细的消费分析~'}],
+        'humanized': '您好！我是您的智能账单小助手 💡 我可以帮您分析消费、推荐商家、预测趋势、预警异常等。试试问我："今日消费分析"、"消费趋势分析"、"好商家推荐"、"消费预警"，我会为您提供详细的个性化分析~'
+    }
@@ -0,0 +1,353 @@
+"""
+账单导出模块 - 按游标分批读取，流式输出CSV/XLSX/Parquet
+"""
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+# xlsx/parquet导出依赖的可选库：未安装时对应格式不可用（csv不受影响）
+try:
+    import openpyxl  # noqa: F401
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from .cold_storage import cold_store
+from .config import EXPORTS_DIR, EXPORT_CONFIG
+from .data_cleaning import data_cleaner
+from .database import ensure_time_columns
+from .sharding import shard_router
+
+# 导出列（与 /bills 接口字段一致）
+EXPORT_COLUMNS = ['id', 'user_id', 'consume_time', 'amount', 'merchant', 'category',
+                  'payment_method', 'location', 'description', 'created_at', 'updated_at']
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# 各格式依赖的可选库：(是否已安装, 包名)
+FORMAT_DEPENDENCIES = {
+    'xlsx': (HAS_OPENPYXL, 'openpyxl'),
+    'parquet': (HAS_PYARROW, 'pyarrow')
+}
+
+
+class ExportUnavailableError(RuntimeError):
+    """导出格式依赖的可选库未安装"""
+
+
+class _ChunkSink:
+    """只写文件对象：Parquet写入器写入后由生成器取走字节"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BillExporter:
+    """账单导出器"""
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or EXPORT_CONFIG['chunk_size']
+
+    def _build_query(self, user_id: int, start_date: str = None, end_date: str = None,
+                     category: str = None, with_ts: bool = False) -> Tuple[str, List[Any]]:
+        """构建筛选条件（与 /bills 接口的日期/类别语义一致）；with_ts时末尾多取 consume_ts 用于归并"""
+        conditions = ["user_id = ?"]
+        params: List[Any] = [user_id]
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if start_date:
+            conditions.append("consume_ts >= ?")
+            params.append(data_cleaner.to_epoch(start_date))
+        if end_date:
+            conditions.append("consume_day <= ?")
+            params.append(data_cleaner.day_key(end_date))
+        sql = f"""
+            SELECT {', '.join(EXPORT_COLUMNS + ['consume_ts'] if with_ts else EXPORT_COLUMNS)}
+            FROM bills
+            WHERE {' AND '.join(conditions)}
+            ORDER BY consume_ts
+        """
+        return sql, params
+
+    def iter_chunks(self, user_id: int, start_date: str = None, end_date: str = None,
+                    category: str = None) -> Iterator[List[tuple]]:
+        """游标分批读取账单，内存占用与总行数无关；已归档的冷数据按消费时间归并进来"""
+        cold = cold_store.rows(user_id, EXPORT_COLUMNS + ['consume_ts'],
+                               data_cleaner.to_epoch(start_date) if start_date else None,
+                               data_cleaner.day_key(end_date) if end_date else None, category)
+        sql, params = self._build_query(user_id, start_date, end_date, category, with_ts=bool(cold))
+        # 流式响应的生成器可能在不同线程中推进
+        conn = shard_router.connect(user_id, check_same_thread=False)
+        try:
+            cursor = conn.execute(sql, params)
+            if cold:
+                # 补录的旧账单可能早于已归档的月份，两路都按 consume_ts 有序，归并后去掉末尾的时间列
+                cursor = (row[:-1] for row in heapq.merge(cold, cursor, key=itemgetter(-1)))
+            while True:
+                rows = list(islice(cursor, self.chunk_size))
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def check_format(fmt: str):
+        """导出前检查格式：不支持时抛ValueError，依赖未安装时抛ExportUnavailableError
+
+        xlsx/parquet的生成器在开始输出后才用到依赖库，必须在返回流式响应之前检查，否则只能得到空文件。
+        """
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        installed, package = FORMAT_DEPENDENCIES.get(fmt, (True, None))
+        if not installed:
+            raise ExportUnavailableError(f"导出 {fmt} 格式需要安装 {package}")
+
+    @staticmethod
+    def check_dates(start_date: str = None, end_date: str = None):
+        """导出前检查日期筛选条件，无法解析时抛ValueError（同样须在开始流式输出之前）"""
+        if start_date:
+            data_cleaner.to_epoch(start_date)
+        if end_date:
+            data_cleaner.day_key(end_date)
+
+    def stream(self, fmt: str, user_id: int, start_date: str = None, end_date: str = None,
+               category: str = None) -> Iterator[bytes]:
+        """按格式流式生成导出内容"""
+        self.check_format(fmt)
+        chunks = self.iter_chunks(user_id, start_date, end_date, category)
+        if fmt == 'csv':
+            return self._stream_csv(chunks)
+        if fmt == 'xlsx':
+            return self._stream_xlsx(chunks)
+        return self._stream_parquet(chunks)
+
+    def _stream_csv(self, chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # 带BOM便于Excel识别中文
+        buffer.write('\ufeff')
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _stream_xlsx(self, chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+        # write_only模式逐行写入临时XML，内存占用恒定；zip需写完后才能输出
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("bills")
+        sheet.append(EXPORT_COLUMNS)
+        for rows in chunks:
+            for row in rows:
+                sheet.append(list(row))
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook.save(tmp_path)
+            with open(tmp_path, 'rb') as f:
+                while True:
+                    data = f.read(64 * 1024)
+                    if not data:
+                        break
+                    yield data
+        finally:
+            os.remove(tmp_path)
+
+    def _stream_parquet(self, chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+        # 每批写成一个row group并立即输出
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ('id', pa.int64()), ('user_id', pa.int64()), ('consume_time', pa.string()),
+            ('amount', pa.float64()), ('merchant', pa.string()), ('category', pa.string()),
+            ('payment_method', pa.string()), ('location', pa.string()), ('description', pa.string()),
+            ('created_at', pa.string()), ('updated_at', pa.string())
+        ])
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        try:
+            for rows in chunks:
+                columns = list(zip(*rows))
+                arrays = [
+                    pa.array([None if v is None else str(v) for v in col], type=field.type)
+                    if pa.types.is_string(field.type) else pa.array(col, type=field.type)
+                    for col, field in zip(columns, schema)
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    def export_to_file(self, fmt: str, user_id: int, start_date: str = None, end_date: str = None,
+                       category: str = None, output_path: Path = None) -> Dict[str, Any]:
+        """导出到文件（默认 data/exports 目录）"""
+        if output_path is None:
+            output_path = Path(EXPORTS_DIR) / f"bills_user{user_id}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 先写临时文件再改名，避免下载到半成品
+        tmp_path = output_path.with_name(output_path.name + '.part')
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for data in self.stream(fmt, user_id, start_date, end_date, category):
+                f.write(data)
+                size += len(data)
+        os.replace(tmp_path, output_path)
+        return {'path': str(output_path), 'size': size}
+
+
+class ExportJobManager:
+    """后台导出任务：状态写在共享导出目录下的 jobs/<job_id>.json，多worker部署时任一进程都能查询与下载"""
+
+    def __init__(self, exporter: BillExporter, jobs_dir: Path = None):
+        self.exporter = exporter
+        self.jobs_dir = Path(jobs_dir or EXPORT_CONFIG['jobs_dir'])
+
+    def _path_for(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _save(self, job: Dict[str, Any]):
+        """先写临时文件再改名，查询方不会读到半截的状态"""
+        path = self._path_for(job['job_id'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.part')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def create_job(self, fmt: str, user_id: int, start_date: str = None, end_date: str = None,
+                   category: str = None) -> Dict[str, Any]:
+        """登记导出任务，返回任务信息"""
+        self.exporter.check_format(fmt)
+        self.exporter.check_dates(start_date, end_date)
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': 'pending',
+            'format': fmt,
+            'user_id': user_id,
+            'filters': {'start_date': start_date, 'end_date': end_date, 'category': category},
+            'created_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'file_path': None,
+            'size': None,
+            'error': None
+        }
+        self._save(job)
+        return job
+
+    def run_job(self, job_id: str):
+        """执行导出任务（在后台线程中调用）"""
+        job = self.get_job(job_id)
+        job['status'] = 'running'
+        self._save(job)
+        try:
+            result = self.exporter.export_to_file(
+                job['format'], job['user_id'], **job['filters']
+            )
+            job['file_path'] = result['path']
+            job['size'] = result['size']
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            job['finished_at'] = datetime.now().isoformat()
+            self._save(job)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # job_id 来自URL，只接受 create_job 生成的十六进制id，避免拼出目录外的路径
+        if not job_id.isalnum():
+            return None
+        path = self._path_for(job_id)
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+# 创建全局导出器实例
+bill_exporter = BillExporter()
+export_job_manager = ExportJobManager(bill_exporter)
+
+
+def main():
+    """命令行导出：python -m src.bill_export --user-id 1 --format csv"""
+    parser = argparse.ArgumentParser(description="导出账单")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--format", choices=EXPORT_CONFIG['formats'], default="csv")
+    parser.add_argument("--start-date", help="起始日期，如 2025-01-01")
+    parser.add_argument("--end-date", help="结束日期，如 2025-12-31")
+    parser.add_argument("--category")
+    parser.add_argument("--output", help="输出文件路径，默认写入 data/exports")
+    args = parser.parse_args()
+    try:
+        bill_exporter.check_format(args.format)
+    except ExportUnavailableError as e:
+        parser.error(str(e))
+
+    # 日期筛选依赖 consume_ts/consume_day 列，旧库先补齐
+    ensure_time_columns(shard_router.path_for(args.user_id))
+    result = bill_exporter.export_to_file(
+        args.format, args.user_id, args.start_date, args.end_date, args.category,
+        Path(args.output) if args.output else None
+    )
+    print(f"导出完成: {result['path']} ({result['size']} 字节)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,72 @@
 账单查询模块 - 智能查询和NLP处理
 """
 import re
+import unicodedata
+from functools import lru_cache
+from math import sqrt
 import jieba
 import jieba.posseg as pseg
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
 from .database import db_manager
 from .data_cleaning import data_cleaner
-from .config import CLEANING_CONFIG
+from .merchant_index import merchant_index
+from .config import CLEANING_CONFIG, QUERY_CONFIG
+from .metrics import registry, timed_section
+
+PARSE_CACHE_TOTAL = registry.counter(
+    "query_parse_cache_total", "自然语言查询解析缓存命中情况", ("result",))
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询串（全角转半角、合并空白），作为解析缓存的键"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', query or '')).strip()
+
+
+class IntentIndex:
+    """意图模板的稀疏最近邻索引：按词倒排，只给与查询有公共词的模板打分"""
+
+    def __init__(self, threshold: float = 0.3):
+        self.threshold = threshold
+        self.vectorizer = TfidfVectorizer()
+        self.labels: List[str] = []
+        self._postings = None
+
+    def fit(self, templates: List[str], labels: List[str]):
+        """预计算模板TF-IDF矩阵（行已L2归一化），转置成 词 -> 模板 的倒排表"""
+        matrix = self.vectorizer.fit_transform(templates)
+        self.labels = list(labels)
+        self._postings = matrix.T.tocsr()
+        self._analyze = self.vectorizer.build_analyzer()
+        self._vocabulary = self.vectorizer.vocabulary_
+        self._idf = self.vectorizer.idf_
+
+    def nearest(self, query: str) -> Tuple[str, float]:
+        """返回余弦相似度最高的模板意图及相似度（与transform + cosine_similarity结果一致）"""
+        if self._postings is None:
+            return 'unknown', 0.0
+        weights: Dict[int, float] = {}
+        for token in self._analyze(query):
+            col = self._vocabulary.get(token)
+            if col is not None:
+                weights[col] = weights.get(col, 0.0) + self._idf[col]
+        if not weights:
+            return 'unknown', 0.0
+
+        scores: Dict[int, float] = {}
+        indptr, indices, data = self._postings.indptr, self._postings.indices, self._postings.data
+        for col, weight in weights.items():
+            for i in range(indptr[col], indptr[col + 1]):
+                scores[indices[i]] = scores.get(indices[i], 0.0) + weight * data[i]
+        best = min(scores, key=lambda row: (-scores[row], row))
+        similarity = scores[best] / sqrt(sum(w * w for w in weights.values()))
+        if similarity < self.threshold:
+            return 'unknown', similarity
+        return self.labels[best], similarity
+
 
 class BillQueryProcessor:
     """账单查询处理器"""
@@ -71,9 +126,12 @@ class BillQueryProcessor:
             '教育': ['教育', '培训', '学习', '书籍', '课程', '教育']
         }
         
-        # 初始化TF-IDF向量化器
-        self.vectorizer = TfidfVectorizer()
+        # 意图识别（模板TF-IDF稀疏倒排索引）
+        self.intent_index = IntentIndex(QUERY_CONFIG['intent_threshold'])
         self._build_intent_model()
+        
+        # 解析结果缓存（不含依赖当前时间的部分）
+        self._parse_cached = lru_cache(maxsize=QUERY_CONFIG['parse_cache_size'])(self._parse_normalized)
     
     def _build_intent_model(self):
         """构建意图识别模型"""
@@ -86,66 +144,107 @@ class BillQueryProcessor:
                 all_texts.append(template)
                 self.intent_labels.append(intent)
         
-        # 训练TF-IDF模型
+        # 预计算模板矩阵与倒排表
         if all_texts:
-            self.tfidf_matrix = self.vectorizer.fit_transform(all_texts)
+            self.intent_index.fit(all_texts, self.intent_labels)
+    
+    @staticmethod
+    def _tokenize(text: str) -> List[Tuple[str, str]]:
+        """分词+词性标注，一次完成，结果供所有抽取器共用"""
+        return [(pair.word, pair.flag) for pair in pseg.cut(text)]
     
     def parse_query(self, query: str) -> Dict[str, Any]:
         """解析用户查询"""
         query = query.strip()
         
-        # 分词和词性标注
-        words = list(jieba.cut(query))
-        pos_words = list(pseg.cut(query))
+        # 同一归一化查询串只分词/抽取一次；相对时间每次按当前时间重新计算
+        cache_info = self._parse_cached.cache_info()
+        parsed = self._parse_cached(normalize_query(query))
+        PARSE_CACHE_TOTAL.inc(result='hit' if self._parse_cached.cache_info().hits > cache_info.hits else 'miss')
         
-        # 提取意图
-        intent = self._extract_intent(query)
-        
-        # 提取时间信息
-        time_info = self._extract_time_info(query, words)
+        with timed_section('nlp_time'):
+            time_info = self._resolve_time_info(parsed['time_spec'])
         
-        # 提取类别信息
-        category_info = self._extract_category_info(query, words)
+        return {
+            'original_query': query,
+            'words': list(parsed['words']),
+            'pos_words': list(parsed['pos_words']),
+            'intent': parsed['intent'],
+            'time_info': time_info,
+            'category_info': dict(parsed['category_info']),
+            'merchant_info': dict(parsed['merchant_info']),
+            'amount_info': dict(parsed['amount_info']),
+            'parsed_at': datetime.now().isoformat()
+        }
+    
+    def _parse_normalized(self, query: str) -> Dict[str, Any]:
+        """与当前时间无关的解析部分（结果被缓存，调用方不得修改）"""
+        # 分词和词性标注
+        with timed_section('nlp_tokenize'):
+            pos_words = self._tokenize(query)
+            words = [word for word, _ in pos_words]
         
-        # 提取商家信息
-        merchant_info = self._extract_merchant_info(query, words)
+        # 提取意图
+        with timed_section('nlp_intent'):
+            intent = self._extract_intent(query)
         
-        # 提取金额信息
-        amount_info = self._extract_amount_info(query, words)
+        with timed_section('nlp_extract'):
+            # 提取时间信息
+            time_spec = self._extract_time_spec(query)
+            
+            # 提取类别信息
+            category_info = self._extract_category_info(query, words)
+            
+            # 提取商家信息
+            merchant_info = self._extract_merchant_info(query, words, pos_words)
+            
+            # 提取金额信息
+            amount_info = self._extract_amount_info(query, words)
         
         return {
-            'original_query': query,
-            'words': words,
-            'pos_words': [(word, flag) for word, flag in pos_words],
+            'words': tuple(words),
+            'pos_words': tuple(pos_words),
             'intent': intent,
-            'time_info': time_info,
+            'time_spec': time_spec,
             'category_info': category_info,
             'merchant_info': merchant_info,
-            'amount_info': amount_info,
-            'parsed_at': datetime.now().isoformat()
+            'amount_info': amount_info
         }
     
+    def clear_cache(self):
+        """清空解析缓存（修改关键词/模板后调用）"""
+        self._parse_cached.cache_clear()
+    
     def _extract_intent(self, query: str) -> str:
         """提取查询意图"""
-        if not hasattr(self, 'tfidf_matrix'):
-            return 'unknown'
-        
-        # 使用TF-IDF计算相似度
-        query_vector = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vector, self.tfidf_matrix)[0]
+        intent, _ = self.intent_index.nearest(query)
+        return intent
+    
+    def _extract_time_spec(self, query: str) -> Dict[str, Any]:
+        """提取时间表达（关键词、月份），不依赖当前时间"""
+        spec = {'keyword': None, 'days_offset': None, 'month': None}
         
-        # 找到最相似的意图
-        max_similarity_idx = np.argmax(similarities)
-        max_similarity = similarities[max_similarity_idx]
+        # 检查时间关键词
+        for keyword, days_offset in self.time_keywords.items():
+            if keyword in query:
+                spec['keyword'] = keyword
+                spec['days_offset'] = days_offset
+                break
         
-        # 如果相似度太低，返回unknown
-        if max_similarity < 0.3:
-            return 'unknown'
+        # 检查月份信息
+        month_pattern = r'(\d{1,2})月'
+        month_match = re.search(month_pattern, query)
+        if month_match:
+            spec['month'] = int(month_match.group(1))
         
-        return self.intent_labels[max_similarity_idx]
+        return spec
     
     def _extract_time_info(self, query: str, words: List[str]) -> Dict[str, Any]:
         """提取时间信息"""
+        return self._resolve_time_info(self._extract_time_spec(query))
+    
+    def _resolve_time_info(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """按当前时间把时间表达换算成具体日期范围"""
         time_info = {
             'type': 'none',
             'start_date': None,
@@ -153,30 +252,27 @@ class BillQueryProcessor:
             'time_range': None
         }
         
-        # 检查时间关键词
-        for keyword, days_offset in self.time_keywords.items():
-            if keyword in query:
-                if days_offset == 0:  # 今天
-                    time_info['type'] = 'single_day'
-                    time_info['start_date'] = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                    time_info['end_date'] = datetime.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-                elif days_offset > 0:  # 时间段
-                    time_info['type'] = 'range'
-                    time_info['start_date'] = datetime.now() - timedelta(days=days_offset)
-                    time_info['end_date'] = datetime.now()
-                else:  # 具体某天
-                    time_info['type'] = 'single_day'
-                    target_date = datetime.now() + timedelta(days=days_offset)
-                    time_info['start_date'] = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                    time_info['end_date'] = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                break
-        
-        # 检查月份信息
-        month_pattern = r'(\d{1,2})月'
-        month_match = re.search(month_pattern, query)
-        if month_match:
-            month = int(month_match.group(1))
-            current_year = datetime.now().year
+        now = datetime.now()
+        days_offset = spec['days_offset']
+        if days_offset is not None:
+            if days_offset == 0:  # 今天
+                time_info['type'] = 'single_day'
+                time_info['start_date'] = now.replace(hour=0, minute=0, second=0, microsecond=0)
+                time_info['end_date'] = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+            elif days_offset > 0:  # 时间段
+                time_info['type'] = 'range'
+                time_info['start_date'] = now - timedelta(days=days_offset)
+                time_info['end_date'] = now
+            else:  # 具体某天
+                time_info['type'] = 'single_day'
+                target_date = now + timedelta(days=days_offset)
+                time_info['start_date'] = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
+                time_info['end_date'] = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        
+        # 月份信息
+        month = spec['month']
+        if month:
+            current_year = now.year
             time_info['type'] = 'month'
             time_info['start_date'] = datetime(current_year, month, 1)
             if month == 12:
@@ -204,7 +300,8 @@ class BillQueryProcessor:
         
         return category_info
     
-    def _extract_merchant_info(self, query: str, words: List[str]) -> Dict[str, Any]:
+    def _extract_merchant_info(self, query: str, words: List[str],
+                               pos_words: List[Tuple[str, str]] = None) -> Dict[str, Any]:
         """提取商家信息"""
         merchant_info = {
             'merchant': None,
@@ -213,7 +310,9 @@ class BillQueryProcessor:
         
         # 简单的商家名称提取（可以根据实际需求优化）
         # 这里假设商家名称通常是名词
-        for word, pos in pseg.cut(query):
+        if pos_words is None:
+            pos_words = self._tokenize(query)
+        for word, pos in pos_words:
             if pos in ['n', 'nr', 'ns', 'nt'] and len(word) > 1:
                 # 检查是否可能是商家名称
                 if word not in ['时间', '金额', '消费', '支出', '费用']:
@@ -263,7 +362,12 @@ class BillQueryProcessor:
         merchant_info = parsed_query['merchant_info']
         amount_info = parsed_query['amount_info']
         
-        # 根据意图执行不同的查询
+        with timed_section('query_execute'):
+            return self._dispatch_query(intent, user_id, time_info, category_info, merchant_info, amount_info)
+    
+    def _dispatch_query(self, intent: str, user_id: int, time_info: Dict, category_info: Dict,
+                        merchant_info: Dict, amount_info: Dict) -> Dict[str, Any]:
+        """根据意图执行不同的查询"""
         if intent == 'query_amount':
             return self._query_total_amount(user_id, time_info, category_info, merchant_info)
         elif intent == 'query_category':
@@ -329,9 +433,10 @@ class BillQueryProcessor:
             }
         else:
             # 查询特定分类
-            bills = db_manager.get_bills_by_category(user_id, category)
             if start_date and end_date:
-                bills = [bill for bill in bills if start_date <= bill.consume_time <= end_date]
+                bills = db_manager.get_bills_by_category(user_id, category, start_date, end_date)
+            else:
+                bills = db_manager.get_bills_by_category(user_id, category)
             
             total_amount = sum(bill.amount for bill in bills)
             return {
@@ -369,16 +474,17 @@ class BillQueryProcessor:
         if not merchant:
             return {'error': '未找到商家信息'}
         
-        bills = db_manager.get_bills_by_merchant(user_id, merchant)
-        
         if time_info.get('start_date') and time_info.get('end_date'):
-            bills = [bill for bill in bills if time_info['start_date'] <= bill.consume_time <= time_info['end_date']]
+            bills = db_manager.get_bills_by_merchant(user_id, merchant, time_info['start_date'], time_info['end_date'])
+        else:
+            bills = db_manager.get_bills_by_merchant(user_id, merchant)
         
         total_amount = sum(bill.amount for bill in bills)
         
+        merchant_id = merchant_index.lookup(merchant)
         return {
             'query_type': 'merchant_amount',
-            'merchant': merchant,
+            'merchant': merchant_index.name(merchant_id, default=merchant),
             'total_amount': total_amount,
             'count': len(bills),
             'avg_amount': total_amount / len(bills) if bills else 0
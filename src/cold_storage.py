@@ -0,0 +1,325 @@
+"""
+冷数据分层模块 - 早于保留期的整月账单移出OLTP库，按月分区写入Parquet；全历史查询时合并冷热数据
+"""
+import argparse
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+# 尝试导入pyarrow，如果失败则不能归档（未归档过的库查询不受影响）
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from .config import ARCHIVE_CONFIG
+from .database import get_sqlite_connection
+from .sharding import shard_router
+
+# 归档列：账单全部字段 + 派生时间列（冷数据按同样的整数列筛选）
+ARCHIVE_COLUMNS = ['id', 'user_id', 'consume_time', 'consume_ts', 'consume_day', 'consume_month', 'amount',
+                   'merchant', 'merchant_id', 'category', 'payment_method', 'location', 'description',
+                   'created_at', 'updated_at']
+ARCHIVE_SCHEMA = pa.schema([
+    ('id', pa.int64()), ('user_id', pa.int64()), ('consume_time', pa.string()), ('consume_ts', pa.int64()),
+    ('consume_day', pa.int32()), ('consume_month', pa.int32()), ('amount', pa.float64()),
+    ('merchant', pa.string()), ('merchant_id', pa.int64()), ('category', pa.string()),
+    ('payment_method', pa.string()), ('location', pa.string()), ('description', pa.string()),
+    ('created_at', pa.string()), ('updated_at', pa.string())
+]) if HAS_PYARROW else None
+# 按 (user_id, consume_month) 索引逐用户取一个月的账单；被发票关联的账单留在库中，发票上的 bill_id 始终能查到
+_ARCHIVABLE = """
+    user_id IN (SELECT user_id FROM temp.archive_users)
+    AND consume_month = :month
+    AND id < :max_id
+    AND NOT EXISTS (SELECT 1 FROM invoices WHERE invoices.bill_id = bills.id)
+"""
+# 未清理的孤儿文件（写完Parquet但事务未提交）超过该秒数才删除，避免误删正在归档的文件
+_ORPHAN_GRACE_SECONDS = 3600
+
+
+def month_key(value: date) -> int:
+    return value.year * 100 + value.month
+
+
+def month_range(first: int, stop: int):
+    """YYYYMM 月份序列 [first, stop)"""
+    month = first
+    while month < stop:
+        yield month
+        month = month + 1 if month % 100 < 12 else (month // 100 + 1) * 100 + 1
+
+
+class ColdStore:
+    """冷数据存储：归档清单 bill_archive 在主库，文件按 consume_month=YYYYMM 分区，
+    查询先按月份与用户范围从清单裁剪文件，再用row group统计信息按用户跳过"""
+
+    def __init__(self, db_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(ARCHIVE_CONFIG, **(config or {}))
+        self.db_path = db_path
+        self.archive_dir = Path(self.config['archive_dir'])
+
+    @property
+    def home_path(self) -> Path:
+        return Path(self.db_path) if self.db_path is not None else shard_router.path_for(None)
+
+    def _paths(self) -> List[Path]:
+        """账单所在的库：指定库或全部分片（归档清单始终在主库）"""
+        return [Path(self.db_path)] if self.db_path is not None else shard_router.paths()
+
+    def _connect(self):
+        return get_sqlite_connection(self.home_path)
+
+    def ensure_schema(self):
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS bill_archive (
+                    id INTEGER PRIMARY KEY,
+                    consume_month INTEGER NOT NULL,
+                    path TEXT NOT NULL UNIQUE,
+                    rows INTEGER NOT NULL,
+                    min_user_id INTEGER NOT NULL,
+                    max_user_id INTEGER NOT NULL,
+                    archived_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_bill_archive_month ON bill_archive (consume_month);
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cutoff_month(self, today: date = None) -> int:
+        """早于该月（YYYYMM）的账单可归档：保留期向前取整到月初，分区归档后不再变化"""
+        today = today or datetime.now().date()
+        return month_key(today - timedelta(days=self.config['horizon_days']))
+
+    # 归档
+    def archive(self, today: date = None, dry_run: bool = False) -> Dict[str, Any]:
+        """把各库中可归档的整月账单写入Parquet并从库中删除"""
+        if not HAS_PYARROW:
+            raise RuntimeError("冷数据归档需要安装 pyarrow")
+        started = time.perf_counter()
+        cutoff = self.cutoff_month(today)
+        stats = {'cutoff_month': cutoff, 'files': 0, 'rows': 0, 'orphans': 0}
+        if not dry_run:
+            self.ensure_schema()
+            stats['orphans'] = self._remove_orphans()
+        for path in self._paths():
+            self._archive_at(Path(path), cutoff, dry_run, stats)
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        return stats
+
+    def _archive_at(self, path: Path, cutoff: int, dry_run: bool, stats: Dict[str, Any]):
+        conn = get_sqlite_connection(path, isolation_level=None)
+        try:
+            # 分片库挂载主库：删账单与登记清单在同一事务中提交（回滚日志模式下跨库原子）
+            manifest = 'bill_archive'
+            if path.resolve() != self.home_path.resolve():
+                conn.execute("ATTACH DATABASE ? AS home", (str(self.home_path),))
+                manifest = 'home.bill_archive'
+            # 保留最大id的一行，未分片时SQLite不会复用已归档账单的id
+            max_id, first_month = conn.execute("SELECT MAX(id), MIN(consume_month) FROM bills").fetchone()
+            conn.execute("CREATE TEMP TABLE archive_users AS SELECT DISTINCT user_id FROM bills")
+            for month in month_range(first_month or cutoff, cutoff):
+                month_params = {'month': month, 'max_id': max_id or 0}
+                if dry_run:
+                    count = conn.execute(f"SELECT COUNT(*) FROM bills WHERE {_ARCHIVABLE}", month_params).fetchone()[0]
+                    stats['files'] += 1 if count else 0
+                    stats['rows'] += count
+                    continue
+                # 选出、写文件、删除在同一写事务内完成，其间的修改不会丢失
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = conn.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM bills WHERE {_ARCHIVABLE}",
+                                        month_params).fetchall()
+                    if not rows:
+                        conn.execute("COMMIT")
+                        continue
+                    relative = self._write_partition(path, month, rows)
+                    conn.execute(f"""
+                        INSERT INTO {manifest} (consume_month, path, rows, min_user_id, max_user_id, archived_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (month, relative, len(rows), min(row[1] for row in rows), max(row[1] for row in rows),
+                          datetime.now().isoformat()))
+                    conn.execute(f"DELETE FROM bills WHERE {_ARCHIVABLE}", month_params)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                stats['files'] += 1
+                stats['rows'] += len(rows)
+        finally:
+            conn.close()
+
+    def _write_partition(self, source: Path, month: int, rows: List[tuple]) -> str:
+        """写入一个分区文件（先写临时文件并落盘再改名），返回相对 archive_dir 的路径"""
+        relative = f"bills/consume_month={month}/{source.stem}-{uuid.uuid4().hex[:12]}.parquet"
+        target = self.archive_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, ARCHIVE_SCHEMA)],
+                                     schema=ARCHIVE_SCHEMA)
+        # 按 (user_id, consume_ts) 排序后写入（在Arrow中排序，比SQLite按虚拟列排序快得多）
+        table = table.sort_by([('user_id', 'ascending'), ('consume_ts', 'ascending')])
+        tmp_path = target.with_name(target.name + '.part')
+        with open(tmp_path, 'wb') as f:
+            pq.write_table(table, f, row_group_size=self.config['row_group_size'],
+                           compression=self.config['compression'])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+        return relative
+
+    def _remove_orphans(self) -> int:
+        """删除不在清单中的分区文件（上次归档写完文件后事务未提交）"""
+        root = self.archive_dir / 'bills'
+        if not root.exists():
+            return 0
+        conn = self._connect()
+        try:
+            known = {row[0] for row in conn.execute("SELECT path FROM bill_archive")}
+        finally:
+            conn.close()
+        removed = 0
+        for file in root.glob('consume_month=*/*.parquet*'):
+            relative = file.relative_to(self.archive_dir).as_posix()
+            if relative not in known and time.time() - file.stat().st_mtime > _ORPHAN_GRACE_SECONDS:
+                file.unlink()
+                removed += 1
+        return removed
+
+    # 查询
+    def files(self, user_id: int, first_month: int = None, last_month: int = None) -> List[str]:
+        """分区裁剪：清单中月份范围与用户范围都命中的文件"""
+        sql = "SELECT path FROM bill_archive WHERE min_user_id <= ? AND max_user_id >= ?"
+        params: List[Any] = [user_id, user_id]
+        if first_month is not None:
+            sql += " AND consume_month >= ?"
+            params.append(first_month)
+        if last_month is not None:
+            sql += " AND consume_month <= ?"
+            params.append(last_month)
+        conn = self._connect()
+        try:
+            return [str(self.archive_dir / row[0]) for row in conn.execute(sql + " ORDER BY consume_month", params)]
+        except Exception as e:
+            # 从未归档过的库没有清单表
+            if 'no such table' in str(e):
+                return []
+            raise
+        finally:
+            conn.close()
+
+    def scan(self, user_id: int, columns: List[str], first_month: int = None,
+             last_month: int = None) -> Optional['pa.Table']:
+        """读取用户的冷数据；没有命中的分区时返回None（不需要pyarrow）"""
+        paths = self.files(user_id, first_month, last_month)
+        return self._read(paths, user_id, columns) if paths else None
+
+    @staticmethod
+    def _read(paths: List[str], user_id: int, columns: List[str], predicate=None) -> 'pa.Table':
+        if not HAS_PYARROW:
+            raise RuntimeError("读取冷数据需要安装 pyarrow")
+        condition = ds.field('user_id') == user_id
+        if predicate is not None:
+            condition = condition & predicate
+        return ds.dataset(paths, schema=ARCHIVE_SCHEMA, format='parquet').to_table(columns=columns, filter=condition)
+
+    def monthly_totals(self, user_id: int, first_month: int, last_month: int) -> Dict[int, Tuple[float, int]]:
+        """冷数据按月汇总：{YYYYMM: (金额合计, 笔数)}"""
+        table = self.scan(user_id, ['consume_month', 'amount'], first_month, last_month)
+        if table is None or table.num_rows == 0:
+            return {}
+        totals = table.group_by('consume_month').aggregate([('amount', 'sum'), ('amount', 'count')])
+        return {month: (total, count) for month, total, count in zip(
+            totals['consume_month'].to_pylist(), totals['amount_sum'].to_pylist(), totals['amount_count'].to_pylist()
+        )}
+
+    def merge_monthly(self, user_id: int, year: int, monthly: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把已归档月份并入热数据的月度统计（格式同 DatabaseManager.get_monthly_spending）"""
+        cold = self.monthly_totals(user_id, year * 100 + 1, year * 100 + 12)
+        if not cold:
+            return monthly
+        merged = {row['month']: (row['total_amount'], row['count']) for row in monthly}
+        for month, (total, count) in cold.items():
+            hot_total, hot_count = merged.get(f"{month % 100:02d}", (0.0, 0))
+            merged[f"{month % 100:02d}"] = (hot_total + total, hot_count + count)
+        return [{"month": month, "total_amount": total, "count": count, "avg_amount": total / count}
+                for month, (total, count) in sorted(merged.items())]
+
+    def rows(self, user_id: int, columns: List[str], start_ts: int = None, end_day: int = None,
+             category: str = None) -> List[tuple]:
+        """按导出筛选条件读取冷数据行，按 consume_ts 排序"""
+        first_month = int(time.strftime('%Y%m', time.gmtime(start_ts))) if start_ts is not None else None
+        last_month = end_day // 100 if end_day is not None else None
+        paths = self.files(user_id, first_month, last_month)
+        if not paths:
+            return []
+        predicate = ds.field('consume_ts') >= (start_ts if start_ts is not None else -2 ** 62)
+        if end_day is not None:
+            predicate = predicate & (ds.field('consume_day') <= end_day)
+        if category:
+            predicate = predicate & (ds.field('category') == category)
+        table = self._read(paths, user_id, columns, predicate)
+        if 'consume_ts' in columns:
+            table = table.sort_by('consume_ts')
+        return list(zip(*[table[name].to_pylist() for name in columns]))
+
+    def status(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT MIN(consume_month), MAX(consume_month), COUNT(*), COALESCE(SUM(rows), 0) FROM bill_archive
+            """).fetchone()
+        finally:
+            conn.close()
+        size = sum(f.stat().st_size for f in (self.archive_dir / 'bills').glob('consume_month=*/*.parquet'))
+        return {'first_month': rows[0], 'last_month': rows[1], 'files': rows[2], 'rows': rows[3], 'bytes': size}
+
+
+# 创建全局冷数据存储实例
+cold_store = ColdStore()
+
+
+def main():
+    """命令行：python -m src.cold_storage status | archive [--dry-run] [--vacuum]"""
+    parser = argparse.ArgumentParser(description="账单冷数据归档")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="已归档的月份、文件数与行数")
+    run = sub.add_parser("archive", help=f"归档 {ARCHIVE_CONFIG['horizon_days']} 天以前的整月账单")
+    run.add_argument("--dry-run", action="store_true", help="只统计可归档的行数")
+    run.add_argument("--vacuum", action="store_true", help="归档后VACUUM各库，归还释放的空间")
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    cold_store.ensure_schema()
+    if args.command == "status":
+        stats = cold_store.status()
+        print(f"已归档 {stats['first_month']}~{stats['last_month']}：{stats['files']} 个文件，"
+              f"{stats['rows']} 笔账单，{stats['bytes']} 字节")
+        return
+
+    stats = cold_store.archive(dry_run=args.dry_run)
+    action = "可归档" if args.dry_run else "已归档"
+    print(f"{action} {stats['cutoff_month']} 之前的账单 {stats['rows']} 笔（{stats['files']} 个分区文件），"
+          f"清理孤儿文件 {stats['orphans']} 个，耗时 {stats['seconds']}s")
+    if args.vacuum and not args.dry_run:
+        for path in cold_store._paths():
+            conn = get_sqlite_connection(path, isolation_level=None)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        print("VACUUM 完成")
+
+
+if __name__ == "__main__":
+    main()
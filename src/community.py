@@ -0,0 +1,216 @@
+"""
+社区帖子模块 - 点赞/评论计数写缓冲（内存增量表定期批量写回），热榜候选集常驻内存、随计数增量更新
+
+点赞只写一行 post_likes（唯一索引保证幂等），不再在同一事务里读改写热门帖子的计数行；
+计数增量按帖子合并，每 flush_interval_seconds 秒一个事务写回。进程异常退出时未写回的增量可用
+python -m src.community --recount 按点赞/评论表重新统计。
+"""
+import argparse
+import calendar
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Sequence
+
+from .config import COMMUNITY_CONFIG, SHARD_CONFIG
+from .database import get_sqlite_connection
+from .records import parse_db_time
+from .sharding import shard_router
+
+# 帖子列表接口输出的字段与查询（计数与发布时间为空时按0/空串输出）
+POST_LIST_COLUMNS = ['id', 'user_id', 'title', 'content', 'bill_id', 'invoice_id',
+                     'likes_count', 'comments_count', 'created_at']
+POST_SELECT = """
+    SELECT id, user_id, title, content, bill_id, invoice_id,
+           COALESCE(likes_count, 0), COALESCE(comments_count, 0), COALESCE(created_at, '')
+    FROM community_posts
+"""
+LIKES, COMMENTS, CREATED_AT = 6, 7, 8
+
+
+class CommunityFeed:
+    """帖子计数缓冲与热榜缓存（每个worker进程一份，增量可直接相加，多进程各自写回互不影响）"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = dict(COMMUNITY_CONFIG, **(config or {}))
+        self._lock = threading.RLock()
+        self._pending: Dict[int, List] = {}  # 帖子id -> [所在分片, 点赞增量, 评论增量]
+        self._hot: Dict[int, List] = {}  # 帖子id -> [列表行, 发布时间戳]
+        self._hot_loaded_at = 0.0
+        self._ranked: Optional[List[tuple]] = None
+        self._ranked_at = 0.0
+        self._flush_thread = None
+
+    @staticmethod
+    def _connect(path: Path):
+        return get_sqlite_connection(path, timeout=SHARD_CONFIG['busy_timeout'])
+
+    def ensure_schema(self):
+        """旧库迁移：去掉重复点赞后建 (post_id, user_id) 唯一索引"""
+        for path in shard_router.paths():
+            conn = self._connect(path)
+            try:
+                conn.executescript("""
+                    DELETE FROM post_likes WHERE id NOT IN (
+                        SELECT MIN(id) FROM post_likes GROUP BY post_id, user_id
+                    );
+                    CREATE UNIQUE INDEX IF NOT EXISTS uq_post_likes_post_user ON post_likes (post_id, user_id);
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+
+    # 计数缓冲
+    def record(self, path: Path, post_id: int, likes: int = 0, comments: int = 0):
+        """记下一次点赞/评论：增量进缓冲，热榜候选中的帖子同步更新"""
+        with self._lock:
+            entry = self._pending.setdefault(post_id, [path, 0, 0])
+            entry[1] += likes
+            entry[2] += comments
+            hot = self._hot.get(post_id)
+            if hot is not None:
+                hot[0][LIKES] += likes
+                hot[0][COMMENTS] += comments
+                self._ranked = None
+
+    def flush(self) -> int:
+        """把缓冲的增量按分片各一个事务写回，返回写回的帖子数；失败的增量放回缓冲下次再写"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        by_path: Dict[Path, List[tuple]] = {}
+        for post_id, (path, likes, comments) in pending.items():
+            by_path.setdefault(path, []).append((likes, comments, post_id))
+        for path, updates in by_path.items():
+            conn = self._connect(path)
+            try:
+                conn.executemany("UPDATE community_posts SET likes_count = COALESCE(likes_count, 0) + ?, "
+                                 "comments_count = COALESCE(comments_count, 0) + ? WHERE id = ?", updates)
+                conn.commit()
+            except Exception:
+                with self._lock:
+                    for likes, comments, post_id in updates:
+                        entry = self._pending.setdefault(post_id, [path, 0, 0])
+                        entry[1] += likes
+                        entry[2] += comments
+                raise
+            finally:
+                conn.close()
+        return len(pending)
+
+    def with_pending(self, rows: Iterable[Sequence]) -> Iterator[Sequence]:
+        """列表行（POST_LIST_COLUMNS顺序）叠加本进程尚未写回的计数"""
+        for row in rows:
+            entry = self._pending.get(row[0])
+            if entry is None:
+                yield row
+            else:
+                row = list(row)
+                row[LIKES] += entry[1]
+                row[COMMENTS] += entry[2]
+                yield row
+
+    def start_background_flush(self):
+        """启动后台写回线程（服务启动时调用，每个worker一个）"""
+        if self._flush_thread is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(self.config['flush_interval_seconds'])
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"社区计数写回失败: {e}")
+
+        self._flush_thread = threading.Thread(target=_loop, name="community-counters", daemon=True)
+        self._flush_thread.start()
+
+    def recount(self) -> int:
+        """按点赞/评论表重新统计全部帖子的计数（修复异常退出丢失的增量），返回更新的帖子数"""
+        self.flush()
+        updated = 0
+        for path in shard_router.paths():
+            conn = self._connect(path)
+            try:
+                updated += conn.execute("""
+                    UPDATE community_posts SET
+                        likes_count = (SELECT COUNT(*) FROM post_likes WHERE post_id = community_posts.id),
+                        comments_count = (SELECT COUNT(*) FROM post_comments WHERE post_id = community_posts.id)
+                """).rowcount
+                conn.commit()
+            finally:
+                conn.close()
+        with self._lock:
+            self._hot_loaded_at = 0.0
+        return updated
+
+    # 热榜
+    def hot_score(self, likes: int, comments: int, created_ts: float, now: float) -> float:
+        age_hours = max(now - created_ts, 0) / 3600
+        return (likes + self.config['comment_weight'] * comments + 1) / (age_hours + 2) ** self.config['hot_gravity']
+
+    def add_post(self, row: Sequence):
+        """新发布的帖子直接进入热榜候选"""
+        with self._lock:
+            if self._hot_loaded_at:
+                self._hot[row[0]] = [list(row), self._timestamp(row[CREATED_AT])]
+                self._ranked = None
+
+    @staticmethod
+    def _timestamp(value: Any) -> float:
+        # created_at 由 CURRENT_TIMESTAMP 写入，为UTC墙上时间
+        parsed = parse_db_time(value) if value else None
+        return calendar.timegm(parsed.timetuple()) if parsed else 0.0
+
+    def _load_candidates(self):
+        """最近发布的 hot_candidates 篇帖子（先写回本进程的增量，库中计数即最新）"""
+        self.flush()
+        limit = self.config['hot_candidates']
+
+        def query(path: Path):
+            conn = get_sqlite_connection(path)
+            try:
+                return conn.execute(f"{POST_SELECT} ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            finally:
+                conn.close()
+
+        rows = shard_router.merge_sorted(shard_router.fan_out(query), key=lambda row: row[CREATED_AT], limit=limit)
+        self._hot = {row[0]: [list(row), self._timestamp(row[CREATED_AT])] for row in rows}
+        self._hot_loaded_at = time.time()
+        self._ranked = None
+
+    def hot_posts(self, limit: int = 20, offset: int = 0) -> List[tuple]:
+        """按热度排序的帖子（POST_LIST_COLUMNS顺序），直接从缓存的排序结果切片"""
+        now = time.time()
+        with self._lock:
+            if now - self._hot_loaded_at > self.config['hot_refresh_seconds']:
+                self._load_candidates()
+            if self._ranked is None or now - self._ranked_at > self.config['hot_rerank_seconds']:
+                entries = sorted(self._hot.values(), reverse=True,
+                                 key=lambda entry: self.hot_score(entry[0][LIKES], entry[0][COMMENTS], entry[1], now))
+                self._ranked = [tuple(row) for row, _ in entries]
+                self._ranked_at = now
+            return self._ranked[offset:offset + limit]
+
+
+# 创建全局社区实例
+community_feed = CommunityFeed()
+
+
+def main():
+    """命令行修复计数：python -m src.community --recount"""
+    parser = argparse.ArgumentParser(description="社区帖子计数维护")
+    parser.add_argument("--recount", action="store_true", help="按点赞/评论表重新统计全部帖子的计数")
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    community_feed.ensure_schema()
+    if args.recount:
+        print(f"重新统计 {community_feed.recount()} 篇帖子的点赞/评论数")
+
+
+if __name__ == "__main__":
+    main()
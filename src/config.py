@@ -7,23 +7,35 @@ from pathlib import Path
 # 项目根目录
 BASE_DIR = Path(__file__).parent.parent
 
-# 数据库配置
-DATABASE_URL = f"sqlite:///{BASE_DIR}/data/bill_db.sqlite"
-DATABASE_PATH = BASE_DIR / "data" / "bill_db.sqlite"
+# 数据库配置（BILL_DB_PATH 可指向其他库文件，如压测用的副本）
+DATABASE_PATH = Path(os.getenv("BILL_DB_PATH", BASE_DIR / "data" / "bill_db.sqlite"))
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+
+# 按用户分片配置：shards为1时不分片，所有数据都在 DATABASE_PATH；
+# 大于1时账单/发票/预算/画像/社区帖子等按user_id分布到 shard_dir 下的多个库，DATABASE_PATH 只保留全局表
+SHARD_CONFIG = {
+    "shards": int(os.getenv("BILL_DB_SHARDS", "1")),
+    "shard_dir": Path(os.getenv("BILL_SHARD_DIR", DATABASE_PATH.parent / "shards")),
+    "virtual_nodes": 128,  # 一致性哈希环上每个分片的虚拟节点数
+    "id_block_size": 1000,  # 分片模式下每次从主库领取的全局id段长度
+    "fanout_workers": 8,  # 跨分片查询的并发线程数
+    "busy_timeout": 30  # 写锁等待秒数
+}
 
 # 数据目录
 DATA_DIR = BASE_DIR / "data"
 MODELS_DIR = BASE_DIR / "data" / "models"
 TEST_DATA_DIR = BASE_DIR / "data" / "test_data"
-EXPORTS_DIR = BASE_DIR / "data" / "exports"
-UPLOADS_DIR = BASE_DIR / "data" / "uploads"
+# 导出目录（BILL_EXPORTS_DIR 可指向多个worker/实例共享的目录：后台导出任务的状态与文件都在这里）
+EXPORTS_DIR = Path(os.getenv("BILL_EXPORTS_DIR", BASE_DIR / "data" / "exports"))
+UPLOADS_DIR = Path(os.getenv("BILL_UPLOADS_DIR", BASE_DIR / "data" / "uploads"))
 
 # 确保目录存在
 DATA_DIR.mkdir(exist_ok=True)
 MODELS_DIR.mkdir(exist_ok=True)
 TEST_DATA_DIR.mkdir(exist_ok=True)
-EXPORTS_DIR.mkdir(exist_ok=True)
-UPLOADS_DIR.mkdir(exist_ok=True)
+EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 # API配置
 API_V1_PREFIX = "/api/v1"
@@ -47,6 +59,216 @@ AI_CONFIG = {
     "min_samples_for_training": 10
 }
 
+# 协同过滤推荐配置（用户×商家/类别稀疏矩阵，离线计算物品相似邻居）
+RECOMMENDER_CONFIG = {
+    "model_path": MODELS_DIR / "cf_recommender.npz",
+    "history_days": 365,  # 训练只统计最近N天的账单
+    "neighbors": 50,  # 每个商家/类别保留的最相似邻居数
+    "min_item_users": 2,  # 消费用户少于该数的商家/类别不参与相似度计算（样本太少不可信）
+    "default_limit": 10
+}
+
+# 模型仓库：registry/<模型名>/vNNNN/ 带校验和的版本目录，CURRENT 指向当前版本
+MODEL_REGISTRY_CONFIG = {
+    "root": MODELS_DIR / "registry",
+    "keep": 5  # 每个模型保留的版本数（当前版本总是保留）
+}
+
+# 发票分类模型配置（python -m src.invoice_classifier train 训练并发布，服务启动只加载）
+INVOICE_MODEL_CONFIG = {
+    "name": "invoice_classifier",
+    "n_features": 2 ** 18,  # 特征哈希空间大小
+    "alpha": 0.01,  # NB平滑系数；哈希空间很大，取1.0会把各类别的词概率抹平
+    "batch_size": 5000,  # 每批从游标读取并增量训练的发票数
+    "holdout_every": 10,  # id能被该数整除的发票留作验证集
+    "ignored_labels": ("未知", ""),  # 未分类的发票不参与训练
+    "reload_interval_seconds": 30  # 检查是否发布了新版本的间隔
+}
+
+# 自然语言查询配置
+QUERY_CONFIG = {
+    "parse_cache_size": 2048,  # 归一化查询串 -> 解析结果 的LRU缓存容量
+    "intent_threshold": 0.3  # 与最近意图模板的余弦相似度低于该值时判为unknown
+}
+
+# 对话助手配置
+ASSISTANT_CONFIG = {
+    "snapshot_days": 365,  # 账单快照覆盖的天数（好商家推荐需至少90天）
+    "snapshot_ttl": 30,  # 快照复用秒数，多轮对话在此期间不再查库
+    "max_snapshots": 1000,  # 最多缓存的用户快照数（LRU）
+    "large_amount": 1000  # 大额预警阈值（元）
+}
+
+# 分析引擎配置（sqlite: 直接查询OLTP库；duckdb: 查询本地列式副本）
+ANALYTICS_CONFIG = {
+    "backend": os.getenv("ANALYTICS_BACKEND", "sqlite"),
+    "duckdb_path": DATA_DIR / "analytics" / "bills.duckdb",
+    "parquet_dir": DATA_DIR / "analytics" / "parquet",
+    "sync_interval_seconds": 60,  # 增量同步间隔
+    "sync_batch_size": 50000,  # 每批从SQLite拉取的行数
+    "recent_limit": 1000  # 与OLTP路径一致的"最近N笔"窗口
+}
+
+# 冷数据归档配置：早于horizon的整月账单移出OLTP库，按月分区写入Parquet，全历史查询时合并读取
+ARCHIVE_CONFIG = {
+    "archive_dir": Path(os.getenv("BILL_ARCHIVE_DIR", DATA_DIR / "archive")),
+    "horizon_days": int(os.getenv("BILL_ARCHIVE_HORIZON_DAYS", "730")),  # 保留在库中的天数（按整月向前取整）
+    "row_group_size": 16384,  # 文件内按 (user_id, consume_ts) 排序，row group统计信息可按用户跳过
+    "compression": "zstd"
+}
+
+# 在线备份与只读副本配置（SQLite在线备份API，分步复制不阻塞写入）
+SNAPSHOT_CONFIG = {
+    "backup_dir": Path(os.getenv("BILL_BACKUP_DIR", DATA_DIR / "backups")),  # 快照：backups/YYYYmmdd_HHMMSS/<库文件>
+    "keep": 7,  # 保留最近N份快照
+    "pages_per_step": 256,  # 每步复制的页数，步间释放读锁让写入提交
+    "step_sleep": 0.005,  # 步间休眠秒数
+    "max_restarts": 3,  # 复制期间源库被写入会从头重来；超过次数后改为一步复制完（短暂持有读锁）
+    "replica_enabled": os.getenv("BILL_REPLICA", "0") == "1",  # 报表批量生成/推荐训练/分析同步读只读副本
+    "replica_dir": DATA_DIR / "replica",
+    "replica_interval_seconds": 300  # 副本刷新间隔
+}
+
+# 前端静态资源配置：构建时加内容指纹并预压缩，/app 下按Accept-Encoding返回
+STATIC_CONFIG = {
+    "mount_path": "/app",
+    "source_dir": os.getenv("STATIC_SOURCE_DIR"),  # 不设置时依次使用 candidates 中第一个含index.html的目录
+    "candidates": (BASE_DIR / "frontend" / "dist", BASE_DIR / "web"),  # React构建产物优先
+    "out_dir": DATA_DIR / "static",
+    "hash_length": 10,  # 文件名中内容指纹的长度
+    "min_size": 512,  # 小于该字节数的文件不压缩
+    "max_ratio": 0.9,  # 压缩后不足原大小90%的才保留压缩版本
+    "brotli_quality": 11,  # 构建时一次性压缩，用最高压缩率
+    "spa_fallback": True,  # 无扩展名的未知路径返回index.html（前端路由）
+    "immutable_cache": "public, max-age=31536000, immutable",
+    "revalidate_cache": "no-cache"
+}
+
+# 账单导出配置
+EXPORT_CONFIG = {
+    "chunk_size": 5000,  # 每批从游标读取的行数
+    "formats": ["csv", "xlsx", "parquet"],
+    "jobs_dir": EXPORTS_DIR / "jobs"  # 后台导出任务状态：jobs/<job_id>.json，任一worker都能查询
+}
+
+# 列表接口流式JSON响应配置
+STREAM_CONFIG = {
+    "chunk_rows": 1000  # 每批从游标读取并序列化的行数
+}
+
+# 社区配置
+COMMUNITY_CONFIG = {
+    "flush_interval_seconds": 2,  # 点赞/评论计数增量批量写回的间隔
+    "hot_candidates": 500,  # 热榜候选集：最近发布的N篇帖子常驻内存
+    "hot_refresh_seconds": 300,  # 从库中重新加载候选集的间隔（合并其他worker写回的计数）
+    "hot_rerank_seconds": 30,  # 热度随时间衰减，至少每隔这么久重新排序
+    "hot_gravity": 1.5,  # 热度 = (点赞 + 评论权重×评论 + 1) / (发布小时数 + 2) ^ gravity
+    "comment_weight": 2
+}
+
+# 消费报表配置
+REPORT_CONFIG = {
+    "recent_limit": 1000,  # 未指定日期范围时分析最近N笔账单（与原各分析接口一致）
+    "reports_dir": EXPORTS_DIR / "reports",  # 预生成的月报：reports/YYYYMM/user_<id>.json
+    "schedule_enabled": os.getenv("REPORT_SCHEDULE", "0") == "1",  # 服务内后台补齐上月月报
+    "schedule_interval_seconds": 3600  # 后台检查间隔（秒）
+}
+
+# MySQL导出文件导入配置
+IMPORT_CONFIG = {
+    "read_chunk_size": 1 << 20,  # 每次从导出文件读取的字符数
+    "batch_size": 5000,  # 每个upsert事务的行数
+    "progress_interval_seconds": 1.0
+}
+
+# 上传文件配置（按SHA-256内容寻址存储，相同图片只识别一次）
+UPLOAD_CONFIG = {
+    "chunk_size": 1 << 20,  # 流式写盘的分块大小
+    "max_bytes": 10 * 1024 * 1024,  # 单个文件上限
+    "fanout_levels": 2  # 哈希前缀目录层数：ab/cd/abcd....jpg
+}
+
+# 发票-账单对账配置
+RECONCILE_CONFIG = {
+    "amount_abs_tolerance": 1.0,  # 金额差容忍（元）
+    "amount_rel_tolerance": 0.01,  # 金额差容忍（比例），取两者较大值
+    "time_window_hours": 72,  # 发票时间与消费时间的最大间隔
+    "ngram": 2,  # 商家名相似度的字n-gram长度
+    "weights": (0.5, 0.3, 0.2),  # 得分权重：商家、金额、时间
+    "min_score": 0.6,  # 低于该分数不关联
+    "commit_every": 10000  # 批量对账每处理多少条关联提交一次
+}
+
+# 商家规范化配置
+MERCHANT_CONFIG = {
+    "ngram": 2,  # 模糊匹配候选召回用的字n-gram长度
+    "min_similarity": 0.7,  # 与已有商家的相似度不低于该值时归为同一商家
+    "resolve_cache_size": 50000,  # 原始名称 -> 商家id 的缓存容量
+    # 归一化时从名称末尾去掉的公司/业态后缀（按顺序反复剥离）
+    "suffixes": ["有限责任公司", "股份有限公司", "有限公司", "公司", "集团", "连锁", "经营", "管理", "贸易",
+                 "商贸", "服务", "餐饮", "旗舰店", "专卖店", "便利店", "咖啡馆", "咖啡", "餐厅", "饭店",
+                 "酒店", "超市", "商城", "外卖", "门店", "分店", "总店", "店"],
+    # 归一化时从名称开头去掉的地名（发票上的公司全称常带城市前缀）
+    "prefixes": ["北京", "上海", "天津", "重庆", "广州", "深圳", "杭州", "南京", "成都", "武汉",
+                 "西安", "苏州", "长沙", "郑州", "青岛", "厦门", "中国"]
+}
+
+# 全文检索配置（FTS5 + jieba分词）
+SEARCH_CONFIG = {
+    "sync_batch_size": 5000,  # 每批处理的待索引行数
+    "default_limit": 20,
+    "max_limit": 100,
+    "snippet_chars": 40,  # 长文本高亮片段在命中词两侧保留的字数
+    "highlight_tags": ("<mark>", "</mark>"),
+    "column_weights": (2.0, 1.0)  # bm25权重：商家、正文（scope列固定为0）
+}
+
+# 性能监控配置
+METRICS_CONFIG = {
+    "enabled": True,
+    "server_timing": os.getenv("SERVER_TIMING", "0") == "1",  # 所有响应都带Server-Timing
+    "server_timing_header": "X-Server-Timing",  # 请求携带该头（值为1）时单独开启
+    "latency_buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+}
+
+# 生产服务配置（gunicorn.conf.py 读取）
+SERVER_CONFIG = {
+    "workers": int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    "timeout": 120,  # 单请求最长处理时间（OCR/报表较慢）
+    "graceful_timeout": 30,  # 平滑重启时等待在途请求完成的时间
+    "keepalive": 5,
+    "max_requests": 10000,  # 处理若干请求后轮换worker，防止内存缓慢增长
+    "max_requests_jitter": 1000,
+    # 全局后台任务（分析库同步、月报预生成、只读副本刷新）只在持有该文件锁的一个worker里运行
+    "leader_lock": Path(os.getenv("BILL_LEADER_LOCK", DATABASE_PATH.parent / ".background.lock")),
+    "leader_retry_seconds": 30  # 未当选的worker隔多久重试一次（原持锁worker轮换退出后接替）
+}
+
+# 准入控制配置（每个worker进程各自计数）：昂贵的报表/画像接口限并发、有界排队，
+# 排队的交互请求总是先于重请求放行；同一请求在途时后来者共用结果
+ADMISSION_CONFIG = {
+    "enabled": os.getenv("ADMISSION_ENABLED", "1") == "1",
+    "slots": 64,  # 同时处理的请求总数
+    "default_class": "interactive",  # 未列出的路由
+    "classes": {
+        # priority越小越先放行；queue为最多排队数，满了直接429；timeout为排队超时秒数，超时返回503
+        "interactive": {"priority": 0, "max_active": 64, "queue": 256, "timeout": 5.0},
+        "heavy": {"priority": 1, "max_active": max(1, os.cpu_count() or 1), "queue": 32, "timeout": 15.0}
+    },
+    "routes": {
+        # 路由模板 -> 优先级类别、该路由自身的并发上限、是否合并相同的在途请求
+        f"{API_V1_PREFIX}/analysis/comprehensive": {"class": "heavy", "max_active": 2, "coalesce": True},
+        f"{API_V1_PREFIX}/analysis/report/monthly": {"class": "heavy", "max_active": 2, "coalesce": True},
+        f"{API_V1_PREFIX}/ai/analysis/comprehensive/{{user_id}}": {"class": "heavy", "max_active": 2, "coalesce": True},
+        f"{API_V1_PREFIX}/ai/recommendations/financial/enhanced/{{user_id}}": {"class": "heavy", "max_active": 2, "coalesce": True},
+        f"{API_V1_PREFIX}/ai/recommendations/financial/{{user_id}}": {"class": "heavy", "coalesce": True},
+        f"{API_V1_PREFIX}/ai/recommendations/spending/{{user_id}}": {"class": "heavy", "coalesce": True},
+        f"{API_V1_PREFIX}/ai/profile/{{user_id}}": {"class": "heavy", "coalesce": True}
+    },
+    "retry_after": 2,  # 拒绝时 Retry-After 秒数
+    "coalesce_max_body": 64 * 1024  # 请求体超过该字节数不参与合并
+}
+
 # 图表配置
 CHART_CONFIG = {
     "default_colors": ["#1890ff", "#52c41a", "#faad14", "#f5222d", "#722ed1"],
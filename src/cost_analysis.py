@@ -22,7 +22,11 @@ except ImportError:
     print("Warning: seaborn not available, some visualization features may be limited")
 
 from .database import db_manager
-from .config import CHART_CONFIG
+from .analytics_engine import analytics_engine
+from .metrics import timed, timed_section
+from .report_pipeline import report_pipeline, load_report_frame
+from .cold_storage import cold_store
+from .config import CHART_CONFIG, ANALYTICS_CONFIG
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
@@ -37,45 +41,10 @@ class CostAnalyzer:
     
     def get_spending_analysis(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> Dict[str, Any]:
         """获取消费分析报告"""
-        # 获取基础数据
-        if start_date and end_date:
-            bills = db_manager.get_bills_by_date_range(user_id, start_date, end_date)
-        else:
-            bills = db_manager.get_bills(user_id, limit=1000)
-        
-        if not bills:
-            return {
-                'summary': {'total_amount': 0, 'total_count': 0, 'avg_amount': 0},
-                'charts': {},
-                'insights': []
-            }
-        
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'id': bill.id,
-            'consume_time': bill.consume_time,
-            'amount': bill.amount,
-            'merchant': bill.merchant,
-            'category': bill.category,
-            'payment_method': bill.payment_method
-        } for bill in bills])
-        
-        # 基础统计
-        summary = self._calculate_summary(df)
-        
-        # 生成图表
-        charts = self._generate_charts(df)
-        
-        # 生成洞察
-        insights = self._generate_insights(df)
-        
-        return {
-            'summary': summary,
-            'charts': charts,
-            'insights': insights,
-            'data_points': len(df)
-        }
+        bills, params = load_report_frame(user_id, start_date, end_date)
+        return report_pipeline.run(['spending_analysis'], {'bills': bills, 'params': params})['spending_analysis']
     
+    @timed('pandas')
     def _calculate_summary(self, df: pd.DataFrame) -> Dict[str, Any]:
         """计算基础统计信息"""
         return {
@@ -88,37 +57,37 @@ class CostAnalyzer:
             'std_amount': float(df['amount'].std())
         }
     
-    def _generate_charts(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """生成各种图表"""
+    @timed('plotly')
+    def _generate_charts(self, df: pd.DataFrame, by_category: pd.DataFrame, by_payment: pd.Series,
+                         by_month: pd.Series, amount_bins: pd.Series) -> Dict[str, Any]:
+        """生成各种图表（分组结果由报表流水线共享，不再逐图重复groupby）"""
         charts = {}
         
         # 1. 消费类别饼图
-        charts['category_pie'] = self._create_category_pie_chart(df)
+        charts['category_pie'] = self._create_category_pie_chart(by_category['sum'].sort_values(ascending=False))
         
         # 2. 月度消费趋势图
-        charts['monthly_trend'] = self._create_monthly_trend_chart(df)
+        charts['monthly_trend'] = self._create_monthly_trend_chart(by_month)
         
         # 3. 支付方式柱状图
-        charts['payment_method_bar'] = self._create_payment_method_chart(df)
+        charts['payment_method_bar'] = self._create_payment_method_chart(by_payment)
         
         # 4. 消费金额分布直方图
-        charts['amount_distribution'] = self._create_amount_distribution_chart(df)
+        charts['amount_distribution'] = self._create_amount_distribution_chart(df['amount'])
         
         # 5. 消费类别雷达图
-        charts['category_radar'] = self._create_category_radar_chart(df)
+        charts['category_radar'] = self._create_category_radar_chart(by_category['sum'])
         
         # 6. 消费漏斗图
-        charts['spending_funnel'] = self._create_spending_funnel_chart(df)
+        charts['spending_funnel'] = self._create_spending_funnel_chart(amount_bins)
         
         # 7. 消费箱线图
         charts['amount_boxplot'] = self._create_amount_boxplot_chart(df)
         
         return charts
     
-    def _create_category_pie_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_category_pie_chart(self, category_data: pd.Series) -> Dict[str, Any]:
         """创建消费类别饼图"""
-        category_data = df.groupby('category')['amount'].sum().sort_values(ascending=False)
-        
         fig = go.Figure(data=[go.Pie(
             labels=category_data.index.tolist(),
             values=category_data.values.tolist(),
@@ -139,17 +108,13 @@ class CostAnalyzer:
             'title': '消费类别分布'
         }
     
-    def _create_monthly_trend_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_monthly_trend_chart(self, monthly_data: pd.Series) -> Dict[str, Any]:
         """创建月度消费趋势图"""
-        df['month'] = df['consume_time'].dt.to_period('M')
-        monthly_data = df.groupby('month')['amount'].sum().reset_index()
-        monthly_data['month_str'] = monthly_data['month'].astype(str)
-        
         fig = go.Figure()
         
         fig.add_trace(go.Scatter(
-            x=monthly_data['month_str'],
-            y=monthly_data['amount'],
+            x=[str(month) for month in monthly_data.index],
+            y=monthly_data.values.tolist(),
             mode='lines+markers',
             name='月度消费',
             line=dict(color=self.colors[0], width=3),
@@ -169,10 +134,8 @@ class CostAnalyzer:
             'title': '月度消费趋势'
         }
     
-    def _create_payment_method_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_payment_method_chart(self, payment_data: pd.Series) -> Dict[str, Any]:
         """创建支付方式柱状图"""
-        payment_data = df.groupby('payment_method')['amount'].sum().sort_values(ascending=False)
-        
         fig = go.Figure(data=[
             go.Bar(
                 x=payment_data.index.tolist(),
@@ -193,11 +156,11 @@ class CostAnalyzer:
             'title': '支付方式统计'
         }
     
-    def _create_amount_distribution_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_amount_distribution_chart(self, amounts: pd.Series) -> Dict[str, Any]:
         """创建消费金额分布直方图"""
         fig = go.Figure(data=[
             go.Histogram(
-                x=df['amount'],
+                x=amounts.tolist(),
                 nbinsx=20,
                 marker_color=self.colors[0],
                 opacity=0.7
@@ -216,11 +179,8 @@ class CostAnalyzer:
             'title': '消费金额分布'
         }
     
-    def _create_category_radar_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_category_radar_chart(self, category_data: pd.Series) -> Dict[str, Any]:
         """创建消费类别雷达图"""
-        # 按类别统计消费金额
-        category_data = df.groupby('category')['amount'].sum()
-        
         # 创建雷达图数据
         categories = category_data.index.tolist()
         values = category_data.values.tolist()
@@ -251,17 +211,10 @@ class CostAnalyzer:
             'title': '消费类别雷达图'
         }
     
-    def _create_spending_funnel_chart(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _create_spending_funnel_chart(self, funnel_data: pd.Series) -> Dict[str, Any]:
         """创建消费漏斗图"""
-        # 按金额区间创建漏斗
-        df['amount_range'] = pd.cut(df['amount'], 
-                                  bins=[0, 50, 100, 200, 500, 1000, float('inf')],
-                                  labels=['0-50', '50-100', '100-200', '200-500', '500-1000', '1000+'])
-        
-        funnel_data = df.groupby('amount_range').size().sort_values(ascending=False)
-        
         fig = go.Figure(go.Funnel(
-            y=funnel_data.index.tolist(),
+            y=[str(label) for label in funnel_data.index],
             x=funnel_data.values.tolist(),
             textinfo="value+percent initial",
             marker=dict(color=self.colors)
@@ -283,10 +236,9 @@ class CostAnalyzer:
         fig = go.Figure()
         
         # 按类别创建箱线图
-        for category in df['category'].unique():
-            category_data = df[df['category'] == category]['amount']
+        for category, category_data in df.groupby('category', sort=False)['amount']:
             fig.add_trace(go.Box(
-                y=category_data,
+                y=category_data.tolist(),
                 name=category,
                 boxpoints='outliers'
             ))
@@ -303,13 +255,14 @@ class CostAnalyzer:
             'title': '消费金额箱线图'
         }
     
-    def _generate_insights(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+    @timed('pandas')
+    def _generate_insights(self, df: pd.DataFrame, by_category: pd.DataFrame, by_payment: pd.Series,
+                           daily_amounts: pd.Series) -> List[Dict[str, Any]]:
         """生成消费洞察"""
         insights = []
         
         # 1. 消费总额洞察
         total_amount = df['amount'].sum()
-        avg_amount = df['amount'].mean()
         
         if total_amount > 5000:
             insights.append({
@@ -320,7 +273,7 @@ class CostAnalyzer:
             })
         
         # 2. 消费类别洞察
-        category_data = df.groupby('category')['amount'].sum().sort_values(ascending=False)
+        category_data = by_category['sum'].sort_values(ascending=False)
         top_category = category_data.index[0]
         top_amount = category_data.iloc[0]
         
@@ -332,8 +285,7 @@ class CostAnalyzer:
         })
         
         # 3. 消费频率洞察
-        daily_spending = df.groupby(df['consume_time'].dt.date)['amount'].sum()
-        avg_daily = daily_spending.mean()
+        avg_daily = daily_amounts.mean()
         
         if avg_daily > 200:
             insights.append({
@@ -344,20 +296,16 @@ class CostAnalyzer:
             })
         
         # 4. 支付方式洞察
-        payment_data = df.groupby('payment_method')['amount'].sum().sort_values(ascending=False)
-        top_payment = payment_data.index[0]
+        top_payment = by_payment.index[0]
         
         insights.append({
             'type': 'payment_analysis',
             'title': '支付方式偏好',
-            'message': f'主要使用{top_payment}支付，占总消费的{payment_data.iloc[0]/total_amount*100:.1f}%',
+            'message': f'主要使用{top_payment}支付，占总消费的{by_payment.iloc[0]/total_amount*100:.1f}%',
             'level': 'info'
         })
         
         # 5. 消费趋势洞察
-        df['date'] = df['consume_time'].dt.date
-        daily_amounts = df.groupby('date')['amount'].sum()
-        
         if len(daily_amounts) > 7:
             recent_trend = daily_amounts.tail(7).mean()
             earlier_trend = daily_amounts.head(7).mean()
@@ -381,37 +329,13 @@ class CostAnalyzer:
     
     def get_category_analysis(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> Dict[str, Any]:
         """获取分类消费分析"""
-        if start_date and end_date:
-            bills = db_manager.get_bills_by_date_range(user_id, start_date, end_date)
-        else:
-            bills = db_manager.get_bills(user_id, limit=1000)
-        
-        if not bills:
-            return {'categories': [], 'total_amount': 0}
-        
-        df = pd.DataFrame([{
-            'category': bill.category,
-            'amount': bill.amount,
-            'consume_time': bill.consume_time
-        } for bill in bills])
-        
-        # 按类别统计
-        category_stats = df.groupby('category').agg({
-            'amount': ['sum', 'count', 'mean', 'std']
-        }).round(2)
-        
-        category_stats.columns = ['total_amount', 'count', 'avg_amount', 'std_amount']
-        category_stats = category_stats.sort_values('total_amount', ascending=False)
-        
-        # 计算占比
-        total_amount = category_stats['total_amount'].sum()
-        category_stats['percentage'] = (category_stats['total_amount'] / total_amount * 100).round(2)
+        if analytics_engine.enabled:
+            return analytics_engine.category_shares(
+                user_id, start_date, end_date, limit=ANALYTICS_CONFIG['recent_limit']
+            )
         
-        return {
-            'categories': category_stats.to_dict('index'),
-            'total_amount': total_amount,
-            'category_count': len(category_stats)
-        }
+        bills, params = load_report_frame(user_id, start_date, end_date)
+        return report_pipeline.run(['category_analysis'], {'bills': bills, 'params': params})['category_analysis']
     
     def get_trend_analysis(self, user_id: int, period: str = 'monthly') -> Dict[str, Any]:
         """获取趋势分析"""
@@ -428,14 +352,19 @@ class CostAnalyzer:
             }
         elif period == 'weekly':
             # 获取周度数据
-            bills = db_manager.get_bills(user_id, limit=1000)
-            if not bills:
+            if analytics_engine.enabled:
+                weekly_data = analytics_engine.weekly_trend(user_id, limit=ANALYTICS_CONFIG['recent_limit'])
+                return {
+                    'period': 'weekly',
+                    'data': weekly_data,
+                    'total_amount': sum(item['amount'] for item in weekly_data)
+                }
+            
+            bills = db_manager.get_bill_columns(user_id, ['consume_time', 'amount'], limit=1000)
+            if not len(bills['amount']):
                 return {'period': 'weekly', 'data': [], 'total_amount': 0}
             
-            df = pd.DataFrame([{
-                'consume_time': bill.consume_time,
-                'amount': bill.amount
-            } for bill in bills])
+            df = pd.DataFrame(bills)
             
             df['week'] = df['consume_time'].dt.to_period('W')
             weekly_data = df.groupby('week')['amount'].sum().reset_index()
@@ -449,24 +378,11 @@ class CostAnalyzer:
         
         return {'period': period, 'data': [], 'total_amount': 0}
     
-    def generate_report(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> Dict[str, Any]:
-        """生成完整的消费分析报告"""
-        analysis = self.get_spending_analysis(user_id, start_date, end_date)
-        category_analysis = self.get_category_analysis(user_id, start_date, end_date)
-        trend_analysis = self.get_trend_analysis(user_id, 'monthly')
-        
-        return {
-            'report_info': {
-                'user_id': user_id,
-                'start_date': start_date.isoformat() if start_date else None,
-                'end_date': end_date.isoformat() if end_date else None,
-                'generated_at': datetime.now().isoformat()
-            },
-            'spending_analysis': analysis,
-            'category_analysis': category_analysis,
-            'trend_analysis': trend_analysis,
-            'recommendations': self._generate_recommendations(analysis, category_analysis)
-        }
+    def generate_report(self, user_id: int, start_date: datetime = None, end_date: datetime = None,
+                        year: int = None) -> Dict[str, Any]:
+        """生成完整的消费分析报告（分析窗口与year整年的月度趋势一次扫描取出，各段落共享分组结果）"""
+        bills, params = load_report_frame(user_id, start_date, end_date, year=year or datetime.now().year)
+        return report_pipeline.run(['report'], {'bills': bills, 'params': params})['report']
     
     def _generate_recommendations(self, spending_analysis: Dict, category_analysis: Dict) -> List[Dict[str, Any]]:
         """生成消费建议"""
@@ -510,3 +426,124 @@ class CostAnalyzer:
 
 # 创建全局分析器实例
 cost_analyzer = CostAnalyzer()
+
+
+# 报表流水线各阶段：输入为 bills（一次扫描得到的账单帧）与 params（窗口参数）
+AMOUNT_BINS = [0, 50, 100, 200, 500, 1000, float('inf')]
+AMOUNT_LABELS = ['0-50', '50-100', '100-200', '200-500', '500-1000', '1000+']
+
+
+@report_pipeline.stage('window', ('bills', 'params'))
+def _window(bills: pd.DataFrame, params: Dict[str, Any]) -> pd.DataFrame:
+    """分析窗口：日期范围（闭区间）或最近N笔"""
+    if params['start_ts'] is not None:
+        return bills[bills['consume_ts'].between(params['start_ts'], params['end_ts'])].reset_index(drop=True)
+    return bills.head(params['limit'])
+
+
+@report_pipeline.stage('by_category', ('window',))
+@timed('pandas')
+def _by_category(window: pd.DataFrame) -> pd.DataFrame:
+    return window.groupby('category')['amount'].agg(['sum', 'count', 'mean', 'std'])
+
+
+@report_pipeline.stage('by_payment', ('window',))
+@timed('pandas')
+def _by_payment(window: pd.DataFrame) -> pd.Series:
+    return window.groupby('payment_method')['amount'].sum().sort_values(ascending=False)
+
+
+@report_pipeline.stage('by_day', ('window',))
+@timed('pandas')
+def _by_day(window: pd.DataFrame) -> pd.Series:
+    return window.groupby(window['consume_time'].dt.date)['amount'].sum()
+
+
+@report_pipeline.stage('by_month', ('window',))
+@timed('pandas')
+def _by_month(window: pd.DataFrame) -> pd.Series:
+    return window.groupby(window['consume_time'].dt.to_period('M'))['amount'].sum()
+
+
+@report_pipeline.stage('amount_bins', ('window',))
+@timed('pandas')
+def _amount_bins(window: pd.DataFrame) -> pd.Series:
+    ranges = pd.cut(window['amount'], bins=AMOUNT_BINS, labels=AMOUNT_LABELS)
+    return window.groupby(ranges, observed=False).size().sort_values(ascending=False)
+
+
+@report_pipeline.stage('spending_analysis', ('window', 'by_category', 'by_payment', 'by_day', 'by_month', 'amount_bins'))
+def _spending_analysis(window, by_category, by_payment, by_day, by_month, amount_bins) -> Dict[str, Any]:
+    if window.empty:
+        return {
+            'summary': {'total_amount': 0, 'total_count': 0, 'avg_amount': 0},
+            'charts': {},
+            'insights': []
+        }
+    return {
+        'summary': cost_analyzer._calculate_summary(window),
+        'charts': cost_analyzer._generate_charts(window, by_category, by_payment, by_month, amount_bins),
+        'insights': cost_analyzer._generate_insights(window, by_category, by_payment, by_day),
+        'data_points': len(window)
+    }
+
+
+@report_pipeline.stage('category_analysis', ('by_category',))
+@timed('pandas')
+def _category_analysis(by_category: pd.DataFrame) -> Dict[str, Any]:
+    if by_category.empty:
+        return {'categories': [], 'total_amount': 0}
+    category_stats = by_category.round(2)
+    category_stats.columns = ['total_amount', 'count', 'avg_amount', 'std_amount']
+    category_stats = category_stats.sort_values('total_amount', ascending=False)
+    
+    # 计算占比
+    total_amount = category_stats['total_amount'].sum()
+    category_stats['percentage'] = (category_stats['total_amount'] / total_amount * 100).round(2)
+    return {
+        'categories': category_stats.to_dict('index'),
+        'total_amount': float(total_amount),
+        'category_count': len(category_stats)
+    }
+
+
+@report_pipeline.stage('monthly_spending', ('bills', 'params'))
+@timed('pandas')
+def _monthly_spending(bills: pd.DataFrame, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """params['year'] 整年的月度统计（格式同 DatabaseManager.get_monthly_spending，并入已归档月份）"""
+    year_bills = bills[(bills['consume_ts'] >= params['year_start']) & (bills['consume_ts'] < params['year_end'])]
+    grouped = year_bills.groupby(year_bills['consume_time'].dt.month)['amount'].agg(['sum', 'count', 'mean'])
+    monthly = [{"month": f"{month:02d}", "total_amount": float(row['sum']), "count": int(row['count']),
+                "avg_amount": float(row['mean'])} for month, row in grouped.iterrows()]
+    return cold_store.merge_monthly(params['user_id'], params['year'], monthly)
+
+
+@report_pipeline.stage('trend_analysis', ('monthly_spending',))
+def _trend_analysis(monthly_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'period': 'monthly',
+        'data': monthly_data,
+        'total_amount': sum(item['total_amount'] for item in monthly_data),
+        'avg_monthly': sum(item['total_amount'] for item in monthly_data) / len(monthly_data) if monthly_data else 0
+    }
+
+
+@report_pipeline.stage('recommendations', ('spending_analysis', 'category_analysis'))
+def _recommendations(spending_analysis: Dict[str, Any], category_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return cost_analyzer._generate_recommendations(spending_analysis, category_analysis)
+
+
+@report_pipeline.stage('report', ('params', 'spending_analysis', 'category_analysis', 'trend_analysis', 'recommendations'))
+def _report(params, spending_analysis, category_analysis, trend_analysis, recommendations) -> Dict[str, Any]:
+    return {
+        'report_info': {
+            'user_id': params['user_id'],
+            'start_date': params['start_date'].isoformat() if params['start_date'] else None,
+            'end_date': params['end_date'].isoformat() if params['end_date'] else None,
+            'generated_at': datetime.now().isoformat()
+        },
+        'spending_analysis': spending_analysis,
+        'category_analysis': category_analysis,
+        'trend_analysis': trend_analysis,
+        'recommendations': recommendations
+    }
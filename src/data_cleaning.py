@@ -2,12 +2,32 @@
 数据清洗模块
 """
 import re
+import calendar
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 import jieba
 from .config import CLEANING_CONFIG
 
+# 库中时间文本的规范格式
+CANONICAL_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 可识别的时间格式（按常见程度排序）
+DATETIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y'
+]
+
 class DataCleaner:
     """数据清洗器"""
     
@@ -25,8 +45,9 @@ class DataCleaner:
             cleaned_data['amount'] = self._clean_amount(cleaned_data['amount'])
         
         # 清洗时间
-        if 'consume_time' in cleaned_data:
-            cleaned_data['consume_time'] = self._clean_datetime(cleaned_data['consume_time'])
+        for time_field in ('consume_time', 'invoice_time'):
+            if time_field in cleaned_data:
+                cleaned_data[time_field] = self._clean_datetime(cleaned_data[time_field])
         
         # 清洗商家名称
         if 'merchant' in cleaned_data:
@@ -66,41 +87,55 @@ class DataCleaner:
         
         return round(amount, 2)
     
-    def _clean_datetime(self, datetime_str: Any) -> datetime:
-        """清洗时间数据"""
-        if isinstance(datetime_str, datetime):
-            return datetime_str
-        
-        if isinstance(datetime_str, str):
-            # 尝试多种时间格式
-            formats = [
-                '%Y-%m-%d %H:%M:%S',
-                '%Y-%m-%d',
-                '%Y/%m/%d %H:%M:%S',
-                '%Y/%m/%d',
-                '%m/%d/%Y %H:%M:%S',
-                '%m/%d/%Y'
-            ]
-            
-            for fmt in formats:
+    def parse_datetime(self, value: Any) -> Optional[datetime]:
+        """解析多种格式的时间（ISO带T、缺秒、带微秒、斜杠日期等），无法解析时返回None"""
+        if isinstance(value, datetime):
+            return value.replace(microsecond=0)
+        
+        if isinstance(value, str):
+            text = value.strip()
+            for fmt in DATETIME_FORMATS:
                 try:
-                    return datetime.strptime(datetime_str, fmt)
+                    return datetime.strptime(text, fmt).replace(microsecond=0)
                 except ValueError:
                     continue
-            
-            # 如果都失败，返回当前时间
-            return datetime.now()
         
-        return datetime.now()
+        return None
+    
+    def _clean_datetime(self, datetime_str: Any) -> datetime:
+        """清洗时间数据"""
+        parsed = self.parse_datetime(datetime_str)
+        # 如果都失败，返回当前时间
+        return parsed if parsed is not None else datetime.now().replace(microsecond=0)
+    
+    def normalize_time_text(self, value: Any) -> str:
+        """时间 -> 库中规范文本（YYYY-MM-DD HH:MM:SS）"""
+        return self._clean_datetime(value).strftime(CANONICAL_DATETIME_FORMAT)
+    
+    def _require_datetime(self, value: Any) -> datetime:
+        """解析查询条件中的时间：无法解析时抛ValueError，不能像清洗账单那样回退为当前时间"""
+        parsed = self.parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"无法解析的时间: {value}")
+        return parsed
+    
+    def to_epoch(self, value: Any) -> int:
+        """时间 -> 秒级整数，与库中 consume_ts/invoice_ts 的换算方式一致（按墙上时间，不做时区转换）；无法解析时抛ValueError"""
+        return calendar.timegm(self._require_datetime(value).timetuple())
+    
+    def day_key(self, value: Any) -> int:
+        """时间 -> 日桶 YYYYMMDD；无法解析时抛ValueError"""
+        dt = self._require_datetime(value)
+        return dt.year * 10000 + dt.month * 100 + dt.day
     
     def _clean_merchant(self, merchant: str) -> str:
         """清洗商家名称"""
         if not merchant or not isinstance(merchant, str):
             return "未知商家"
         
-        # 去除多余空格和特殊字符
+        # 去除多余空格和特殊字符（保留括号：商家规范化据此识别分店后缀）
         merchant = re.sub(r'\s+', ' ', merchant.strip())
-        merchant = re.sub(r'[^\w\s\u4e00-\u9fff]', '', merchant)
+        merchant = re.sub(r'[^\w\s\u4e00-\u9fff()（）\[\]【】]', '', merchant)
         
         # 如果为空，返回默认值
         if not merchant:
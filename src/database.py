@@ -10,16 +10,52 @@ from datetime import datetime, timedelta
 import pandas as pd
 
 from .config import DATABASE_URL, DATABASE_PATH
+from .analytics_engine import analytics_engine
+from .metrics import instrument_engine, InstrumentedConnection
+from .records import (
+    BillRecord, InvoiceRecord, BILL_SELECT, INVOICE_SELECT,
+    bill_records, invoice_records, to_columns, select_columns
+)
 from .models import (
     Base, Bill, Invoice, User, FinancialProduct, UserProfile,
     UserBudget, UserSubscription, OCRUsageQuota,
     CommunityPost, PostComment, PostLike
 )
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_
+from sqlalchemy.schema import CreateColumn, CreateIndex
 
 # 创建数据库引擎
 engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine)
+# get_db_session 退出时会再提交一次；不过期属性，返回给调用方的对象在会话关闭后仍可读取
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+def get_sqlite_connection(db_path=None, row_factory=None, **kwargs) -> sqlite3.Connection:
+    """获取原生sqlite3连接（带SQL耗时统计）"""
+    conn = sqlite3.connect(str(db_path or DATABASE_PATH), factory=InstrumentedConnection, **kwargs)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    return conn
+
+def dispose_engine_after_fork():
+    """fork后丢弃从父进程继承的连接池，各worker重新建立自己的连接"""
+    engine.dispose(close=False)
+    _shards().dispose()
+
+def _shards():
+    """分片路由（延迟导入：sharding 模块依赖本模块）"""
+    from .sharding import shard_router
+    return shard_router
+
+def _cold():
+    """冷数据存储（延迟导入：cold_storage 模块依赖本模块）"""
+    from .cold_storage import cold_store
+    return cold_store
+
+def _community():
+    """社区计数缓冲（延迟导入：community 模块依赖本模块）"""
+    from .community import community_feed
+    return community_feed
 
 def init_database():
     """初始化数据库，创建所有表"""
@@ -28,8 +64,91 @@ def init_database():
     
     # 创建所有表
     Base.metadata.create_all(bind=engine)
+    ensure_model_columns()
+    ensure_time_columns()
+    _shards().ensure_schema()
     print("数据库初始化完成")
 
+def _is_time_index(index) -> bool:
+    """索引是否用到时间戳/日桶/月桶生成列（由 ensure_time_columns 负责创建）"""
+    return any(column.computed is not None for column in index.columns)
+
+def ensure_model_columns(db_path=None) -> List[str]:
+    """旧库迁移：补充模型中新增的可空普通列（create_all不会修改已存在的表）及其索引，返回补充的列"""
+    added = []
+    conn = get_sqlite_connection(db_path)
+    try:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table.name})")}
+            if not existing:
+                continue
+            for column in table.columns:
+                if column.name in existing or column.computed is not None:
+                    continue
+                if column.primary_key or column.unique or not column.nullable:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                existing.add(column.name)
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                # 补不上的列（非空/唯一）上的索引跳过
+                if not _is_time_index(index) and all(column.name in existing for column in index.columns):
+                    conn.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)))
+        conn.commit()
+    finally:
+        conn.close()
+    if added:
+        print(f"已补充字段: {', '.join(added)}")
+    return added
+
+# 需要整数时间列的表：模型 -> 时间文本列
+TIME_COLUMN_TABLES = ((Bill, 'consume_time'), (Invoice, 'invoice_time'))
+
+def ensure_time_columns(db_path=None) -> Dict[str, int]:
+    """旧库迁移：补充时间戳/日桶/月桶生成列与索引，并把非规范的时间文本改写为规范格式
+
+    返回各表改写的行数。生成列为VIRTUAL，ALTER TABLE不会重写表。
+    """
+    from .data_cleaning import data_cleaner, CANONICAL_DATETIME_FORMAT
+
+    rewritten = {}
+    conn = get_sqlite_connection(db_path)
+    try:
+        for model, time_column in TIME_COLUMN_TABLES:
+            table = model.__table__
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table.name})")}
+            if not existing:
+                continue
+
+            # 先统一文本格式：不能解析的保留原值（生成列为NULL）
+            rows = conn.execute(
+                f"SELECT id, {time_column} FROM {table.name} WHERE {time_column} NOT GLOB "
+                f"'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'"
+            ).fetchall()
+            updates = []
+            for row_id, value in rows:
+                parsed = data_cleaner.parse_datetime(value)
+                if parsed is not None:
+                    updates.append((parsed.strftime(CANONICAL_DATETIME_FORMAT), row_id))
+            conn.executemany(f"UPDATE {table.name} SET {time_column} = ? WHERE id = ?", updates)
+            rewritten[table.name] = len(updates)
+            if len(updates) < len(rows):
+                print(f"{table.name}: {len(rows) - len(updates)} 行时间无法解析，保持原值")
+
+            for column in table.columns:
+                if column.computed is not None and column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            # 只建时间列索引：其他索引的列可能尚未由 ensure_model_columns 补充
+            for index in table.indexes:
+                if _is_time_index(index):
+                    conn.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)))
+        conn.commit()
+    finally:
+        conn.close()
+    return rewritten
+
 @contextmanager
 def get_db_session():
     """获取数据库会话的上下文管理器"""
@@ -53,170 +172,237 @@ class DatabaseManager:
     # 账单相关操作
     def create_bill(self, bill_data: Dict[str, Any]) -> Bill:
         """创建账单记录"""
-        with get_db_session() as session:
+        from .merchant_index import merchant_index
+
+        bill_data = dict(bill_data)
+        if bill_data.get('merchant_id') is None:
+            bill_data['merchant_id'] = merchant_index.resolve(bill_data.get('merchant'))
+        with _shards().session(bill_data.get('user_id', 1)) as session:
             bill = Bill(**bill_data)
             session.add(bill)
             session.commit()
             session.refresh(bill)
             return bill
     
-    def get_bills(self, user_id: int = 1, limit: int = 100, offset: int = 0) -> List[Bill]:
+    def get_bills(self, user_id: int = 1, limit: int = 100, offset: int = 0) -> List[BillRecord]:
         """获取账单列表"""
-        with get_db_session() as session:
-            return session.query(Bill).filter(Bill.user_id == user_id)\
-                .order_by(Bill.consume_time.desc())\
-                .offset(offset).limit(limit).all()
+        return self._select_bills(user_id, limit=limit, offset=offset)
     
-    def get_bills_by_date_range(self, user_id: int, start_date: datetime, end_date: datetime) -> List[Bill]:
+    def get_bills_by_date_range(self, user_id: int, start_date: datetime, end_date: datetime) -> List[BillRecord]:
         """按日期范围获取账单"""
-        with get_db_session() as session:
-            return session.query(Bill).filter(
-                Bill.user_id == user_id,
-                Bill.consume_time >= start_date,
-                Bill.consume_time <= end_date
-            ).order_by(Bill.consume_time.desc()).all()
+        return self._select_bills(user_id, *self._time_range_sql(start_date, end_date))
     
-    def get_bills_by_category(self, user_id: int, category: str) -> List[Bill]:
-        """按类别获取账单"""
-        with get_db_session() as session:
-            return session.query(Bill).filter(
-                Bill.user_id == user_id,
-                Bill.category == category
-            ).order_by(Bill.consume_time.desc()).all()
+    def get_bills_by_category(self, user_id: int, category: str,
+                              start_date: datetime = None, end_date: datetime = None) -> List[BillRecord]:
+        """按类别获取账单（可选日期范围）"""
+        conditions, params = self._time_range_sql(start_date, end_date)
+        return self._select_bills(user_id, ["category = ?", *conditions], [category, *params])
     
-    def get_bills_by_merchant(self, user_id: int, merchant: str) -> List[Bill]:
-        """按商家获取账单"""
-        with get_db_session() as session:
-            return session.query(Bill).filter(
-                Bill.user_id == user_id,
-                Bill.merchant.like(f"%{merchant}%")
-            ).order_by(Bill.consume_time.desc()).all()
+    def get_bills_by_merchant(self, user_id: int, merchant: str,
+                              start_date: datetime = None, end_date: datetime = None) -> List[BillRecord]:
+        """按商家获取账单（可选日期范围）；能解析到规范商家时按 merchant_id 匹配其全部写法"""
+        from .merchant_index import merchant_index
+        from .search_index import search_index_for
+
+        # 名称包含匹配：纯中文商家名走全文检索索引，其余写法用LIKE
+        name_filter = search_index_for(user_id).bill_merchant_condition(merchant, user_id) \
+            or ("merchant LIKE ?", [f"%{merchant}%"])
+        merchant_id = merchant_index.lookup(merchant)
+        if merchant_id is not None:
+            # 尚未回填merchant_id的账单仍按名称包含匹配
+            merchant_filter = f"(merchant_id = ? OR (merchant_id IS NULL AND {name_filter[0]}))"
+            merchant_params = [merchant_id, *name_filter[1]]
+        else:
+            merchant_filter, merchant_params = name_filter
+        conditions, params = self._time_range_sql(start_date, end_date)
+        return self._select_bills(user_id, [merchant_filter, *conditions], [*merchant_params, *params])
+
+    def get_bill_columns(self, user_id: int, columns: List[str], start_date: datetime = None,
+                         end_date: datetime = None, limit: int = None) -> Dict[str, Any]:
+        """按列批量取账单（列名 -> numpy数组，consume_time为datetime64），按时间倒序；供pandas分析直接构造DataFrame"""
+        conditions, params = self._time_range_sql(start_date, end_date)
+        sql = f"SELECT {select_columns(columns)} FROM bills WHERE " + " AND ".join(["user_id = ?", *conditions]) \
+            + " ORDER BY consume_ts DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        conn = _shards().connect(user_id)
+        try:
+            return to_columns(conn.execute(sql, [user_id, *params]).fetchall(), columns)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _select_bills(user_id: int, conditions: List[str] = (), params: List[Any] = (),
+                      limit: int = None, offset: int = 0) -> List[BillRecord]:
+        """原生SQL查询账单并直接构造只读记录，按时间倒序"""
+        sql = f"SELECT {BILL_SELECT} FROM bills WHERE " + " AND ".join(["user_id = ?", *conditions]) \
+            + " ORDER BY consume_ts DESC"
+        args = [user_id, *params]
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            args += [limit, offset]
+        conn = _shards().connect(user_id)
+        try:
+            return bill_records(conn.execute(sql, args))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _time_range_sql(start_date: datetime = None, end_date: datetime = None):
+        """日期范围 -> (consume_ts 条件列表, 参数列表)，闭区间，与 _time_range_filters 一致"""
+        from .data_cleaning import data_cleaner
+
+        conditions, params = [], []
+        if start_date:
+            conditions.append("consume_ts >= ?")
+            params.append(data_cleaner.to_epoch(start_date))
+        if end_date:
+            conditions.append("consume_ts <= ?")
+            params.append(data_cleaner.to_epoch(end_date))
+        return conditions, params
+
+    @staticmethod
+    def _time_range_filters(start_date: datetime = None, end_date: datetime = None) -> list:
+        """日期范围 -> consume_ts 整数比较条件（闭区间，可走 (user_id, consume_ts) 索引）"""
+        from .data_cleaning import data_cleaner
+
+        filters = []
+        if start_date:
+            filters.append(Bill.consume_ts >= data_cleaner.to_epoch(start_date))
+        if end_date:
+            filters.append(Bill.consume_ts <= data_cleaner.to_epoch(end_date))
+        return filters
     
-    def update_bill(self, bill_id: int, update_data: Dict[str, Any]) -> Optional[Bill]:
-        """更新账单记录"""
-        with get_db_session() as session:
-            bill = session.query(Bill).filter(Bill.id == bill_id).first()
-            if bill:
-                for key, value in update_data.items():
-                    setattr(bill, key, value)
-                session.commit()
-                session.refresh(bill)
-                return bill
-            return None
+    def update_bill(self, bill_id: int, update_data: Dict[str, Any], user_id: int = None) -> Optional[Bill]:
+        """更新账单记录（user_id用于定位分片，不确定时各分片依次查找）"""
+        from .merchant_index import merchant_index
+
+        if 'merchant' in update_data:
+            update_data = dict(update_data, merchant_id=merchant_index.resolve(update_data['merchant']))
+
+        def update_at(path):
+            with _shards().session_at(path) as session:
+                bill = session.query(Bill).filter(Bill.id == bill_id).first()
+                if bill:
+                    for key, value in update_data.items():
+                        setattr(bill, key, value)
+                    session.commit()
+                    session.refresh(bill)
+                    return bill
+                return None
+        return _shards().locate(update_at, user_id)
     
-    def delete_bill(self, bill_id: int) -> bool:
-        """删除账单记录"""
-        with get_db_session() as session:
-            bill = session.query(Bill).filter(Bill.id == bill_id).first()
-            if bill:
-                session.delete(bill)
-                session.commit()
-                return True
-            return False
+    def delete_bill(self, bill_id: int, user_id: int = None) -> bool:
+        """删除账单记录（user_id用于定位分片，不确定时各分片依次查找）"""
+        def delete_at(path):
+            with _shards().session_at(path) as session:
+                bill = session.query(Bill).filter(Bill.id == bill_id).first()
+                if bill:
+                    session.delete(bill)
+                    session.commit()
+                    return True
+                return False
+        return bool(_shards().locate(delete_at, user_id))
     
     # 发票相关操作
     def create_invoice(self, invoice_data: Dict[str, Any]) -> Invoice:
         """创建发票记录"""
-        with get_db_session() as session:
+        with _shards().session(invoice_data.get('user_id', 1)) as session:
             invoice = Invoice(**invoice_data)
             session.add(invoice)
             session.commit()
             session.refresh(invoice)
             return invoice
     
-    def get_invoices(self, user_id: int = 1, limit: int = 100) -> List[Invoice]:
+    def get_invoices(self, user_id: int = 1, limit: int = 100) -> List[InvoiceRecord]:
         """获取发票列表"""
-        with get_db_session() as session:
-            return session.query(Invoice).filter(Invoice.user_id == user_id)\
-                .order_by(Invoice.invoice_time.desc())\
-                .limit(limit).all()
+        conn = _shards().connect(user_id)
+        try:
+            return invoice_records(conn.execute(
+                f"SELECT {INVOICE_SELECT} FROM invoices WHERE user_id = ? ORDER BY invoice_ts DESC LIMIT ?",
+                (user_id, limit)
+            ))
+        finally:
+            conn.close()
     
     # 统计分析
     def get_spending_summary(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> Dict[str, Any]:
         """获取消费汇总统计"""
-        with get_db_session() as session:
-            query = session.query(Bill).filter(Bill.user_id == user_id)
-            
-            if start_date:
-                query = query.filter(Bill.consume_time >= start_date)
-            if end_date:
-                query = query.filter(Bill.consume_time <= end_date)
-            
-            bills = query.all()
-            
-            if not bills:
-                return {
-                    "total_amount": 0,
-                    "total_count": 0,
-                    "avg_amount": 0,
-                    "categories": {},
-                    "payment_methods": {}
-                }
-            
-            total_amount = sum(bill.amount for bill in bills)
-            total_count = len(bills)
-            avg_amount = total_amount / total_count if total_count > 0 else 0
-            
-            # 按类别统计
-            categories = {}
-            for bill in bills:
-                category = bill.category or "未知"
-                if category not in categories:
-                    categories[category] = {"amount": 0, "count": 0}
-                categories[category]["amount"] += bill.amount
-                categories[category]["count"] += 1
-            
-            # 按支付方式统计
-            payment_methods = {}
-            for bill in bills:
-                method = bill.payment_method
-                if method not in payment_methods:
-                    payment_methods[method] = {"amount": 0, "count": 0}
-                payment_methods[method]["amount"] += bill.amount
-                payment_methods[method]["count"] += 1
-            
+        bills = self._select_bills(user_id, *self._time_range_sql(start_date, end_date))
+        if not bills:
             return {
-                "total_amount": total_amount,
-                "total_count": total_count,
-                "avg_amount": avg_amount,
-                "categories": categories,
-                "payment_methods": payment_methods
+                "total_amount": 0,
+                "total_count": 0,
+                "avg_amount": 0,
+                "categories": {},
+                "payment_methods": {}
             }
+        
+        total_amount = sum(bill.amount for bill in bills)
+        total_count = len(bills)
+        avg_amount = total_amount / total_count if total_count > 0 else 0
+        
+        # 按类别统计
+        categories = {}
+        for bill in bills:
+            category = bill.category or "未知"
+            if category not in categories:
+                categories[category] = {"amount": 0, "count": 0}
+            categories[category]["amount"] += bill.amount
+            categories[category]["count"] += 1
+        
+        # 按支付方式统计
+        payment_methods = {}
+        for bill in bills:
+            method = bill.payment_method
+            if method not in payment_methods:
+                payment_methods[method] = {"amount": 0, "count": 0}
+            payment_methods[method]["amount"] += bill.amount
+            payment_methods[method]["count"] += 1
+        
+        return {
+            "total_amount": total_amount,
+            "total_count": total_count,
+            "avg_amount": avg_amount,
+            "categories": categories,
+            "payment_methods": payment_methods
+        }
     
     def get_monthly_spending(self, user_id: int, year: int) -> List[Dict[str, Any]]:
         """获取月度消费数据"""
-        with get_db_session() as session:
-            # 使用SQL查询按月统计
+        if analytics_engine.enabled:
+            return _cold().merge_monthly(user_id, year, analytics_engine.monthly_trend(user_id, year))
+        
+        with _shards().session(user_id) as session:
+            # 按月桶整数列统计，走 (user_id, consume_month) 索引，不再逐行strftime
             query = text("""
                 SELECT 
-                    strftime('%m', consume_time) as month,
+                    printf('%02d', consume_month % 100) as month,
                     SUM(amount) as total_amount,
                     COUNT(*) as count,
                     AVG(amount) as avg_amount
                 FROM bills 
                 WHERE user_id = :user_id 
-                AND strftime('%Y', consume_time) = :year
-                GROUP BY strftime('%m', consume_time)
-                ORDER BY month
+                AND consume_month BETWEEN :first_month AND :last_month
+                GROUP BY consume_month
+                ORDER BY consume_month
             """)
             
-            result = session.execute(query, {"user_id": user_id, "year": str(year)})
-            return [{"month": row[0], "total_amount": row[1], "count": row[2], "avg_amount": row[3]} 
-                   for row in result.fetchall()]
+            result = session.execute(query, {"user_id": user_id, "first_month": year * 100 + 1,
+                                             "last_month": year * 100 + 12})
+            monthly = [{"month": row[0], "total_amount": row[1], "count": row[2], "avg_amount": row[3]} 
+                       for row in result.fetchall()]
+        # 已归档的月份在Parquet冷数据中，按月合并
+        return _cold().merge_monthly(user_id, year, monthly)
     
     def get_category_spending(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> List[Dict[str, Any]]:
         """获取分类消费数据"""
-        with get_db_session() as session:
+        with _shards().session(user_id) as session:
             query = session.query(Bill.category, 
                                 func.sum(Bill.amount).label('total_amount'),
                                 func.count(Bill.id).label('count'),
                                 func.avg(Bill.amount).label('avg_amount'))\
-                .filter(Bill.user_id == user_id)
-            
-            if start_date:
-                query = query.filter(Bill.consume_time >= start_date)
-            if end_date:
-                query = query.filter(Bill.consume_time <= end_date)
+                .filter(Bill.user_id == user_id, *self._time_range_filters(start_date, end_date))
             
             result = query.group_by(Bill.category).all()
             
@@ -248,7 +434,7 @@ class DatabaseManager:
     # 用户画像相关
     def create_user_profile(self, profile_data: Dict[str, Any]) -> UserProfile:
         """创建用户画像"""
-        with get_db_session() as session:
+        with _shards().session(profile_data['user_id']) as session:
             profile = UserProfile(**profile_data)
             session.add(profile)
             session.commit()
@@ -257,12 +443,12 @@ class DatabaseManager:
     
     def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
         """获取用户画像"""
-        with get_db_session() as session:
+        with _shards().session(user_id) as session:
             return session.query(UserProfile).filter(UserProfile.user_id == user_id).first()
     
     def update_user_profile(self, user_id: int, update_data: Dict[str, Any]) -> Optional[UserProfile]:
         """更新用户画像"""
-        with get_db_session() as session:
+        with _shards().session(user_id) as session:
             profile = session.query(UserProfile).filter(UserProfile.user_id == user_id).first()
             if profile:
                 for key, value in update_data.items():
@@ -275,7 +461,7 @@ class DatabaseManager:
     # 预算相关操作
     def create_budget(self, budget_data: Dict[str, Any]) -> UserBudget:
         """创建预算"""
-        with get_db_session() as session:
+        with _shards().session(budget_data['user_id']) as session:
             budget = UserBudget(**budget_data)
             session.add(budget)
             session.commit()
@@ -284,12 +470,12 @@ class DatabaseManager:
 
     def get_budgets(self, user_id: int) -> List[UserBudget]:
         """获取用户预算列表"""
-        with get_db_session() as session:
+        with _shards().session(user_id) as session:
             return session.query(UserBudget).filter(UserBudget.user_id == user_id).all()
 
     def get_budget_alerts(self, user_id: int) -> List[Dict[str, Any]]:
         """获取预算预警"""
-        with get_db_session() as session:
+        with _shards().session(user_id) as session:
             budgets = session.query(UserBudget).filter(UserBudget.user_id == user_id).all()
             alerts = []
             for budget in budgets:
@@ -307,56 +493,68 @@ class DatabaseManager:
 
     # 社区帖子相关操作
     def create_post(self, post_data: Dict[str, Any]) -> CommunityPost:
-        """创建帖子"""
-        with get_db_session() as session:
+        """创建帖子（存放在作者所在分片）"""
+        with _shards().session(post_data['user_id']) as session:
             post = CommunityPost(**post_data)
             session.add(post)
             session.commit()
             session.refresh(post)
-            return post
+        _community().add_post([post.id, post.user_id, post.title, post.content, post.bill_id, post.invoice_id,
+                               post.likes_count or 0, post.comments_count or 0, str(post.created_at or '')])
+        return post
 
     def get_posts(self, limit: int = 20, offset: int = 0) -> List[CommunityPost]:
-        """获取帖子列表"""
-        with get_db_session() as session:
-            return session.query(CommunityPost).order_by(CommunityPost.created_at.desc()).offset(offset).limit(limit).all()
+        """获取帖子列表（各分片取前 offset+limit 条后按发布时间归并）"""
+        def posts_at(path):
+            with _shards().session_at(path) as session:
+                return session.query(CommunityPost).order_by(CommunityPost.created_at.desc())\
+                    .limit(offset + limit).all()
+        return _shards().merge_sorted(_shards().fan_out(posts_at), key=lambda post: post.created_at or datetime.min,
+                                      limit=limit, offset=offset)
 
     def like_post(self, post_id: int, user_id: int) -> bool:
-        """点赞帖子"""
-        with get_db_session() as session:
-            # 检查是否已点赞
-            existing = session.query(PostLike).filter(
-                PostLike.post_id == post_id,
-                PostLike.user_id == user_id
-            ).first()
-            if existing:
-                return False  # 已点赞
-            
-            # 添加点赞
-            like = PostLike(post_id=post_id, user_id=user_id)
-            session.add(like)
-            
-            # 更新帖子点赞数
-            post = session.query(CommunityPost).filter(CommunityPost.id == post_id).first()
-            if post:
-                post.likes_count = (post.likes_count or 0) + 1
-            
-            session.commit()
-            return True
+        """点赞帖子（点赞记录与帖子存放在同一分片）；已点赞返回False
+
+        唯一索引 (post_id, user_id) 保证重复点赞被忽略，帖子点赞数经计数缓冲批量写回。
+        """
+        path = self._post_path(post_id)
+        like_id = _shards().next_id('post_likes') if _shards().sharded else None
+        conn = get_sqlite_connection(path, timeout=_shards().config['busy_timeout'])
+        try:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO post_likes (id, post_id, user_id, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                (like_id, post_id, user_id)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if not inserted:
+            return False  # 已点赞
+        _community().record(path, post_id, likes=1)
+        return True
 
     def create_comment(self, comment_data: Dict[str, Any]) -> PostComment:
-        """创建评论"""
-        with get_db_session() as session:
+        """创建评论（评论与帖子存放在同一分片，帖子评论数经计数缓冲批量写回）"""
+        path = self._post_path(comment_data['post_id'])
+        with _shards().session_at(path) as session:
             comment = PostComment(**comment_data)
             session.add(comment)
-            
-            # 更新帖子评论数
-            post = session.query(CommunityPost).filter(CommunityPost.id == comment_data['post_id']).first()
-            if post:
-                post.comments_count = (post.comments_count or 0) + 1
-            
             session.commit()
             session.refresh(comment)
-            return comment
+        _community().record(path, comment_data['post_id'], comments=1)
+        return comment
+
+    @staticmethod
+    def _post_path(post_id: int):
+        """帖子所在分片；帖子不存在时取第一个分片"""
+        if not _shards().sharded:
+            return _shards().paths()[0]
+
+        def find_at(path):
+            with _shards().session_at(path) as session:
+                exists = session.query(CommunityPost.id).filter(CommunityPost.id == post_id).first()
+                return path if exists else None
+        return _shards().locate(find_at) or _shards().paths()[0]
 
 # 创建全局数据库管理器实例
 db_manager = DatabaseManager()
@@ -0,0 +1,273 @@
+"""
+发票分类模型 - 哈希特征 + TF-IDF + 多项式朴素贝叶斯，从发票历史分批训练，发布到模型仓库
+
+词表用特征哈希代替（HashingVectorizer无状态，不需要在进程间复制词典），
+idf与NB权重保存为 .npy 并以 mmap 方式加载：多个worker共享操作系统页缓存中的同一份数据，
+预测时只读到文本命中的那几行权重。服务启动只加载已发布的版本，从不训练。
+"""
+import argparse
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+import jieba
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.preprocessing import normalize
+
+from .config import INVOICE_MODEL_CONFIG
+from .database import get_sqlite_connection
+from .model_registry import ModelRegistry, ModelIntegrityError
+from .sharding import shard_router
+from .snapshot import snapshot_store
+
+# 内置样例：保证每个类别都有样本，发票历史为空时也能训练出可用的模型
+SEED_EXAMPLES = [
+    # 餐饮发票
+    ('餐饮服务 星巴克 咖啡 35.50元', '餐饮'),
+    ('餐饮费 麦当劳 汉堡 28.00元', '餐饮'),
+    ('餐饮发票 肯德基 炸鸡 45.00元', '餐饮'),
+    ('餐厅消费 海底捞 火锅 168.00元', '餐饮'),
+    ('外卖费 美团 午餐 25.00元', '餐饮'),
+
+    # 交通发票
+    ('交通费 滴滴出行 打车 15.50元', '交通'),
+    ('出租车费 出租车 出行 22.00元', '交通'),
+    ('地铁费 地铁 通勤 6.00元', '交通'),
+    ('加油费 中石化 汽油 200.00元', '交通'),
+    ('停车费 停车场 停车 10.00元', '交通'),
+
+    # 购物发票
+    ('商品销售 淘宝 网购 89.00元', '购物'),
+    ('零售商品 京东 电子产品 299.00元', '购物'),
+    ('超市购物 沃尔玛 日用品 156.00元', '购物'),
+    ('服装销售 优衣库 衣服 199.00元', '购物'),
+    ('百货商品 商场 化妆品 88.00元', '购物'),
+
+    # 娱乐发票
+    ('娱乐服务 电影院 电影票 35.00元', '娱乐'),
+    ('KTV消费 钱柜 唱歌 128.00元', '娱乐'),
+    ('游戏充值 腾讯游戏 游戏币 50.00元', '娱乐'),
+    ('旅游服务 携程 酒店 299.00元', '娱乐'),
+    ('健身服务 健身房 会员费 200.00元', '娱乐'),
+
+    # 医疗发票
+    ('医疗服务 医院 挂号费 15.00元', '医疗'),
+    ('药品销售 药店 药品 45.00元', '医疗'),
+    ('体检费 体检中心 体检 200.00元', '医疗'),
+    ('医疗费 诊所 看病 80.00元', '医疗'),
+
+    # 教育发票
+    ('教育服务 培训机构 课程费 500.00元', '教育'),
+    ('图书销售 书店 书籍 68.00元', '教育'),
+    ('培训费 英语培训 学费 800.00元', '教育'),
+    ('考试费 考试中心 报名费 100.00元', '教育'),
+]
+
+IDF_FILE = "idf.npy"
+WEIGHTS_FILE = "feature_log_prob.npy"  # (特征数, 类别数)，同一特征的各类别权重相邻
+PRIOR_FILE = "class_log_prior.npy"
+
+_UNCHECKED = object()
+
+
+def tokenize(text: str) -> List[str]:
+    """jieba分词（OCR文本没有空格分隔，按词而不是按空白切分）"""
+    return [token for token in jieba.lcut(text) if token.strip()]
+
+
+def make_vectorizer(n_features: int) -> HashingVectorizer:
+    return HashingVectorizer(n_features=n_features, tokenizer=tokenize, token_pattern=None,
+                             alternate_sign=False, norm=None)
+
+
+class InvoiceTypeModel:
+    """已发布的分类模型（只读）；接口与sklearn分类器一致：predict / predict_proba / classes_"""
+
+    def __init__(self, version: str, path: Path, meta: Dict[str, Any]):
+        self.version = version
+        self.meta = meta
+        self.classes_ = np.array(meta['classes'])
+        self.vectorizer = make_vectorizer(meta['n_features'])
+        self.idf = np.load(path / IDF_FILE, mmap_mode='r')
+        self.feature_log_prob = np.load(path / WEIGHTS_FILE, mmap_mode='r')
+        self.class_log_prior = np.load(path / PRIOR_FILE)
+
+    def _features(self, texts: Sequence[str]):
+        """词频 × idf 后按行L2归一化（只取命中特征的idf）"""
+        matrix = self.vectorizer.transform(texts).astype(np.float64)
+        matrix.data *= self.idf[matrix.indices]
+        return normalize(matrix)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = self._features(texts)
+        scores = np.tile(self.class_log_prior, (matrix.shape[0], 1))
+        for row in range(matrix.shape[0]):
+            # 只按下标取命中特征的权重行，不把整份mmap权重读入或转换类型
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            scores[row] += matrix.data[start:end] @ self.feature_log_prob[matrix.indices[start:end]]
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Sequence[str]) -> np.ndarray:
+        return self.classes_[self.predict_proba(texts).argmax(axis=1)]
+
+
+class InvoiceClassifier:
+    """发票分类模型的训练、发布与加载"""
+
+    def __init__(self, config: Dict[str, Any] = None, registry: ModelRegistry = None):
+        self.config = dict(INVOICE_MODEL_CONFIG, **(config or {}))
+        self.registry = registry or ModelRegistry(self.config['name'])
+        self._model: Optional[InvoiceTypeModel] = None
+        self._mtime = _UNCHECKED
+        self._checked_at = 0.0
+
+    # 加载
+    def current(self) -> Optional[InvoiceTypeModel]:
+        """当前版本的模型；每隔 reload_interval_seconds 检查一次是否发布了新版本。未发布或校验失败时为None"""
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < self.config['reload_interval_seconds']:
+            return self._model
+        self._checked_at = now
+        mtime = self.registry.current_mtime()
+        if mtime == self._mtime:
+            return self._model
+        self._mtime = mtime
+        if mtime is None:
+            print("发票分类模型尚未发布，使用规则分类（训练：python -m src.invoice_classifier train）")
+            self._model = None
+            return None
+        try:
+            version, path, meta = self.registry.resolve()
+            if self._model is None or self._model.version != version:
+                self._model = InvoiceTypeModel(version, path, meta)
+                print(f"发票分类模型 {version} 加载成功（{len(meta['classes'])} 类，训练样本 {meta['samples']}）")
+        except (ModelIntegrityError, OSError, ValueError, KeyError) as e:
+            # 保留已加载的旧版本继续服务
+            print(f"发票分类模型加载失败: {e}")
+        return self._model
+
+    # 训练
+    def _history(self, holdout: bool) -> Iterator[List[Tuple[str, str]]]:
+        """分批读取各分片已分类的发票 (OCR文本, 类型)；id能被 holdout_every 整除的作为验证集。启用副本时读只读副本"""
+        ignored = list(self.config['ignored_labels'])
+        placeholders = ', '.join('?' * len(ignored))
+        condition = "id % ? = 0" if holdout else "id % ? != 0"
+        for path in shard_router.paths():
+            conn = get_sqlite_connection(snapshot_store.read_path(path))
+            try:
+                cursor = conn.execute(
+                    f"SELECT ocr_text, invoice_type FROM invoices WHERE ocr_text IS NOT NULL AND ocr_text != '' "
+                    f"AND invoice_type IS NOT NULL AND invoice_type NOT IN ({placeholders}) AND {condition}",
+                    ignored + [self.config['holdout_every']]
+                )
+                while True:
+                    rows = cursor.fetchmany(self.config['batch_size'])
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                conn.close()
+
+    def _training_batches(self) -> Iterator[List[Tuple[str, str]]]:
+        yield list(SEED_EXAMPLES)
+        yield from self._history(holdout=False)
+
+    def train(self, activate: bool = True) -> Dict[str, Any]:
+        """两遍扫描发票历史：第一遍统计文档频率与类别，第二遍分批 partial_fit；在验证集上评估后发布新版本"""
+        started = time.perf_counter()
+        n_features = self.config['n_features']
+        vectorizer = make_vectorizer(n_features)
+
+        # 第一遍：文档频率 -> idf（与TfidfTransformer的smooth_idf一致）
+        document_frequency = np.zeros(n_features, dtype=np.int64)
+        labels = Counter()
+        for batch in self._training_batches():
+            counts = vectorizer.transform([text for text, _ in batch]).tocsr()
+            counts.sum_duplicates()
+            document_frequency += np.bincount(counts.indices, minlength=n_features)
+            labels.update(label for _, label in batch)
+        samples = sum(labels.values())
+        idf = np.log((1 + samples) / (1 + document_frequency)) + 1.0
+
+        def features(texts):
+            matrix = vectorizer.transform(texts).astype(np.float64)
+            matrix.data *= idf[matrix.indices]
+            return normalize(matrix)
+
+        # 第二遍：分批增量训练，内存只占一批
+        classes = np.array(sorted(labels))
+        clf = MultinomialNB(alpha=self.config['alpha'])
+        for batch in self._training_batches():
+            clf.partial_fit(features([text for text, _ in batch]), [label for _, label in batch], classes=classes)
+
+        # 验证集准确率
+        correct = total = 0
+        for batch in self._history(holdout=True):
+            predicted = clf.predict(features([text for text, _ in batch]))
+            correct += int(sum(p == label for p, (_, label) in zip(predicted, batch)))
+            total += len(batch)
+
+        def write(directory: Path):
+            np.save(directory / IDF_FILE, idf.astype(np.float32))
+            np.save(directory / WEIGHTS_FILE, np.ascontiguousarray(clf.feature_log_prob_.T, dtype=np.float32))
+            np.save(directory / PRIOR_FILE, clf.class_log_prior_)
+
+        meta = {
+            'classes': classes.tolist(),
+            'n_features': n_features,
+            'alpha': self.config['alpha'],
+            'samples': samples,
+            'label_counts': dict(labels),
+            'holdout_samples': total,
+            'holdout_accuracy': round(correct / total, 4) if total else None
+        }
+        version = self.registry.publish(write, meta, activate=activate)
+        return dict(meta, version=version, seconds=round(time.perf_counter() - started, 2))
+
+
+# 创建全局分类模型实例
+invoice_classifier = InvoiceClassifier()
+
+
+def main():
+    """命令行：python -m src.invoice_classifier train | list | activate v0003 | predict "文本" """
+    parser = argparse.ArgumentParser(description="发票分类模型训练与版本管理")
+    parser.add_argument("action", choices=["train", "list", "activate", "predict"])
+    parser.add_argument("arg", nargs="?", help="activate: 版本号；predict: 发票文本")
+    parser.add_argument("--no-activate", action="store_true", help="train: 只发布，不切换为当前版本")
+    args = parser.parse_args()
+    registry = invoice_classifier.registry
+
+    if args.action == "train":
+        result = invoice_classifier.train(activate=not args.no_activate)
+        accuracy = result['holdout_accuracy']
+        print(f"训练完成: {result['version']}，样本 {result['samples']}，类别 {len(result['classes'])}，"
+              f"验证集 {result['holdout_samples']} 条" + (f"，准确率 {accuracy:.2%}" if accuracy is not None else "") +
+              f"，耗时 {result['seconds']}s")
+    elif args.action == "list":
+        current = registry.current_version()
+        for version in registry.versions():
+            meta = registry.meta(version)
+            accuracy = meta.get('holdout_accuracy')
+            print(f"{'*' if version == current else ' '} {version}  {meta['created_at']}  样本 {meta['samples']}"
+                  f"  准确率 {accuracy if accuracy is not None else '-'}")
+    elif args.action == "activate":
+        registry.activate(args.arg)
+        print(f"当前版本: {args.arg}")
+    else:
+        model = invoice_classifier.current()
+        if model is None:
+            print("没有可用的模型版本")
+            return
+        probabilities = model.predict_proba([args.arg])[0]
+        for index in np.argsort(probabilities)[::-1][:3]:
+            print(f"  {model.classes_[index]}  {probabilities[index]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,12 @@ import re
 import jieba
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.pipeline import Pipeline
-import pickle
-import os
 
 from .database import db_manager
 from .data_cleaning import data_cleaner
+from .reconciliation import reconciler, INVOICE_PAYMENT_METHOD, AUTO_BILL_DESCRIPTION
 from .config import CLEANING_CONFIG
+from .invoice_classifier import invoice_classifier
 
 class InvoiceOCRProcessor:
     """发票OCR处理器"""
@@ -22,97 +19,13 @@ class InvoiceOCRProcessor:
         self.config = CLEANING_CONFIG
         # 初始化jieba
         jieba.initialize()
-        
-        # 发票类型分类器
-        self.classifier = None
-        self.vectorizer = None
-        self._load_classifier()
-    
-    def _load_classifier(self):
-        """加载发票分类器"""
-        model_path = "data/models/invoice_classifier.pkl"
-        if os.path.exists(model_path):
-            try:
-                with open(model_path, 'rb') as f:
-                    self.classifier = pickle.load(f)
-                print("发票分类器加载成功")
-            except Exception as e:
-                print(f"发票分类器加载失败: {e}")
-                self._train_default_classifier()
-        else:
-            self._train_default_classifier()
-    
-    def _train_default_classifier(self):
-        """训练默认分类器"""
-        # 创建训练数据
-        training_data = self._create_training_data()
-        
-        if training_data:
-            # 准备训练数据
-            texts = [item['text'] for item in training_data]
-            labels = [item['label'] for item in training_data]
-            
-            # 创建分类器
-            self.classifier = Pipeline([
-                ('tfidf', TfidfVectorizer(max_features=1000)),
-                ('clf', MultinomialNB())
-            ])
-            
-            # 训练分类器
-            self.classifier.fit(texts, labels)
-            
-            # 保存分类器
-            os.makedirs("data/models", exist_ok=True)
-            with open("data/models/invoice_classifier.pkl", 'wb') as f:
-                pickle.dump(self.classifier, f)
-            
-            print("默认发票分类器训练完成")
+        # 加载已发布的分类模型（只加载，不训练；未发布时使用规则分类）
+        invoice_classifier.current()
     
-    def _create_training_data(self) -> List[Dict[str, Any]]:
-        """创建训练数据"""
-        training_data = [
-            # 餐饮发票
-            {'text': '餐饮服务 星巴克 咖啡 35.50元', 'label': '餐饮'},
-            {'text': '餐饮费 麦当劳 汉堡 28.00元', 'label': '餐饮'},
-            {'text': '餐饮发票 肯德基 炸鸡 45.00元', 'label': '餐饮'},
-            {'text': '餐厅消费 海底捞 火锅 168.00元', 'label': '餐饮'},
-            {'text': '外卖费 美团 午餐 25.00元', 'label': '餐饮'},
-            
-            # 交通发票
-            {'text': '交通费 滴滴出行 打车 15.50元', 'label': '交通'},
-            {'text': '出租车费 出租车 出行 22.00元', 'label': '交通'},
-            {'text': '地铁费 地铁 通勤 6.00元', 'label': '交通'},
-            {'text': '加油费 中石化 汽油 200.00元', 'label': '交通'},
-            {'text': '停车费 停车场 停车 10.00元', 'label': '交通'},
-            
-            # 购物发票
-            {'text': '商品销售 淘宝 网购 89.00元', 'label': '购物'},
-            {'text': '零售商品 京东 电子产品 299.00元', 'label': '购物'},
-            {'text': '超市购物 沃尔玛 日用品 156.00元', 'label': '购物'},
-            {'text': '服装销售 优衣库 衣服 199.00元', 'label': '购物'},
-            {'text': '百货商品 商场 化妆品 88.00元', 'label': '购物'},
-            
-            # 娱乐发票
-            {'text': '娱乐服务 电影院 电影票 35.00元', 'label': '娱乐'},
-            {'text': 'KTV消费 钱柜 唱歌 128.00元', 'label': '娱乐'},
-            {'text': '游戏充值 腾讯游戏 游戏币 50.00元', 'label': '娱乐'},
-            {'text': '旅游服务 携程 酒店 299.00元', 'label': '娱乐'},
-            {'text': '健身服务 健身房 会员费 200.00元', 'label': '娱乐'},
-            
-            # 医疗发票
-            {'text': '医疗服务 医院 挂号费 15.00元', 'label': '医疗'},
-            {'text': '药品销售 药店 药品 45.00元', 'label': '医疗'},
-            {'text': '体检费 体检中心 体检 200.00元', 'label': '医疗'},
-            {'text': '医疗费 诊所 看病 80.00元', 'label': '医疗'},
-            
-            # 教育发票
-            {'text': '教育服务 培训机构 课程费 500.00元', 'label': '教育'},
-            {'text': '图书销售 书店 书籍 68.00元', 'label': '教育'},
-            {'text': '培训费 英语培训 学费 800.00元', 'label': '教育'},
-            {'text': '考试费 考试中心 报名费 100.00元', 'label': '教育'},
-        ]
-        
-        return training_data
+    @property
+    def classifier(self):
+        """当前发布的发票分类模型（未发布时为None，走规则分类）"""
+        return invoice_classifier.current()
     
     def process_invoice_text(self, ocr_text: str) -> Dict[str, Any]:
         """处理发票OCR文本"""
@@ -260,19 +173,20 @@ class InvoiceOCRProcessor:
     
     def _classify_invoice_type(self, ocr_text: str) -> str:
         """分类发票类型"""
-        if not self.classifier:
+        classifier = self.classifier
+        if not classifier:
             return self._rule_based_classification(ocr_text)
         
         try:
             # 使用机器学习分类器
-            prediction = self.classifier.predict([ocr_text])[0]
-            confidence = self.classifier.predict_proba([ocr_text]).max()
+            probabilities = classifier.predict_proba([ocr_text])[0]
+            confidence = probabilities.max()
             
             # 如果置信度太低，使用规则分类
             if confidence < 0.5:
                 return self._rule_based_classification(ocr_text)
             
-            return prediction
+            return str(classifier.classes_[probabilities.argmax()])
         except Exception as e:
             print(f"分类器预测失败: {e}")
             return self._rule_based_classification(ocr_text)
@@ -307,14 +221,15 @@ class InvoiceOCRProcessor:
     
     def _calculate_confidence(self, ocr_text: str, invoice_type: str) -> float:
         """计算分类置信度"""
-        if not self.classifier:
+        classifier = self.classifier
+        if not classifier:
             # 基于规则的置信度计算
             return 0.6 if invoice_type != '其他' else 0.3
         
         try:
             # 使用分类器的预测概率
-            probabilities = self.classifier.predict_proba([ocr_text])[0]
-            classes = self.classifier.classes_
+            probabilities = classifier.predict_proba([ocr_text])[0]
+            classes = classifier.classes_
             
             if invoice_type in classes:
                 type_index = list(classes).index(invoice_type)
@@ -324,10 +239,12 @@ class InvoiceOCRProcessor:
         except Exception:
             return 0.5
     
-    def create_invoice_record(self, ocr_text: str, file_path: str = None, user_id: int = 1) -> Dict[str, Any]:
-        """创建发票记录"""
+    def create_invoice_record(self, ocr_text: str, file_path: str = None, user_id: int = 1,
+                              processed_result: Dict[str, Any] = None) -> Dict[str, Any]:
+        """创建发票记录（processed_result为已缓存的提取结果时跳过文本处理）"""
         # 处理OCR文本
-        processed_result = self.process_invoice_text(ocr_text)
+        if processed_result is None:
+            processed_result = self.process_invoice_text(ocr_text)
         
         if 'error' in processed_result:
             return processed_result
@@ -351,7 +268,22 @@ class InvoiceOCRProcessor:
         try:
             invoice = db_manager.create_invoice(invoice_data)
 
+            # 先与已有账单对账（如同一笔刷卡消费），匹配上则只关联，不重复记账
+            match = reconciler.reconcile_invoice(invoice.id, user_id)
+            if match:
+                return {
+                    'success': True,
+                    'invoice_id': invoice.id,
+                    'bill_id': match['bill_id'],
+                    'reconciliation': match,
+                    'extracted_info': extracted_info,
+                    'classification': invoice_type,
+                    'confidence': confidence,
+                    'message': f"发票记录创建成功，已关联已有账单#{match['bill_id']}"
+                }
+
             # 同步生成对应账单记录
+            bill_id = None
             try:
                 bill_data = {
                     'user_id': user_id,
@@ -359,11 +291,12 @@ class InvoiceOCRProcessor:
                     'amount': invoice_data['amount'],
                     'merchant': invoice_data['merchant'],
                     'category': invoice_type or '其他',
-                    'payment_method': '发票',
+                    'payment_method': INVOICE_PAYMENT_METHOD,
                     'location': None,
-                    'description': f"由发票#{invoice.id}自动生成"
+                    'description': AUTO_BILL_DESCRIPTION.format(invoice_id=invoice.id)
                 }
-                db_manager.create_bill(bill_data)
+                bill_id = db_manager.create_bill(bill_data).id
+                reconciler.link(invoice.id, bill_id, user_id)
             except Exception as _:
                 # 账单失败不影响发票入库
                 pass
@@ -371,6 +304,7 @@ class InvoiceOCRProcessor:
             return {
                 'success': True,
                 'invoice_id': invoice.id,
+                'bill_id': bill_id,
                 'extracted_info': extracted_info,
                 'classification': invoice_type,
                 'confidence': confidence,
@@ -446,7 +380,7 @@ class InvoiceOCRProcessor:
                     'merchant': invoice.merchant,
                     'amount': invoice.amount,
                     'type': invoice.invoice_type,
-                    'time': invoice.invoice_time.isoformat()
+                    'time': invoice.invoice_datetime.isoformat()
                 }
                 for invoice in invoices[:5]
             ]
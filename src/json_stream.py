@@ -0,0 +1,98 @@
+"""
+流式JSON响应 - 列表接口直接从游标分批序列化（orjson），不在内存中拼装整份列表再交给jsonable_encoder
+"""
+import json
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, Optional, Sequence
+
+from fastapi.responses import Response, StreamingResponse
+
+from .config import STREAM_CONFIG
+
+# 尝试导入orjson，如果失败则使用标准库json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为UTF-8 JSON字节（datetime输出ISO格式，numpy数值按原生数值输出）"""
+    if HAS_ORJSON:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def _default(value: Any):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, '__slots__'):
+        return {name: getattr(value, name) for name in value.__slots__}
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def json_response(content: Any, status_code: int = 200, headers: Dict[str, str] = None) -> Response:
+    """已序列化的JSON响应（跳过jsonable_encoder的逐层遍历）"""
+    return Response(dumps(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+def wants_ndjson(fmt: Optional[str], accept: Optional[str] = None) -> bool:
+    """format=ndjson 或 Accept: application/x-ndjson 时按行输出"""
+    return fmt == 'ndjson' or (accept or '').startswith(NDJSON_MEDIA_TYPE)
+
+
+def _chunks(rows: Iterable[Sequence], columns: Sequence[str], chunk_rows: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        chunk = [dict(zip(columns, row)) for row in islice(rows, chunk_rows)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(rows: Iterable[Sequence], columns: Sequence[str], head: Dict[str, Any] = None,
+                    tail: Dict[str, Any] = None, key: str = 'data', chunk_rows: int = None) -> Iterator[bytes]:
+    """生成 {**head, key: [行对象...], **tail}，每批行序列化一次，内存占用与总行数无关"""
+    head_bytes = dumps(head or {})
+    yield head_bytes[:-1] + (b',' if head else b'') + dumps(key) + b':['
+    first = True
+    for chunk in _chunks(rows, columns, chunk_rows or STREAM_CONFIG['chunk_rows']):
+        body = dumps(chunk)[1:-1]
+        yield body if first else b',' + body
+        first = False
+    yield b']' + (b',' + dumps(tail)[1:] if tail else b'}')
+
+
+def iter_ndjson(rows: Iterable[Sequence], columns: Sequence[str], chunk_rows: int = None) -> Iterator[bytes]:
+    """每行一个JSON对象"""
+    for chunk in _chunks(rows, columns, chunk_rows or STREAM_CONFIG['chunk_rows']):
+        yield b'\n'.join(dumps(item) for item in chunk) + b'\n'
+
+
+def _closing(iterator: Iterator[bytes], conns: Sequence) -> Iterator[bytes]:
+    """输出结束（或客户端断开、生成器被回收）时关闭游标所在的连接"""
+    try:
+        yield from iterator
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def stream_rows(rows: Iterable[Sequence], columns: Sequence[str], ndjson: bool = False,
+                head: Dict[str, Any] = None, tail: Dict[str, Any] = None, conns: Sequence = (),
+                headers: Dict[str, str] = None) -> StreamingResponse:
+    """游标行 -> 分块流式响应（JSON信封或NDJSON）；conns在输出结束后关闭
+
+    游标需在调用前执行（SQL错误仍能以HTTP错误返回），连接需以 check_same_thread=False 打开：
+    同步生成器由线程池推进，每批可能在不同线程上取数。
+    """
+    if ndjson:
+        content, media_type = iter_ndjson(rows, columns), NDJSON_MEDIA_TYPE
+    else:
+        content, media_type = iter_json_array(rows, columns, head, tail), "application/json"
+    return StreamingResponse(_closing(content, conns), media_type=media_type, headers=headers)
@@ -0,0 +1,84 @@
+"""
+后台任务选主模块 - 多worker部署时，全局后台任务只在持有文件锁的一个worker进程里运行
+
+gunicorn 的每个worker都会执行应用的startup事件；分析库同步、月报预生成、只读副本刷新这类任务
+每台机器跑一份就够了，各worker抢同一个锁文件（flock，进程退出时由内核释放），抢到的启动这些任务。
+未抢到的worker在后台定期重试：持锁worker因 max_requests 轮换或崩溃退出后，由其余worker接替。
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any
+
+# 尝试导入fcntl，如果失败（Windows）则视为单进程部署：不支持gunicorn预fork，本进程即为唯一worker
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from .config import SERVER_CONFIG
+
+
+class LeaderLock:
+    """基于文件锁的进程间选主"""
+
+    def __init__(self, lock_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(SERVER_CONFIG, **(config or {}))
+        self.lock_path = Path(lock_path or self.config['leader_lock'])
+        self._lock = threading.Lock()
+        self._fd = None
+        self._held = False
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._held
+
+    def try_acquire(self) -> bool:
+        """非阻塞抢锁，成功后本进程一直持有直到退出或 release()"""
+        with self._lock:
+            if self._held:
+                return True
+            if HAS_FCNTL:
+                self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    return False
+                # 写入持锁进程号，便于排查
+                os.ftruncate(fd, 0)
+                os.write(fd, str(os.getpid()).encode())
+                self._fd = fd
+            self._held = True
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+            self._held = False
+
+    def run_when_elected(self, start: Callable[[], None]) -> bool:
+        """当选则立即执行start并返回True；否则在后台周期重试，当选后再执行（只执行一次）"""
+        if self.try_acquire():
+            start()
+            return True
+        if self._thread is None:
+            def _loop():
+                while not self.try_acquire():
+                    time.sleep(self.config['leader_retry_seconds'])
+                start()
+
+            self._thread = threading.Thread(target=_loop, name="leader-election", daemon=True)
+            self._thread.start()
+        return False
+
+
+# 创建全局选主实例
+leader_lock = LeaderLock()
@@ -1,27 +1,49 @@
 """
 FastAPI主应用 - 账单查询与管理系统API
 """
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import uvicorn
 import os
 import random
+import time
 
 # 导入自定义模块
 from .database import db_manager
 from fix_sqlalchemy_session import get_bills_simple, get_bill_by_id, create_bill_simple, get_spending_summary_simple
-from .database import init_database
+from .database import init_database, get_sqlite_connection
 from .bill_query import query_processor
 from .cost_analysis import cost_analyzer
 from .ai_services import user_profiler, recommendation_engine, intelligent_analyzer
 from .invoice_ocr import invoice_ocr_processor
 from .data_cleaning import data_cleaner
-from .config import HOST, PORT, API_V1_PREFIX
+from .analytics_engine import analytics_engine
+from .bill_export import bill_exporter, export_job_manager, MEDIA_TYPES, ExportUnavailableError
+from .search_index import search_index_for, shard_search_indexes, SOURCES as SEARCH_SOURCES
+from .upload_store import upload_store, UploadTooLargeError
+from .reconciliation import reconciler
+from .merchant_index import merchant_index
+from .community import community_feed, POST_LIST_COLUMNS, POST_SELECT
+from .assistant import AssistantContext, intents, snapshot_store
+from .sharding import shard_router
+from .cold_storage import cold_store
+from .report_pipeline import monthly_reports
+from .snapshot import snapshot_store as replica_store
+from .static_assets import static_assets, StaticAssetApp
+from .records import BILL_COLUMNS, BILL_SELECT
+from .json_stream import stream_rows, json_response, wants_ndjson
+from .admission import AdmissionMiddleware
+from .leader import leader_lock
+from .metrics import (
+    registry, begin_request, finish_after_body, REQUEST_LATENCY, REQUESTS_TOTAL, REQUESTS_IN_FLIGHT,
+    REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS
+)
+from .config import HOST, PORT, API_V1_PREFIX, METRICS_CONFIG
 import sqlite3
 
 # 创建FastAPI应用
@@ -33,6 +55,9 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# 准入控制：重接口限并发、排队与合并（放在CORS内层，429/503响应也带CORS头）
+app.add_middleware(AdmissionMiddleware)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -42,6 +67,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _route_template(request: Request) -> str:
+    """匹配路由模板作为指标标签（避免路径参数导致标签爆炸）"""
+    from starlette.routing import Match
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+# 性能监控中间件
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """记录路由耗时、SQL次数与耗时、在途请求数，按需返回Server-Timing
+
+    /metrics 中的指标在响应体发送完后记录，包含流式响应体生成期间执行的SQL；
+    Server-Timing 随响应头发出，只统计到响应头为止（流式导出/列表接口的逐批读取不在其中）。
+    """
+    if not METRICS_CONFIG["enabled"]:
+        return await call_next(request)
+    
+    route = _route_template(request)
+    stats = begin_request()
+    REQUESTS_IN_FLIGHT.inc(route=route)
+
+    def finish(status: int):
+        elapsed = time.perf_counter() - stats.started
+        REQUESTS_IN_FLIGHT.dec(route=route)
+        REQUEST_LATENCY.observe(elapsed, method=request.method, route=route, status=status)
+        REQUESTS_TOTAL.inc(method=request.method, route=route, status=status)
+        REQUEST_SQL_STATEMENTS.observe(stats.sql_count, route=route)
+        REQUEST_SQL_SECONDS.observe(stats.sql_seconds, route=route)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish(500)
+        raise
+    
+    if METRICS_CONFIG["server_timing"] or request.headers.get(METRICS_CONFIG["server_timing_header"]) == "1":
+        response.headers["Server-Timing"] = stats.server_timing(time.perf_counter() - stats.started)
+    response.body_iterator = finish_after_body(response.body_iterator, lambda: finish(response.status_code))
+    return response
+
 # 数据模型定义
 class BillCreate(BaseModel):
     consume_time: datetime
@@ -75,29 +143,96 @@ class InvoiceProcessRequest(BaseModel):
     user_id: int = 1
     file_path: Optional[str] = None
 
+class ExportRequest(BaseModel):
+    user_id: int = 1
+    format: str = "csv"
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    category: Optional[str] = None
+
+def prepare_storage():
+    """建表/建索引（幂等）；多worker部署时由主进程在fork前先执行一次"""
+    init_database()
+    # 确保 OCR 日用量表存在（按用户计数，每个分片一张）
+    try:
+        for path in shard_router.paths():
+            conn = get_sqlite_connection(path)
+            cur = conn.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                used_at DATE NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                UNIQUE(user_id, used_at)
+            )
+            """)
+            conn.commit()
+            conn.close()
+    except Exception as _:
+        pass
+    # 商家规范化：为导入脚本等原始SQL写入、尚未解析的账单补齐 merchant_id
+    try:
+        merchant_index.ensure_schema()
+        stats = merchant_index.backfill()
+        if stats['updated']:
+            print(f"商家规范化回填 {stats['updated']} 笔账单")
+    except Exception as e:
+        print(f"商家规范化回填失败: {e}")
+    # 分析库副本按id同步删除所需的删除日志
+    try:
+        analytics_engine.ensure_schema()
+    except Exception as e:
+        print(f"分析库删除日志初始化失败: {e}")
+    # 冷数据归档清单
+    try:
+        cold_store.ensure_schema()
+    except Exception as e:
+        print(f"冷数据归档清单初始化失败: {e}")
+    # 点赞唯一索引（幂等点赞）
+    try:
+        community_feed.ensure_schema()
+    except Exception as e:
+        print(f"社区点赞索引初始化失败: {e}")
+    # 上传内容哈希 -> 识别结果映射表
+    try:
+        upload_store.ensure_schema()
+    except Exception as e:
+        print(f"上传存储初始化失败: {e}")
+    # 全文检索索引（首次启动时全量建索引；分片部署时每个分片各有一份）
+    try:
+        if any([index.ensure_schema() for index in shard_search_indexes()]):
+            print("全文检索索引构建完成")
+    except Exception as e:
+        print(f"全文检索索引初始化失败: {e}")
+
 # 启动事件
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库"""
-    init_database()
+    prepare_storage()
     print("数据库初始化完成")
-    # 确保 OCR 日用量表存在
+    # 全局后台任务多worker时只在抢到锁文件的一个worker里运行，其余worker在它退出后接替
+    leader_lock.run_when_elected(start_background_singletons)
+    # 点赞/评论计数增量缓冲在各自进程内，每个worker写回自己的增量
+    community_feed.start_background_flush()
+
+def start_background_singletons():
+    """全机只需一份的后台任务"""
+    # 启用列式分析后端时，后台周期同步bills副本
+    analytics_engine.start_background_sync()
+    # REPORT_SCHEDULE=1 时后台补齐上月月报
+    monthly_reports.start_background_schedule()
+    # BILL_REPLICA=1 时后台周期刷新只读副本（报表批量生成、推荐训练、分析库同步读副本）
+    replica_store.start_background_replica()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """退出前写回尚未落库的社区计数"""
     try:
-        conn = sqlite3.connect(str((__import__('pathlib').Path(__file__).parent.parent / 'data' / 'bill_db.sqlite')))
-        cur = conn.cursor()
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS ocr_usage (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            used_at DATE NOT NULL,
-            count INTEGER NOT NULL DEFAULT 0,
-            UNIQUE(user_id, used_at)
-        )
-        """)
-        conn.commit()
-        conn.close()
-    except Exception as _:
-        pass
+        community_feed.flush()
+    except Exception as e:
+        print(f"社区计数写回失败: {e}")
 
 # 根路径
 @app.get("/", response_class=HTMLResponse)
@@ -152,24 +287,12 @@ async def create_bill(bill: BillCreate, user_id: int = 1):
                 ]
             })
         
-        # 检查短时间内频繁消费
-        recent_bills = get_bills_simple(user_id=user_id, limit=100)
+        # 检查短时间内频繁消费（1小时内的账单直接按consume_ts范围取）
+        recent_bills = get_bills_simple(user_id=user_id, limit=100,
+                                        start_ts=data_cleaner.to_epoch(datetime.now()) - 3600)
         if recent_bills:
-            from datetime import datetime, timedelta
-            now = datetime.now()
-            recent_count = 0
-            recent_total = 0
-            
-            for b in recent_bills:
-                consume_time = b.get('consume_time', '')
-                if isinstance(consume_time, str):
-                    try:
-                        bill_time = datetime.fromisoformat(consume_time.replace(' ', 'T'))
-                        if (now - bill_time).total_seconds() < 3600:  # 1小时内
-                            recent_count += 1
-                            recent_total += float(b.get('amount', 0))
-                    except:
-                        pass
+            recent_count = len(recent_bills)
+            recent_total = sum(b.amount for b in recent_bills)
             
             # 1小时内超过5笔或总额超过2000元
             if recent_count >= 5:
@@ -200,6 +323,7 @@ async def create_bill(bill: BillCreate, user_id: int = 1):
         
         # 创建账单
         created_bill = db_manager.create_bill(bill_data)
+        snapshot_store.invalidate(user_id)
         
         response = {
             "success": True,
@@ -227,21 +351,26 @@ async def create_bill(bill: BillCreate, user_id: int = 1):
 
 @app.get(f"{API_V1_PREFIX}/bills")
 async def get_bills(
+    request: Request,
     user_id: int = 1, 
     limit: int = 100, 
     offset: int = 0,
     merchant: Optional[str] = None,
     category: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    format: str = "json"
 ):
-    """获取账单列表（支持搜索和筛选）"""
+    """获取账单列表（支持搜索和筛选）；从游标分批流式输出，format=ndjson 时按行输出"""
+    try:
+        start_ts = data_cleaner.to_epoch(start_date) if start_date else None
+        end_day = data_cleaner.day_key(end_date) if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 流式响应的生成器可能在不同线程中推进
+    conn = shard_router.connect(user_id, check_same_thread=False)
     try:
-        import sqlite3
-        from .config import DATABASE_PATH
-        
-        conn = sqlite3.connect(str(DATABASE_PATH))
-        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
         # 构建查询条件
@@ -249,20 +378,24 @@ async def get_bills(
         params = [user_id]
         
         if merchant:
-            conditions.append("merchant LIKE ?")
-            params.append(f"%{merchant}%")
+            # 纯中文商家名走全文检索索引，其余写法按名称包含匹配
+            condition = search_index_for(user_id).bill_merchant_condition(merchant, user_id)
+            condition, merchant_params = condition or ("merchant LIKE ?", [f"%{merchant}%"])
+            conditions.append(condition)
+            params.extend(merchant_params)
         
         if category:
             conditions.append("category = ?")
             params.append(category)
         
-        if start_date:
-            conditions.append("consume_time >= ?")
-            params.append(start_date)
+        # 日期按整数列比较：起始日0点起，截止日整天（与原先 "<= 截止日 23:59:59" 一致）
+        if start_ts is not None:
+            conditions.append("consume_ts >= ?")
+            params.append(start_ts)
         
-        if end_date:
-            conditions.append("consume_time <= ?")
-            params.append(end_date + " 23:59:59")
+        if end_day is not None:
+            conditions.append("consume_day <= ?")
+            params.append(end_day)
         
         where_clause = " AND ".join(conditions)
         
@@ -270,54 +403,115 @@ async def get_bills(
         cursor.execute(f"SELECT COUNT(*) FROM bills WHERE {where_clause}", params)
         total = cursor.fetchone()[0]
         
-        # 获取分页数据
+        # 获取分页数据（执行后交给流式响应逐批取数，连接在输出结束后关闭）
         cursor.execute(f"""
-            SELECT id, user_id, consume_time, amount, merchant, category, 
-                   payment_method, location, description, created_at, updated_at
+            SELECT {BILL_SELECT}
             FROM bills 
             WHERE {where_clause}
-            ORDER BY consume_time DESC 
+            ORDER BY consume_ts DESC 
             LIMIT ? OFFSET ?
         """, params + [limit, offset])
         
-        bills = []
-        for row in cursor.fetchall():
-            bills.append({
-                'id': row['id'],
-                'user_id': row['user_id'],
-                'consume_time': row['consume_time'],
-                'amount': row['amount'],
-                'merchant': row['merchant'],
-                'category': row['category'],
-                'payment_method': row['payment_method'],
-                'location': row['location'],
-                'description': row['description'],
-                'created_at': row['created_at'],
-                'updated_at': row['updated_at']
-            })
-        
-        conn.close()
-        
-        return {
-            "success": True,
-            "data": bills,
-            "total": total
-        }
+        return stream_rows(cursor, BILL_COLUMNS, wants_ndjson(format, request.headers.get('accept')),
+                           head={"success": True}, tail={"total": total}, conns=[conn],
+                           headers={"X-Total-Count": str(total)})
     except Exception as e:
+        conn.close()
         raise HTTPException(status_code=500, detail=f"获取账单列表失败: {str(e)}")
 
+@app.get(f"{API_V1_PREFIX}/bills/export")
+async def export_bills(
+    user_id: int = 1,
+    format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """流式导出账单（csv/xlsx/parquet），按批读取不在内存中拼装整份文件"""
+    try:
+        bill_exporter.check_format(format)
+        bill_exporter.check_dates(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    try:
+        content = bill_exporter.stream(format, user_id, start_date, end_date, category)
+        filename = f"bills_user{user_id}_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+        return StreamingResponse(
+            content,
+            media_type=MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导出账单失败: {str(e)}")
+
+@app.post(f"{API_V1_PREFIX}/exports")
+async def create_export_job(request: ExportRequest, background_tasks: BackgroundTasks):
+    """创建后台导出任务（大批量导出）"""
+    try:
+        job = export_job_manager.create_job(
+            request.format, request.user_id, request.start_date, request.end_date, request.category
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    background_tasks.add_task(export_job_manager.run_job, job['job_id'])
+    return {"success": True, "data": job}
+
+@app.get(f"{API_V1_PREFIX}/exports/{{job_id}}")
+async def get_export_job(job_id: str):
+    """查询导出任务状态"""
+    job = export_job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return {"success": True, "data": job}
+
+@app.get(f"{API_V1_PREFIX}/exports/{{job_id}}/download")
+async def download_export(job_id: str):
+    """下载已完成的导出文件"""
+    job = export_job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"导出任务未完成: {job['status']}")
+    return FileResponse(
+        job['file_path'],
+        media_type=MEDIA_TYPES[job['format']],
+        filename=os.path.basename(job['file_path'])
+    )
+
+@app.get(f"{API_V1_PREFIX}/search")
+async def search(
+    q: str,
+    user_id: Optional[int] = 1,
+    source: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """全文检索账单商家/备注与发票OCR文本（按相关度排序并高亮）"""
+    sources = [s for s in source.split(",") if s] if source else None
+    if sources and any(s not in SEARCH_SOURCES for s in sources):
+        raise HTTPException(status_code=400, detail=f"不支持的检索来源: {source}")
+    try:
+        result = search_index_for(user_id).search(q, user_id=user_id, sources=sources, limit=limit, offset=offset)
+        return {"success": True, "data": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"检索失败: {str(e)}")
+
 @app.get(f"{API_V1_PREFIX}/bills/{{bill_id}}")
 async def get_bill(bill_id: int, user_id: int = 1):
     """获取单个账单详情"""
     try:
-        bill = get_bill_by_id(bill_id)
+        bill = get_bill_by_id(bill_id, user_id)
         
-        if not bill or bill['user_id'] != user_id:
+        if not bill or bill.user_id != user_id:
             raise HTTPException(status_code=404, detail="账单不存在")
         
         return {
             "success": True,
-            "data": bill
+            "data": bill.to_dict()
         }
     except HTTPException:
         raise
@@ -339,10 +533,11 @@ async def update_bill(bill_id: int, bill_update: BillUpdate, user_id: int = 1):
             update_data = data_cleaner.clean_bill_data(update_data)
         
         # 更新账单
-        updated_bill = db_manager.update_bill(bill_id, update_data)
+        updated_bill = db_manager.update_bill(bill_id, update_data, user_id)
         
         if not updated_bill:
             raise HTTPException(status_code=404, detail="账单不存在")
+        snapshot_store.invalidate(updated_bill.user_id)
         
         return {
             "success": True,
@@ -365,10 +560,11 @@ async def update_bill(bill_id: int, bill_update: BillUpdate, user_id: int = 1):
 async def delete_bill(bill_id: int, user_id: int = 1):
     """删除账单记录"""
     try:
-        success = db_manager.delete_bill(bill_id)
+        success = db_manager.delete_bill(bill_id, user_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="账单不存在")
+        snapshot_store.invalidate(user_id)
         
         return {
             "success": True,
@@ -417,7 +613,9 @@ async def get_spending_summary(user_id: int = 1, start_date: Optional[datetime]
 async def get_comprehensive_analysis(request: AnalysisRequest):
     """获取综合分析报告"""
     try:
-        analysis = cost_analyzer.get_spending_analysis(
+        # 报表生成是CPU密集的同步代码，放到线程池，不阻塞事件循环上的轻量请求
+        analysis = await run_in_threadpool(
+            cost_analyzer.get_spending_analysis,
             request.user_id, 
             request.start_date, 
             request.end_date
@@ -456,12 +654,31 @@ async def get_trend_analysis(user_id: int = 1, period: str = "monthly"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取趋势分析失败: {str(e)}")
 
+@app.get(f"{API_V1_PREFIX}/analysis/report/monthly")
+async def get_monthly_report(user_id: int = 1, month: Optional[str] = None):
+    """获取月度完整报告（month如2025-09，默认上个月）；优先返回预生成的月报"""
+    try:
+        month_key = int(month.replace('-', '')) if month else monthly_reports.previous_month()
+        if not 1 <= month_key % 100 <= 12:
+            raise ValueError(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式应为YYYY-MM")
+    try:
+        report = await run_in_threadpool(monthly_reports.get_or_generate, user_id, month_key)
+        
+        return {
+            "success": True,
+            "data": report
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取月度报告失败: {str(e)}")
+
 # AI服务API
 @app.get(f"{API_V1_PREFIX}/ai/profile/{{user_id}}")
 async def get_user_profile(user_id: int):
     """获取用户画像"""
     try:
-        profile = user_profiler.generate_user_profile(user_id)
+        profile = await run_in_threadpool(user_profiler.generate_user_profile, user_id)
         
         return {
             "success": True,
@@ -474,7 +691,7 @@ async def get_user_profile(user_id: int):
 async def get_financial_recommendations(user_id: int):
     """获取金融产品推荐"""
     try:
-        recommendations = recommendation_engine.get_financial_recommendations(user_id)
+        recommendations = await run_in_threadpool(recommendation_engine.get_financial_recommendations, user_id)
         
         return {
             "success": True,
@@ -487,7 +704,7 @@ async def get_financial_recommendations(user_id: int):
 async def get_spending_recommendations(user_id: int):
     """获取消费建议"""
     try:
-        recommendations = recommendation_engine.get_spending_recommendations(user_id)
+        recommendations = await run_in_threadpool(recommendation_engine.get_spending_recommendations, user_id)
         
         return {
             "success": True,
@@ -496,11 +713,28 @@ async def get_spending_recommendations(user_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取消费建议失败: {str(e)}")
 
+@app.get(f"{API_V1_PREFIX}/ai/recommendations/collaborative/{{user_id}}")
+async def get_collaborative_recommendations(user_id: int, kind: str = "merchant", limit: int = 10):
+    """获取协同过滤推荐（kind: merchant 商家 / category 类别）"""
+    try:
+        recommendations = await run_in_threadpool(
+            recommendation_engine.get_collaborative_recommendations, user_id, kind, limit
+        )
+        
+        return {
+            "success": True,
+            "data": recommendations
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取协同过滤推荐失败: {str(e)}")
+
 @app.get(f"{API_V1_PREFIX}/ai/analysis/comprehensive/{{user_id}}")
 async def get_comprehensive_ai_analysis(user_id: int):
     """获取综合AI分析"""
     try:
-        analysis = intelligent_analyzer.generate_comprehensive_analysis(user_id)
+        analysis = await run_in_threadpool(intelligent_analyzer.generate_comprehensive_analysis, user_id)
         
         return {
             "success": True,
@@ -527,28 +761,28 @@ async def process_invoice(request: InvoiceProcessRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"处理发票失败: {str(e)}")
 
+# 发票列表接口输出的字段
+INVOICE_LIST_COLUMNS = ['id', 'invoice_time', 'amount', 'merchant', 'invoice_type', 'file_path', 'bill_id', 'created_at']
+
 @app.get(f"{API_V1_PREFIX}/invoices")
-async def get_invoices(user_id: int = 1, limit: int = 100):
-    """获取发票列表"""
+async def get_invoices(request: Request, user_id: int = 1, limit: int = 100, format: str = "json"):
+    """获取发票列表（从游标分批流式输出，format=ndjson 时按行输出）"""
+    conn = shard_router.connect(user_id, check_same_thread=False)
     try:
-        invoices = db_manager.get_invoices(user_id, limit)
-        
-        return {
-            "success": True,
-            "data": [
-                {
-                    "id": invoice.id,
-                    "invoice_time": invoice.invoice_time.isoformat(),
-                    "amount": invoice.amount,
-                    "merchant": invoice.merchant,
-                    "invoice_type": invoice.invoice_type,
-                    "file_path": invoice.file_path,
-                    "created_at": invoice.created_at.isoformat()
-                }
-                for invoice in invoices
-            ]
-        }
+        # 时间文本的空格换成T，与datetime.isoformat()输出一致
+        cursor = conn.execute("""
+            SELECT id, replace(invoice_time, ' ', 'T'), amount, merchant, invoice_type,
+                   file_path, bill_id, replace(created_at, ' ', 'T')
+            FROM invoices
+            WHERE user_id = ?
+            ORDER BY invoice_ts DESC
+            LIMIT ?
+        """, (user_id, limit))
+        
+        return stream_rows(cursor, INVOICE_LIST_COLUMNS, wants_ndjson(format, request.headers.get('accept')),
+                           head={"success": True}, conns=[conn])
     except Exception as e:
+        conn.close()
         raise HTTPException(status_code=500, detail=f"获取发票列表失败: {str(e)}")
 
 @app.get(f"{API_V1_PREFIX}/invoices/statistics")
@@ -564,109 +798,125 @@ async def get_invoice_statistics(user_id: int = 1):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取发票统计失败: {str(e)}")
 
+@app.post(f"{API_V1_PREFIX}/invoices/reconcile")
+async def reconcile_invoices(user_id: Optional[int] = None, merge: bool = True):
+    """批量对账：把未对账发票关联到已有账单，merge时删除被取代的发票自动生成账单"""
+    try:
+        # 全量回填耗时较长，放到线程池执行，不阻塞事件循环
+        stats = await run_in_threadpool(reconciler.backfill, user_id, merge)
+        return {
+            "success": True,
+            "data": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"发票对账失败: {str(e)}")
+
 # 前端与OCR整合：发票图片上传并OCR
+def _consume_ocr_quota(user_id: int):
+    """非订阅用户每日10次限额（演示）"""
+    try:
+        today = datetime.now().strftime('%Y-%m-%d')
+        conn = shard_router.connect(user_id)
+        cur = conn.cursor()
+        cur.execute("SELECT count FROM ocr_usage WHERE user_id=? AND used_at=?", (user_id, today))
+        row = cur.fetchone()
+        current = row[0] if row else 0
+        if current >= 10:
+            conn.close()
+            raise HTTPException(status_code=429, detail="OCR当日次数已达上限(10)。请订阅提升配额或次日再试。")
+        if row:
+            cur.execute("UPDATE ocr_usage SET count=count+1 WHERE user_id=? AND used_at=?", (user_id, today))
+        else:
+            cur.execute("INSERT INTO ocr_usage(user_id, used_at, count) VALUES(?,?,1)", (user_id, today))
+        conn.commit()
+        conn.close()
+    except HTTPException:
+        raise
+    except Exception as _:
+        pass
+
 @app.post(f"{API_V1_PREFIX}/invoices/upload")
 async def upload_invoice_image(file: UploadFile = File(...), user_id: int = 1):
-    """上传发票图片并进行OCR，返回入库结果"""
+    """上传发票图片并进行OCR，返回入库结果（相同图片直接返回已识别的发票）"""
     try:
-        # 非订阅用户每日10次限额（演示）
+        # 分块写入内容寻址存储
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            db_path = str((__import__('pathlib').Path(__file__).parent.parent / 'data' / 'bill_db.sqlite'))
-            conn = sqlite3.connect(db_path)
-            cur = conn.cursor()
-            cur.execute("SELECT count FROM ocr_usage WHERE user_id=? AND used_at=?", (user_id, today))
-            row = cur.fetchone()
-            current = row[0] if row else 0
-            if current >= 10:
-                conn.close()
-                raise HTTPException(status_code=429, detail="OCR当日次数已达上限(10)。请订阅提升配额或次日再试。")
-            if row:
-                cur.execute("UPDATE ocr_usage SET count=count+1 WHERE user_id=? AND used_at=?", (user_id, today))
+            stored = await upload_store.save(file)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        content_hash = stored['content_hash']
+        async with upload_store.lock(content_hash):
+            # 同一用户重复上传：直接返回已有发票，不占用OCR配额
+            blob = upload_store.get_blob(content_hash)
+            invoice_id = upload_store.get_invoice_id(content_hash, user_id) if blob else None
+            if invoice_id is not None:
+                processed = blob['processed']
+                return {
+                    "success": True,
+                    "data": {
+                        'success': True,
+                        'invoice_id': invoice_id,
+                        'extracted_info': processed['extracted_info'],
+                        'classification': processed['classification'],
+                        'confidence': processed['confidence'],
+                        'content_hash': content_hash,
+                        'duplicate': True,
+                        'message': '该图片已识别过，返回已有发票记录'
+                    }
+                }
+
+            if blob and blob['processed']:
+                # 其他用户上传过相同图片：复用识别结果，只为当前用户建发票
+                ocr_text, processed = blob['ocr_text'], blob['processed']
             else:
-                cur.execute("INSERT INTO ocr_usage(user_id, used_at, count) VALUES(?,?,1)", (user_id, today))
-            conn.commit()
-            conn.close()
-        except HTTPException:
-            raise
-        except Exception as _:
-            pass
-        # 保存上传文件
-        from .config import UPLOADS_DIR
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-        save_path = os.path.join(str(UPLOADS_DIR), file.filename)
-        with open(save_path, "wb") as f:
-            f.write(await file.read())
-
-        # 这里可接入真实OCR；当前以文件名作为占位OCR文本
-        ocr_text = f"发票图片: {file.filename}"
-        result = invoice_ocr_processor.create_invoice_record(
-            ocr_text=ocr_text,
-            file_path=save_path,
-            user_id=user_id,
-        )
+                _consume_ocr_quota(user_id)
+                # 这里可接入真实OCR；当前以文件名作为占位OCR文本
+                ocr_text = f"发票图片: {file.filename}"
+                processed = invoice_ocr_processor.process_invoice_text(ocr_text)
+                if 'error' not in processed:
+                    upload_store.record_result(stored, ocr_text, processed)
+
+            result = invoice_ocr_processor.create_invoice_record(
+                ocr_text=ocr_text,
+                file_path=stored['file_path'],
+                user_id=user_id,
+                processed_result=processed,
+            )
+            if result.get('success'):
+                upload_store.record_invoice(content_hash, user_id, result['invoice_id'])
+            result.update({'content_hash': content_hash, 'duplicate': False})
 
         return {
             "success": result.get("success", False),
             "data": result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传并处理发票失败: {str(e)}")
 
-# 可选：挂载前端静态资源（若存在web目录）
+# 可选：挂载前端静态资源（frontend/dist 或 web 目录；加指纹、预压缩后从内存返回）
 try:
-    web_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "web")
-    if os.path.isdir(web_dir):
-        app.mount("/app", StaticFiles(directory=web_dir, html=True), name="app")
-except Exception:
-    pass
+    if static_assets.load():
+        app.mount(static_assets.mount_path, StaticAssetApp(static_assets), name="app")
+except Exception as e:
+    print(f"前端静态资源加载失败: {e}")
 
 # 商家评估Top榜（频率/复购/间隔）
 @app.get(f"{API_V1_PREFIX}/merchants/top")
 async def get_top_merchants(user_id: int = 1, window: int = 90, top_k: int = 10):
     """近window天用户商家评估Top榜"""
     try:
-        # 取近window天账单
-        from datetime import timedelta
-        end_dt = datetime.now()
-        start_dt = end_dt - timedelta(days=window)
-        bills = get_bills_simple(user_id=user_id, limit=10000, offset=0)
-        bills = [b for b in bills if b.get('consume_time') and str(b['consume_time']) >= start_dt.strftime('%Y-%m-%d')]
-
-        # 聚合
-        by_merchant = {}
-        for b in bills:
-            m = b.get('merchant') or '未知'
-            by_merchant.setdefault(m, []).append(b)
-
-        results = []
-        for m, arr in by_merchant.items():
-            arr_sorted = sorted(arr, key=lambda x: str(x.get('consume_time')))
-            visits = len(arr_sorted)
-            total_amount = sum(float(x.get('amount') or 0) for x in arr_sorted)
-            repurchase = 1.0 if visits >= 2 else 0.0  # 单用户退化定义
-            # 平均间隔天数
-            intervals = []
-            for i in range(1, len(arr_sorted)):
-                try:
-                    t1 = datetime.fromisoformat(str(arr_sorted[i]['consume_time']).replace(' ', 'T'))
-                    t0 = datetime.fromisoformat(str(arr_sorted[i-1]['consume_time']).replace(' ', 'T'))
-                    intervals.append((t1 - t0).days or 0)
-                except Exception:
-                    pass
-            avg_interval = sum(intervals)/len(intervals) if intervals else None
-            # 简易评分：访问频次+复购+金额占比权重
-            score = visits*0.5 + repurchase*1.5 + (total_amount/ (1+total_amount))
-            results.append({
-                'merchant': m,
-                'visits': visits,
-                'total_amount': round(total_amount,2),
-                'repurchase_rate': repurchase,
-                'avg_interval_days': avg_interval,
-                'score': round(score,3)
-            })
-
-        results = sorted(results, key=lambda x: x['score'], reverse=True)[:top_k]
+        # 近window天在快照范围内时复用对话助手的账单快照，否则按window单独加载一份
+        start_ts = data_cleaner.to_epoch(datetime.now().replace(hour=0, minute=0, second=0)) - window * 86400
+        if window <= snapshot_store.config['snapshot_days']:
+            snapshot = await run_in_threadpool(snapshot_store.get, user_id)
+        else:
+            snapshot = await run_in_threadpool(snapshot_store.load, user_id, window)
+        results = snapshot.top_merchants(start_ts, top_k=top_k)
         return { 'success': True, 'data': results }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取商家Top失败: {str(e)}")
@@ -674,125 +924,10 @@ async def get_top_merchants(user_id: int = 1, window: int = 90, top_k: int = 10)
 # AI助手意图增强
 @app.post(f"{API_V1_PREFIX}/ai/advice/{{user_id}}")
 async def ai_advice(user_id: int, body: Dict[str, Any]):
-    """对话式AI助手：今日/趋势/好商家/预警"""
+    """对话式AI助手：按意图注册表分派，各意图共用同一份账单快照"""
     try:
-        q = (body.get('query') or '').strip().lower()
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        from collections import Counter
-        
-        # 今日消费分析（增强版）
-        if any(k in q for k in ['今日','今天','today','今天花了','今日消费']):
-            bills = get_bills_simple(user_id=user_id, limit=1000)
-            tb = [b for b in bills if str(b.get('consume_time','')).startswith(today_str)]
-            total = sum(float(x.get('amount') or 0) for x in tb)
-            
-            if not tb:
-                return {
-                    'cards': [{'type': 'tip', 'title': '今日暂无消费记录', 'content': '今天还没有消费记录哦~继续保持理性消费的好习惯！💰'}],
-                    'humanized': '今天过得真节俭呢！为您点赞👍 继续保持理性消费的好习惯。'
-                }
-            
-            avg_amount = total / len(tb) if tb else 0
-            topm = Counter([x.get('merchant') for x in tb]).most_common(1)[0][0] if tb else None
-            categories = Counter([x.get('category', '未知') for x in tb])
-            top_category = categories.most_common(1)[0] if categories else None
-            
-            mood = "今天消费控制得很好" if total < 200 else "今天的消费在合理范围内" if total < 500 else "看起来今天消费比较活跃呢"
-            advice = "继续保持理性消费！" if total < 200 else "继续保持良好的消费习惯！" if total < 500 else "建议关注一下各类别支出占比，合理控制消费节奏~"
-            
-            return {
-                'cards': [
-                    {'type': 'summary', 'title': '今日消费概览', 'content': f"共 {len(tb)} 笔交易，总计 ¥{total:.2f} 元，平均单笔 ¥{avg_amount:.2f} 元"},
-                    {'type': 'tip', 'title': '消费亮点', 'content': f"今日最爱类别：{top_category[0] if top_category else '—'}（{top_category[1] if top_category else 0}次）；最常光顾：{topm or '—'}"},
-                    {'type': 'tip', 'title': '温馨提示', 'content': f"{mood}，{advice}"}
-                ],
-                'humanized': f"您好！根据今天的账单记录，您共消费了 {len(tb)} 笔，总计 ¥{total:.2f} 元。{mood}！{advice} ✨"
-            }
-        # 消费趋势分析（增强版）
-        if any(k in q for k in ['趋势','trend','近7','近30','消费趋势','趋势分析']):
-            s = get_spending_summary_simple(user_id)
-            total_amount = float(s.get('total_amount', 0))
-            avg_amount = float(s.get('avg_amount', 0))
-            total_count = s.get('total_count', 0)
-            
-            # 分析趋势
-            bills = get_bills_simple(user_id=user_id, limit=1000)
-            if bills:
-                from datetime import timedelta
-                recent_bills = [b for b in bills if str(b.get('consume_time', '')).startswith((datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d'))]
-                recent_total = sum(float(x.get('amount', 0) or 0) for x in recent_bills)
-                trend = "上升" if recent_total > total_amount / 4 else "下降" if recent_total < total_amount / 8 else "稳定"
-            else:
-                trend = "稳定"
-            
-            return {
-                'cards': [
-                    {'type': 'summary', 'title': '消费趋势分析', 'content': f"累计消费 ¥{total_amount:.2f} 元，共 {total_count} 笔，平均单笔 ¥{avg_amount:.2f} 元。近7天消费趋势：{trend}趋势"},
-                    {'type': 'tip', 'title': '趋势建议', 'content': '建议关注月度预算，合理规划支出节奏，让每一分钱都花得有价值~'}
-                ],
-                'humanized': f"根据您的消费记录分析，总消费金额为 ¥{total_amount:.2f} 元，共 {total_count} 笔交易，平均单笔 ¥{avg_amount:.2f} 元。近期的消费呈现{trend}趋势。建议您关注月度预算，合理规划支出节奏，让每一分钱都花得有价值~ 📊"
-            }
-        # 好商家推荐（增强版）
-        if any(k in q for k in ['好商家','推荐商家','回购','常去','喜欢的商家']):
-            r = await get_top_merchants(user_id=user_id, window=90, top_k=5)
-            merchants = r.get('data', [])
-            
-            if not merchants:
-                return {
-                    'cards': [{'type': 'tip', 'title': '暂无推荐', 'content': '消费记录较少，建议多使用系统记录消费，我们会为您推荐优质商家~'}],
-                    'humanized': '您好！目前您的消费记录还不够丰富，建议多使用系统记录消费，积累数据后我会为您推荐优质商家哦~ 💡'
-                }
-            
-            top3 = merchants[:3]
-            merchant_list = '、'.join([f"{m['merchant']}({m['visits']}次)" for m in top3])
-            
-            return {
-                'cards': [
-                    {'type': 'recommendation', 'title': '好商家推荐', 'items': merchants, 'content': f"根据您的消费频率和复购率，为您推荐：{merchant_list}"},
-                    {'type': 'tip', 'title': '推荐理由', 'content': '这些商家在您的消费记录中频率较高，复购率良好，说明您对他们的服务比较满意~'}
-                ],
-                'humanized': f"根据您近90天的消费记录，我为您推荐以下优质商家：{merchant_list}。这些商家在您的消费记录中频率较高，复购率良好，说明您对他们的服务比较满意呢~ 建议继续关注这些商家的优惠活动！⭐"
-            }
-        # 消费预警（增强版）
-        if any(k in q for k in ['预警','超额','大额','异常','风险']):
-            bills = get_bills_simple(user_id=user_id, limit=1000)
-            large = [b for b in bills if float(b.get('amount', 0) or 0) >= 1000]
-            
-            if not large:
-                return {
-                    'cards': [{'type': 'tip', 'title': '消费健康', 'content': '恭喜！您的消费记录中没有发现异常大额交易，消费习惯良好~'}],
-                    'humanized': '恭喜您！我检查了您的消费记录，没有发现异常大额交易，您的消费习惯非常健康，继续保持！🎉'
-                }
-            
-            # 分析大额交易
-            large_total = sum(float(b.get('amount', 0) or 0) for b in large)
-            avg_large = large_total / len(large) if large else 0
-            
-            return {
-                'cards': [
-                    {'type': 'alert', 'title': '大额支出提示', 'content': f"发现 {len(large)} 笔大额交易（≥¥1000），累计金额 ¥{large_total:.2f} 元，平均单笔 ¥{avg_large:.2f} 元。建议核对交易详情，确认商家信息正确。"},
-                    {'type': 'tip', 'title': '安全建议', 'content': '大额交易已标记，建议您及时核对交易详情和商家信息，确保资金安全~'}
-                ],
-                'humanized': f"⚠️ 消费预警：我检查了您的账单，发现了 {len(large)} 笔大额交易（单笔≥¥1000），累计金额 ¥{large_total:.2f} 元。为了您的资金安全，建议您及时核对这些交易的详情和商家信息。如果发现异常，请及时联系银行处理~"
-            }
-        
-        # 如果没有任何匹配，返回通用回复（不显示抱歉）
-        # 尝试进行模糊匹配或提供帮助信息
-        if len(q) > 0:
-            # 尝试提取关键词
-            keywords = ['消费', '账单', '分析', '推荐', '商家', '趋势', '金额', '类别', '餐饮', '购物', '交通', '娱乐']
-            matched = [k for k in keywords if k in q]
-            if matched:
-                return {
-                    'cards': [{'type': 'tip', 'title': '关键词识别', 'content': f"我识别到您提到了：{', '.join(matched)}。试试问我：\"今日消费分析\"、\"消费趋势分析\"、\"好商家推荐\"等具体问题~"}],
-                    'humanized': f"您好！我注意到您提到了：{', '.join(matched)}。我可以帮您分析消费、推荐商家、预测趋势、预警异常等。试试问我更具体的问题，比如：\"今日消费分析\"、\"消费趋势分析\"、\"好商家推荐\"、\"消费预警\"等~ 💡"
-                }
-        
-        # 默认回复（增强版）
-        return {
-            'cards': [{'type': 'tip', 'title': '我可以帮您做什么？', 'content': '试试问我："今日消费分析"、"消费趋势分析"、"好商家推荐"、"消费预警"等，我会为您提供详细的消费分析~'}],
-            'humanized': '您好！我是您的智能账单小助手 💡 我可以帮您分析消费、推荐商家、预测趋势、预警异常等。试试问我："今日消费分析"、"消费趋势分析"、"好商家推荐"、"消费预警"，我会为您提供详细的个性化分析~'
-        }
+        ctx = AssistantContext(user_id, body.get('query'))
+        return await run_in_threadpool(intents.dispatch, ctx)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -881,10 +1016,10 @@ async def get_large_transactions(user_id: int = 1, threshold: float = 1000.0):
     """获取大额交易（反欺诈提示）"""
     try:
         bills = get_bills_simple(user_id, limit=1000)
-        large = [b for b in bills if float(b.get('amount', 0)) >= threshold]
+        large = [b for b in bills if b.amount >= threshold]
         return {
             "success": True,
-            "data": large[:20],
+            "data": [b.to_dict() for b in large[:20]],
             "total": len(large),
             "threshold": threshold,
             "hints": {
@@ -944,44 +1079,38 @@ async def create_post(post: PostCreate, user_id: int = 1):
         raise HTTPException(status_code=500, detail=f"创建帖子失败: {str(e)}")
 
 @app.get(f"{API_V1_PREFIX}/community/posts")
-async def get_posts(limit: int = 20, offset: int = 0):
-    """获取社区帖子列表（使用直接SQL查询避免会话问题）"""
+async def get_posts(request: Request, limit: int = 20, offset: int = 0, sort: str = "new", format: str = "json"):
+    """获取社区帖子列表（sort: new 按发布时间 / hot 按热度），从游标或热榜缓存分批流式输出"""
+    if sort not in ("new", "hot"):
+        raise HTTPException(status_code=400, detail="sort 只支持 new 或 hot")
+    ndjson = wants_ndjson(format, request.headers.get('accept'))
+    if sort == "hot":
+        try:
+            rows = await run_in_threadpool(community_feed.hot_posts, limit, offset)
+            return stream_rows(rows, POST_LIST_COLUMNS, ndjson, head={"success": True})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"获取热门帖子失败: {str(e)}")
+
+    conns = []
+
+    def open_cursors():
+        # 帖子按作者分片：各分片游标取前 offset+limit 条，按发布时间边取边归并
+        cursors = []
+        for path in shard_router.paths():
+            conn = get_sqlite_connection(path, check_same_thread=False)
+            conns.append(conn)
+            cursors.append(conn.execute(f"{POST_SELECT} ORDER BY created_at DESC LIMIT ?", (offset + limit,)))
+        return cursors
+
     try:
-        # 直接使用SQL查询避免SQLAlchemy会话问题
-        import sqlite3
-        from .config import DATABASE_PATH
-        
-        conn = sqlite3.connect(str(DATABASE_PATH))
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, user_id, title, content, bill_id, invoice_id, 
-                   likes_count, comments_count, created_at
-            FROM community_posts
-            ORDER BY created_at DESC
-            LIMIT ? OFFSET ?
-        """, (limit, offset))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        result_data = []
-        for row in rows:
-            result_data.append({
-                "id": row['id'],
-                "user_id": row['user_id'],
-                "title": row['title'],
-                "content": row['content'],
-                "bill_id": row['bill_id'],
-                "invoice_id": row['invoice_id'],
-                "likes_count": row['likes_count'] or 0,
-                "comments_count": row['comments_count'] or 0,
-                "created_at": row['created_at'] if row['created_at'] else ''
-            })
-        
-        return {"success": True, "data": result_data}
+        cursors = await run_in_threadpool(open_cursors)
+        rows = shard_router.iter_merge_sorted(cursors, key=lambda row: row[8], limit=limit, offset=offset)
+        # 叠加本进程尚未写回的点赞/评论数
+        return stream_rows(community_feed.with_pending(rows), POST_LIST_COLUMNS, ndjson,
+                           head={"success": True}, conns=conns)
     except Exception as e:
+        for conn in conns:
+            conn.close()
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取帖子失败: {str(e)}")
@@ -1026,7 +1155,7 @@ async def login(request: LoginRequest):
         from .config import DATABASE_PATH
         
         # 从数据库验证用户（简化版：检查用户名是否存在）
-        conn = sqlite3.connect(str(DATABASE_PATH))
+        conn = get_sqlite_connection()
         cur = conn.cursor()
         cur.execute("SELECT id, username, email FROM users WHERE username=?", (request.username,))
         user_row = cur.fetchone()
@@ -1087,7 +1216,7 @@ async def predict_totals(user_id: int = 1, days: int = 30):
     try:
         # 简化预测（实际应使用深度学习模型）
         bills = get_bills_simple(user_id, limit=100)
-        avg_daily = sum(float(b.get('amount', 0)) for b in bills) / max(len(bills), 1) if bills else 0
+        avg_daily = sum(b.amount for b in bills) / max(len(bills), 1) if bills else 0
         predicted = avg_daily * days
         
         return {
@@ -1108,7 +1237,7 @@ async def predict_category(user_id: int = 1, days: int = 30):
     try:
         from collections import Counter
         bills = get_bills_simple(user_id, limit=1000)
-        categories = Counter([b.get('category', '未知') for b in bills])
+        categories = Counter([b.category for b in bills])
         total = sum(categories.values())
         predicted = {k: round(v/total * days, 0) if total > 0 else 0 for k, v in categories.items()}
         
@@ -1129,8 +1258,9 @@ async def predict_merchant(user_id: int = 1, days: int = 30):
     try:
         from collections import Counter
         bills = get_bills_simple(user_id, limit=1000)
-        merchants = Counter([b.get('merchant', '未知') for b in bills])
-        top_merchants = dict(merchants.most_common(5))
+        merchants = Counter(b.merchant_id or merchant_index.resolve(b.merchant) or b.merchant for b in bills)
+        top_merchants = {merchant_index.name(key) if isinstance(key, int) else key: count
+                         for key, count in merchants.most_common(5)}
         
         return {
             "success": True,
@@ -1148,30 +1278,31 @@ async def predict_anomaly(user_id: int = 1):
     """异常检测"""
     try:
         bills = get_bills_simple(user_id, limit=1000)
-        amounts = [float(b.get('amount', 0)) for b in bills if b.get('amount')]
+        amounts = [b.amount for b in bills if b.amount]
         if not amounts:
             return {"success": True, "data": {"anomalies": [], "risk_score": 0.0}}
         
         import numpy as np
         mean, std = np.mean(amounts), np.std(amounts)
         threshold = mean + 2 * std
-        anomalies = [b for b in bills if float(b.get('amount', 0)) > threshold]
+        anomalies = [b for b in bills if b.amount > threshold]
         
-        return {
+        # 账单记录由orjson直接序列化，不经jsonable_encoder逐层转换
+        return json_response({
             "success": True,
             "data": {
                 "anomalies": anomalies[:10],
                 "risk_score": min(len(anomalies) / len(bills) if bills else 0, 1.0),
-                "threshold": round(threshold, 2)
+                "threshold": round(float(threshold), 2)
             }
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"异常检测失败: {str(e)}")
 
 # 增强金融推荐（原因+风险）
 @app.get(f"{API_V1_PREFIX}/ai/recommendations/financial/enhanced/{{user_id}}")
-async def get_enhanced_financial_recommendations(user_id: int):
-    """获取增强金融产品推荐（含原因和风险提示）- 增强版，更多推荐"""
+def get_enhanced_financial_recommendations(user_id: int):
+    """获取增强金融产品推荐（含原因和风险提示）- 增强版，更多推荐（同步接口，由FastAPI放到线程池执行）"""
     try:
         # 获取推荐列表
         try:
@@ -1218,7 +1349,7 @@ async def get_enhanced_financial_recommendations(user_id: int):
                 else:
                     min_amount_filter = 50000
                 
-                conn = sqlite3.connect(str(DATABASE_PATH))
+                conn = get_sqlite_connection()
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -1332,6 +1463,12 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Prometheus指标
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus文本格式指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 启动服务器
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,270 @@
+"""
+商家规范化模块 - 把各种写法的商家名（分店后缀、公司全称、OCR噪声）归到同一个规范商家id
+"""
+import argparse
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import MERCHANT_CONFIG
+from .database import get_sqlite_connection
+from .sharding import shard_router
+
+_BRANCH_PATTERN = re.compile(r'[(\[【<][^)\]】>]*[)\]】>]')
+_NOISE_PATTERN = re.compile(r'[\W_]+')
+UNKNOWN_MERCHANTS = {'', '未知商家', '未知'}
+
+
+class MerchantIndex:
+    """商家字典：别名精确命中走内存字典，新名称经n-gram倒排索引召回候选再按编辑相似度确认"""
+
+    def __init__(self, db_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(MERCHANT_CONFIG, **(config or {}))
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._aliases: Dict[str, int] = {}  # 归一化名称 -> 商家id
+        self._names: Dict[int, str] = {}  # 商家id -> 展示名
+        self._keys: Dict[int, str] = {}  # 商家id -> 规范名称
+        self._grams: Dict[str, set] = defaultdict(set)  # n-gram -> 商家id集合
+        self._suffixes = tuple(sorted(self.config['suffixes'], key=len, reverse=True))
+        self._prefixes = tuple(sorted(self.config['prefixes'], key=len, reverse=True))
+        self.resolve = lru_cache(maxsize=self.config['resolve_cache_size'])(self._resolve)
+
+    def _connect(self):
+        return get_sqlite_connection(self.db_path)
+
+    # 归一化
+    @staticmethod
+    def display_name(raw: str) -> str:
+        """展示名：去掉分店括号与首尾空白"""
+        text = unicodedata.normalize('NFKC', raw or '')
+        return _BRANCH_PATTERN.sub('', text).strip() or text.strip()
+
+    def normalize(self, raw: str) -> str:
+        """归一化：全角转半角、小写、去分店括号与标点，剥离城市前缀和公司/业态后缀"""
+        text = _NOISE_PATTERN.sub('', self.display_name(raw).lower())
+        stripped = True
+        while stripped:
+            stripped = False
+            for suffix in self._suffixes:
+                if text.endswith(suffix) and len(text) > len(suffix) + 1:
+                    text, stripped = text[:-len(suffix)], True
+                    break
+            for prefix in self._prefixes:
+                if text.startswith(prefix) and len(text) > len(prefix) + 1:
+                    text, stripped = text[len(prefix):], True
+                    break
+        return text
+
+    def _ngrams(self, key: str) -> set:
+        n = self.config['ngram']
+        if len(key) <= n:
+            return {key}
+        return {key[i:i + n] for i in range(len(key) - n + 1)}
+
+    # 加载与维护内存索引
+    def load(self):
+        """从库中加载商家与别名（首次解析时自动调用）"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                merchants = conn.execute("SELECT id, name, norm_key FROM merchants").fetchall()
+                aliases = conn.execute("SELECT alias_key, merchant_id FROM merchant_aliases").fetchall()
+            finally:
+                conn.close()
+            self._aliases, self._names, self._keys = {}, {}, {}
+            self._grams = defaultdict(set)
+            for merchant_id, name, key in merchants:
+                self._add_merchant(merchant_id, name, key)
+            self._aliases.update(aliases)
+            self.resolve.cache_clear()
+            self._loaded = True
+
+    def _add_merchant(self, merchant_id: int, name: str, key: str):
+        self._names[merchant_id] = name
+        self._keys[merchant_id] = key
+        self._aliases[key] = merchant_id
+        for gram in self._ngrams(key):
+            self._grams[gram].add(merchant_id)
+
+    def match(self, key: str) -> Tuple[Optional[int], float]:
+        """在已有商家中找最相似的一个，返回 (商家id, 相似度)；相似度不足时id为None"""
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in self._ngrams(key):
+            for merchant_id in self._grams.get(gram, ()):
+                counts[merchant_id] += 1
+        best_id, best_score = None, 0.0
+        # 共享n-gram最多的少数候选再算编辑相似度
+        for merchant_id, _ in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:20]:
+            candidate = self._keys[merchant_id]
+            # 两个字的名称差一个字就是另一家（京东/京东方），不做模糊归并
+            if min(len(key), len(candidate)) <= 2:
+                continue
+            score = SequenceMatcher(None, key, candidate).ratio()
+            if score > best_score:
+                best_id, best_score = merchant_id, score
+        if best_score < self.config['min_similarity']:
+            return None, best_score
+        return best_id, best_score
+
+    # 解析
+    def _resolve(self, raw: str) -> Optional[int]:
+        """原始商家名 -> 规范商家id，未知名称时新建商家（经lru_cache包装为self.resolve）"""
+        if (raw or '').strip() in UNKNOWN_MERCHANTS:
+            return None
+        if not self._loaded:
+            self.load()
+        key = self.normalize(raw)
+        if not key:
+            return None
+        merchant_id = self._aliases.get(key)
+        if merchant_id is not None:
+            return merchant_id
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                # 其他进程可能已登记过该别名
+                row = conn.execute("SELECT merchant_id FROM merchant_aliases WHERE alias_key = ?", (key,)).fetchone()
+                if row:
+                    self._aliases[key] = row[0]
+                    return row[0]
+                merchant_id, score = self.match(key)
+                if merchant_id is None:
+                    conn.execute("INSERT OR IGNORE INTO merchants (name, norm_key, created_at) "
+                                 "VALUES (?, ?, CURRENT_TIMESTAMP)", (self.display_name(raw), key))
+                    merchant_id, name = conn.execute("SELECT id, name FROM merchants WHERE norm_key = ?",
+                                                     (key,)).fetchone()
+                    self._add_merchant(merchant_id, name, key)
+                    score = 1.0
+                conn.execute("INSERT OR IGNORE INTO merchant_aliases (alias_key, merchant_id, similarity, created_at) "
+                             "VALUES (?, ?, ?, CURRENT_TIMESTAMP)", (key, merchant_id, round(score, 4)))
+                conn.commit()
+            finally:
+                conn.close()
+            self._aliases[key] = merchant_id
+            return merchant_id
+
+    def lookup(self, raw: str) -> Optional[int]:
+        """只查不建：查询条件中的商家名解析为已有商家id"""
+        if not self._loaded:
+            self.load()
+        key = self.normalize(raw)
+        if not key:
+            return None
+        merchant_id = self._aliases.get(key)
+        if merchant_id is None:
+            merchant_id, _ = self.match(key)
+        return merchant_id
+
+    def name(self, merchant_id: Optional[int], default: str = '未知') -> str:
+        """商家id -> 展示名"""
+        if merchant_id is None:
+            return default
+        if merchant_id not in self._names:
+            self.load()
+        return self._names.get(merchant_id, default)
+
+    # 批量回填
+    def _bill_paths(self) -> List[Path]:
+        """账单所在的库：指定库或全部分片（商家字典始终在主库）"""
+        return [self.db_path] if self.db_path is not None else shard_router.paths()
+
+    def backfill(self, rebuild: bool = False) -> Dict[str, Any]:
+        """为 merchant_id 为空的账单解析商家；rebuild时清空字典后对全部账单重新解析"""
+        started = time.perf_counter()
+        paths = self._bill_paths()
+        if rebuild:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM merchant_aliases")
+                conn.execute("DELETE FROM merchants")
+                conn.commit()
+            finally:
+                conn.close()
+            for path in paths:
+                conn = get_sqlite_connection(path)
+                try:
+                    conn.execute("UPDATE bills SET merchant_id = NULL")
+                    conn.commit()
+                finally:
+                    conn.close()
+            self.load()
+        # 按不同原始名称解析一次（各库合计出现最多的写法先解析，成为商家展示名），再用临时映射表一趟UPDATE写回
+        counts = Counter()
+        for path in paths:
+            conn = get_sqlite_connection(path)
+            try:
+                counts.update(dict(conn.execute(
+                    "SELECT merchant, COUNT(*) FROM bills WHERE merchant_id IS NULL GROUP BY merchant"
+                ).fetchall()))
+            finally:
+                conn.close()
+        names = [raw for raw, _ in counts.most_common()]
+        mapping = [(raw, self.resolve(raw)) for raw in names]
+        mapping = [(raw, merchant_id) for raw, merchant_id in mapping if merchant_id is not None]
+        updated = sum(self._apply_mapping(path, mapping) for path in paths)
+        return {'names': len(names), 'merchants': len(self._names), 'updated': updated,
+                'seconds': round(time.perf_counter() - started, 2)}
+
+    @staticmethod
+    def _apply_mapping(path: Path, mapping: List[Tuple[str, int]]) -> int:
+        conn = get_sqlite_connection(path)
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS merchant_map (raw TEXT PRIMARY KEY, merchant_id INTEGER)")
+            conn.execute("DELETE FROM merchant_map")
+            conn.executemany("INSERT OR REPLACE INTO merchant_map (raw, merchant_id) VALUES (?, ?)", mapping)
+            updated = conn.execute("""
+                UPDATE bills SET merchant_id = m.merchant_id
+                FROM merchant_map m
+                WHERE bills.merchant = m.raw AND bills.merchant_id IS NULL
+            """).rowcount
+            conn.execute("DROP TABLE merchant_map")
+            conn.commit()
+        finally:
+            conn.close()
+        return updated
+
+    def ensure_schema(self):
+        """商家名被原始SQL改写时清空merchant_id，待回填重新解析"""
+        for path in self._bill_paths():
+            conn = get_sqlite_connection(path)
+            try:
+                conn.executescript("""
+                    CREATE TRIGGER IF NOT EXISTS bills_merchant_au AFTER UPDATE OF merchant ON bills
+                    WHEN NEW.merchant IS NOT OLD.merchant AND NEW.merchant_id IS OLD.merchant_id BEGIN
+                        UPDATE bills SET merchant_id = NULL WHERE id = NEW.id;
+                    END;
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+
+
+# 创建全局商家索引实例
+merchant_index = MerchantIndex()
+
+
+def main():
+    """命令行回填：python -m src.merchant_index [--rebuild]"""
+    parser = argparse.ArgumentParser(description="账单商家规范化回填")
+    parser.add_argument("--rebuild", action="store_true", help="清空商家字典后对全部账单重新解析")
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    merchant_index.ensure_schema()
+    stats = merchant_index.backfill(rebuild=args.rebuild)
+    print(f"解析 {stats['names']} 个不同商家名，归并为 {stats['merchants']} 个商家，"
+          f"更新 {stats['updated']} 笔账单，耗时 {stats['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
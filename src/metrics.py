@@ -0,0 +1,301 @@
+"""
+性能监控模块 - 请求级耗时、SQL统计与Prometheus指标导出
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
+
+from .config import METRICS_CONFIG
+
+
+class _Metric:
+    """指标基类（带标签）"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = [(k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in pairs]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets or METRICS_CONFIG["latency_buckets"]))
+        # key -> [各桶计数..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': repr(float(bound))})} {count}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {state[-1]}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """导出Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表与内置指标
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时", ("method", "route", "status"))
+REQUESTS_TOTAL = registry.counter(
+    "http_requests_total", "HTTP请求总数", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数", ("route",))
+REQUEST_SQL_STATEMENTS = registry.histogram(
+    "http_request_sql_statements", "单个请求执行的SQL语句数", ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+REQUEST_SQL_SECONDS = registry.histogram(
+    "http_request_sql_seconds", "单个请求的SQL累计耗时", ("route",))
+SQL_STATEMENT_SECONDS = registry.histogram(
+    "sql_statement_duration_seconds", "单条SQL语句耗时", ("driver",))
+SECTION_SECONDS = registry.histogram(
+    "app_section_duration_seconds", "代码段耗时（pandas/plotly等）", ("section",))
+
+
+class RequestStats:
+    """单个请求的累计统计"""
+
+    __slots__ = ("started", "sql_count", "sql_seconds", "sections")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.sections: Dict[str, float] = {}
+
+    def server_timing(self, total_seconds: float) -> str:
+        """生成Server-Timing响应头"""
+        parts = [f"app;dur={total_seconds * 1000:.2f}",
+                 f'sql;dur={self.sql_seconds * 1000:.2f};desc="{self.sql_count} queries"']
+        for name, seconds in sorted(self.sections.items()):
+            parts.append(f"{name};dur={seconds * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def begin_request() -> RequestStats:
+    """开始记录当前请求"""
+    stats = RequestStats()
+    _current_request.set(stats)
+    return stats
+
+
+def current_request() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+def record_sql(seconds: float, driver: str):
+    """记录一条SQL语句耗时"""
+    SQL_STATEMENT_SECONDS.observe(seconds, driver=driver)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += seconds
+
+
+async def finish_after_body(body_iterator: AsyncIterator[bytes], on_finish: Callable[[], None]) -> AsyncIterator[bytes]:
+    """包装响应体：全部发送完（或客户端断开）后调用on_finish，流式响应体生成期间的SQL也能计入"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        on_finish()
+
+
+@contextmanager
+def timed_section(section: str):
+    """统计代码段耗时（如pandas、plotly）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SECTION_SECONDS.observe(elapsed, section=section)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.sections[section] = stats.sections.get(section, 0.0) + elapsed
+
+
+def timed(section: str):
+    """timed_section的装饰器形式"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_section(section):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# 原生sqlite3连接埋点
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录execute耗时的游标"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(time.perf_counter() - started, "sqlite3")
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(time.perf_counter() - started, "sqlite3")
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """默认创建InstrumentedCursor的连接，用作sqlite3.connect的factory"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def instrument_engine(engine):
+    """为SQLAlchemy引擎挂载SQL耗时统计"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        record_sql(time.perf_counter() - started, "sqlalchemy")
+
+    return engine
@@ -0,0 +1,134 @@
+"""
+模型仓库 - 按版本保存模型文件（带SHA-256校验和），发布与切换版本均为原子操作
+
+目录结构：registry/<模型名>/v0001/{模型文件..., meta.json}，registry/<模型名>/CURRENT 记录当前版本。
+新版本先写入临时目录，校验和写入meta.json后整体改名为版本目录，最后替换CURRENT；
+读取方要么看到旧版本、要么看到完整的新版本，不会读到写了一半的文件。
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from .config import MODEL_REGISTRY_CONFIG
+
+META_NAME = "meta.json"
+CURRENT_NAME = "CURRENT"
+
+
+class ModelIntegrityError(Exception):
+    """模型文件缺失或校验和不一致"""
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """单个模型的版本仓库"""
+
+    def __init__(self, name: str, root: Path = None, keep: int = None):
+        self.name = name
+        self.root = Path(root or MODEL_REGISTRY_CONFIG['root'])
+        self.keep = MODEL_REGISTRY_CONFIG['keep'] if keep is None else keep
+        self.model_dir = self.root / name
+
+    def versions(self) -> List[str]:
+        """已发布的版本（从旧到新）"""
+        if not self.model_dir.exists():
+            return []
+        return sorted(path.name for path in self.model_dir.iterdir()
+                      if path.is_dir() and path.name.startswith('v') and path.name[1:].isdigit())
+
+    def current_version(self) -> Optional[str]:
+        try:
+            version = (self.model_dir / CURRENT_NAME).read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def current_mtime(self) -> Optional[float]:
+        """CURRENT文件的修改时间（其他进程发布新版本后变化）"""
+        try:
+            return (self.model_dir / CURRENT_NAME).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def meta(self, version: str) -> Dict[str, Any]:
+        try:
+            return json.loads((self.model_dir / version / META_NAME).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise ModelIntegrityError(f"{self.name} {version} 缺少有效的 {META_NAME}: {e}")
+
+    def verify(self, version: str) -> Dict[str, Any]:
+        """按meta.json中的校验和检查版本目录下的全部模型文件，返回meta"""
+        meta = self.meta(version)
+        version_dir = self.model_dir / version
+        for filename, checksum in meta['files'].items():
+            path = version_dir / filename
+            if not path.exists():
+                raise ModelIntegrityError(f"{self.name} {version} 缺少文件 {filename}")
+            if file_sha256(path) != checksum:
+                raise ModelIntegrityError(f"{self.name} {version} 文件 {filename} 校验和不一致")
+        return meta
+
+    def resolve(self, version: str = None) -> Tuple[str, Path, Dict[str, Any]]:
+        """(版本, 版本目录, meta)；version为空时取当前版本，校验失败抛 ModelIntegrityError"""
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"模型 {self.name} 尚未发布任何版本")
+        return version, self.model_dir / version, self.verify(version)
+
+    def publish(self, write: Callable[[Path], None], meta: Dict[str, Any] = None, activate: bool = True) -> str:
+        """write(目录) 把模型文件写入临时目录；计算校验和后改名为下一个版本号，默认设为当前版本"""
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.model_dir / f".tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp_dir.mkdir()
+        try:
+            write(tmp_dir)
+            files = {path.name: file_sha256(path) for path in sorted(tmp_dir.iterdir()) if path.is_file()}
+            record = dict(meta or {}, name=self.name, created_at=datetime.now().isoformat(timespec='seconds'),
+                          files=files)
+            (tmp_dir / META_NAME).write_text(json.dumps(record, ensure_ascii=False, indent=1), encoding='utf-8')
+
+            # 版本目录已存在（其他进程同时发布）时改名失败，取下一个版本号重试
+            while True:
+                versions = self.versions()
+                version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+                try:
+                    os.rename(tmp_dir, self.model_dir / version)
+                    break
+                except OSError:
+                    if not (self.model_dir / version).exists():
+                        raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str):
+        """校验通过后把CURRENT原子替换为指定版本（也用于回滚）"""
+        self.verify(version)
+        tmp_path = self.model_dir / f"{CURRENT_NAME}.tmp-{os.getpid()}"
+        tmp_path.write_text(version, encoding='utf-8')
+        os.replace(tmp_path, self.model_dir / CURRENT_NAME)
+        self.prune()
+
+    def prune(self) -> List[str]:
+        """只保留最近keep个版本（当前版本总是保留）"""
+        current = self.current_version()
+        stale = [version for version in self.versions()[:-self.keep] if version != current] if self.keep > 0 else []
+        for version in stale:
+            shutil.rmtree(self.model_dir / version, ignore_errors=True)
+        return stale
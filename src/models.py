@@ -1,20 +1,40 @@
 """
 数据模型定义
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Computed, Index
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
 
 Base = declarative_base()
 
+# 时间文本统一存为 "YYYY-MM-DD HH:MM:SS"（不带微秒），与数据生成脚本、DataCleaner一致
+CanonicalDateTime = DateTime().with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+
+def epoch_columns(time_column: str):
+    """由时间文本派生的整数列：秒级时间戳、日桶(YYYYMMDD)、月桶(YYYYMM)
+
+    时间戳按墙上时间换算（不做时区转换）；SQLite能识别ISO带T、缺秒等写法，任何写入方都能得到一致的值。
+    """
+    prefix = time_column.rsplit('_', 1)[0]
+    return (
+        Column(f"{prefix}_ts", Integer, Computed(f"CAST(strftime('%s', {time_column}) AS INTEGER)", persisted=False)),
+        Column(f"{prefix}_day", Integer, Computed(f"CAST(strftime('%Y%m%d', {prefix}_ts, 'unixepoch') AS INTEGER)", persisted=False)),
+        Column(f"{prefix}_month", Integer, Computed(f"{prefix}_day / 100", persisted=False)),
+    )
+
 class Bill(Base):
     """账单表"""
     __tablename__ = "bills"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, default=1)
-    consume_time = Column(DateTime, nullable=False)
+    consume_time = Column(CanonicalDateTime, nullable=False)
     amount = Column(Float, nullable=False)
     merchant = Column(String(255), nullable=False)
     category = Column(String(50), default="未知")
@@ -23,6 +43,14 @@ class Bill(Base):
     description = Column(Text)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    consume_ts, consume_day, consume_month = epoch_columns("consume_time")
+    merchant_id = Column(Integer)  # 规范商家id（merchants.id），按商家聚合时用它分组
+
+    __table_args__ = (
+        Index("idx_bills_user_ts", "user_id", "consume_ts"),
+        Index("idx_bills_user_month", "user_id", "consume_month"),
+        Index("idx_bills_user_merchant_id", "user_id", "merchant_id"),
+    )
 
 class Invoice(Base):
     """发票表"""
@@ -30,7 +58,8 @@ class Invoice(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, default=1)
-    invoice_time = Column(DateTime, nullable=False)
+    bill_id = Column(Integer)  # 对账关联的账单
+    invoice_time = Column(CanonicalDateTime, nullable=False)
     amount = Column(Float, nullable=False)
     merchant = Column(String(255), nullable=False)
     invoice_type = Column(String(50), default="未知")
@@ -38,6 +67,30 @@ class Invoice(Base):
     file_path = Column(String(500))
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    invoice_ts, invoice_day, invoice_month = epoch_columns("invoice_time")
+
+    __table_args__ = (
+        Index("idx_invoices_user_ts", "user_id", "invoice_ts"),
+        Index("idx_invoices_bill_id", "bill_id"),
+    )
+
+class Merchant(Base):
+    """规范商家表"""
+    __tablename__ = "merchants"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)  # 展示名
+    norm_key = Column(String(255), unique=True, nullable=False)  # 归一化后的名称
+    created_at = Column(DateTime, default=func.now())
+
+class MerchantAlias(Base):
+    """商家别名表：归一化后的原始名称 -> 规范商家"""
+    __tablename__ = "merchant_aliases"
+    
+    alias_key = Column(String(255), primary_key=True)
+    merchant_id = Column(Integer, nullable=False)
+    similarity = Column(Float)  # 模糊匹配得分，精确匹配为1
+    created_at = Column(DateTime, default=func.now())
 
 class User(Base):
     """用户表"""
@@ -147,3 +200,8 @@ class PostLike(Base):
     post_id = Column(Integer, nullable=False)
     user_id = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        # 同一用户对同一帖子只能点赞一次：INSERT OR IGNORE 即可幂等点赞
+        Index("uq_post_likes_post_user", "post_id", "user_id", unique=True),
+    )
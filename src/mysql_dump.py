@@ -0,0 +1,545 @@
+"""
+MySQL导出文件导入模块 - 流式解析INSERT元组（正确处理引号/转义），类型映射到SQLite并批量upsert
+
+命令行：python -m src.mysql_dump loan_db.sql --db data/products.sqlite
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Iterable, Tuple
+
+from .config import IMPORT_CONFIG
+
+# 词法规则：一个锚定的总正则，先跳过空白与注释，再按分组识别一个词元
+# 字符串采用展开循环写法，未闭合时不会回溯爆炸
+_TOKEN = re.compile(r"""
+    (?:\s+|--(?=\s|$)[^\n]*|\#[^\n]*|/\*.*?\*/)*
+    (?:
+        '(?P<sq>[^'\\]*(?:(?:\\.|'')[^'\\]*)*)'
+      | "(?P<dq>[^"\\]*(?:(?:\\.|"")[^"\\]*)*)"
+      | `(?P<bt>[^`]*(?:``[^`]*)*)`
+      | 0[xX](?P<hex>[0-9a-fA-F]+)
+      | (?P<float>[-+]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?)
+      | (?P<int>[-+]?\d+)
+      | (?P<word>[^\W\d][\w$]*)
+      | (?P<punct>\S)
+    )
+""", re.VERBOSE | re.DOTALL)
+# 快速路径：整个元组只含字符串/数字/NULL时一次匹配，再用findall切出各值
+_SIMPLE_ITEM = r"""(?:'[^'\\]*(?:(?:\\.|'')[^'\\]*)*'|-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|NULL)"""
+_SIMPLE_ROW = re.compile(
+    r"\s*\(\s*((?:" + _SIMPLE_ITEM + r"\s*,\s*)*" + _SIMPLE_ITEM + r")\s*\)\s*([,;]?)",
+    re.DOTALL | re.IGNORECASE
+)
+# 分组：带引号的字符串、浮点数、整数（NULL时三组均为空）
+_ROW_ITEMS = re.compile(
+    r"""('[^'\\]*(?:(?:\\.|'')[^'\\]*)*')|(-?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?)|(-?\d+)|NULL""",
+    re.DOTALL | re.IGNORECASE
+)
+_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a',
+            '%': '\\%', '_': '\\_'}
+_ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+# 出现在punct分组即表示字符串/块注释尚未读全
+_UNCLOSED = {"'", '"', '`', '/'}
+
+# 词元结束处之后须保留的前瞻字符数，不足时先补读再匹配，避免词元被块边界截断
+_LOOKAHEAD = 64
+
+# 词元类型
+STRING, NUMBER, WORD, IDENT, PUNCT = 'string', 'number', 'word', 'ident', 'punct'
+
+
+def unescape_string(body: str, quote: str) -> str:
+    """还原MySQL字符串字面量（反斜杠转义与双写引号）"""
+    if '\\' in body:
+        body = _ESCAPE_PATTERN.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), body)
+    return body.replace(quote * 2, quote)
+
+
+def mysql_to_sqlite_type(mysql_type: str) -> str:
+    """MySQL列类型 -> SQLite类型亲和性"""
+    t = mysql_type.strip().lower()
+    base = re.split(r'[\s(]', t, 1)[0]
+    if base in ('tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'bit', 'bool', 'boolean', 'year'):
+        return 'INTEGER'
+    if base in ('decimal', 'numeric', 'float', 'double', 'real', 'fixed', 'dec'):
+        return 'REAL'
+    if base in ('blob', 'tinyblob', 'mediumblob', 'longblob', 'binary', 'varbinary'):
+        return 'BLOB'
+    # char/varchar/text/enum/set/json/date/time/datetime/timestamp 等均以TEXT存储
+    return 'TEXT'
+
+
+def coerce_value(value: Any, sqlite_type: str) -> Any:
+    """按目标列类型转换值（引号包裹的数字、布尔词等）"""
+    if value is None:
+        return None
+    if sqlite_type == 'INTEGER' and not isinstance(value, int):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return value
+    if sqlite_type == 'REAL' and not isinstance(value, float):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+    if sqlite_type == 'TEXT' and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+@dataclass
+class TableSchema:
+    """CREATE TABLE 解析结果"""
+    name: str
+    columns: List[Tuple[str, str]] = field(default_factory=list)  # (列名, MySQL类型)
+    primary_key: List[str] = field(default_factory=list)
+
+    @property
+    def sqlite_types(self) -> Dict[str, str]:
+        return {name: mysql_to_sqlite_type(mysql_type) for name, mysql_type in self.columns}
+
+    def to_sqlite_ddl(self) -> str:
+        """生成SQLite建表语句"""
+        defs = [f'"{name}" {mysql_to_sqlite_type(mysql_type)}' for name, mysql_type in self.columns]
+        if len(self.primary_key) == 1 and self.sqlite_types.get(self.primary_key[0]) == 'INTEGER':
+            # 单列整数主键写成rowid别名，未提供时自动分配
+            index = [name for name, _ in self.columns].index(self.primary_key[0])
+            defs[index] += ' PRIMARY KEY'
+        elif self.primary_key:
+            defs.append('PRIMARY KEY (' + ', '.join(f'"{c}"' for c in self.primary_key) + ')')
+        return f'CREATE TABLE IF NOT EXISTS "{self.name}" (\n    ' + ',\n    '.join(defs) + '\n)'
+
+
+class MySQLDumpReader:
+    """MySQL导出文件的流式读取器：按块读取，逐条产出INSERT行，内存占用与文件大小无关"""
+
+    def __init__(self, path: Path, chunk_size: int = None, encoding: str = 'utf-8'):
+        self.path = Path(path)
+        self.chunk_size = chunk_size or IMPORT_CONFIG['read_chunk_size']
+        self.encoding = encoding
+        self.total_bytes = os.path.getsize(self.path)
+        self.schemas: Dict[str, TableSchema] = {}
+        self._file = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def bytes_read(self) -> int:
+        return self._file.buffer.tell() if self._file and not self._file.closed else self.total_bytes
+
+    # 词法
+    def _fill(self) -> bool:
+        """读入下一块；丢弃已消费的部分"""
+        if self._eof:
+            return False
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _tokens(self) -> Iterator[Tuple[str, Any]]:
+        match = _TOKEN.match
+        while True:
+            m = match(self._buffer, self._pos)
+            if m is None or (m.end() + _LOOKAHEAD > len(self._buffer) and not self._eof):
+                if self._fill():
+                    continue
+                if m is None:
+                    return
+            group = m.lastgroup
+            if group == 'punct' and m.group('punct') in _UNCLOSED:
+                # 字符串/块注释跨越了缓冲区：继续读入直到闭合
+                unclosed = m.group('punct') != '/' or self._buffer.startswith('*', m.end())
+                if unclosed and self._fill():
+                    continue
+                if unclosed:
+                    raise ValueError(f"未闭合的字符串、标识符或注释（约第 {self.bytes_read} 字节）")
+            self._pos = m.end()
+            value = m.group(group)
+            if group == 'sq' or group == 'dq':
+                quote = "'" if group == 'sq' else '"'
+                if '\\' in value or quote in value:
+                    value = unescape_string(value, quote)
+                yield STRING, value
+            elif group == 'int':
+                yield NUMBER, int(value)
+            elif group == 'float':
+                yield NUMBER, float(value)
+            elif group == 'word':
+                yield WORD, value
+            elif group == 'bt':
+                yield IDENT, value.replace('``', '`')
+            elif group == 'hex':
+                yield NUMBER, bytes.fromhex(value if len(value) % 2 == 0 else '0' + value)
+            else:
+                yield PUNCT, value
+
+    def _match_row(self) -> Optional[re.Match]:
+        """快速路径：匹配一个只含简单值的元组及其后的分隔符，匹配不到时返回None且不移动位置"""
+        while True:
+            m = _SIMPLE_ROW.match(self._buffer, self._pos)
+            if m is not None and m.end() + _LOOKAHEAD > len(self._buffer) and self._fill():
+                continue
+            if m is not None:
+                self._pos = m.end()
+            return m
+
+    @staticmethod
+    def _row_values(body: str) -> tuple:
+        values = []
+        for text, real, integer in _ROW_ITEMS.findall(body):
+            if text:
+                text = text[1:-1]
+                values.append(unescape_string(text, "'") if '\\' in text or "'" in text else text)
+            elif integer:
+                values.append(int(integer))
+            elif real:
+                values.append(float(real))
+            else:
+                values.append(None)
+        return tuple(values)
+
+    # 语法
+    def _read_value(self, kind: str, value: Any, tokens: Iterator) -> Tuple[Any, Tuple[str, Any]]:
+        """读取一个字段值，返回(值, 下一个词元)"""
+        if kind == STRING or kind == NUMBER:
+            return value, next(tokens)
+        if kind == WORD:
+            upper = value.upper()
+            following = next(tokens)
+            if following == (PUNCT, '('):
+                # 函数调用（如 NOW()），保留原始表达式文本
+                parts, depth = [value, '('], 1
+                while depth:
+                    k, v = next(tokens)
+                    if (k, v) == (PUNCT, '('):
+                        depth += 1
+                    elif (k, v) == (PUNCT, ')'):
+                        depth -= 1
+                    parts.append(v if k != STRING else f"'{v}'")
+                return ''.join(str(p) for p in parts), next(tokens)
+            if upper == 'NULL':
+                return None, following
+            if upper == 'TRUE':
+                return 1, following
+            if upper == 'FALSE':
+                return 0, following
+            if upper in ('X', 'B') and following[0] == STRING:
+                raw = following[1]
+                data = bytes.fromhex(raw) if upper == 'X' else int(raw or '0', 2).to_bytes((len(raw) + 7) // 8, 'big')
+                return data, next(tokens)
+            return value, following
+        if kind == PUNCT and value in '-+':
+            # 符号与数字之间有空格的情况
+            k, v = next(tokens)
+            number, following = self._read_value(k, v, tokens)
+            return (-number if value == '-' else number), following
+        raise ValueError(f"无法解析的值: {value!r}")
+
+    @staticmethod
+    def _read_name(token: Tuple[str, Any], tokens: Iterator) -> Tuple[str, Tuple[str, Any]]:
+        """从当前词元读取（可带库名前缀的）表名，返回(表名, 下一个词元)"""
+        kind, name = token
+        following = next(tokens)
+        while following == (PUNCT, '.'):
+            kind, name = next(tokens)
+            following = next(tokens)
+        return name, following
+
+    @staticmethod
+    def _skip_statement(token: Tuple[str, Any], tokens: Iterator):
+        while token != (PUNCT, ';'):
+            token = next(tokens, (PUNCT, ';'))
+
+    def _parse_insert(self, tokens: Iterator) -> Iterator[Tuple[str, List[str], tuple]]:
+        token = next(tokens)
+        # INSERT [LOW_PRIORITY|DELAYED|HIGH_PRIORITY] [IGNORE] [INTO]
+        while token[0] == WORD and token[1].upper() in ('LOW_PRIORITY', 'DELAYED', 'HIGH_PRIORITY', 'IGNORE', 'INTO'):
+            token = next(tokens)
+        table, token = self._read_name(token, tokens)
+        columns = []
+        if token == (PUNCT, '('):
+            while True:
+                kind, value = next(tokens)
+                if (kind, value) == (PUNCT, ')'):
+                    break
+                if kind in (WORD, IDENT):
+                    columns.append(value)
+            token = next(tokens)
+        if not columns and table in self.schemas:
+            columns = [name for name, _ in self.schemas[table].columns]
+        if not (token[0] == WORD and token[1].upper() in ('VALUES', 'VALUE')):
+            # INSERT ... SELECT / SET 语法不支持，跳过
+            self._skip_statement(token, tokens)
+            return
+
+        while True:
+            m = self._match_row()
+            if m is not None:
+                yield table, columns, self._row_values(m.group(1))
+                separator = m.group(2)
+                if separator == ',':
+                    continue
+                if separator == ';':
+                    return
+            else:
+                yield table, columns, self._read_row(table, tokens)
+            token = next(tokens, (PUNCT, ';'))
+            if token == (PUNCT, ','):
+                continue
+            # ON DUPLICATE KEY UPDATE ... 之类的尾部直接跳过
+            self._skip_statement(token, tokens)
+            return
+
+    def _read_row(self, table: str, tokens: Iterator) -> tuple:
+        """通用路径：逐个词元读取一个元组（函数调用、十六进制、双引号字符串、注释等）"""
+        token = next(tokens)
+        if token != (PUNCT, '('):
+            raise ValueError(f"{table}: 期望 '(' 实际 {token[1]!r}")
+        row = []
+        token = next(tokens)
+        if token != (PUNCT, ')'):
+            while True:
+                value, token = self._read_value(token[0], token[1], tokens)
+                row.append(value)
+                if token == (PUNCT, ')'):
+                    break
+                if token != (PUNCT, ','):
+                    raise ValueError(f"{table}: 元组中出现意外词元 {token[1]!r}")
+                token = next(tokens)
+        return tuple(row)
+
+    def _parse_create_table(self, tokens: Iterator):
+        token = next(tokens)
+        # CREATE [TEMPORARY] TABLE [IF NOT EXISTS] name (...)
+        while token[0] == WORD and token[1].upper() in ('IF', 'NOT', 'EXISTS'):
+            token = next(tokens)
+        name, token = self._read_name(token, tokens)
+        if token != (PUNCT, '('):
+            self._skip_statement(token, tokens)
+            return
+
+        schema = TableSchema(name)
+        definition: List[Tuple[str, Any]] = []
+        depth = 1
+        while depth:
+            token = next(tokens)
+            if token == (PUNCT, '('):
+                depth += 1
+            elif token == (PUNCT, ')'):
+                depth -= 1
+                if depth == 0:
+                    break
+            if depth == 1 and token == (PUNCT, ','):
+                self._add_definition(schema, definition)
+                definition = []
+            else:
+                definition.append(token)
+        self._add_definition(schema, definition)
+        self.schemas[name] = schema
+        self._skip_statement(next(tokens, (PUNCT, ';')), tokens)
+
+    @staticmethod
+    def _add_definition(schema: TableSchema, definition: List[Tuple[str, Any]]):
+        if not definition:
+            return
+        words = [str(v).upper() for _, v in definition]
+        if definition[0][0] == WORD and words[0] in ('PRIMARY', 'KEY', 'INDEX', 'UNIQUE', 'CONSTRAINT',
+                                                      'FOREIGN', 'FULLTEXT', 'SPATIAL', 'CHECK'):
+            if words[0] == 'PRIMARY':
+                schema.primary_key = [v for k, v in definition[3:] if k in (WORD, IDENT)]
+            return
+        name = definition[0][1]
+        # 类型：类型名 + 可选的括号参数（DECIMAL(5,2)、ENUM('a','b')）+ UNSIGNED
+        type_parts = [definition[1][1]]
+        i = 2
+        if i < len(definition) and definition[i] == (PUNCT, '('):
+            depth = 0
+            while i < len(definition):
+                type_parts.append(str(definition[i][1]))
+                if definition[i] == (PUNCT, '('):
+                    depth += 1
+                elif definition[i] == (PUNCT, ')'):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+        schema.columns.append((name, ''.join(type_parts)))
+        if 'PRIMARY' in words[2:] and not schema.primary_key:
+            schema.primary_key = [name]
+
+    def iter_rows(self, tables: Iterable[str] = None) -> Iterator[Tuple[str, List[str], tuple]]:
+        """逐行产出 (表名, 列名列表, 值元组)；同时记录遇到的 CREATE TABLE 结构"""
+        wanted = set(tables) if tables else None
+        with open(self.path, 'r', encoding=self.encoding, newline='') as self._file:
+            self._buffer, self._pos, self._eof = '', 0, False
+            tokens = self._tokens()
+            for kind, value in tokens:
+                if kind != WORD:
+                    if (kind, value) != (PUNCT, ';'):
+                        self._skip_statement((kind, value), tokens)
+                    continue
+                keyword = value.upper()
+                if keyword in ('INSERT', 'REPLACE'):
+                    for row in self._parse_insert(tokens):
+                        if wanted is None or row[0] in wanted:
+                            yield row
+                elif keyword == 'CREATE':
+                    kind, value = next(tokens)
+                    while kind == WORD and value.upper() in ('TEMPORARY', 'OR', 'REPLACE'):
+                        kind, value = next(tokens)
+                    if kind == WORD and value.upper() == 'TABLE':
+                        self._parse_create_table(tokens)
+                    else:
+                        self._skip_statement((kind, value), tokens)
+                else:
+                    self._skip_statement((kind, value), tokens)
+
+
+class ProgressReporter:
+    """按时间间隔打印导入进度"""
+
+    def __init__(self, reader: MySQLDumpReader, label: str = '', interval: float = None):
+        self.reader = reader
+        self.label = label
+        self.interval = interval if interval is not None else IMPORT_CONFIG['progress_interval_seconds']
+        self.started = time.time()
+        self._last = 0.0
+
+    def __call__(self, rows: int, force: bool = False):
+        now = time.time()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        done = self.reader.bytes_read
+        percent = done / self.reader.total_bytes * 100 if self.reader.total_bytes else 100.0
+        elapsed = max(now - self.started, 1e-6)
+        print(f"\r{self.label} {rows} 行  {percent:5.1f}%  "
+              f"{done / elapsed / 1e6:.1f} MB/s  {rows / elapsed:.0f} 行/s", end='', file=sys.stderr)
+        if force:
+            print(file=sys.stderr)
+
+
+def bulk_upsert(conn: sqlite3.Connection, table: str, columns: List[str], rows: Iterable[tuple],
+                key_columns: List[str], batch_size: int = None, progress=None,
+                create_index: bool = True) -> Dict[str, int]:
+    """按业务键批量upsert：每批写入临时表后用两条集合语句更新已有行、插入新行，每批一个事务
+
+    目标表无需唯一约束（键列上会建普通索引），因此也适用于已有重复数据的旧表。
+    """
+    batch_size = batch_size or IMPORT_CONFIG['batch_size']
+    quoted = [f'"{c}"' for c in columns]
+    key_list = ', '.join(f'"{k}"' for k in key_columns)
+    staging = f"_import_{table}"
+    # 用 IS 比较，键中含NULL的行也能匹配
+    key_match = ' AND '.join(f'{table}."{k}" IS s."{k}"' for k in key_columns)
+    updates = [c for c in columns if c not in key_columns]
+
+    if create_index:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_import_key ON {table} ({key_list})')
+    conn.execute(f'DROP TABLE IF EXISTS temp."{staging}"')
+    # 临时表以业务键为主键，同一批内重复键以最后一条为准
+    conn.execute(f'CREATE TEMP TABLE "{staging}" ({", ".join(quoted)}, PRIMARY KEY ({key_list}))')
+    insert_staging = f'INSERT OR REPLACE INTO temp."{staging}" ({", ".join(quoted)}) VALUES ({", ".join("?" * len(columns))})'
+    # 相关子查询形式的UPDATE（UPDATE ... FROM 需SQLite 3.33+）：CROSS JOIN固定以临时表为外层，
+    # 经键索引找出要改的rowid，避免每批扫描整张目标表
+    targets = ', '.join(f'"{c}"' for c in updates)
+    sources = ', '.join(f's."{c}"' for c in updates)
+    update_sql = (f'UPDATE {table} SET ({targets}) = '
+                  f'(SELECT {sources} FROM temp."{staging}" AS s WHERE {key_match}) '
+                  f'WHERE rowid IN (SELECT {table}.rowid FROM temp."{staging}" AS s '
+                  f'CROSS JOIN {table} ON {key_match})') if updates else None
+    insert_sql = (f'INSERT INTO {table} ({", ".join(quoted)}) SELECT {", ".join("s." + q for q in quoted)} '
+                  f'FROM temp."{staging}" AS s WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {key_match})')
+
+    counts = {'rows': 0, 'inserted': 0, 'updated': 0}
+
+    def flush(batch):
+        with conn:
+            conn.executemany(insert_staging, batch)
+            if update_sql:
+                counts['updated'] += conn.execute(update_sql).rowcount
+            counts['inserted'] += conn.execute(insert_sql).rowcount
+            conn.execute(f'DELETE FROM temp."{staging}"')
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush(batch)
+            counts['rows'] += len(batch)
+            batch = []
+            if progress:
+                progress(counts['rows'])
+    if batch:
+        flush(batch)
+        counts['rows'] += len(batch)
+    if progress:
+        progress(counts['rows'], force=True)
+    conn.execute(f'DROP TABLE IF EXISTS temp."{staging}"')
+    return counts
+
+
+def import_dump(dump_path: Path, db_path: Path, tables: List[str] = None,
+                batch_size: int = None) -> Dict[str, Dict[str, int]]:
+    """把导出文件中的表原样导入SQLite（按CREATE TABLE映射类型，按主键upsert）"""
+    reader = MySQLDumpReader(dump_path)
+    conn = sqlite3.connect(str(db_path))
+    results: Dict[str, Dict[str, int]] = {}
+    try:
+        rows = reader.iter_rows(tables)
+        pending = next(rows, None)
+        while pending is not None:
+            table, columns, _ = pending
+            if not columns:
+                raise ValueError(f"{table}: INSERT未列出列名且导出文件中没有建表语句")
+            schema = reader.schemas.get(table) or TableSchema(table, [(c, 'text') for c in columns])
+            conn.execute(schema.to_sqlite_ddl())
+            types = schema.sqlite_types
+            # 自增主键不在INSERT列中时，以整行去重
+            key_columns = schema.primary_key if set(schema.primary_key or [None]) <= set(columns) else columns
+
+            def table_rows():
+                # 连续属于同一张表的行作为一次批量upsert
+                nonlocal pending
+                while pending is not None and pending[0] == table and pending[1] == columns:
+                    yield tuple(coerce_value(v, types.get(c, 'TEXT')) for c, v in zip(columns, pending[2]))
+                    pending = next(rows, None)
+
+            counts = bulk_upsert(conn, table, columns, table_rows(), key_columns, batch_size,
+                                 ProgressReporter(reader, table),
+                                 create_index=key_columns != schema.primary_key)
+            total = results.setdefault(table, {'rows': 0, 'inserted': 0, 'updated': 0})
+            for key, value in counts.items():
+                total[key] += value
+    finally:
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式导入MySQL导出文件到SQLite")
+    parser.add_argument("dump", help="MySQL导出的.sql文件")
+    parser.add_argument("--db", required=True, help="目标SQLite文件")
+    parser.add_argument("--table", action="append", help="只导入指定表，可多次指定")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_CONFIG['batch_size'])
+    args = parser.parse_args()
+
+    results = import_dump(Path(args.dump), Path(args.db), args.table, args.batch_size)
+    for table, counts in results.items():
+        print(f"{table}: 解析 {counts['rows']} 行，新增 {counts['inserted']}，更新 {counts['updated']}")
+
+
+if __name__ == "__main__":
+    main()
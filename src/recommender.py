@@ -0,0 +1,289 @@
+"""
+协同过滤推荐模块 - 用户×商家/类别的稀疏消费矩阵（SciPy CSR），离线计算物品相似邻居，在线一次稀疏点积出推荐
+
+相似度按全体用户的消费行为离线计算（python -m src.recommender 或首次请求时），每个物品只保留top-N邻居；
+训练之后新增的账单在请求时按账单id水位增量折入用户向量，无需重新训练。
+"""
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .config import RECOMMENDER_CONFIG
+from .data_cleaning import data_cleaner
+from .database import get_sqlite_connection
+from .sharding import shard_router
+from .snapshot import snapshot_store
+
+# 物品类型 -> (账单列, 有效取值条件)
+ITEM_KINDS = {
+    'merchant': ('merchant_id', "merchant_id IS NOT NULL"),
+    'category': ('category', "category IS NOT NULL AND category != ''"),
+}
+_MATRIX_PARTS = ('data', 'indices', 'indptr', 'shape')
+
+
+@dataclass
+class ItemModel:
+    """一类物品的训练结果：行/列下标与用户id、物品键一一对应"""
+    items: np.ndarray  # 物品键（商家id或类别名），升序
+    users: np.ndarray  # 训练时有消费的用户id，升序
+    interactions: sparse.csr_matrix  # 用户×物品 消费笔数
+    neighbors: sparse.csr_matrix  # 物品×物品 余弦相似度，每行只保留top-N
+    index: Dict[Any, int] = field(init=False, repr=False)
+    popularity: np.ndarray = field(init=False, repr=False)  # 每个物品的消费用户数（冷启动用）
+
+    def __post_init__(self):
+        self.index = {key: i for i, key in enumerate(self.items.tolist())}
+        self.popularity = np.diff(self.interactions.tocsc().indptr)
+
+
+class CollaborativeRecommender:
+    """基于物品的协同过滤：score(用户, 物品j) = Σ_i 权重(用户, i) × 相似度(i, j)，权重为 log(1 + 消费笔数)"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = dict(RECOMMENDER_CONFIG, **(config or {}))
+        self.model_path = Path(self.config['model_path'])
+        self._lock = threading.RLock()
+        self._models: Optional[Dict[str, ItemModel]] = None
+        self._watermark = 0
+        self._mtime = None
+
+    # 离线训练
+    def _interaction_rows(self, kind: str, since_ts: int) -> List[Tuple]:
+        """各分片按 (用户, 物品) 聚合消费笔数（用户只在一个分片上，直接拼接；启用副本时读只读副本）"""
+        column, condition = ITEM_KINDS[kind]
+
+        def query(path: Path):
+            conn = get_sqlite_connection(snapshot_store.read_path(path))
+            try:
+                return conn.execute(
+                    f"SELECT user_id, {column}, COUNT(*) FROM bills WHERE consume_ts >= ? AND {condition} "
+                    f"GROUP BY user_id, {column}", (since_ts,)
+                ).fetchall()
+            finally:
+                conn.close()
+
+        return [row for rows in shard_router.fan_out(query) for row in rows]
+
+    @staticmethod
+    def _max_bill_id() -> int:
+        def query(path: Path):
+            conn = get_sqlite_connection(snapshot_store.read_path(path))
+            try:
+                return conn.execute("SELECT COALESCE(MAX(id), 0) FROM bills").fetchone()[0]
+            finally:
+                conn.close()
+
+        return max(shard_router.fan_out(query))
+
+    def fit(self, rows: List[Tuple]) -> ItemModel:
+        """(用户id, 物品键, 笔数) -> 交互矩阵与物品相似邻居"""
+        if not rows:
+            empty = sparse.csr_matrix((0, 0), dtype=np.float32)
+            return ItemModel(np.array([]), np.array([], dtype=np.int64), empty, empty)
+        user_ids, item_keys, counts = zip(*rows)
+        users, user_pos = np.unique(np.array(user_ids, dtype=np.int64), return_inverse=True)
+        items, item_pos = np.unique(np.array(item_keys), return_inverse=True)
+        interactions = sparse.csr_matrix((np.array(counts, dtype=np.float32), (user_pos, item_pos)),
+                                         shape=(len(users), len(items)))
+        return ItemModel(items, users, interactions, self._item_neighbors(interactions))
+
+    def _item_neighbors(self, interactions: sparse.csr_matrix) -> sparse.csr_matrix:
+        """物品间余弦相似度（稀疏矩阵乘），去掉自身后每行保留top-N"""
+        weights = interactions.copy()
+        weights.data = np.log1p(weights.data)
+        # 消费用户太少的物品不参与：对应列置零
+        support = np.diff(interactions.tocsc().indptr)
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=0)).ravel())
+        scale = np.where((support >= self.config['min_item_users']) & (norms > 0), 1.0 / np.maximum(norms, 1e-12), 0)
+        normalized = (weights @ sparse.diags(scale.astype(np.float32))).tocsr()
+        normalized.eliminate_zeros()
+        similarity = (normalized.T @ normalized).tocsr()
+        similarity = (similarity - sparse.diags(similarity.diagonal())).tocsr()
+        similarity.eliminate_zeros()
+        return self._top_n(similarity, self.config['neighbors'])
+
+    @staticmethod
+    def _top_n(similarity: sparse.csr_matrix, n: int) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for i in range(similarity.shape[0]):
+            start, end = similarity.indptr[i], similarity.indptr[i + 1]
+            keep = np.arange(start, end)
+            if end - start > n:
+                keep = start + np.argpartition(similarity.data[start:end], -n)[-n:]
+            indices.append(similarity.indices[keep])
+            data.append(similarity.data[keep])
+            indptr.append(indptr[-1] + len(keep))
+        if not data:
+            return similarity
+        return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), np.array(indptr)),
+                                 shape=similarity.shape)
+
+    def build(self) -> Dict[str, Any]:
+        """全量训练并写入模型文件（先写临时文件再改名，其他进程按文件修改时间重新加载）"""
+        started = time.perf_counter()
+        since_ts = data_cleaner.to_epoch(datetime.now() - timedelta(days=self.config['history_days']))
+        # 先取水位：训练期间新写入的账单会在请求时折入（最多重复计入少量账单）
+        watermark = self._max_bill_id()
+        models = {kind: self.fit(self._interaction_rows(kind, since_ts)) for kind in ITEM_KINDS}
+        self.save(models, watermark)
+        with self._lock:
+            self._models, self._watermark = models, watermark
+            self._mtime = self.model_path.stat().st_mtime
+        stats = {'watermark': watermark, 'seconds': round(time.perf_counter() - started, 2)}
+        for kind, model in models.items():
+            stats[kind] = {'users': len(model.users), 'items': len(model.items), 'neighbors': model.neighbors.nnz}
+        return stats
+
+    # 模型文件
+    def save(self, models: Dict[str, ItemModel], watermark: int):
+        arrays = {'watermark': np.array(watermark)}
+        for kind, model in models.items():
+            arrays[f'{kind}_items'] = model.items
+            arrays[f'{kind}_users'] = model.users
+            for name in ('interactions', 'neighbors'):
+                matrix = getattr(model, name)
+                for part in _MATRIX_PARTS:
+                    arrays[f'{kind}_{name}_{part}'] = np.asarray(getattr(matrix, part))
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.model_path.with_name(self.model_path.stem + '.part.npz')
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, self.model_path)
+
+    def _load(self) -> Tuple[Dict[str, ItemModel], int]:
+        with np.load(self.model_path, allow_pickle=False) as arrays:
+            models = {}
+            for kind in ITEM_KINDS:
+                matrices = [
+                    sparse.csr_matrix(tuple(arrays[f'{kind}_{name}_{part}'] for part in _MATRIX_PARTS[:3]),
+                                      shape=tuple(arrays[f'{kind}_{name}_shape']))
+                    for name in ('interactions', 'neighbors')
+                ]
+                models[kind] = ItemModel(arrays[f'{kind}_items'], arrays[f'{kind}_users'], *matrices)
+            return models, int(arrays['watermark'])
+
+    def models(self) -> Dict[str, ItemModel]:
+        """当前模型：文件被其他进程重建后重新加载，尚未训练时先训练一次"""
+        try:
+            mtime = self.model_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime is None:
+                if self._models is None:
+                    self.build()
+            elif mtime != self._mtime:
+                self._models, self._watermark = self._load()
+                self._mtime = mtime
+            return self._models
+
+    # 在线推荐
+    def user_weights(self, kind: str, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用户的物品下标与权重：训练时的消费笔数 + 水位之后新账单的增量折入"""
+        model = self.models()[kind]
+        counts: Dict[int, float] = {}
+        row = np.searchsorted(model.users, user_id)
+        if row < len(model.users) and model.users[row] == user_id:
+            start, end = model.interactions.indptr[row], model.interactions.indptr[row + 1]
+            counts.update(zip(model.interactions.indices[start:end].tolist(),
+                              model.interactions.data[start:end].tolist()))
+
+        column, condition = ITEM_KINDS[kind]
+        conn = shard_router.connect(user_id)
+        try:
+            fresh = conn.execute(
+                f"SELECT {column}, COUNT(*) FROM bills WHERE user_id = ? AND id > ? AND {condition} "
+                f"GROUP BY {column}", (user_id, self._watermark)
+            ).fetchall()
+        finally:
+            conn.close()
+        for key, count in fresh:
+            # 训练后才出现的新物品还没有相似邻居，等下次训练
+            position = model.index.get(key)
+            if position is not None:
+                counts[position] = counts.get(position, 0) + count
+
+        positions = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        return positions, weights
+
+    def recommend(self, user_id: int, kind: str = 'merchant', limit: int = None,
+                  include_seen: bool = False) -> List[Dict[str, Any]]:
+        """为用户推荐商家或类别；没有可用消费记录时按消费人数推荐热门物品"""
+        if kind not in ITEM_KINDS:
+            raise ValueError(f"不支持的推荐类型: {kind}")
+        limit = limit or self.config['default_limit']
+        model = self.models()[kind]
+        if not len(model.items):
+            return []
+        positions, weights = self.user_weights(kind, user_id)
+
+        scores = np.zeros(len(model.items), dtype=np.float32)
+        source = 'similar'
+        if len(positions):
+            # 只取用户消费过的物品的邻居行：k×n 稀疏矩阵转置乘权重向量
+            scores = np.asarray(model.neighbors[positions].T @ weights).ravel()
+        if not scores.any():
+            scores, source = model.popularity.astype(np.float32), 'popular'
+        if not include_seen and len(positions):
+            scores[positions] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(scores[candidates], -limit)[-limit:]]
+        top = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        because = [None] * len(top)
+        if source == 'similar' and len(top):
+            # 每个推荐项贡献最大的已消费物品，作为推荐理由
+            contributions = model.neighbors[positions][:, top].toarray() * weights[:, None]
+            because = [model.items[positions[i]].item() for i in contributions.argmax(axis=0)]
+
+        return [{
+            'item': model.items[position].item(),
+            'name': self.item_name(kind, model.items[position].item()),
+            'score': round(float(scores[position]), 4),
+            'source': source,
+            'similar_to': self.item_name(kind, reason) if reason is not None else None
+        } for position, reason in zip(top, because)]
+
+    @staticmethod
+    def item_name(kind: str, key: Any) -> str:
+        if kind == 'merchant':
+            from .merchant_index import merchant_index
+            return merchant_index.name(key)
+        return key
+
+
+# 创建全局推荐实例
+collaborative_recommender = CollaborativeRecommender()
+
+
+def main():
+    """命令行训练（可由cron定期调用）：python -m src.recommender [--user-id 1 --kind merchant]"""
+    parser = argparse.ArgumentParser(description="训练协同过滤推荐模型")
+    parser.add_argument("--user-id", type=int, help="训练后预览该用户的推荐")
+    parser.add_argument("--kind", choices=list(ITEM_KINDS), default='merchant')
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    stats = collaborative_recommender.build()
+    for kind in ITEM_KINDS:
+        print(f"{kind}: 用户 {stats[kind]['users']}，物品 {stats[kind]['items']}，邻居 {stats[kind]['neighbors']}")
+    print(f"训练完成，账单水位 {stats['watermark']}，耗时 {stats['seconds']}s，模型 {collaborative_recommender.model_path}")
+    if args.user_id:
+        for item in collaborative_recommender.recommend(args.user_id, args.kind):
+            print(f"  {item['name']}  {item['score']}  ({item['similar_to'] or item['source']})")
+
+
+if __name__ == "__main__":
+    main()
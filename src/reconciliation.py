@@ -0,0 +1,303 @@
+"""
+对账模块 - 把发票关联到已有账单（同用户、金额容差、时间窗口、商家名n-gram相似度），避免重复记账
+"""
+import argparse
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from .assistant import snapshot_store
+from .config import RECONCILE_CONFIG
+from .database import get_sqlite_connection
+from .sharding import shard_router
+
+# 由发票自动生成的账单使用该支付方式与备注，对账时不作为候选，找到真实账单后可被合并掉
+INVOICE_PAYMENT_METHOD = '发票'
+AUTO_BILL_DESCRIPTION = "由发票#{invoice_id}自动生成"
+_AUTO_BILL_PATTERN = re.compile(r'^由发票#(\d+)自动生成$')
+UNKNOWN_MERCHANTS = {'', '未知商家', '未知'}
+
+_BRANCH_PATTERN = re.compile(r'[(（][^)）]*[)）]')
+_NOISE_PATTERN = re.compile(r'[\W_]+|有限责任公司|股份有限公司|有限公司|公司')
+
+
+@lru_cache(maxsize=100000)
+def merchant_ngrams(name: str, n: int = 2) -> frozenset:
+    """商家名 -> 字n-gram集合（去掉分店括号、标点与公司后缀）；按名称缓存"""
+    text = _NOISE_PATTERN.sub('', _BRANCH_PATTERN.sub('', (name or '').lower()))
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def merchant_similarity(a: str, b: str, n: int = 2) -> Optional[float]:
+    """重叠系数 |A∩B|/min(|A|,|B|)：简称与发票上的公司全称也能匹配；任一方未知时返回None"""
+    if (a or '') in UNKNOWN_MERCHANTS or (b or '') in UNKNOWN_MERCHANTS:
+        return None
+    grams_a, grams_b = merchant_ngrams(a, n), merchant_ngrams(b, n)
+    if not grams_a or not grams_b:
+        return None
+    return len(grams_a & grams_b) / min(len(grams_a), len(grams_b))
+
+
+class Reconciler:
+    """发票-账单对账：单张发票走 (user_id, consume_ts) 索引，批量回填走按用户的有序归并"""
+
+    def __init__(self, db_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(RECONCILE_CONFIG, **(config or {}))
+        self.db_path = db_path
+
+    def _connect(self, user_id: int = None):
+        if self.db_path is not None:
+            return get_sqlite_connection(self.db_path)
+        return shard_router.connect(user_id)
+
+    def _paths(self, user_id: int = None) -> List[Path]:
+        """批量对账要扫描的库：指定库 / 该用户所在分片 / 全部分片"""
+        if self.db_path is not None:
+            return [self.db_path]
+        if user_id is not None:
+            return [shard_router.path_for(user_id)]
+        return shard_router.paths()
+
+    @property
+    def window_seconds(self) -> int:
+        return int(self.config['time_window_hours'] * 3600)
+
+    def amount_tolerance(self, amount: float) -> float:
+        return max(self.config['amount_abs_tolerance'], abs(amount) * self.config['amount_rel_tolerance'])
+
+    def score(self, invoice: tuple, bill: tuple, tolerance: float = None) -> Optional[float]:
+        """invoice/bill: (id, user_id, ts, amount, merchant)；超出金额容差返回None"""
+        if tolerance is None:
+            tolerance = self.amount_tolerance(invoice[3])
+        amount_diff = abs(invoice[3] - bill[3])
+        if amount_diff > tolerance:
+            return None
+        similarity = merchant_similarity(invoice[4], bill[4], self.config['ngram'])
+        # OCR没识别出商家时不加分也不扣分
+        if similarity is None:
+            similarity = 0.5
+        w_merchant, w_amount, w_time = self.config['weights']
+        return (w_merchant * similarity
+                + w_amount * (1 - amount_diff / tolerance)
+                + w_time * (1 - abs(invoice[2] - bill[2]) / self.window_seconds))
+
+    # 单张发票
+    def find_match(self, invoice_id: int, conn=None, user_id: int = None) -> Optional[Dict[str, Any]]:
+        """为一张发票找最佳候选账单（未被其他发票关联、非发票自动生成）"""
+        own = conn is None
+        conn = conn or self._connect(user_id)
+        try:
+            invoice = conn.execute(
+                "SELECT id, user_id, invoice_ts, amount, merchant FROM invoices WHERE id = ?", (invoice_id,)
+            ).fetchone()
+            if invoice is None or invoice[2] is None:
+                return None
+            tolerance = self.amount_tolerance(invoice[3])
+            candidates = conn.execute("""
+                SELECT b.id, b.user_id, b.consume_ts, b.amount, b.merchant
+                FROM bills b
+                WHERE b.user_id = ? AND b.consume_ts BETWEEN ? AND ?
+                  AND b.amount BETWEEN ? AND ?
+                  AND b.payment_method != ?
+                  AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.bill_id = b.id AND i.id != ?)
+            """, (invoice[1], invoice[2] - self.window_seconds, invoice[2] + self.window_seconds,
+                  invoice[3] - tolerance, invoice[3] + tolerance, INVOICE_PAYMENT_METHOD,
+                  invoice_id)).fetchall()
+        finally:
+            if own:
+                conn.close()
+
+        best = None
+        for bill in candidates:
+            score = self.score(invoice, bill)
+            if score is not None and score >= self.config['min_score'] and (best is None or score > best[1]):
+                best = (bill, score)
+        if best is None:
+            return None
+        return {'bill_id': best[0][0], 'merchant': best[0][4], 'amount': best[0][3], 'score': round(best[1], 4)}
+
+    def link(self, invoice_id: int, bill_id: int, user_id: int = None):
+        conn = self._connect(user_id)
+        try:
+            conn.execute("UPDATE invoices SET bill_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (bill_id, invoice_id))
+            conn.commit()
+        finally:
+            conn.close()
+        # 发票自动生成账单后也经此关联：丢弃对话助手的账单快照
+        snapshot_store.invalidate(user_id)
+
+    def reconcile_invoice(self, invoice_id: int, user_id: int = None) -> Optional[Dict[str, Any]]:
+        """新发票入库时调用：找到匹配账单则关联并返回匹配信息"""
+        match = self.find_match(invoice_id, user_id=user_id)
+        if match:
+            self.link(invoice_id, match['bill_id'], user_id)
+        return match
+
+    # 批量回填
+    def _pending_invoices(self, conn, user_id: int = None) -> Iterator[tuple]:
+        """未关联、或关联的是发票自动生成账单的发票，按 (user_id, invoice_ts) 有序"""
+        user_filter = "AND i.user_id = ?" if user_id is not None else ""
+        return conn.execute(f"""
+            SELECT i.id, i.user_id, i.invoice_ts, i.amount, i.merchant,
+                   CASE WHEN b.payment_method = ? THEN b.id END AS auto_bill_id
+            FROM invoices i
+            LEFT JOIN bills b ON b.id = i.bill_id
+            WHERE i.invoice_ts IS NOT NULL
+              AND (i.bill_id IS NULL OR b.id IS NULL OR b.payment_method = ?)
+              {user_filter}
+            ORDER BY i.user_id, i.invoice_ts
+        """, [INVOICE_PAYMENT_METHOD, INVOICE_PAYMENT_METHOD] + ([user_id] if user_id is not None else []))
+
+    def _candidate_bills(self, conn, user_id: int = None) -> Iterator[tuple]:
+        """可被关联的账单，按 (user_id, consume_ts) 有序（直接沿索引读取，无需排序）"""
+        user_filter = "AND b.user_id = ?" if user_id is not None else ""
+        return conn.execute(f"""
+            SELECT b.id, b.user_id, b.consume_ts, b.amount, b.merchant
+            FROM bills b
+            WHERE b.consume_ts IS NOT NULL
+              AND b.payment_method != ?
+              AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.bill_id = b.id)
+              {user_filter}
+            ORDER BY b.user_id, b.consume_ts
+        """, [INVOICE_PAYMENT_METHOD] + ([user_id] if user_id is not None else []))
+
+    @staticmethod
+    def _merge_by_user(invoices: Iterator[tuple], bills: Iterator[tuple]) -> Iterator[Tuple[int, list, list]]:
+        """两路按user_id有序的游标归并，逐用户产出 (user_id, 发票列表, 账单列表)"""
+        bill_groups = groupby(bills, key=itemgetter(1))
+        current_bill = next(bill_groups, None)
+        for user_id, user_invoices in groupby(invoices, key=itemgetter(1)):
+            while current_bill is not None and current_bill[0] < user_id:
+                current_bill = next(bill_groups, None)
+            user_bills = []
+            if current_bill is not None and current_bill[0] == user_id:
+                user_bills = list(current_bill[1])
+                current_bill = next(bill_groups, None)
+            yield user_id, list(user_invoices), user_bills
+
+    def match_sorted(self, invoices: List[tuple], bills: List[tuple]) -> List[Tuple[tuple, tuple, float]]:
+        """同一用户按时间有序的发票与账单做滑动窗口连接，按得分贪心一对一匹配"""
+        window_seconds = self.window_seconds
+        min_score = self.config['min_score']
+        pairs = []
+        window = deque()
+        j = 0
+        for invoice in invoices:
+            ts = invoice[2]
+            while j < len(bills) and bills[j][2] <= ts + window_seconds:
+                window.append(bills[j])
+                j += 1
+            while window and window[0][2] < ts - window_seconds:
+                window.popleft()
+            # 先按金额容差过滤，窗口内多数账单无需打分
+            amount = invoice[3]
+            tolerance = self.amount_tolerance(amount)
+            for bill in window:
+                if abs(bill[3] - amount) <= tolerance:
+                    score = self.score(invoice, bill, tolerance)
+                    if score >= min_score:
+                        pairs.append((invoice, bill, score))
+
+        pairs.sort(key=itemgetter(2), reverse=True)
+        used_invoices, used_bills, matches = set(), set(), []
+        for invoice, bill, score in pairs:
+            if invoice[0] in used_invoices or bill[0] in used_bills:
+                continue
+            used_invoices.add(invoice[0])
+            used_bills.add(bill[0])
+            matches.append((invoice, bill, score))
+        return matches
+
+    def _legacy_auto_bills(self, conn, user_id: int = None) -> Dict[int, int]:
+        """旧版本由发票自动生成、但没有回写bill_id的账单：发票id -> 账单id"""
+        user_filter = "AND user_id = ?" if user_id is not None else ""
+        rows = conn.execute(
+            f"SELECT id, description FROM bills WHERE payment_method = ? {user_filter}",
+            [INVOICE_PAYMENT_METHOD] + ([user_id] if user_id is not None else [])
+        ).fetchall()
+        auto_bills = {}
+        for bill_id, description in rows:
+            m = _AUTO_BILL_PATTERN.match(description or '')
+            if m:
+                auto_bills[int(m.group(1))] = bill_id
+        return auto_bills
+
+    def backfill(self, user_id: int = None, merge: bool = True) -> Dict[str, Any]:
+        """批量对账：关联未对账的发票；merge时删除已被真实账单取代的发票自动生成账单"""
+        started = time.perf_counter()
+        stats = {'invoices': 0, 'linked': 0, 'merged': 0}
+        # 发票与账单同在用户所在分片，各分片独立归并
+        for path in self._paths(user_id):
+            self._backfill_at(path, user_id, merge, stats)
+        if stats['linked'] or stats['merged']:
+            # 合并会删除发票自动生成的账单；未指定用户时丢弃全部快照
+            snapshot_store.invalidate(user_id)
+        stats['unmatched'] = stats['invoices'] - stats['linked']
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        return stats
+
+    def _backfill_at(self, path: Path, user_id: int, merge: bool, stats: Dict[str, int]):
+        commit_every = self.config['commit_every']
+        conn = get_sqlite_connection(path)
+        try:
+            legacy = self._legacy_auto_bills(conn, user_id)
+            # 两个游标在同一连接上读取；写入只涉及已读完的用户，不影响后续扫描
+            invoices = self._pending_invoices(conn, user_id)
+            bills = self._candidate_bills(conn.cursor(), user_id)
+            pending_writes = 0
+            for _, user_invoices, user_bills in self._merge_by_user(invoices, bills):
+                stats['invoices'] += len(user_invoices)
+                if not merge:
+                    # 只关联模式下，已有自动账单的发票保持不变，避免同一笔消费留下两条账单
+                    user_invoices = [inv for inv in user_invoices if not (inv[5] or inv[0] in legacy)]
+                matches = self.match_sorted(user_invoices, user_bills) if user_bills else []
+                links = [(bill[0], invoice[0]) for invoice, bill, _ in matches]
+                superseded = [invoice[5] or legacy.get(invoice[0]) for invoice, _, _ in matches]
+                superseded = [(bill_id, INVOICE_PAYMENT_METHOD) for bill_id in superseded if bill_id]
+                # 没找到真实账单的旧数据：关联到自己的自动账单
+                matched = {invoice[0] for invoice, _, _ in matches}
+                links += [(legacy[inv[0]], inv[0]) for inv in user_invoices
+                          if inv[0] not in matched and not inv[5] and inv[0] in legacy]
+
+                conn.executemany("UPDATE invoices SET bill_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                                 links)
+                conn.executemany("DELETE FROM bills WHERE id = ? AND payment_method = ?", superseded)
+                stats['linked'] += len(matches)
+                stats['merged'] += len(superseded)
+                pending_writes += len(links) + len(superseded)
+                if pending_writes >= commit_every:
+                    conn.commit()
+                    pending_writes = 0
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# 创建全局对账实例
+reconciler = Reconciler()
+
+
+def main():
+    """命令行批量对账：python -m src.reconciliation [--user-id 1] [--no-merge]"""
+    parser = argparse.ArgumentParser(description="发票-账单批量对账")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--no-merge", action="store_true", help="只关联，不删除发票自动生成的重复账单")
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    stats = reconciler.backfill(args.user_id, merge=not args.no_merge)
+    print(f"处理发票 {stats['invoices']} 张，关联 {stats['linked']} 张，合并重复账单 {stats['merged']} 笔，"
+          f"未匹配 {stats['unmatched']} 张，耗时 {stats['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
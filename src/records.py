@@ -0,0 +1,129 @@
+"""
+只读数据模型 - 由游标行直接构造的轻量账单/发票记录，以及按列批量取数（分析用）
+
+读路径不再返回会话关闭后的ORM对象（没有identity map与属性插桩，也不会DetachedInstanceError），
+字段值与库中存储一致：时间列为规范文本，需要datetime时用 *_datetime 属性或 parse_db_time。
+"""
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Sequence
+
+import numpy as np
+
+
+def parse_db_time(value: Any) -> Optional[datetime]:
+    """库中的时间文本 -> datetime（规范格式走fromisoformat快速路径）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        from .data_cleaning import data_cleaner
+        return data_cleaner.parse_datetime(value)
+
+
+# dataclass(slots=True) 需要Python 3.10+：手写 __slots__（字段均无默认值，与类属性不冲突），顺序与字段一致
+@dataclass
+class BillRecord:
+    """账单只读记录（字段顺序即 BILL_COLUMNS 的查询列顺序）"""
+    __slots__ = ('id', 'user_id', 'consume_time', 'consume_ts', 'amount', 'merchant', 'merchant_id', 'category',
+                 'payment_method', 'location', 'description', 'created_at', 'updated_at')
+    id: int
+    user_id: int
+    consume_time: str
+    consume_ts: Optional[int]
+    amount: float
+    merchant: str
+    merchant_id: Optional[int]
+    category: Optional[str]
+    payment_method: str
+    location: Optional[str]
+    description: Optional[str]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+
+    @property
+    def consume_datetime(self) -> Optional[datetime]:
+        return parse_db_time(self.consume_time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in BILL_COLUMNS}
+
+
+@dataclass
+class InvoiceRecord:
+    """发票只读记录（字段顺序即 INVOICE_COLUMNS 的查询列顺序）"""
+    __slots__ = ('id', 'user_id', 'bill_id', 'invoice_time', 'invoice_ts', 'amount', 'merchant', 'invoice_type',
+                 'ocr_text', 'file_path', 'created_at', 'updated_at')
+    id: int
+    user_id: int
+    bill_id: Optional[int]
+    invoice_time: str
+    invoice_ts: Optional[int]
+    amount: float
+    merchant: str
+    invoice_type: Optional[str]
+    ocr_text: Optional[str]
+    file_path: Optional[str]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+
+    @property
+    def invoice_datetime(self) -> Optional[datetime]:
+        return parse_db_time(self.invoice_time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in INVOICE_COLUMNS}
+
+
+BILL_COLUMNS = tuple(f.name for f in fields(BillRecord))
+INVOICE_COLUMNS = tuple(f.name for f in fields(InvoiceRecord))
+assert BILL_COLUMNS == BillRecord.__slots__ and INVOICE_COLUMNS == InvoiceRecord.__slots__
+BILL_SELECT = ", ".join(BILL_COLUMNS)
+INVOICE_SELECT = ", ".join(INVOICE_COLUMNS)
+
+
+def bill_records(rows: Iterable[Sequence]) -> List[BillRecord]:
+    """按 BILL_SELECT 查出的行 -> BillRecord列表"""
+    return [BillRecord(*row) for row in rows]
+
+
+def invoice_records(rows: Iterable[Sequence]) -> List[InvoiceRecord]:
+    """按 INVOICE_SELECT 查出的行 -> InvoiceRecord列表"""
+    return [InvoiceRecord(*row) for row in rows]
+
+
+# 按列取数时的数组类型：整数列含NULL时退化为float（NaN），其余文本列为object
+FLOAT_COLUMNS = {'amount'}
+INT_COLUMNS = {'id', 'user_id', 'bill_id', 'merchant_id', 'consume_ts', 'consume_day', 'consume_month',
+               'invoice_ts', 'invoice_day', 'invoice_month'}
+# 由秒级时间戳列还原的时间列（datetime64，与库中按墙上时间换算一致）
+TIME_COLUMNS = {'consume_time': 'consume_ts', 'invoice_time': 'invoice_ts'}
+
+
+def column_array(name: str, values: Sequence) -> np.ndarray:
+    """一列取值 -> numpy数组"""
+    if name in FLOAT_COLUMNS:
+        return np.array(values, dtype=np.float64)
+    if name in INT_COLUMNS or name in TIME_COLUMNS:
+        try:
+            array = np.array(values, dtype=np.int64)
+        except TypeError:
+            array = np.array(values, dtype=np.float64)
+        return array.astype('datetime64[s]') if name in TIME_COLUMNS else array
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def to_columns(rows: Sequence[Sequence], names: Sequence[str]) -> Dict[str, np.ndarray]:
+    """按行取出的结果转成列式数组字典（可直接构造DataFrame）；
+    names中的时间列对应的查询列应为其时间戳列（见 select_columns）"""
+    if not rows:
+        return {name: column_array(name, []) for name in names}
+    return {name: column_array(name, values) for name, values in zip(names, zip(*rows))}
+
+
+def select_columns(names: Sequence[str]) -> str:
+    """列名 -> SELECT列表，时间列换成其秒级时间戳列"""
+    return ", ".join(TIME_COLUMNS.get(name, name) for name in names)
@@ -0,0 +1,270 @@
+"""
+报表流水线模块 - 账单窗口一次扫描成列式DataFrame，各报表段落按依赖组成DAG、共享分组结果；月报预生成
+"""
+import argparse
+import calendar
+import json
+import os
+import threading
+import time
+from datetime import datetime, date
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+import pandas as pd
+
+from .config import REPORT_CONFIG
+from .data_cleaning import data_cleaner
+from .database import get_sqlite_connection
+from .records import to_columns
+from .sharding import shard_router
+from .snapshot import snapshot_store
+
+# 报表用到的账单列（consume_time 由 consume_ts 还原，与库中按墙上时间换算的方式一致）
+FRAME_COLUMNS = ['id', 'consume_ts', 'amount', 'category', 'payment_method']
+
+
+class ReportPipeline:
+    """报表阶段注册表：阶段声明所依赖的阶段，运行时按需求值，一次运行内每个阶段只计算一次"""
+
+    def __init__(self):
+        self._stages: Dict[str, Tuple[Tuple[str, ...], Callable]] = {}
+
+    def stage(self, name: str, deps: Tuple[str, ...] = ()):
+        """装饰器：注册阶段，处理函数的参数依次为各依赖阶段的结果"""
+        def decorator(func: Callable):
+            self._stages[name] = (tuple(deps), func)
+            return func
+        return decorator
+
+    def run(self, targets: List[str], inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """以inputs为初始结果求值targets（依赖先于使用者计算，共享的分组结果只算一次）"""
+        results = dict(inputs)
+        visiting = set()
+
+        def resolve(name: str):
+            if name in results:
+                return results[name]
+            if name in visiting:
+                raise ValueError(f"报表阶段存在循环依赖: {name}")
+            visiting.add(name)
+            deps, func = self._stages[name]
+            results[name] = func(*[resolve(dep) for dep in deps])
+            visiting.discard(name)
+            return results[name]
+
+        return {name: resolve(name) for name in targets}
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._stages)
+
+
+def _year_bounds(year: int) -> Tuple[int, int]:
+    return calendar.timegm((year, 1, 1, 0, 0, 0)), calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+
+def load_report_frame(user_id: int, start_date: datetime = None, end_date: datetime = None,
+                      year: int = None, limit: int = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """一次扫描取出报表需要的全部账单：分析窗口（日期范围或最近limit笔）并上year整年（月度趋势用）
+
+    返回 (账单DataFrame按consume_ts降序, 窗口参数)，走 (user_id, consume_ts) 索引。
+    """
+    params = {'user_id': user_id, 'start_date': start_date, 'end_date': end_date, 'year': year,
+              'limit': limit or REPORT_CONFIG['recent_limit'], 'start_ts': None, 'end_ts': None}
+    if start_date and end_date:
+        params['start_ts'], params['end_ts'] = data_cleaner.to_epoch(start_date), data_cleaner.to_epoch(end_date)
+    if year:
+        params['year_start'], params['year_end'] = _year_bounds(year)
+
+    sql = f"SELECT {', '.join(FRAME_COLUMNS)} FROM bills WHERE user_id = ?"
+    args: List[Any] = [user_id]
+    ranged = params['start_ts'] is not None
+    if ranged:
+        sql += " AND (consume_ts BETWEEN ? AND ?"
+        args += [params['start_ts'], params['end_ts']]
+        if year:
+            sql += " OR (consume_ts >= ? AND consume_ts < ?)"
+            args += [params['year_start'], params['year_end']]
+        sql += ")"
+    sql += " ORDER BY consume_ts DESC"
+    if not ranged and not year:
+        sql += " LIMIT ?"
+        args.append(params['limit'])
+
+    conn = shard_router.connect(user_id)
+    try:
+        cursor = conn.execute(sql, args)
+        if ranged or not year:
+            rows = cursor.fetchall()
+        else:
+            # 最近limit笔与整年取并集：按时间倒序读到两者都满足为止
+            rows = []
+            while True:
+                batch = cursor.fetchmany(params['limit'])
+                rows.extend(batch)
+                if not batch or (len(rows) >= params['limit'] and (rows[-1][1] or 0) < params['year_start']):
+                    break
+    finally:
+        conn.close()
+
+    df = pd.DataFrame(to_columns(rows, FRAME_COLUMNS))
+    df['consume_time'] = df['consume_ts'].to_numpy().astype('datetime64[s]')
+    return df, params
+
+
+class MonthlyReports:
+    """月报预生成：reports_dir/YYYYMM/user_<id>.json，接口优先读取已生成的文件"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = dict(REPORT_CONFIG, **(config or {}))
+        self.reports_dir = Path(self.config['reports_dir'])
+        self._schedule_thread = None
+
+    @staticmethod
+    def month_range(month: int) -> Tuple[datetime, datetime]:
+        """YYYYMM -> 当月第一秒与最后一秒"""
+        year, mon = divmod(month, 100)
+        last_day = calendar.monthrange(year, mon)[1]
+        return datetime(year, mon, 1), datetime(year, mon, last_day, 23, 59, 59)
+
+    @staticmethod
+    def previous_month(today: date = None) -> int:
+        today = today or datetime.now().date()
+        return (today.year - 1) * 100 + 12 if today.month == 1 else today.year * 100 + today.month - 1
+
+    def path_for(self, user_id: int, month: int) -> Path:
+        return self.reports_dir / str(month) / f"user_{user_id}.json"
+
+    def load(self, user_id: int, month: int) -> Optional[Dict[str, Any]]:
+        path = self.path_for(user_id, month)
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def generate(self, user_id: int, month: int) -> Dict[str, Any]:
+        """生成并写入一个用户的月报（先写临时文件再改名）"""
+        from .cost_analysis import cost_analyzer
+
+        start_date, end_date = self.month_range(month)
+        report = cost_analyzer.generate_report(user_id, start_date, end_date, year=month // 100)
+        path = self.path_for(user_id, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.part')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        return report
+
+    def get_or_generate(self, user_id: int, month: int) -> Dict[str, Any]:
+        """已结束的月份读取/补写预生成文件；当月账单仍在变化，直接计算不落盘"""
+        if month >= int(datetime.now().strftime('%Y%m')):
+            from .cost_analysis import cost_analyzer
+
+            return cost_analyzer.generate_report(user_id, *self.month_range(month), year=month // 100)
+        return self.load(user_id, month) or self.generate(user_id, month)
+
+    def users_in_month(self, month: int) -> List[int]:
+        """当月有账单的用户（各分片合并）"""
+        users = set()
+        for path in shard_router.paths():
+            conn = get_sqlite_connection(snapshot_store.read_path(path))
+            try:
+                users.update(row[0] for row in conn.execute(
+                    "SELECT DISTINCT user_id FROM bills WHERE consume_month = ?", (month,)
+                ))
+            finally:
+                conn.close()
+        return sorted(users)
+
+    def generate_month(self, month: int, user_ids: List[int] = None, force: bool = False) -> Dict[str, Any]:
+        """批量生成某月全部用户的月报；已生成的跳过（force时重建）。已结束月份的账单读只读副本（启用时）"""
+        started = time.perf_counter()
+        stats = {'month': month, 'generated': 0, 'skipped': 0, 'failed': 0}
+        with snapshot_store.replica_reads():
+            for user_id in user_ids or self.users_in_month(month):
+                if not force and self.path_for(user_id, month).exists():
+                    stats['skipped'] += 1
+                    continue
+                try:
+                    self.generate(user_id, month)
+                    stats['generated'] += 1
+                except Exception as e:
+                    stats['failed'] += 1
+                    print(f"生成月报失败 user={user_id} month={month}: {e}")
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        return stats
+
+    def _claim(self, month: int) -> bool:
+        """多worker时只由一个进程生成：在月份目录下原子创建锁文件"""
+        lock = self.reports_dir / str(month) / '.generating'
+        lock.parent.mkdir(parents=True, exist_ok=True)
+        if (lock.parent / '_SUCCESS').exists():
+            return False
+        try:
+            # 超过一个周期仍未完成的锁视为上次生成中断
+            if lock.exists() and time.time() - lock.stat().st_mtime > self.config['schedule_interval_seconds']:
+                lock.unlink()
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def run_scheduled(self, today: date = None) -> Optional[Dict[str, Any]]:
+        """补齐上个月的月报（每月只生成一次，完成后写 _SUCCESS 标记）"""
+        month = self.previous_month(today)
+        if not self._claim(month):
+            return None
+        month_dir = self.reports_dir / str(month)
+        try:
+            stats = self.generate_month(month)
+            if not stats['failed']:
+                (month_dir / '_SUCCESS').touch()
+            return stats
+        finally:
+            (month_dir / '.generating').unlink(missing_ok=True)
+
+    def start_background_schedule(self):
+        """启动后台周期检查线程（REPORT_SCHEDULE=1 时启用）"""
+        if not self.config['schedule_enabled'] or self._schedule_thread is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    stats = self.run_scheduled()
+                    if stats:
+                        print(f"月报预生成 {stats['month']}: 生成 {stats['generated']}，跳过 {stats['skipped']}，"
+                              f"失败 {stats['failed']}，耗时 {stats['seconds']}s")
+                except Exception as e:
+                    print(f"月报预生成失败: {e}")
+                time.sleep(self.config['schedule_interval_seconds'])
+
+        self._schedule_thread = threading.Thread(target=_loop, name="monthly-reports", daemon=True)
+        self._schedule_thread.start()
+
+
+# 创建全局实例
+report_pipeline = ReportPipeline()
+monthly_reports = MonthlyReports()
+
+
+def main():
+    """命令行预生成月报（可由cron每月调用）：python -m src.report_pipeline [--month 2025-09] [--user-id 1] [--force]"""
+    parser = argparse.ArgumentParser(description="预生成月度消费报表")
+    parser.add_argument("--month", help="月份，如 2025-09；默认上个月")
+    parser.add_argument("--user-id", type=int, action="append", help="只生成指定用户，可重复")
+    parser.add_argument("--force", action="store_true", help="覆盖已生成的月报")
+    args = parser.parse_args()
+
+    from .database import init_database
+    init_database()
+    month = int(args.month.replace('-', '')) if args.month else monthly_reports.previous_month()
+    stats = monthly_reports.generate_month(month, args.user_id, force=args.force)
+    print(f"{month} 月报：生成 {stats['generated']}，跳过 {stats['skipped']}，失败 {stats['failed']}，"
+          f"耗时 {stats['seconds']}s，输出目录 {monthly_reports.reports_dir / str(month)}")
+
+
+if __name__ == "__main__":
+    main()
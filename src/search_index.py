@@ -0,0 +1,343 @@
+"""
+全文检索模块 - 基于SQLite FTS5的商家/备注/发票OCR文本检索（中文按相邻二字切分）
+"""
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import DATABASE_PATH, SEARCH_CONFIG
+from .database import get_sqlite_connection
+from .sharding import shard_router
+
+# 数据源：来源名 -> (表名, 商家列, 正文列, 时间列, rowid偏移)
+# FTS行的rowid = 源表id * 2 + 偏移，便于按主键直接覆盖/删除，检索时无需回表取来源
+SOURCES = {
+    'bill': ('bills', 'merchant', 'description', 'consume_time', 0),
+    'invoice': ('invoices', 'merchant', 'ocr_text', 'invoice_time', 1),
+}
+_SOURCE_BY_OFFSET = {spec[4]: name for name, spec in SOURCES.items()}
+
+# 索引切分方式的版本：变更后已有索引按新方式全量重建
+TOKENIZER_VERSION = 'cjk-bigram-1'
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_PATTERN = re.compile(f'[{_CJK}]+')
+# 连续的中文、连续的字母数字各成一段（标点、空白为分隔）
+_RUN_PATTERN = re.compile(f'[{_CJK}]+|[^\\W{_CJK}]+')
+
+
+def _bigrams(run: str) -> List[str]:
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+@lru_cache(maxsize=50000)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """文档分词：中文段切成相邻二字（末字单独一个词元），字母数字段整段
+
+    不依赖词典分词：词典切法随上下文变化（"喝拿铁"整段成一个词），查询词会在索引里找不到；
+    二字切分下任意中文子串都是索引中相邻词元组成的短语，每个字也都是某个词元的开头。
+    """
+    tokens = []
+    for run in _RUN_PATTERN.findall(text or ''):
+        if _CJK_PATTERN.fullmatch(run):
+            tokens.extend(_bigrams(run))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tuple(tokens)
+
+
+def segment(text: str) -> str:
+    """文档分词结果以空格连接后交给FTS5的unicode61分词器"""
+    return ' '.join(tokenize(text))
+
+
+def query_terms(query: str) -> List[str]:
+    """把用户输入按与文档相同的分段规则切成检索词（去标点、去重、保持顺序）"""
+    terms = []
+    for run in _RUN_PATTERN.findall(query or ''):
+        run = run.lower()
+        if run not in terms:
+            terms.append(run)
+    return terms
+
+
+def term_phrase(term: str) -> str:
+    """检索词 -> FTS5短语：中文为相邻二字组成的短语（单字用前缀匹配），字母数字做前缀匹配"""
+    if _CJK_PATTERN.fullmatch(term):
+        return f'"{term}"*' if len(term) == 1 else '"' + ' '.join(_bigrams(term)) + '"'
+    return '"{}"{}'.format(term.replace('"', '""'), '*' if term.isascii() else '')
+
+
+class SearchIndex:
+    """FTS5全文索引：触发器记录变更，检索前增量分词入库"""
+
+    def __init__(self, db_path: Path = DATABASE_PATH, config: Dict[str, Any] = None):
+        self.config = dict(SEARCH_CONFIG, **(config or {}))
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        return get_sqlite_connection(self.db_path)
+
+    def ensure_schema(self) -> bool:
+        """创建FTS表、待索引队列与触发器；首次创建或切分方式变更时全量建索引，返回是否重建"""
+        conn = self._connect()
+        try:
+            conn.executescript(self._schema_sql())
+            conn.commit()
+            version = conn.execute("SELECT value FROM search_meta WHERE key = 'tokenizer'").fetchone()
+        finally:
+            conn.close()
+        self._ready = True
+        stale = version is None or version[0] != TOKENIZER_VERSION
+        if stale:
+            self.rebuild()
+        return stale
+
+    def _schema_sql(self) -> str:
+        # 触发器只写队列，不依赖Python函数，任何连接（SQLAlchemy、命令行）写入都能被捕获
+        statements = ["""
+            -- scope列存 "u<用户id> <来源>" 词元，用户/来源过滤走倒排索引而不是逐行回表
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                merchant, body, scope,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS search_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS search_pending (
+                source TEXT NOT NULL,
+                ref_id INTEGER NOT NULL,
+                PRIMARY KEY (source, ref_id)
+            ) WITHOUT ROWID;
+        """]
+        for source, (table, merchant_col, body_col, _, _) in SOURCES.items():
+            statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN
+                INSERT OR IGNORE INTO search_pending (source, ref_id) VALUES ('{source}', NEW.id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_search_au
+            AFTER UPDATE OF {merchant_col}, {body_col}, user_id ON {table} BEGIN
+                INSERT OR IGNORE INTO search_pending (source, ref_id) VALUES ('{source}', NEW.id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN
+                INSERT OR IGNORE INTO search_pending (source, ref_id) VALUES ('{source}', OLD.id);
+            END;
+            """)
+        return "\n".join(statements)
+
+    def _index_rows(self, conn, source: str, rows: List[tuple]):
+        """rows: (id, user_id, merchant, body)"""
+        offset = SOURCES[source][4]
+        conn.executemany(
+            "INSERT OR REPLACE INTO search_fts (rowid, merchant, body, scope) VALUES (?, ?, ?, ?)",
+            [(row[0] * 2 + offset, segment(row[2] or ''), segment(row[3] or ''), f"u{row[1]} {source}")
+             for row in rows]
+        )
+
+    def rebuild(self) -> Dict[str, int]:
+        """全量重建索引"""
+        batch_size = self.config['sync_batch_size']
+        counts = {}
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM search_fts")
+                conn.execute("DELETE FROM search_pending")
+                for source, (table, merchant_col, body_col, _, _) in SOURCES.items():
+                    cursor = conn.cursor()
+                    cursor.execute(f"SELECT id, user_id, {merchant_col}, {body_col} FROM {table}")
+                    counts[source] = 0
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        self._index_rows(conn, source, rows)
+                        counts[source] += len(rows)
+                conn.execute("INSERT INTO search_fts (search_fts) VALUES ('optimize')")
+                conn.execute("INSERT OR REPLACE INTO search_meta (key, value) VALUES ('tokenizer', ?)",
+                             (TOKENIZER_VERSION,))
+                conn.commit()
+            finally:
+                conn.close()
+        return counts
+
+    def sync(self) -> int:
+        """处理待索引队列，返回处理行数"""
+        if not self._ready:
+            self.ensure_schema()
+        batch_size = self.config['sync_batch_size']
+        processed = 0
+        with self._lock:
+            conn = self._connect()
+            try:
+                while True:
+                    pending = conn.execute(
+                        "SELECT source, ref_id FROM search_pending LIMIT ?", (batch_size,)
+                    ).fetchall()
+                    if not pending:
+                        break
+                    for source, (table, merchant_col, body_col, _, offset) in SOURCES.items():
+                        ids = [ref_id for src, ref_id in pending if src == source]
+                        if not ids:
+                            continue
+                        placeholders = ','.join('?' * len(ids))
+                        rows = conn.execute(
+                            f"SELECT id, user_id, {merchant_col}, {body_col} FROM {table} "
+                            f"WHERE id IN ({placeholders})", ids
+                        ).fetchall()
+                        # 源行已删除的直接从索引移除
+                        alive = {row[0] for row in rows}
+                        conn.executemany("DELETE FROM search_fts WHERE rowid = ?",
+                                         [(i * 2 + offset,) for i in ids if i not in alive])
+                        self._index_rows(conn, source, rows)
+                    conn.executemany("DELETE FROM search_pending WHERE source = ? AND ref_id = ?", pending)
+                    conn.commit()
+                    processed += len(pending)
+            finally:
+                conn.close()
+        return processed
+
+    @staticmethod
+    def build_match(terms: List[str], user_id: int = None, sources: List[str] = None) -> str:
+        """检索词转FTS5查询：各词AND，限定商家/正文列；用户与来源按scope词元过滤"""
+        expr = '{merchant body} : (' + ' '.join(term_phrase(t) for t in terms) + ')'
+        if user_id is not None:
+            expr += f' AND scope : "u{int(user_id)}"'
+        if sources:
+            expr += ' AND scope : (' + ' OR '.join(f'"{s}"' for s in sources) + ')'
+        return expr
+
+    def bill_merchant_condition(self, merchant: str, user_id: int) -> Optional[Tuple[str, List[Any]]]:
+        """账单商家名包含 merchant 的筛选条件，走检索索引，结果与 merchant LIKE '%merchant%' 一致
+
+        只对纯中文的写法成立（任意中文子串都能由二字词元短语精确匹配）；含字母数字、空白或标点时
+        索引无法等价表达子串匹配，返回None由调用方回退到LIKE。
+        """
+        if not merchant or not _CJK_PATTERN.fullmatch(merchant):
+            return None
+        self.sync()
+        match = '{merchant} : ' + term_phrase(merchant) + f' AND scope : ("u{int(user_id)}" AND "bill")'
+        # 账单在索引中的rowid = id * 2
+        return "id IN (SELECT rowid / 2 FROM search_fts WHERE search_fts MATCH ?)", [match]
+
+    def search(self, query: str, user_id: int = None, sources: List[str] = None,
+               limit: int = None, offset: int = 0) -> Dict[str, Any]:
+        """检索并按bm25排序，返回带高亮的结果"""
+        terms = query_terms(query)
+        if not terms:
+            return {'query': query, 'terms': [], 'total': 0, 'results': []}
+        limit = min(limit or self.config['default_limit'], self.config['max_limit'])
+        self.sync()
+
+        match = self.build_match(terms, user_id, sources)
+        weights = ', '.join(str(w) for w in self.config['column_weights'])
+
+        conn = self._connect()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM search_fts WHERE search_fts MATCH ?", (match,)).fetchone()[0]
+            hits = [
+                (_SOURCE_BY_OFFSET[rowid % 2], rowid // 2, score)
+                for rowid, score in conn.execute(f"""
+                    SELECT rowid, bm25(search_fts, {weights}, 0.0) AS score
+                    FROM search_fts
+                    WHERE search_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ? OFFSET ?
+                """, (match, limit, offset)).fetchall()
+            ]
+            details = self._load_details(conn, hits)
+        finally:
+            conn.close()
+
+        results = []
+        for source, ref_id, score in hits:
+            row = details.get((source, ref_id))
+            if row is None:
+                continue
+            results.append({
+                'source': source,
+                'id': ref_id,
+                'user_id': row['user_id'],
+                'time': row['time'],
+                'amount': row['amount'],
+                'merchant': row['merchant'],
+                'merchant_highlight': self.highlight(row['merchant'], terms),
+                'snippet': self.snippet(row['body'], terms),
+                'score': round(-score, 4)
+            })
+        return {'query': query, 'terms': terms, 'total': total, 'results': results}
+
+    def _load_details(self, conn, hits: List[tuple]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """按来源批量取回原始记录"""
+        details = {}
+        for source, (table, merchant_col, body_col, time_col, _) in SOURCES.items():
+            ids = [ref_id for src, ref_id, _ in hits if src == source]
+            if not ids:
+                continue
+            rows = conn.execute(
+                f"SELECT id, user_id, {time_col}, amount, {merchant_col}, {body_col} FROM {table} "
+                f"WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+            for row in rows:
+                details[(source, row[0])] = {
+                    'user_id': row[1], 'time': row[2], 'amount': row[3],
+                    'merchant': row[4], 'body': row[5]
+                }
+        return details
+
+    def highlight(self, text: Optional[str], terms: List[str]) -> Optional[str]:
+        """在原文中标记命中词"""
+        if not text:
+            return text
+        open_tag, close_tag = self.config['highlight_tags']
+        pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+        marked = pattern.sub(lambda m: f"{open_tag}{m.group(0)}{close_tag}", text)
+        # 相邻命中词合并成一段
+        return marked.replace(close_tag + open_tag, '')
+
+    def snippet(self, text: Optional[str], terms: List[str]) -> Optional[str]:
+        """截取首个命中词附近的片段并高亮"""
+        if not text:
+            return text
+        width = self.config['snippet_chars']
+        lowered = text.lower()
+        positions = [p for p in (lowered.find(t) for t in terms) if p >= 0]
+        start = max(min(positions) - width, 0) if positions else 0
+        end = min(start + width * 2 + max(len(t) for t in terms), len(text))
+        fragment = text[start:end].replace('\n', ' ')
+        prefix = '...' if start > 0 else ''
+        suffix = '...' if end < len(text) else ''
+        return prefix + self.highlight(fragment, terms) + suffix
+
+
+# 创建全局检索索引实例
+search_index = SearchIndex()
+
+# 分片部署时每个分片库各有一份索引（触发器只能写同库的队列表）
+_shard_indexes: Dict[Path, SearchIndex] = {}
+
+
+def _index_at(path: Path) -> SearchIndex:
+    path = Path(path)
+    if path == search_index.db_path:
+        return search_index
+    index = _shard_indexes.get(path)
+    if index is None:
+        index = _shard_indexes.setdefault(path, SearchIndex(path))
+    return index
+
+
+def search_index_for(user_id: int) -> SearchIndex:
+    """用户所在分片的检索索引；不分片时即 search_index"""
+    return _index_at(shard_router.path_for(user_id))
+
+
+def shard_search_indexes() -> List[SearchIndex]:
+    """全部分片的检索索引"""
+    return [_index_at(path) for path in shard_router.paths()]
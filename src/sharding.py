@@ -0,0 +1,378 @@
+"""
+分片路由模块 - 按user_id把用户数据分布到多个SQLite库（一致性哈希），跨用户查询并发扇出
+"""
+import argparse
+import bisect
+import hashlib
+import heapq
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Iterable, Iterator
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from .config import DATABASE_PATH, SHARD_CONFIG
+from .database import SessionLocal as HomeSession, get_sqlite_connection
+from .metrics import instrument_engine
+from .snapshot import snapshot_store
+from .models import (
+    Base, Bill, Invoice, UserProfile, UserBudget, UserSubscription, OCRUsageQuota,
+    CommunityPost, PostComment, PostLike
+)
+
+# 按user_id分片的模型；评论/点赞跟随帖子所在分片
+SHARDED_MODELS = (Bill, Invoice, UserProfile, UserBudget, UserSubscription, OCRUsageQuota,
+                  CommunityPost, PostComment, PostLike)
+SHARDED_TABLES = [model.__table__ for model in SHARDED_MODELS]
+# 迁移时随用户移动的原始SQL表（不在模型中）
+RAW_USER_TABLES = ('ocr_usage', 'upload_invoices')
+# 挂在帖子下的子表：按帖子作者迁移
+POST_CHILD_TABLES = ('post_comments', 'post_likes')
+_CREATE_TABLE_PATTERN = re.compile(r'^CREATE TABLE (IF NOT EXISTS )?', re.IGNORECASE)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环：增减分片时只有约 1/N 的用户需要迁移"""
+
+    def __init__(self, nodes: List[str], virtual_nodes: int = 128):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: Any) -> str:
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[index]
+
+
+class ShardRouter:
+    """用户 -> 分片库路由：原生连接、SQLAlchemy会话、按id定位、跨分片扇出与全局id分配"""
+
+    def __init__(self, config: Dict[str, Any] = None, home_path: Path = DATABASE_PATH):
+        self.config = dict(SHARD_CONFIG, **(config or {}))
+        self.home_path = Path(home_path)
+        count = max(1, int(self.config['shards']))
+        if count == 1:
+            self._paths = {'main': self.home_path}
+        else:
+            shard_dir = Path(self.config['shard_dir'])
+            self._paths = {f"shard_{i:02d}": shard_dir / f"bill_db_{i:02d}.sqlite" for i in range(count)}
+        self.ring = HashRing(list(self._paths), self.config['virtual_nodes'])
+        self._lock = threading.Lock()
+        self._sessions: Dict[Path, Any] = {}
+        self._id_blocks: Dict[str, List[int]] = {}  # 表名 -> [下一个id, 段末尾(不含)]
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def sharded(self) -> bool:
+        return len(self._paths) > 1
+
+    def paths(self) -> List[Path]:
+        """全部分片库路径（不分片时即主库）"""
+        return list(self._paths.values())
+
+    def shard_of(self, user_id: int) -> str:
+        return self.ring.node_for(int(user_id))
+
+    def path_for(self, user_id: int = None) -> Path:
+        """用户所在分片库；user_id为空时为主库（全局表）"""
+        if user_id is None:
+            return self.home_path
+        return self._paths[self.shard_of(user_id)]
+
+    # 连接与会话
+    def connect(self, user_id: int = None, row_factory=None, **kwargs):
+        kwargs.setdefault('timeout', self.config['busy_timeout'])
+        # 批量任务在 snapshot_store.replica_reads() 块内时读只读副本
+        return get_sqlite_connection(snapshot_store.routed_path(self.path_for(user_id)), row_factory=row_factory,
+                                     **kwargs)
+
+    def _sessionmaker(self, path: Path):
+        if path == DATABASE_PATH:
+            return HomeSession
+        factory = self._sessions.get(path)
+        if factory is None:
+            with self._lock:
+                factory = self._sessions.get(path)
+                if factory is None:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    shard_engine = instrument_engine(create_engine(
+                        f"sqlite:///{path}", echo=False,
+                        connect_args={'timeout': self.config['busy_timeout']}
+                    ))
+                    factory = self._sessions[path] = sessionmaker(
+                        autocommit=False, autoflush=False, expire_on_commit=False, bind=shard_engine)
+        return factory
+
+    @contextmanager
+    def session_at(self, path: Path):
+        """指定分片库的会话（与 get_db_session 相同的提交/回滚语义）"""
+        session = self._sessionmaker(Path(path))()
+        try:
+            yield session
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def session(self, user_id: int = None):
+        return self.session_at(self.path_for(user_id))
+
+    def dispose(self):
+        """fork后丢弃继承的分片连接池"""
+        for factory in self._sessions.values():
+            factory.kw['bind'].dispose(close=False)
+
+    # 跨分片
+    def locate(self, fn: Callable[[Path], Any], user_id: int = None) -> Any:
+        """按主键查找时不知道行在哪个分片：先查该用户所在分片，再依次查其余分片，返回第一个非空结果"""
+        paths = self.paths()
+        if user_id is not None:
+            preferred = self.path_for(user_id)
+            paths = [preferred] + [path for path in paths if path != preferred]
+        for path in paths:
+            result = fn(path)
+            if result:
+                return result
+        return None
+
+    def fan_out(self, fn: Callable[[Path], Any]) -> List[Any]:
+        """在每个分片上执行fn(路径)，返回各分片结果（分片间并发）"""
+        paths = self.paths()
+        if len(paths) == 1:
+            return [fn(paths[0])]
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.config['fanout_workers'],
+                                                    thread_name_prefix='shard-fanout')
+        return list(self._pool.map(fn, paths))
+
+    @staticmethod
+    def merge_sorted(results: Iterable[List[Any]], key: Callable, limit: int, offset: int = 0,
+                     reverse: bool = True) -> List[Any]:
+        """各分片已排序的结果归并后分页（每个分片需返回前 offset+limit 条）"""
+        return list(ShardRouter.iter_merge_sorted(results, key, limit, offset, reverse))
+
+    @staticmethod
+    def iter_merge_sorted(results: Iterable[Iterable[Any]], key: Callable, limit: int, offset: int = 0,
+                          reverse: bool = True) -> Iterator[Any]:
+        """merge_sorted的惰性版本：各分片可以是游标，边取边归并"""
+        return islice(heapq.merge(*results, key=key, reverse=reverse), offset, offset + limit)
+
+    # 全局id
+    def next_id(self, table: str) -> int:
+        """分片模式下各分片不能各自自增：从主库按段领取全局唯一id，迁移用户时id保持不变"""
+        with self._lock:
+            block = self._id_blocks.get(table)
+            if block is None or block[0] >= block[1]:
+                start = self._claim_block(table)
+                block = self._id_blocks[table] = [start, start + self.config['id_block_size']]
+            block[0] += 1
+            return block[0] - 1
+
+    def _claim_block(self, table: str) -> int:
+        size = self.config['id_block_size']
+        conn = get_sqlite_connection(self.home_path, timeout=self.config['busy_timeout'])
+        try:
+            # 多进程同时领取时串行化，保证首次初始化只有一个进程执行
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TABLE IF NOT EXISTS shard_id_blocks "
+                         "(table_name TEXT PRIMARY KEY, next_id INTEGER NOT NULL) WITHOUT ROWID")
+            # 不用 UPDATE ... RETURNING（需SQLite 3.35+）：同一写事务内先更新再读回，结果一致
+            claimed = conn.execute("UPDATE shard_id_blocks SET next_id = next_id + ? WHERE table_name = ?",
+                                   (size, table)).rowcount
+            row = conn.execute("SELECT next_id - ? FROM shard_id_blocks WHERE table_name = ?",
+                               (size, table)).fetchone() if claimed else None
+            if row is None:
+                # 首次领取：从所有库（含主库中分片前的旧数据）的最大id之后开始
+                start = max(self._max_id(path, table) for path in set(self.paths()) | {self.home_path}) + 1
+                conn.execute("INSERT INTO shard_id_blocks (table_name, next_id) VALUES (?, ?)",
+                             (table, start + size))
+                row = (start,)
+            conn.commit()
+            return row[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _max_id(path: Path, table: str) -> int:
+        if not Path(path).exists():
+            return 0
+        conn = get_sqlite_connection(path)
+        try:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table,)).fetchone()
+            return (conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) if exists else 0
+        finally:
+            conn.close()
+
+    # 建表
+    def ensure_schema(self):
+        """分片库建表并执行与主库相同的迁移（主库由 init_database 处理）"""
+        if not self.sharded:
+            return
+        from .database import ensure_model_columns, ensure_time_columns
+
+        for path in self.paths():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shard_engine = create_engine(f"sqlite:///{path}")
+            try:
+                Base.metadata.create_all(shard_engine, tables=SHARDED_TABLES)
+            finally:
+                shard_engine.dispose()
+            ensure_model_columns(path)
+            ensure_time_columns(path)
+
+
+# 创建全局路由实例
+shard_router = ShardRouter()
+
+
+@event.listens_for(Base, 'before_insert', propagate=True)
+def _assign_global_id(mapper, connection, target):
+    """分片模式下ORM插入分片表时预先分配全局id"""
+    if shard_router.sharded and target.__table__ in SHARDED_TABLES and getattr(target, 'id', None) is None:
+        target.id = shard_router.next_id(target.__tablename__)
+
+
+# 重新分片
+def _copy_columns(conn, schema: str, table: str) -> List[str]:
+    """可写入的列（排除生成列）"""
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_xinfo({table})") if row[6] == 0]
+
+
+def _user_ids(conn) -> set:
+    users = set()
+    for table in [t.name for t in SHARDED_TABLES if t.name not in POST_CHILD_TABLES] + list(RAW_USER_TABLES):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            users.update(row[0] for row in conn.execute(f"SELECT DISTINCT user_id FROM {table}"))
+    return users
+
+
+def _move_users(source: Path, target: Path, user_ids: List[int]) -> Dict[str, int]:
+    """把一组用户的全部行从source库搬到target库（同一事务内先复制后删除）"""
+    moved = {}
+    conn = get_sqlite_connection(source, timeout=SHARD_CONFIG['busy_timeout'])
+    try:
+        conn.execute("ATTACH DATABASE ? AS dst", (str(target),))
+        conn.execute("CREATE TEMP TABLE moving_users (user_id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO moving_users (user_id) VALUES (?)", [(u,) for u in user_ids])
+        post_filter = "post_id IN (SELECT id FROM main.community_posts WHERE user_id IN (SELECT user_id FROM moving_users))"
+        user_filter = "user_id IN (SELECT user_id FROM moving_users)"
+        # 子表先于帖子搬迁（筛选条件依赖源库中的帖子）
+        tables = [(name, post_filter) for name in POST_CHILD_TABLES]
+        tables += [(t.name, user_filter) for t in SHARDED_TABLES if t.name not in POST_CHILD_TABLES]
+        tables += [(name, user_filter) for name in RAW_USER_TABLES]
+        for table, condition in tables:
+            exists = conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table,)).fetchone()
+            if not exists:
+                continue
+            if table in RAW_USER_TABLES:
+                # 原始SQL表由各模块启动时创建，目标分片可能还没有：按源库的建表语句补建
+                ddl = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                   (table,)).fetchone()[0]
+                conn.execute(_CREATE_TABLE_PATTERN.sub('CREATE TABLE IF NOT EXISTS dst.', ddl, count=1))
+            dst_columns = set(_copy_columns(conn, 'dst', table))
+            # OCR日用量表的id是各库自增、无外部引用，不随迁移
+            if table == 'ocr_usage':
+                dst_columns.discard('id')
+            columns = ', '.join(c for c in _copy_columns(conn, 'main', table) if c in dst_columns)
+            conn.execute(f"INSERT OR REPLACE INTO dst.{table} ({columns}) "
+                         f"SELECT {columns} FROM main.{table} WHERE {condition}")
+            moved[table] = conn.execute(f"DELETE FROM main.{table} WHERE {condition}").rowcount
+        conn.commit()
+        conn.execute("DETACH DATABASE dst")
+    finally:
+        conn.close()
+    return moved
+
+
+def reshard(from_shards: int, to_shards: int, dry_run: bool = False) -> Dict[str, Any]:
+    """离线重新分片：按新的哈希环搬迁归属发生变化的用户（服务需停写，完成后用新分片数重启）"""
+    started = time.perf_counter()
+    old = ShardRouter({'shards': from_shards})
+    new = ShardRouter({'shards': to_shards})
+    stats = {'users': 0, 'moved_users': 0, 'rows': {}}
+    if not dry_run:
+        new.ensure_schema()
+    for source in old.paths():
+        if not source.exists():
+            continue
+        conn = get_sqlite_connection(source)
+        try:
+            users = _user_ids(conn)
+        finally:
+            conn.close()
+        stats['users'] += len(users)
+        by_target: Dict[Path, List[int]] = {}
+        for user_id in users:
+            target = new.path_for(user_id)
+            if target != source:
+                by_target.setdefault(target, []).append(user_id)
+        for target, user_ids in by_target.items():
+            stats['moved_users'] += len(user_ids)
+            print(f"{source.name} -> {target.name}: {len(user_ids)} 个用户")
+            if dry_run:
+                continue
+            for table, count in _move_users(source, target, user_ids).items():
+                stats['rows'][table] = stats['rows'].get(table, 0) + count
+    if not dry_run:
+        # 旧分片数下领取的id段作废，新进程从各库最大id之后重新领取
+        conn = get_sqlite_connection(new.home_path)
+        try:
+            conn.execute("DROP TABLE IF EXISTS shard_id_blocks")
+            conn.commit()
+        finally:
+            conn.close()
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    """命令行：python -m src.sharding status | reshard --to 4 [--from 1] [--dry-run]"""
+    parser = argparse.ArgumentParser(description="按用户分片的存储管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="各分片的用户数与账单数")
+    move = sub.add_parser("reshard", help="按新的分片数搬迁用户数据")
+    move.add_argument("--from", dest="from_shards", type=int, default=SHARD_CONFIG['shards'])
+    move.add_argument("--to", dest="to_shards", type=int, required=True)
+    move.add_argument("--dry-run", action="store_true", help="只统计需要搬迁的用户")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for name, path in shard_router._paths.items():
+            if not path.exists():
+                print(f"{name}: 未创建 ({path})")
+                continue
+            conn = get_sqlite_connection(path)
+            try:
+                users = len(_user_ids(conn))
+                bills = conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+            finally:
+                conn.close()
+            print(f"{name}: {users} 个用户，{bills} 笔账单 ({path})")
+        return
+
+    from .database import init_database
+    init_database()
+    stats = reshard(args.from_shards, args.to_shards, dry_run=args.dry_run)
+    print(f"共 {stats['users']} 个用户，搬迁 {stats['moved_users']} 个，行数 {stats['rows']}，耗时 {stats['seconds']}s")
+    if not args.dry_run:
+        print(f"请设置 BILL_DB_SHARDS={args.to_shards} 后重启服务")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+在线备份模块 - 用SQLite在线备份API分步复制出一致快照（不停写入），并维护供批量分析读取的只读副本
+
+库为回滚日志模式，读事务期间写入无法提交：备份每步只复制 pages_per_step 页，步间释放读锁让写入提交；
+若复制期间源库被写入，备份会从头重来，重来超过 max_restarts 次后改为一步复制完（只在这一步内持有读锁）。
+主库与各分片分别快照，每个文件自身一致，跨库之间不保证同一时刻。
+"""
+import argparse
+import contextvars
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from .config import DATABASE_PATH, SNAPSHOT_CONFIG, SHARD_CONFIG
+from .database import get_sqlite_connection
+
+# 当前上下文中经 shard_router.connect 的读取是否改走只读副本
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+class BackupRestarted(Exception):
+    """复制期间源库被反复写入，分步备份重来的次数超过上限"""
+
+
+class SnapshotStore:
+    """在线快照与只读副本"""
+
+    def __init__(self, config: Dict[str, Any] = None, home_path: Path = DATABASE_PATH):
+        self.config = dict(SNAPSHOT_CONFIG, **(config or {}))
+        self.backup_dir = Path(self.config['backup_dir'])
+        self.replica_dir = Path(self.config['replica_dir'])
+        self.home_path = Path(home_path)
+        self._lock = threading.Lock()
+        self._replica_thread = None
+
+    def database_paths(self) -> List[Path]:
+        """需要备份的库：主库（全局表）与全部分片"""
+        from .sharding import shard_router
+
+        paths = [self.home_path] + [path for path in shard_router.paths() if path != self.home_path]
+        return [path for path in paths if path.exists()]
+
+    # 在线备份
+    def copy(self, source: Path, dest: Path, readonly: bool = False) -> Dict[str, Any]:
+        """source -> dest 的一致副本：先写临时文件，校验后原子替换"""
+        started = time.perf_counter()
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(dest.name + '.part')
+        tmp_path.unlink(missing_ok=True)
+        stats = {'source': str(source), 'dest': str(dest), 'pages': 0, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            # 剩余页数回升说明源库被写入、备份从头重来
+            if stats['pages'] and remaining > stats.get('remaining', remaining):
+                stats['restarts'] += 1
+                if stats['restarts'] > self.config['max_restarts']:
+                    raise BackupRestarted(f"{source} 备份重来 {stats['restarts']} 次")
+            stats['pages'], stats['remaining'] = total, remaining
+
+        src = get_sqlite_connection(source, timeout=SHARD_CONFIG['busy_timeout'])
+        try:
+            dst = sqlite3.connect(str(tmp_path))
+            try:
+                try:
+                    src.backup(dst, pages=self.config['pages_per_step'], progress=progress,
+                               sleep=self.config['step_sleep'])
+                except BackupRestarted:
+                    src.backup(dst, pages=-1)
+                check = dst.execute("PRAGMA quick_check").fetchone()[0]
+                if check != 'ok':
+                    raise sqlite3.DatabaseError(f"{dest.name} 校验失败: {check}")
+            finally:
+                dst.close()
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            src.close()
+
+        if readonly:
+            os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, dest)
+        stats.pop('remaining', None)
+        stats['bytes'] = dest.stat().st_size
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def snapshot(self) -> Dict[str, Any]:
+        """主库与各分片各做一份快照到 backup_dir/YYYYmmdd_HHMMSS/，只保留最近keep份"""
+        started = time.perf_counter()
+        target = self.backup_dir / datetime.now().strftime('%Y%m%d_%H%M%S')
+        files = [self.copy(path, target / path.name) for path in self.database_paths()]
+        pruned = self.prune()
+        return {'snapshot': str(target), 'files': files, 'pruned': pruned,
+                'seconds': round(time.perf_counter() - started, 2)}
+
+    def snapshots(self) -> List[Path]:
+        """已有快照目录（从旧到新）"""
+        if not self.backup_dir.exists():
+            return []
+        return sorted(path for path in self.backup_dir.iterdir() if path.is_dir() and path.name[:8].isdigit())
+
+    def prune(self) -> int:
+        stale = self.snapshots()[:-self.config['keep']] if self.config['keep'] > 0 else []
+        for path in stale:
+            shutil.rmtree(path)
+        return len(stale)
+
+    # 只读副本
+    def replica_path(self, path: Path) -> Path:
+        return self.replica_dir / Path(path).name
+
+    def read_path(self, path: Path) -> Path:
+        """批量分析读取用的库：副本启用且未过期时为副本，否则为原库"""
+        if self.config['replica_enabled']:
+            replica = self.replica_path(path)
+            try:
+                # 刷新线程停了几个周期时不再读过期副本
+                if time.time() - replica.stat().st_mtime < 3 * self.config['replica_interval_seconds']:
+                    return replica
+            except FileNotFoundError:
+                pass
+        return Path(path)
+
+    def routed_path(self, path: Path) -> Path:
+        """shard_router.connect 使用：处于 replica_reads() 块内时改走副本"""
+        return self.read_path(path) if _replica_reads.get() else path
+
+    @contextmanager
+    def replica_reads(self):
+        """块内经 shard_router.connect 的读取改走只读副本（批量任务用；副本是只读文件，误写会直接报错）"""
+        token = _replica_reads.set(True)
+        try:
+            yield
+        finally:
+            _replica_reads.reset(token)
+
+    def _replicas_fresh(self) -> bool:
+        deadline = time.time() - self.config['replica_interval_seconds']
+        for path in self.database_paths():
+            replica = self.replica_path(path)
+            if not replica.exists() or replica.stat().st_mtime < deadline:
+                return False
+        return True
+
+    def _claim(self) -> bool:
+        """多worker时只由一个进程刷新：原子创建锁文件，超过一个周期的锁视为上次刷新中断"""
+        lock = self.replica_dir / '.refreshing'
+        try:
+            if lock.exists() and time.time() - lock.stat().st_mtime > self.config['replica_interval_seconds']:
+                lock.unlink()
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def refresh_replicas(self, force: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """刷新只读副本（未过期且非force时跳过）；替换文件后，已打开旧副本的连接读完旧文件再关闭"""
+        self.replica_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if (not force and self._replicas_fresh()) or not self._claim():
+                return None
+            try:
+                return [self.copy(path, self.replica_path(path), readonly=True) for path in self.database_paths()]
+            finally:
+                (self.replica_dir / '.refreshing').unlink(missing_ok=True)
+
+    def start_background_replica(self):
+        """启动副本周期刷新线程（BILL_REPLICA=1 时启用）"""
+        if not self.config['replica_enabled'] or self._replica_thread is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    files = self.refresh_replicas()
+                    if files:
+                        print(f"只读副本已刷新: {len(files)} 个库，耗时 {sum(f['seconds'] for f in files):.2f}s")
+                except Exception as e:
+                    print(f"只读副本刷新失败: {e}")
+                time.sleep(self.config['replica_interval_seconds'])
+
+        self._replica_thread = threading.Thread(target=_loop, name="sqlite-replica", daemon=True)
+        self._replica_thread.start()
+
+
+# 创建全局快照实例
+snapshot_store = SnapshotStore()
+
+
+def main():
+    """命令行：python -m src.snapshot backup | replica | list"""
+    parser = argparse.ArgumentParser(description="SQLite在线备份与只读副本")
+    parser.add_argument("action", choices=["backup", "replica", "list"])
+    args = parser.parse_args()
+
+    if args.action == "backup":
+        result = snapshot_store.snapshot()
+        for item in result['files']:
+            print(f"  {item['source']} -> {item['dest']}：{item['pages']} 页，重来 {item['restarts']} 次，"
+                  f"{item['seconds']}s")
+        print(f"快照完成: {result['snapshot']}，清理旧快照 {result['pruned']} 份，耗时 {result['seconds']}s")
+    elif args.action == "replica":
+        files = snapshot_store.refresh_replicas(force=True) or []
+        for item in files:
+            print(f"  {item['source']} -> {item['dest']}：{item['seconds']}s")
+        print(f"只读副本刷新完成: {len(files)} 个库" if files else "其他进程正在刷新副本")
+    else:
+        for path in snapshot_store.snapshots():
+            size = sum(f.stat().st_size for f in path.iterdir())
+            print(f"  {path.name}  {len(list(path.iterdir()))} 个库  {size / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
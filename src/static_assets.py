@@ -0,0 +1,331 @@
+"""
+静态资源模块 - 前端资源构建时加内容指纹、预先生成gzip/brotli压缩版本，按Accept-Encoding协商返回
+
+带指纹的文件（以及Vite构建产物中已带哈希的文件）用immutable长缓存，浏览器复访时不再请求；
+HTML和原文件名地址用no-cache + ETag，每次只做一次条件请求（未变化时304）。
+构建结果写入 data/static/（manifest.json 记录源文件状态，未变化时启动直接加载），资源全部读入内存服务。
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import STATIC_CONFIG
+
+# 尝试导入brotli，如果失败则只生成gzip版本
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# 构建格式版本：改动构建规则时递增，使已有构建结果失效
+BUILD_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# 值得压缩的文本类资源
+COMPRESSIBLE = {'.html', '.htm', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.map', '.xml', '.ico', '.wasm'}
+# 文件名中已带内容哈希（Vite产物：index-BfYt3kQ2.js）
+_FINGERPRINTED = re.compile(r'-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+# HTML的src/href属性与CSS的url()引用
+_REFERENCE = re.compile(r'''((?:\bsrc|\bhref)\s*=\s*["']|url\(\s*["']?)([^"'()\s]+)''')
+
+# 各编码的文件后缀，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAssets:
+    """前端资源的构建与加载"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = dict(STATIC_CONFIG, **(config or {}))
+        self.out_dir = Path(self.config['out_dir'])
+        self.mount_path = self.config['mount_path'].rstrip('/')
+        self.files: Dict[str, Dict[str, Any]] = {}  # 请求路径 -> {type, etag, cache_control, bodies{编码: bytes}}
+        self.source: Optional[Path] = None
+
+    def source_dir(self) -> Optional[Path]:
+        """资源目录：已构建的React前端（frontend/dist）优先，否则为web/"""
+        if self.config['source_dir']:
+            return Path(self.config['source_dir'])
+        for path in self.config['candidates']:
+            if (Path(path) / 'index.html').exists():
+                return Path(path)
+        return None
+
+    # 构建
+    @staticmethod
+    def _source_files(source: Path) -> List[Path]:
+        return sorted(
+            path for path in source.rglob('*')
+            if path.is_file() and not any(part.startswith('.') for part in path.relative_to(source).parts)
+            and path.suffix not in ('.gz', '.br')
+        )
+
+    def _source_key(self, source: Path) -> str:
+        """源文件 (相对路径, 大小, 修改时间) 与构建参数的摘要，判断构建结果是否过期"""
+        digest = hashlib.sha1(f"{BUILD_VERSION}|{source.resolve()}|{HAS_BROTLI}".encode())
+        for path in self._source_files(source):
+            stat = path.stat()
+            digest.update(f"{path.relative_to(source).as_posix()}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()
+
+    def _rewrite(self, text: str, rel: str, names: Dict[str, str]) -> str:
+        """把HTML/CSS中指向本地资源的引用改为带指纹的文件名（保持原有的相对/绝对写法）"""
+        base = posixpath.dirname(rel)
+
+        def replace(match):
+            prefix, ref = match.groups()
+            url, rest = re.match(r'([^?#]*)(.*)', ref).groups()
+            if not url or url.startswith(('http:', 'https:', '//', 'data:', 'mailto:', '#')):
+                return match.group(0)
+            if url.startswith('/'):
+                if not url.startswith(self.mount_path + '/'):
+                    return match.group(0)
+                target = posixpath.normpath(url[len(self.mount_path) + 1:])
+            else:
+                target = posixpath.normpath(posixpath.join(base, url))
+            hashed = names.get(target)
+            if hashed is None:
+                return match.group(0)
+            new_url = url[:len(url) - len(posixpath.basename(url))] + posixpath.basename(hashed)
+            return f"{prefix}{new_url}{rest}"
+
+        return _REFERENCE.sub(replace, text)
+
+    def _compress(self, dest: Path, body: bytes) -> List[str]:
+        """生成 .gz/.br 版本（压缩后不足原大小 max_ratio 的才保留）"""
+        if dest.suffix not in COMPRESSIBLE or len(body) < self.config['min_size']:
+            return []
+        variants = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if HAS_BROTLI:
+            variants['br'] = brotli.compress(body, quality=self.config['brotli_quality'])
+        kept = []
+        for encoding, suffix in ENCODINGS:
+            data = variants.get(encoding)
+            if data is not None and len(data) < len(body) * self.config['max_ratio']:
+                dest.with_name(dest.name + suffix).write_bytes(data)
+                kept.append(encoding)
+        return kept
+
+    def build(self, source: Path = None) -> Dict[str, Any]:
+        """资源加指纹并预压缩到 out_dir：先写临时目录，完成后整体替换"""
+        started = time.perf_counter()
+        source = Path(source or self.source_dir())
+        tmp_dir = self.out_dir.with_name(f".{self.out_dir.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        files = self._source_files(source)
+        rels = [path.relative_to(source).as_posix() for path in files]
+        names: Dict[str, str] = {}  # 原相对路径 -> 带指纹的相对路径
+        entries: Dict[str, Dict[str, Any]] = {}
+
+        # 先处理被引用的资源，再处理引用它们的CSS，最后是HTML（HTML不加指纹）
+        def order(rel):
+            suffix = posixpath.splitext(rel)[1]
+            return {'.css': 1, '.html': 2, '.htm': 2}.get(suffix, 0)
+
+        for path, rel in sorted(zip(files, rels), key=lambda item: (order(item[1]), item[1])):
+            body = path.read_bytes()
+            suffix = path.suffix
+            # 已带哈希的文件名对应固定内容，不能改写（Vite已替换其中的引用）
+            prehashed = bool(_FINGERPRINTED.search(path.name))
+            if suffix in ('.css', '.html', '.htm') and not prehashed:
+                body = self._rewrite(body.decode('utf-8'), rel, names).encode('utf-8')
+            digest = hashlib.sha256(body).hexdigest()[:self.config['hash_length']]
+
+            outputs = [(rel, prehashed)]
+            if suffix not in ('.html', '.htm') and not prehashed:
+                stem, ext = posixpath.splitext(rel)
+                names[rel] = f"{stem}.{digest}{ext}"
+                outputs.append((names[rel], True))
+
+            for out_rel, immutable in outputs:
+                dest = tmp_dir / out_rel
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                dest.write_bytes(body)
+                entries[out_rel] = {'etag': digest, 'immutable': immutable, 'encodings': self._compress(dest, body)}
+
+        manifest = {'source': str(source), 'source_key': self._source_key(source), 'files': entries}
+        (tmp_dir / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding='utf-8')
+
+        # 替换旧构建；多个进程同时构建时后完成的一方放弃自己的结果
+        old_dir = self.out_dir.with_name(f".{self.out_dir.name}.old-{os.getpid()}")
+        if self.out_dir.exists():
+            os.rename(self.out_dir, old_dir)
+        try:
+            os.rename(tmp_dir, self.out_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        sizes = {'identity': 0, 'gzip': 0, 'br': 0}
+        for out_rel, entry in entries.items():
+            dest = self.out_dir / out_rel
+            sizes['identity'] += dest.stat().st_size
+            for encoding, suffix in ENCODINGS:
+                if encoding in entry['encodings']:
+                    sizes[encoding] += dest.with_name(dest.name + suffix).stat().st_size
+        return {'source': str(source), 'files': len(files), 'fingerprinted': len(names), 'bytes': sizes,
+                'seconds': round(time.perf_counter() - started, 2)}
+
+    def _manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.out_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    # 加载
+    def load(self) -> bool:
+        """构建结果缺失或源文件有变化时重新构建，然后把全部资源读入内存；没有前端资源时返回False"""
+        self.source = self.source_dir()
+        if self.source is None:
+            return False
+        manifest = self._manifest()
+        if manifest is None or manifest.get('source_key') != self._source_key(self.source):
+            self.build(self.source)
+            manifest = self._manifest()
+
+        files = {}
+        for rel, entry in manifest['files'].items():
+            dest = self.out_dir / rel
+            content_type = mimetypes.guess_type(dest.name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript', 'image/svg+xml'):
+                content_type += '; charset=utf-8'
+            bodies = {'identity': dest.read_bytes()}
+            for encoding, suffix in ENCODINGS:
+                if encoding in entry['encodings']:
+                    bodies[encoding] = dest.with_name(dest.name + suffix).read_bytes()
+            files[rel] = {
+                'type': content_type,
+                'etag': entry['etag'],
+                'cache_control': self.config['immutable_cache'] if entry['immutable'] else self.config['revalidate_cache'],
+                'bodies': bodies
+            }
+        self.files = files
+        return True
+
+    def resolve(self, path: str) -> Optional[Dict[str, Any]]:
+        """请求路径（挂载点之后的部分）-> 资源；目录取index.html，无扩展名的未知路径回退到前端路由的index.html"""
+        rel = path.lstrip('/')
+        if rel == '' or rel.endswith('/'):
+            rel += 'index.html'
+        asset = self.files.get(rel)
+        if asset is None and self.config['spa_fallback'] and '.' not in posixpath.basename(rel):
+            asset = self.files.get('index.html')
+        return asset
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """按Accept-Encoding（含q值）在已有的压缩版本中选择：br优先于gzip，都不接受时原样返回"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    for encoding, _ in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class StaticAssetApp:
+    """挂载在 /app 下的ASGI应用：内存中取资源，协商编码，支持 If-None-Match 与 HEAD"""
+
+    def __init__(self, assets: StaticAssets):
+        self.assets = assets
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        path = scope['path']
+        prefix = scope.get('root_path', '')
+        if prefix and path.startswith(prefix):
+            path = path[len(prefix):]
+        elif path == self.assets.mount_path or path.startswith(self.assets.mount_path + '/'):
+            # 未经Mount转发（直接作为ASGI应用或由外层路由原样转来）时路径仍带挂载前缀
+            prefix, path = self.assets.mount_path, path[len(self.assets.mount_path):]
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self._send(send, 405, [(b'allow', b'GET, HEAD')], b'Method Not Allowed', scope)
+            return
+        if path == '':
+            # /app -> /app/，否则页面中的相对路径会解析到站点根目录
+            location = prefix + '/'
+            if scope.get('query_string'):
+                location += '?' + scope['query_string'].decode('latin-1')
+            await self._send(send, 307, [(b'location', location.encode('latin-1'))], b'', scope)
+            return
+        asset = self.assets.resolve(path)
+        if asset is None:
+            await self._send(send, 404, [(b'content-type', b'text/plain; charset=utf-8')], b'Not Found', scope)
+            return
+
+        request_headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        bodies = asset['bodies']
+        encoding = negotiate(request_headers.get('accept-encoding', ''), bodies)
+        # 各编码版本的字节不同，ETag随编码区分
+        etag = f'"{asset["etag"]}"' if encoding == 'identity' else f'"{asset["etag"]}-{encoding}"'
+        headers = [(b'etag', etag.encode()), (b'cache-control', asset['cache_control'].encode())]
+        if len(bodies) > 1:
+            headers.append((b'vary', b'Accept-Encoding'))
+
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in (
+                tag.strip() for tag in if_none_match.replace('W/', '').split(','))):
+            await self._send(send, 304, headers, b'', scope)
+            return
+
+        headers.append((b'content-type', asset['type'].encode()))
+        if encoding != 'identity':
+            headers.append((b'content-encoding', encoding.encode()))
+        await self._send(send, 200, headers, bodies[encoding], scope)
+
+    @staticmethod
+    async def _send(send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, scope):
+        if status != 304:
+            headers = headers + [(b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+# 创建全局资源实例
+static_assets = StaticAssets()
+
+
+def main():
+    """命令行：python -m src.static_assets build（部署时预先构建，启动时直接加载）"""
+    parser = argparse.ArgumentParser(description="前端资源指纹与预压缩")
+    parser.add_argument("action", choices=["build"])
+    parser.add_argument("--source", help="资源目录（默认frontend/dist，不存在时为web）")
+    args = parser.parse_args()
+
+    source = Path(args.source) if args.source else static_assets.source_dir()
+    if source is None:
+        print("未找到前端资源目录（frontend/dist 或 web）")
+        return
+    result = static_assets.build(source)
+    sizes = result['bytes']
+    print(f"构建完成: {result['source']} -> {static_assets.out_dir}，{result['files']} 个文件，"
+          f"加指纹 {result['fingerprinted']} 个，耗时 {result['seconds']}s")
+    print(f"  原始 {sizes['identity'] / 1024:.1f} KB，gzip {sizes['gzip'] / 1024:.1f} KB，"
+          f"brotli {sizes['br'] / 1024:.1f} KB" + ("" if HAS_BROTLI else "（未安装brotli）"))
+
+
+if __name__ == "__main__":
+    main()
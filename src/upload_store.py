@@ -0,0 +1,237 @@
+"""
+上传存储模块 - 按内容哈希(SHA-256)寻址保存上传文件，并缓存OCR与信息提取结果
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from .config import UPLOADS_DIR, UPLOAD_CONFIG
+from .data_cleaning import data_cleaner
+from .database import get_sqlite_connection
+from .sharding import shard_router
+
+_SUFFIX_PATTERN = re.compile(r'^\.[a-z0-9]{1,8}$')
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过大小上限"""
+
+
+class UploadStore:
+    """内容寻址上传存储：相同内容只落盘一次，识别结果按哈希复用"""
+
+    def __init__(self, root: Path = UPLOADS_DIR, db_path: Path = None, config: Dict[str, Any] = None):
+        self.config = dict(UPLOAD_CONFIG, **(config or {}))
+        self.root = Path(root)
+        self.db_path = db_path
+        self._locks: Dict[str, list] = {}
+
+    def _connect(self, user_id: int = None):
+        """识别结果缓存在主库；(哈希, 用户) -> 发票 映射与发票同在用户所在分片"""
+        if self.db_path is not None:
+            return get_sqlite_connection(self.db_path)
+        return shard_router.connect(user_id)
+
+    def ensure_schema(self):
+        """创建哈希 -> 识别结果、(哈希, 用户) -> 发票 两张映射表"""
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS upload_blobs (
+                    content_hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    file_path TEXT NOT NULL,
+                    ocr_text TEXT,
+                    result_json TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID;
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+        for path in ([self.db_path] if self.db_path is not None else shard_router.paths()):
+            conn = get_sqlite_connection(path)
+            try:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS upload_invoices (
+                        content_hash TEXT NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        invoice_id INTEGER NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (content_hash, user_id)
+                    ) WITHOUT ROWID;
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def path_for(self, content_hash: str, suffix: str = '') -> Path:
+        """哈希 -> 分层存储路径，避免单目录文件过多"""
+        levels = self.config['fanout_levels']
+        parts = [content_hash[i * 2:i * 2 + 2] for i in range(levels)]
+        return self.root.joinpath(*parts, content_hash + suffix)
+
+    @staticmethod
+    def _suffix(filename: Optional[str]) -> str:
+        """只保留规范的扩展名，客户端文件名不参与路径"""
+        suffix = Path(filename or '').suffix.lower()
+        return suffix if _SUFFIX_PATTERN.match(suffix) else ''
+
+    async def save(self, upload) -> Dict[str, Any]:
+        """分块读取上传内容，边写临时文件边计算哈希，完成后原子移动到内容地址
+
+        写盘、哈希与查库都放到线程池执行，慢磁盘上的大文件不阻塞事件循环中的其他请求。
+        """
+        chunk_size = self.config['chunk_size']
+        max_bytes = self.config['max_bytes']
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = await run_in_threadpool(self._mkstemp)
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                while True:
+                    chunk = await upload.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLargeError(f"文件超过大小上限 {max_bytes // (1024 * 1024)}MB")
+                    await run_in_threadpool(self._write_chunk, f, digest, chunk)
+            finally:
+                await run_in_threadpool(f.close)
+            if size == 0:
+                raise ValueError("上传文件为空")
+            return await run_in_threadpool(self._store, tmp_path, digest.hexdigest(), size, upload.filename)
+        finally:
+            await run_in_threadpool(self._discard, tmp_path)
+
+    def _mkstemp(self):
+        incoming = self.root / '.incoming'
+        incoming.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=str(incoming))
+
+    @staticmethod
+    def _write_chunk(f, digest, chunk: bytes):
+        digest.update(chunk)
+        f.write(chunk)
+
+    def _store(self, tmp_path: str, content_hash: str, size: int, filename: Optional[str]) -> Dict[str, Any]:
+        """临时文件移动到内容地址；相同内容已保存过时沿用已有文件（临时文件由调用方删除）"""
+        existing = self.get_blob(content_hash)
+        if existing and Path(existing['file_path']).exists():
+            return {'content_hash': content_hash, 'size': size,
+                    'file_path': existing['file_path'], 'created': False}
+
+        target = self.path_for(content_hash, self._suffix(filename))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 同一内容并发上传时后到者覆盖的也是相同字节
+        os.replace(tmp_path, target)
+        return {'content_hash': content_hash, 'size': size, 'file_path': str(target), 'created': True}
+
+    @staticmethod
+    def _discard(tmp_path: str):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    @asynccontextmanager
+    async def lock(self, content_hash: str):
+        """同一内容的并发上传串行处理，后到者直接命中前者的识别结果"""
+        # [锁, 等待/持有者数]，最后一个使用者退出时移除
+        entry = self._locks.setdefault(content_hash, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[content_hash]
+
+    def get_blob(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按哈希取已保存的文件与识别结果"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT size, file_path, ocr_text, result_json FROM upload_blobs WHERE content_hash = ?",
+                (content_hash,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            'content_hash': content_hash,
+            'size': row[0],
+            'file_path': row[1],
+            'ocr_text': row[2],
+            'processed': self._decode(row[3]) if row[3] else None
+        }
+
+    def get_invoice_id(self, content_hash: str, user_id: int) -> Optional[int]:
+        """该用户已由此内容生成的发票id；发票已被删除时清掉映射"""
+        conn = self._connect(user_id)
+        try:
+            row = conn.execute(
+                "SELECT u.invoice_id, i.id FROM upload_invoices u "
+                "LEFT JOIN invoices i ON i.id = u.invoice_id "
+                "WHERE u.content_hash = ? AND u.user_id = ?", (content_hash, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is None:
+                conn.execute("DELETE FROM upload_invoices WHERE content_hash = ? AND user_id = ?",
+                             (content_hash, user_id))
+                conn.commit()
+                return None
+            return row[0]
+        finally:
+            conn.close()
+
+    def record_result(self, stored: Dict[str, Any], ocr_text: str, processed: Dict[str, Any]):
+        """保存哈希对应的OCR文本与提取结果"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_blobs (content_hash, size, file_path, ocr_text, result_json) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stored['content_hash'], stored['size'], stored['file_path'], ocr_text,
+                 json.dumps(processed, ensure_ascii=False, default=str))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_invoice(self, content_hash: str, user_id: int, invoice_id: int):
+        conn = self._connect(user_id)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_invoices (content_hash, user_id, invoice_id) VALUES (?, ?, ?)",
+                (content_hash, user_id, invoice_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _decode(result_json: str) -> Dict[str, Any]:
+        """还原提取结果中的时间字段（JSON中存为文本）"""
+        processed = json.loads(result_json)
+        info = processed.get('extracted_info') or {}
+        for key, value in info.items():
+            if key.endswith('_time') and isinstance(value, str):
+                info[key] = data_cleaner.parse_datetime(value) or value
+        return processed
+
+
+# 创建全局上传存储实例
+upload_store = UploadStore()
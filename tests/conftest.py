@@ -0,0 +1,50 @@
+"""
+测试公共夹具 - 所有库文件、分片、归档、快照、导出与上传目录指向临时目录
+
+src.config 在首次导入时读取环境变量，必须在导入任何 src 模块之前设置。
+"""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+DATA = Path(tempfile.mkdtemp(prefix="bill-tests-"))
+os.environ.update({
+    "BILL_DB_PATH": str(DATA / "bill_db.sqlite"),
+    "BILL_SHARD_DIR": str(DATA / "shards"),
+    "BILL_ARCHIVE_DIR": str(DATA / "archive"),
+    "BILL_BACKUP_DIR": str(DATA / "backups"),
+    "BILL_EXPORTS_DIR": str(DATA / "exports"),
+    "BILL_UPLOADS_DIR": str(DATA / "uploads"),
+    "BILL_DB_SHARDS": "1",
+    "BILL_REPLICA": "0",
+    "REPORT_SCHEDULE": "0",
+    "ADMISSION_ENABLED": "0",
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """启动事件已执行（建表、迁移）的测试客户端"""
+    from fastapi.testclient import TestClient
+    from src.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def bill_payload():
+    return {"user_id": 1, "consume_time": "2025-06-01 12:00:00", "amount": 35.5, "merchant": "星巴克",
+            "category": "餐饮", "payment_method": "微信"}
@@ -0,0 +1,66 @@
+"""DuckDB分析库增量同步：删除按id识别，行数不变时也能发现"""
+import sqlite3
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from src.analytics_engine import AnalyticsEngine
+
+
+def bill(i):
+    return (i, 1, f"2025-03-{i:02d} 12:00:00", 10.0 * i, f"商家{i}", "餐饮", "微信", f"2025-03-{i:02d} 12:00:00")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    db_path = tmp_path / "bills.sqlite"
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE bills (id INTEGER PRIMARY KEY, user_id INTEGER, consume_time TEXT, amount REAL, "
+                 "merchant TEXT, category TEXT, payment_method TEXT, updated_at TEXT)")
+    conn.executemany("INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [bill(i) for i in range(1, 6)])
+    conn.commit()
+    conn.close()
+    engine = AnalyticsEngine(db_path, tmp_path / "bills.duckdb", config={"backend": "duckdb"})
+    engine.ensure_schema()
+    yield engine
+    if engine._conn is not None:
+        engine._conn.close()
+
+
+def replica_ids(engine):
+    return [row[0] for row in engine._get_conn().execute("SELECT id FROM bills ORDER BY id").fetchall()]
+
+
+def write(engine, *statements):
+    conn = sqlite3.connect(str(engine.sqlite_path))
+    for sql, params in statements:
+        conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_delete_with_insert_in_same_interval(engine):
+    assert engine.sync()['inserted'] == 5
+
+    # 删一行、加一行：行数不变
+    write(engine, ("DELETE FROM bills WHERE id = 2", ()),
+          ("INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bill(6)))
+    stats = engine.sync()
+    assert (stats['deleted'], stats['inserted']) == (1, 1)
+    assert replica_ids(engine) == [1, 3, 4, 5, 6]
+
+    # 已同步的删除日志被清理
+    conn = sqlite3.connect(str(engine.sqlite_path))
+    assert conn.execute("SELECT COUNT(*) FROM bill_deletions").fetchone()[0] == 0
+    conn.close()
+
+
+def test_deleted_max_id_reused_by_new_row(engine):
+    engine.sync()
+    write(engine, ("DELETE FROM bills WHERE id = 5", ()),
+          ("INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bill(5)[:4] + ("新商家", "餐饮", "微信", "2025-04-01 00:00:00")))
+    engine.sync()
+    assert replica_ids(engine) == [1, 2, 3, 4, 5]
+    merchant = engine._get_conn().execute("SELECT merchant FROM bills WHERE id = 5").fetchone()[0]
+    assert merchant == "新商家"
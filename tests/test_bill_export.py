@@ -0,0 +1,66 @@
+"""账单导出：各格式的流式下载、依赖缺失时的错误码，以及跨进程可查的后台导出任务"""
+import csv
+import io
+
+import pytest
+
+from src.bill_export import BillExporter, ExportJobManager, FORMAT_DEPENDENCIES
+
+USER_ID = 701
+PREFIX = "/api/v1"
+
+
+@pytest.fixture(scope="module")
+def bills(client):
+    for day, merchant in ((1, "星巴克"), (2, "麦当劳"), (3, "淘宝")):
+        response = client.post(f"{PREFIX}/bills", params={"user_id": USER_ID},
+                               json={"consume_time": f"2025-03-0{day} 12:00:00", "amount": 20 + day,
+                                     "merchant": merchant, "category": "餐饮", "payment_method": "微信"})
+        assert response.status_code == 200, response.text
+
+
+def csv_rows(content: bytes):
+    return list(csv.DictReader(io.StringIO(content.decode('utf-8-sig'))))
+
+
+def test_csv_export_streams_all_rows_in_time_order(client, bills):
+    response = client.get(f"{PREFIX}/bills/export", params={"user_id": USER_ID, "format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert [row["merchant"] for row in csv_rows(response.content)] == ["星巴克", "麦当劳", "淘宝"]
+
+    response = client.get(f"{PREFIX}/bills/export", params={"user_id": USER_ID, "format": "csv",
+                                                              "start_date": "2025-03-02", "end_date": "2025-03-02"})
+    assert [row["merchant"] for row in csv_rows(response.content)] == ["麦当劳"]
+
+
+@pytest.mark.parametrize("fmt", sorted(FORMAT_DEPENDENCIES))
+def test_optional_formats_fail_before_streaming(client, bills, fmt):
+    installed, package = FORMAT_DEPENDENCIES[fmt]
+    response = client.get(f"{PREFIX}/bills/export", params={"user_id": USER_ID, "format": fmt})
+    if installed:
+        assert response.status_code == 200 and response.content
+    else:
+        assert response.status_code == 501
+        assert package in response.json()["detail"]
+        assert client.post(f"{PREFIX}/exports", json={"user_id": USER_ID, "format": fmt}).status_code == 501
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.get(f"{PREFIX}/bills/export", params={"format": "pdf"}).status_code == 400
+    assert client.post(f"{PREFIX}/exports", json={"format": "pdf"}).status_code == 400
+
+
+def test_export_job_visible_to_other_workers(client, bills):
+    response = client.post(f"{PREFIX}/exports", json={"user_id": USER_ID, "format": "csv"})
+    assert response.status_code == 200, response.text
+    job_id = response.json()["data"]["job_id"]
+
+    # 另一个worker进程里的管理器实例只共享导出目录
+    job = ExportJobManager(BillExporter()).get_job(job_id)
+    assert job["status"] == "done" and job["size"] > 0
+
+    response = client.get(f"{PREFIX}/exports/{job_id}/download")
+    assert response.status_code == 200
+    assert len(csv_rows(response.content)) == 3
+    assert client.get(f"{PREFIX}/exports/..%2Fjobs/download").status_code == 404
@@ -0,0 +1,86 @@
+"""账单接口：写入（含发票自动记账与对账合并）后对话助手快照失效，商家Top榜可用，日期筛选无法解析时返回400"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.assistant import snapshot_store
+from src.data_cleaning import data_cleaner
+
+USER_ID = 501
+PREFIX = "/api/v1"
+
+
+def recent_bill(**fields):
+    consume_time = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+    return dict({"consume_time": consume_time, "amount": 35.5, "merchant": "星巴克",
+                 "category": "餐饮", "payment_method": "微信"}, **fields)
+
+
+def test_bill_writes_invalidate_assistant_snapshot(client):
+    assert len(snapshot_store.get(USER_ID)) == 0  # 缓存一份空快照
+
+    response = client.post(f"{PREFIX}/bills", params={"user_id": USER_ID}, json=recent_bill())
+    assert response.status_code == 200, response.text
+    bill_id = response.json()["bill_id"]
+    assert len(snapshot_store.get(USER_ID)) == 1
+
+    response = client.put(f"{PREFIX}/bills/{bill_id}", params={"user_id": USER_ID}, json={"amount": 88.0})
+    assert response.status_code == 200, response.text
+    assert snapshot_store.get(USER_ID).amount.tolist() == [88.0]
+
+    response = client.delete(f"{PREFIX}/bills/{bill_id}", params={"user_id": USER_ID})
+    assert response.status_code == 200, response.text
+    assert len(snapshot_store.get(USER_ID)) == 0
+
+
+def test_invoice_bills_and_reconcile_merge_invalidate_assistant_snapshot(client):
+    user_id = USER_ID + 3
+    assert len(snapshot_store.get(user_id)) == 0
+
+    # 上传发票图片后自动生成账单
+    response = client.post(f"{PREFIX}/invoices/upload", params={"user_id": user_id},
+                           files={"file": ("发票.jpg", b"\xff\xd8\xff invoice", "image/jpeg")})
+    assert response.status_code == 200 and response.json()["data"]["bill_id"], response.text
+    assert len(snapshot_store.get(user_id)) == 1
+
+    # 先有发票自动账单、后补记真实账单，对账合并时删除自动账单
+    bill = recent_bill()
+    response = client.post(f"{PREFIX}/invoices/process", json={
+        "user_id": user_id, "ocr_text": f"星巴克咖啡 金额：{bill['amount']:.2f}元 日期：{bill['consume_time']}"})
+    assert response.json()["data"]["bill_id"], response.text
+    client.post(f"{PREFIX}/bills", params={"user_id": user_id}, json=bill)
+    assert len(snapshot_store.get(user_id)) == 3
+
+    response = client.post(f"{PREFIX}/invoices/reconcile", params={"user_id": user_id})
+    assert response.json()["data"]["merged"] == 1, response.text
+    assert len(snapshot_store.get(user_id)) == 2
+
+
+def test_top_merchants_within_and_beyond_snapshot_window(client):
+    client.post(f"{PREFIX}/bills", params={"user_id": USER_ID + 1}, json=recent_bill())
+    for window in (30, snapshot_store.config['snapshot_days'] + 30):
+        response = client.get(f"{PREFIX}/merchants/top", params={"user_id": USER_ID + 1, "window": window})
+        assert response.status_code == 200, response.text
+        assert [item["merchant"] for item in response.json()["data"]] == ["星巴克"]
+
+
+def test_bill_date_filters_reject_unparseable_dates(client):
+    client.post(f"{PREFIX}/bills", params={"user_id": USER_ID + 2}, json=recent_bill())
+    for params in ({"start_date": "2025-13-45"}, {"end_date": "昨天"}):
+        response = client.get(f"{PREFIX}/bills", params=dict(params, user_id=USER_ID + 2))
+        assert response.status_code == 400, response.text
+        assert "无法解析的时间" in response.json()["detail"]
+        assert client.get(f"{PREFIX}/bills/export", params=dict(params, user_id=USER_ID + 2)).status_code == 400
+        assert client.post(f"{PREFIX}/exports", json=dict(params, user_id=USER_ID + 2)).status_code == 400
+
+    response = client.get(f"{PREFIX}/bills", params={"user_id": USER_ID + 2, "start_date": "2000-01-01",
+                                                     "end_date": datetime.now().strftime('%Y-%m-%d')})
+    assert response.status_code == 200 and response.json()["total"] == 1
+
+
+def test_to_epoch_does_not_fall_back_to_now():
+    with pytest.raises(ValueError):
+        data_cleaner.to_epoch("not a date")
+    with pytest.raises(ValueError):
+        data_cleaner.day_key(None)
+    assert data_cleaner.day_key("2025-03-02T08:30") == 20250302
@@ -0,0 +1,25 @@
+"""后台任务选主：同一锁文件只有一个持有者，持有者释放后等待中的实例接替"""
+import threading
+
+import pytest
+
+from src.leader import LeaderLock, HAS_FCNTL
+
+
+@pytest.mark.skipif(not HAS_FCNTL, reason="需要fcntl文件锁")
+def test_only_one_holder_and_takeover(tmp_path):
+    lock_path = tmp_path / "background.lock"
+    first = LeaderLock(lock_path)
+    second = LeaderLock(lock_path, config={'leader_retry_seconds': 0.05})
+
+    started = []
+    assert first.run_when_elected(lambda: started.append('first'))
+    elected = threading.Event()
+    assert not second.run_when_elected(lambda: (started.append('second'), elected.set()))
+    assert started == ['first'] and not second.is_leader
+
+    first.release()
+    assert elected.wait(5)
+    assert started == ['first', 'second'] and second.is_leader
+    assert not first.try_acquire()
+    second.release()
@@ -0,0 +1,35 @@
+"""商家规范化：不同写法（分店括号、后缀）的账单归到同一个商家id"""
+from src.data_cleaning import data_cleaner
+from src.merchant_index import merchant_index
+from src.sharding import shard_router
+
+USER_ID = 601
+
+
+def test_cleaning_keeps_branch_brackets():
+    assert data_cleaner.clean_bill_data({'merchant': ' 星巴克咖啡(南山店)! '})['merchant'] == "星巴克咖啡(南山店)"
+    assert data_cleaner.clean_bill_data({'merchant': '星巴克【国贸店】'})['merchant'] == "星巴克【国贸店】"
+
+
+def test_normalize_strips_branch_and_suffix():
+    assert merchant_index.normalize("星巴克咖啡(南山店)") == merchant_index.normalize("星巴克")
+    assert merchant_index.normalize("星巴克（国贸店）") == merchant_index.normalize("星巴克")
+
+
+def test_api_resolves_branch_variants_to_one_merchant(client):
+    ids = []
+    for merchant in ("星巴克", "星巴克咖啡(南山店)", "星巴克（国贸店）"):
+        response = client.post("/api/v1/bills", params={"user_id": USER_ID},
+                               json={"consume_time": "2025-06-01 12:00:00", "amount": 30, "merchant": merchant,
+                                     "category": "餐饮", "payment_method": "微信"})
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["bill_id"])
+
+    conn = shard_router.connect(USER_ID)
+    try:
+        rows = conn.execute(f"SELECT merchant, merchant_id FROM bills WHERE id IN ({', '.join('?' * len(ids))}) "
+                            f"ORDER BY id", ids).fetchall()
+    finally:
+        conn.close()
+    assert rows[1][0] == "星巴克咖啡(南山店)"
+    assert {merchant_id for _, merchant_id in rows} == {merchant_index.lookup("星巴克")}
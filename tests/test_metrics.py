@@ -0,0 +1,30 @@
+"""请求指标：流式响应体生成期间执行的SQL在响应体发送完后计入 /metrics"""
+from src.metrics import REQUEST_SQL_STATEMENTS, REQUESTS_IN_FLIGHT
+
+USER_ID = 801
+PREFIX = "/api/v1"
+ROUTE = f"{PREFIX}/bills/export"
+
+
+def sql_statements(route: str):
+    """该路由的 (请求数, SQL语句总数)"""
+    state = REQUEST_SQL_STATEMENTS._values.get((route,))
+    return (state[-1], state[-2]) if state else (0, 0)
+
+
+def test_streamed_body_sql_is_recorded(client):
+    response = client.post(f"{PREFIX}/bills", params={"user_id": USER_ID},
+                           json={"consume_time": "2025-05-01 09:00:00", "amount": 12, "merchant": "全家",
+                                 "category": "购物", "payment_method": "微信"})
+    assert response.status_code == 200, response.text
+    requests_before, statements_before = sql_statements(ROUTE)
+
+    response = client.get(ROUTE, params={"user_id": USER_ID}, headers={"X-Server-Timing": "1"})
+    assert response.status_code == 200
+    header_queries = int(response.headers["server-timing"].split('desc="')[1].split()[0])
+
+    requests_after, statements_after = sql_statements(ROUTE)
+    assert requests_after == requests_before + 1
+    # 导出的查询在响应体生成时才执行：响应头里看不到，/metrics 中要有
+    assert statements_after - statements_before > header_queries
+    assert REQUESTS_IN_FLIGHT._values.get((ROUTE,)) == 0
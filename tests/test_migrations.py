@@ -0,0 +1,59 @@
+"""旧库迁移：最初版本的表结构上补字段、时间生成列与索引"""
+import sqlite3
+
+from src.database import ensure_model_columns, ensure_time_columns
+
+# 最初上线版本的bills/invoices（没有merchant_id/bill_id列）
+LEGACY_SCHEMA = """
+    CREATE TABLE bills (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, consume_time DATETIME NOT NULL,
+        amount REAL NOT NULL, merchant TEXT NOT NULL, category TEXT DEFAULT '未知', payment_method TEXT NOT NULL,
+        location TEXT, description TEXT, created_at DATETIME, updated_at DATETIME
+    );
+    CREATE TABLE invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, invoice_time DATETIME NOT NULL,
+        amount REAL NOT NULL, merchant TEXT NOT NULL, invoice_type TEXT DEFAULT '未知', ocr_text TEXT,
+        file_path TEXT, created_at DATETIME, updated_at DATETIME
+    );
+    INSERT INTO bills (user_id, consume_time, amount, merchant, payment_method)
+    VALUES (1, '2024/03/05 08:30:00', 12.5, '星巴克', '微信');
+"""
+
+
+def legacy_database(tmp_path):
+    path = tmp_path / "legacy.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+    return path
+
+
+def indexes(path, table):
+    conn = sqlite3.connect(str(path))
+    try:
+        return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+    finally:
+        conn.close()
+
+
+def test_time_columns_alone_on_legacy_database(tmp_path):
+    path = legacy_database(tmp_path)
+
+    assert ensure_time_columns(path) == {'bills': 1, 'invoices': 0}
+    assert {"idx_bills_user_ts", "idx_bills_user_month"} <= indexes(path, "bills")
+    assert "idx_bills_user_merchant_id" not in indexes(path, "bills")
+    conn = sqlite3.connect(str(path))
+    assert conn.execute("SELECT consume_time, consume_month FROM bills").fetchone() == ("2024-03-05 08:30:00", 202403)
+    conn.close()
+
+
+def test_model_columns_add_columns_and_their_indexes(tmp_path):
+    path = legacy_database(tmp_path)
+
+    added = ensure_model_columns(path)
+    ensure_time_columns(path)
+
+    assert {"bills.merchant_id", "invoices.bill_id"} <= set(added)
+    assert "idx_bills_user_merchant_id" in indexes(path, "bills")
+    assert "idx_invoices_bill_id" in indexes(path, "invoices")
+    assert ensure_model_columns(path) == []
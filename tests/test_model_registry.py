@@ -0,0 +1,44 @@
+"""模型仓库：发布、校验、切换与清理"""
+import pytest
+
+from src.model_registry import ModelRegistry, ModelIntegrityError
+
+
+def write_weights(content: bytes):
+    def write(directory):
+        (directory / "weights.bin").write_bytes(content)
+    return write
+
+
+def test_publish_activates_new_version(tmp_path):
+    registry = ModelRegistry("demo", root=tmp_path, keep=2)
+    first = registry.publish(write_weights(b"v1"), meta={"accuracy": 0.9})
+    second = registry.publish(write_weights(b"v2"))
+
+    assert (first, second) == ("v0001", "v0002")
+    assert registry.current_version() == "v0002"
+    version, directory, meta = registry.resolve()
+    assert version == "v0002" and (directory / "weights.bin").read_bytes() == b"v2"
+    assert registry.meta("v0001")["accuracy"] == 0.9
+
+
+def test_activate_rolls_back_and_prune_keeps_current(tmp_path):
+    registry = ModelRegistry("demo", root=tmp_path, keep=1)
+    registry.publish(write_weights(b"v1"))
+    registry.publish(write_weights(b"v2"), activate=False)
+    assert registry.current_version() == "v0001"
+    assert registry.versions() == ["v0001", "v0002"]
+
+    registry.activate("v0002")
+    assert registry.versions() == ["v0002"]
+
+
+def test_tampered_file_fails_verification(tmp_path):
+    registry = ModelRegistry("demo", root=tmp_path)
+    version = registry.publish(write_weights(b"v1"))
+    (registry.model_dir / version / "weights.bin").write_bytes(b"tampered")
+
+    with pytest.raises(ModelIntegrityError):
+        registry.resolve()
+    with pytest.raises(FileNotFoundError):
+        ModelRegistry("missing", root=tmp_path).resolve()
@@ -0,0 +1,84 @@
+"""MySQL导出文件流式读取：引号/转义/注释识别与跨块边界切分，批量upsert"""
+import sqlite3
+
+import pytest
+
+from src.mysql_dump import MySQLDumpReader, bulk_upsert, import_dump
+
+DUMP = r"""-- MySQL dump 10.13
+/*!40101 SET NAMES utf8mb4 */;
+DROP TABLE IF EXISTS `products`;
+CREATE TABLE `products` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `name` varchar(64) NOT NULL COMMENT '名称; 含分号',
+  `rate` decimal(6,2) DEFAULT NULL,
+  `note` text,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+# 单行注释 'not a string
+INSERT INTO `products` (`id`, `name`, `rate`, `note`) VALUES (1,'It\'s ok',3.50,'a, b, c'),(2,'两行\n文本',-1.25,NULL),
+(3,'O''Brien',1e2,'-- not a comment /* nor this */'),(4,'back\\slash',.5,'tab\there; semi');
+INSERT INTO `other` VALUES (9,'skipped');
+/* 块注释 INSERT INTO `products` VALUES (99,'x',0,'y'); */
+INSERT INTO `products` VALUES (5,'尾行',0,'");');
+"""
+
+EXPECTED = [
+    (1, "It's ok", 3.5, 'a, b, c'),
+    (2, '两行\n文本', -1.25, None),
+    (3, "O'Brien", 100.0, '-- not a comment /* nor this */'),
+    (4, 'back\\slash', 0.5, 'tab\there; semi'),
+    (5, '尾行', 0, '");'),
+]
+
+
+@pytest.fixture
+def dump_file(tmp_path):
+    path = tmp_path / "dump.sql"
+    path.write_text(DUMP, encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [3, 7, 64, 100000])
+def test_rows_identical_across_chunk_sizes(dump_file, chunk_size):
+    reader = MySQLDumpReader(dump_file, chunk_size=chunk_size)
+    rows = list(reader.iter_rows(['products']))
+
+    assert [values for _, _, values in rows] == EXPECTED
+    # 未列出列名的INSERT按建表语句补全列名
+    assert all(columns == ['id', 'name', 'rate', 'note'] for _, columns, _ in rows)
+    assert reader.schemas['products'].primary_key == ['id']
+    assert reader.bytes_read == reader.total_bytes
+
+
+def test_other_tables_are_filtered(dump_file):
+    tables = [table for table, _, _ in MySQLDumpReader(dump_file, chunk_size=7).iter_rows()]
+    assert tables.count('other') == 1 and tables.count('products') == 5
+
+
+def test_import_dump_upserts_by_primary_key(dump_file, tmp_path):
+    db_path = tmp_path / "import.sqlite"
+    assert import_dump(dump_file, db_path, tables=['products'])['products']['inserted'] == 5
+    counts = import_dump(dump_file, db_path, tables=['products'])['products']
+    assert (counts['inserted'], counts['updated']) == (0, 5)
+
+    conn = sqlite3.connect(str(db_path))
+    assert conn.execute("SELECT name, rate FROM products WHERE id = 3").fetchone() == ("O'Brien", 100.0)
+    conn.close()
+
+    # 没有建表语句也没有列名的表无法导入
+    with pytest.raises(ValueError):
+        import_dump(dump_file, db_path, tables=['other'])
+
+
+def test_bulk_upsert_updates_existing_and_dedupes_batch():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE loan_products (name TEXT, interest_rate REAL)")
+    conn.execute("INSERT INTO loan_products VALUES ('房贷', 4.9)")
+    rows = iter([('房贷', 4.2), ('车贷', 6.0), ('车贷', 5.5), ('消费贷', None)])
+
+    counts = bulk_upsert(conn, 'loan_products', ['name', 'interest_rate'], rows, ['name'], batch_size=10)
+
+    assert counts == {'rows': 4, 'inserted': 2, 'updated': 1}
+    assert dict(conn.execute("SELECT name, interest_rate FROM loan_products")) == \
+        {'房贷': 4.2, '车贷': 5.5, '消费贷': None}
@@ -0,0 +1,35 @@
+"""只读记录：手写 __slots__ 的dataclass（兼容Python 3.8），可直接序列化"""
+import dataclasses
+import json
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from fix_sqlalchemy_session import get_bills_simple
+from src.json_stream import dumps
+from src.records import BillRecord, InvoiceRecord, BILL_COLUMNS, INVOICE_COLUMNS
+
+USER_ID = 1001
+
+
+@pytest.mark.parametrize("record_type, columns", [(BillRecord, BILL_COLUMNS), (InvoiceRecord, INVOICE_COLUMNS)])
+def test_records_are_slotted_dataclasses(record_type, columns):
+    record = record_type(*range(len(columns)))
+    assert not hasattr(record, '__dict__')
+    assert dataclasses.is_dataclass(record) and record.__slots__ == columns
+    assert record.to_dict() == dict(zip(columns, range(len(columns))))
+    assert json.loads(dumps(record)) == jsonable_encoder(record) == record.to_dict()
+    with pytest.raises(AttributeError):
+        record.extra = 1
+
+
+def test_get_bills_simple_returns_records(client):
+    response = client.post("/api/v1/bills", params={"user_id": USER_ID},
+                           json={"consume_time": "2025-02-01 10:00:00", "amount": 9.5, "merchant": "全家",
+                                 "category": "购物", "payment_method": "现金"})
+    assert response.status_code == 200, response.text
+
+    [bill] = get_bills_simple(USER_ID)
+    assert isinstance(bill, BillRecord)
+    assert (bill.merchant, bill.amount, bill.consume_time) == ("全家", 9.5, "2025-02-01 10:00:00")
+    assert bill.to_dict()["id"] == response.json()["bill_id"]
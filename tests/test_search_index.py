@@ -0,0 +1,78 @@
+"""全文检索：中文按相邻二字切分，较长连续中文里的词也能检出；商家筛选走同一索引"""
+import sqlite3
+
+import pytest
+
+from src.database import db_manager
+from src.search_index import SearchIndex, query_terms, segment, term_phrase
+
+USER_ID = 901
+PREFIX = "/api/v1"
+
+
+@pytest.mark.parametrize("text, word", [("和同事开会喝拿铁", "拿铁"), ("星巴克咖啡(南山店)", "山店"),
+                                        ("中华人民共和国驻港部队", "人民共和国"), ("喝拿铁", "铁")])
+def test_word_inside_longer_run_is_indexed(text, word):
+    # 单字按前缀匹配，其余为相邻二字组成的短语，都要是文档词元
+    indexed = segment(text).split()
+    phrase = term_phrase(word).rstrip('*').strip('"').split()
+    assert any(indexed[i:i + len(phrase)] == phrase for i in range(len(indexed)))
+
+
+def test_query_terms_split_on_script_and_punctuation():
+    assert query_terms("星巴克 Starbucks拿铁，拿铁") == ["星巴克", "starbucks", "拿铁"]
+
+
+def test_index_rebuilds_when_tokenizer_changes(tmp_path):
+    path = tmp_path / "search.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE bills (id INTEGER PRIMARY KEY, user_id INTEGER, consume_time TEXT, amount REAL,
+                            merchant TEXT, description TEXT);
+        CREATE TABLE invoices (id INTEGER PRIMARY KEY, user_id INTEGER, invoice_time TEXT, amount REAL,
+                               merchant TEXT, ocr_text TEXT);
+        INSERT INTO bills VALUES (1, 1, '2025-04-01 08:00:00', 16, '瑞幸咖啡', '喝拿铁');
+    """)
+    conn.close()
+    index = SearchIndex(path)
+    assert index.ensure_schema()
+    assert not SearchIndex(path).ensure_schema()
+
+    conn = sqlite3.connect(str(path))
+    conn.execute("UPDATE search_meta SET value = 'old' WHERE key = 'tokenizer'")
+    conn.execute("DELETE FROM search_fts")
+    conn.commit()
+    conn.close()
+    assert SearchIndex(path).ensure_schema()
+    assert index.search("拿铁")["total"] == 1
+
+
+def test_search_finds_words_inside_longer_runs(client):
+    response = client.post(f"{PREFIX}/bills", params={"user_id": USER_ID},
+                           json={"consume_time": "2025-04-01 15:00:00", "amount": 38, "merchant": "星巴克咖啡(南山店)",
+                                 "category": "餐饮", "payment_method": "微信", "description": "和同事开会喝拿铁"})
+    assert response.status_code == 200, response.text
+
+    for query in ("拿铁", "星巴克 拿铁", "咖啡", "南山", "铁"):
+        data = client.get(f"{PREFIX}/search", params={"q": query, "user_id": USER_ID}).json()["data"]
+        assert data["total"] == 1, query
+        assert data["results"][0]["merchant"] == "星巴克咖啡(南山店)"
+
+    for query in ("麦当劳", "拿铁铁", "巴星"):
+        assert client.get(f"{PREFIX}/search", params={"q": query, "user_id": USER_ID}).json()["data"]["total"] == 0
+
+
+def test_merchant_filter_matches_like_semantics(client):
+    for merchant in ("瑞幸咖啡", "Luckin瑞幸", "麦当劳"):
+        response = client.post(f"{PREFIX}/bills", params={"user_id": USER_ID + 1},
+                               json={"consume_time": "2025-04-02 09:00:00", "amount": 20, "merchant": merchant,
+                                     "category": "餐饮", "payment_method": "微信"})
+        assert response.status_code == 200, response.text
+
+    for merchant, expected in (("瑞幸", {"瑞幸咖啡", "Luckin瑞幸"}), ("幸咖", {"瑞幸咖啡"}), ("luckin", {"Luckin瑞幸"}),
+                               ("肯德基", set())):
+        rows = client.get(f"{PREFIX}/bills", params={"user_id": USER_ID + 1, "merchant": merchant}).json()["data"]
+        assert {row["merchant"] for row in rows} == expected, merchant
+
+    # 解析不到规范商家时按名称包含匹配
+    assert [bill.merchant for bill in db_manager.get_bills_by_merchant(USER_ID + 1, "幸咖")] == ["瑞幸咖啡"]
@@ -0,0 +1,22 @@
+import sqlite3
+
+from src.sharding import ShardRouter
+
+
+def test_id_blocks_continue_after_existing_rows(tmp_path):
+    home = tmp_path / "home.sqlite"
+    conn = sqlite3.connect(str(home))
+    conn.execute("CREATE TABLE bills (id INTEGER PRIMARY KEY)")
+    conn.execute("INSERT INTO bills (id) VALUES (41)")
+    conn.commit()
+    conn.close()
+
+    config = {'shards': 1, 'id_block_size': 3}
+    router = ShardRouter(config, home_path=home)
+    assert [router.next_id('bills') for _ in range(5)] == [42, 43, 44, 45, 46]
+
+    # 另一个进程（新的路由实例）领取的是下一段，不与已发出的id重叠
+    other = ShardRouter(config, home_path=home)
+    assert other.next_id('bills') == 48
+    assert router.next_id('bills') == 47
+    assert router.next_id('bills') == 51
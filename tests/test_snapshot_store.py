@@ -0,0 +1,59 @@
+"""在线快照与只读副本"""
+import os
+import sqlite3
+import stat
+
+from src.snapshot import SnapshotStore
+
+
+def make_store(tmp_path, **config):
+    home = tmp_path / "home.sqlite"
+    conn = sqlite3.connect(str(home))
+    conn.execute("CREATE TABLE bills (id INTEGER PRIMARY KEY, amount REAL)")
+    conn.executemany("INSERT INTO bills (amount) VALUES (?)", [(i,) for i in range(2000)])
+    conn.commit()
+    conn.close()
+    config = dict({'backup_dir': tmp_path / "backups", 'replica_dir': tmp_path / "replica",
+                   'pages_per_step': 2, 'step_sleep': 0}, **config)
+    return SnapshotStore(config, home_path=home), home
+
+
+def count(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_copy_is_consistent_and_readonly(tmp_path):
+    store, home = make_store(tmp_path)
+    stats = store.copy(home, tmp_path / "copy.sqlite", readonly=True)
+
+    assert count(tmp_path / "copy.sqlite") == 2000
+    assert stats['pages'] > 0 and not (tmp_path / "copy.sqlite.part").exists()
+    assert stat.S_IMODE(os.stat(tmp_path / "copy.sqlite").st_mode) == 0o444
+
+
+def test_snapshot_prunes_old_directories(tmp_path):
+    store, home = make_store(tmp_path, keep=2)
+    for name in ("20240101_000000", "20240102_000000", "20240103_000000"):
+        (tmp_path / "backups" / name).mkdir(parents=True)
+
+    result = store.snapshot()
+
+    assert result['pruned'] == 2
+    assert [path.name for path in store.snapshots()][:1] == ["20240103_000000"]
+    assert count(store.snapshots()[-1] / home.name) == 2000
+
+
+def test_routed_path_uses_replica_only_inside_block(tmp_path):
+    store, home = make_store(tmp_path, replica_enabled=True)
+    assert store.read_path(home) == home  # 副本还不存在
+
+    store.refresh_replicas(force=True)
+    replica = store.replica_path(home)
+    assert store.routed_path(home) == home
+    with store.replica_reads():
+        assert store.routed_path(home) == replica
+    assert store.read_path(home) == replica
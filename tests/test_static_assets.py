@@ -0,0 +1,37 @@
+"""前端静态资源：挂载路径不带斜杠时重定向到 /app/"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.static_assets import StaticAssets, StaticAssetApp
+
+
+@pytest.fixture(scope="module")
+def assets(tmp_path_factory):
+    source = tmp_path_factory.mktemp("web")
+    (source / "index.html").write_text('<script src="app.js"></script>', encoding='utf-8')
+    (source / "app.js").write_text("console.log('app')", encoding='utf-8')
+    assets = StaticAssets({'source_dir': str(source), 'out_dir': str(tmp_path_factory.mktemp("static"))})
+    assert assets.load()
+    return assets
+
+
+def test_mounted_bare_path_redirects(assets):
+    app = FastAPI()
+    app.mount(assets.mount_path, StaticAssetApp(assets), name="app")
+    client = TestClient(app)
+
+    response = client.get("/app", params={"tab": "bills"}, follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"].endswith("/app/?tab=bills")
+    assert client.get("/app/").status_code == 200
+
+
+def test_unmounted_app_redirects_bare_mount_path(assets):
+    client = TestClient(StaticAssetApp(assets))
+
+    response = client.get("/app", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "/app/"
+    response = client.get("/app/")
+    assert response.status_code == 200 and b"<script" in response.content
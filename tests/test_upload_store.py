@@ -0,0 +1,68 @@
+"""上传存储：分块写盘在线程池执行，内容寻址去重，超限/空文件不留下临时文件"""
+import asyncio
+import hashlib
+import io
+import threading
+
+import pytest
+
+from src.upload_store import UploadStore, UploadTooLargeError
+
+
+class FakeUpload:
+    def __init__(self, content: bytes, filename: str = "发票.JPG"):
+        self._file = io.BytesIO(content)
+        self.filename = filename
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UploadStore(root=tmp_path / "uploads", db_path=tmp_path / "uploads.sqlite",
+                        config={'chunk_size': 4, 'max_bytes': 64})
+    store.ensure_schema()
+    return store
+
+
+def incoming_files(store):
+    return list((store.root / '.incoming').iterdir())
+
+
+def test_save_writes_chunks_off_the_event_loop(store, monkeypatch):
+    content = b"invoice image bytes"
+    writer_threads = set()
+    write_chunk = UploadStore._write_chunk
+
+    def record_thread(f, digest, chunk):
+        writer_threads.add(threading.get_ident())
+        write_chunk(f, digest, chunk)
+
+    monkeypatch.setattr(UploadStore, '_write_chunk', staticmethod(record_thread))
+
+    async def save():
+        return await store.save(FakeUpload(content)), threading.get_ident()
+
+    stored, loop_thread = asyncio.run(save())
+    assert writer_threads and loop_thread not in writer_threads
+    assert stored['content_hash'] == hashlib.sha256(content).hexdigest()
+    assert stored['created'] and stored['file_path'].endswith('.jpg')
+    with open(stored['file_path'], 'rb') as f:
+        assert f.read() == content
+    assert incoming_files(store) == []
+
+
+def test_same_content_reuses_saved_file(store):
+    first = asyncio.run(store.save(FakeUpload(b"same bytes")))
+    store.record_result(first, "ocr", {'extracted_info': {}})
+    second = asyncio.run(store.save(FakeUpload(b"same bytes", "other.png")))
+    assert not second['created'] and second['file_path'] == first['file_path']
+    assert incoming_files(store) == []
+
+
+@pytest.mark.parametrize("content, error", [(b"x" * 65, UploadTooLargeError), (b"", ValueError)])
+def test_rejected_uploads_leave_no_temp_files(store, content, error):
+    with pytest.raises(error):
+        asyncio.run(store.save(FakeUpload(content)))
+    assert incoming_files(store) == []